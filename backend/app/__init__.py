@@ -116,8 +116,8 @@ def create_app(config_name='development'):
     
     # 导入所有模型以确保表被创建
     from app.models import (
-        User, UserPlan, Stock, UserWatchlist, AnalysisTask, 
-        PromptTemplate, ReportIndex, ReportStatistics, ReportViewLog, ReportDownloadLog,
+        User, UserPlan, Stock, UserWatchlist, AnalysisTask, TaskRecord, TaskStockStatus,
+        PromptTemplate, ReportIndex, ReportCounter, ReportStatistics, ReportViewLog, ReportDownloadLog,
         EmailSubscription, PaymentTransaction, Admin, SystemConfig
     )
     
@@ -174,6 +174,14 @@ def create_app(config_name='development'):
     from app.api.payment_api import payment_bp
     app.register_blueprint(payment_bp, url_prefix='/api/payment')
     
+    # 每个进程处理第一个请求时启动分析任务维护线程（续租、恢复中断的任务）
+    if app.config.get('ANALYSIS_RECOVER_INTERRUPTED_TASKS'):
+        from app.services.ai.task_executor import analysis_executor
+        
+        @app.before_request
+        def start_analysis_maintenance():
+            analysis_executor.start_maintenance(app)
+    
 
     
     # 错误处理
@@ -1,11 +1,12 @@
 """
 AI配置管理API
 """
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, Response, current_app, request, jsonify, session
 from app import db
 from app.services.ai.ai_config_service import AIConfigService
 from app.utils.permissions import login_required, super_admin_required
 from app.utils.response import success_response, error_response
+import hmac
 import logging
 
 logger = logging.getLogger(__name__)
@@ -238,6 +239,88 @@ def get_usage_stats():
         return error_response("获取统计失败", str(e))
 
 
+@ai_config_api_bp.route('/configs/circuit-breakers', methods=['GET'])
+@super_admin_required
+def get_circuit_breakers():
+    """获取各提供商的熔断状态和切换次数"""
+    try:
+        service = get_ai_config_service()
+        states = service.get_circuit_breaker_states()
+        
+        return success_response(data=states)
+        
+    except Exception as e:
+        logger.error(f"获取熔断状态失败: {str(e)}")
+        return error_response("获取熔断状态失败", str(e))
+
+
+@ai_config_api_bp.route('/configs/hedging', methods=['GET'])
+@super_admin_required
+def get_hedging_stats():
+    """获取请求对冲统计"""
+    try:
+        service = get_ai_config_service()
+        stats = service.get_hedging_stats()
+        
+        return success_response(data=stats)
+        
+    except Exception as e:
+        logger.error(f"获取对冲统计失败: {str(e)}")
+        return error_response("获取对冲统计失败", str(e))
+
+
+@ai_config_api_bp.route('/configs/metrics', methods=['GET'])
+@super_admin_required
+def get_llm_metrics():
+    """获取各模型的调用指标，window 为统计的时间窗口秒数"""
+    try:
+        window = min(max(request.args.get('window', 3600, type=int), 60), 7 * 24 * 3600)
+        service = get_ai_config_service()
+        metrics = service.get_llm_metrics(window)
+        
+        return success_response(data=metrics)
+        
+    except Exception as e:
+        logger.error(f"获取调用指标失败: {str(e)}")
+        return error_response("获取调用指标失败", str(e))
+
+
+@ai_config_api_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus文本格式的调用指标；配置了 METRICS_AUTH_TOKEN 时抓取端可用Bearer令牌访问，否则需要超级管理员登录"""
+    token = current_app.config.get('METRICS_AUTH_TOKEN')
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return _prometheus_response()
+    return _admin_prometheus_metrics()
+
+
+@super_admin_required
+def _admin_prometheus_metrics():
+    return _prometheus_response()
+
+
+def _prometheus_response():
+    service = get_ai_config_service()
+    return Response(service.get_prometheus_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+@ai_config_api_bp.route('/configs/<int:config_id>/reset-circuit', methods=['POST'])
+@super_admin_required
+def reset_circuit_breaker(config_id):
+    """手动恢复提供商熔断"""
+    try:
+        service = get_ai_config_service()
+        state = service.reset_circuit_breaker(config_id)
+        
+        if state is None:
+            return error_response("配置不存在")
+        return success_response(data=state, message="熔断已恢复")
+        
+    except Exception as e:
+        logger.error(f"恢复熔断失败: {str(e)}")
+        return error_response("操作失败", str(e))
+
+
 @ai_config_api_bp.route('/configs/templates', methods=['GET'])
 @super_admin_required
 def get_provider_templates():
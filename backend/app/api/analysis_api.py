@@ -1,14 +1,14 @@
 """
 分析相关API
 """
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, Response, request, jsonify, session, stream_with_context
 from app.utils.response import success_response, error_response
 from app.services.ai.analysis_service import AnalysisService
+from app.services.ai.task_executor import ExecutorFullError
 from app.services.data.usage_service import UsageTrackingService
 from app import db
-import logging
 import json
-import os
+import logging
 
 logger = logging.getLogger(__name__)
 
@@ -70,14 +70,18 @@ def analyze_stock():
         service = get_analysis_service()
         
         # 创建单个分析任务
-        task_id = service.create_single_analysis_task(
-            user_id=user_id,
-            stock_code=stock_code,
-            analysis_type=analysis_type,
-            ai_provider=ai_provider,
-            ai_model=ai_model,
-            prompt_id=prompt_id
-        )
+        try:
+            task_id = service.create_single_analysis_task(
+                user_id=user_id,
+                stock_code=stock_code,
+                analysis_type=analysis_type,
+                ai_provider=ai_provider,
+                ai_model=ai_model,
+                prompt_id=prompt_id
+            )
+        except ExecutorFullError as e:
+            return error_response("QUEUE_FULL", str(e), 429)
+        queue_position = service.get_task_queue_position(task_id)
         
         # 立即增加使用次数（管理员不计入）
         if not is_admin:
@@ -93,7 +97,8 @@ def analyze_stock():
                 'task_id': task_id,
                 'stock_code': stock_code,
                 'analysis_type': analysis_type,
-                'ai_provider': ai_provider
+                'ai_provider': ai_provider,
+                'queue_position': queue_position
             },
             message=f"已提交 {stock_code} 的分析任务，请稍后查看结果"
         )
@@ -281,20 +286,24 @@ def batch_analyze():
         analysis_service = AnalysisService(db.session)
         
         # 创建批量分析任务
-        task_id = analysis_service.create_batch_analysis_task(
-            user_id=user_id,
-            user_email=user_email,
-            stocks=stocks,
-            analysis_type=analysis_type,
-            ai_provider=ai_provider,
-            ai_model=ai_model
-        )
+        try:
+            task_id = analysis_service.create_batch_analysis_task(
+                user_id=user_id,
+                user_email=user_email,
+                stocks=stocks,
+                analysis_type=analysis_type,
+                ai_provider=ai_provider,
+                ai_model=ai_model
+            )
+        except ExecutorFullError as e:
+            return jsonify({'success': False, 'message': str(e)}), 429
         
         return jsonify({
             'success': True,
             'message': '批量分析任务已提交',
             'task_id': task_id,
-            'stocks_count': len(stocks)
+            'stocks_count': len(stocks),
+            'queue_position': analysis_service.get_task_queue_position(task_id)
         })
         
     except Exception as e:
@@ -312,19 +321,18 @@ def get_task_status(task_id):
         
         # 管理员可以查看所有任务，普通用户只能查看自己的任务
         if is_admin:
-            # 管理员直接读取任务文件，不检查用户权限
-            task_file = os.path.join(analysis_service.reports_dir, f"{task_id}.task.json")
-            if not os.path.exists(task_file):
+            # 管理员直接读取任务记录，不检查用户权限
+            task_data = analysis_service.get_task_status(task_id)
+            if not task_data:
                 return jsonify({'success': False, 'message': '任务不存在'}), 404
-            
-            with open(task_file, 'r', encoding='utf-8') as f:
-                task_data = json.load(f)
         else:
             # 普通用户使用原有的权限检查方法
             task_data = analysis_service.get_task_status(task_id, user_id)
             if not task_data:
                 return jsonify({'success': False, 'message': '任务不存在或无权限访问'}), 404
         
+        task_data['queue_position'] = analysis_service.get_task_queue_position(task_id)
+        
         return jsonify({
             'success': True,
             'task': task_data
@@ -334,6 +342,36 @@ def get_task_status(task_id):
         logger.error(f"获取任务状态失败: {str(e)}")
         return jsonify({'success': False, 'message': f'获取任务状态失败: {str(e)}'}), 500
 
+@analysis_api_bp.route('/task-stream/<task_id>', methods=['GET'])
+@login_required
+def stream_task(task_id):
+    """实时查看任务进度和正在生成的报告内容（Server-Sent Events）"""
+    user_id = session.get('user_id')
+    is_admin = session.get('is_admin', False)
+    analysis_service = AnalysisService(db.session)
+    
+    # 管理员可以查看所有任务，普通用户只能查看自己的任务
+    task_data = analysis_service.get_task_status(task_id, None if is_admin else user_id)
+    if not task_data:
+        return jsonify({'success': False, 'message': '任务不存在或无权限访问'}), 404
+    
+    def generate():
+        try:
+            for event, data in analysis_service.iter_task_events(task_id):
+                if event is None:
+                    yield ': keep-alive\n\n'
+                else:
+                    yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            logger.error(f"实时查看任务失败: {task_id}, 错误: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'message': str(e)}, ensure_ascii=False)}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @analysis_api_bp.route('/tasks', methods=['GET'])
 @login_required
 def get_user_tasks():
@@ -371,30 +409,11 @@ def retry_task(task_id):
         if task_data.get('status') != 'failed':
             return jsonify({'success': False, 'message': '只有失败的任务才能重试'}), 400
         
-        # 重置任务状态
-        task_data['status'] = 'pending'
-        task_data['retry_count'] = 0
-        task_data['retry_history'] = []
-        task_data['failed_stocks'] = []
-        task_data['completed_count'] = 0
-        task_data['failed_count'] = 0
-        task_data['started_at'] = None
-        task_data['completed_at'] = None
-        task_data['failed_at'] = None
-        task_data['final_error'] = None
-        
-        # 保存更新后的任务数据
-        task_file = os.path.join(analysis_service.reports_dir, f"{task_id}.task.json")
-        with open(task_file, 'w', encoding='utf-8') as f:
-            json.dump(task_data, f, ensure_ascii=False, indent=2)
-        
-        # 重新启动任务
-        if task_data.get('task_id', '').startswith('single_'):
-            # 单个分析任务
-            analysis_service._retry_single_task(task_data)
-        else:
-            # 批量分析任务
-            analysis_service._retry_batch_task(task_data)
+        # 重置任务状态并重新启动任务
+        try:
+            analysis_service.retry_task(task_id)
+        except ExecutorFullError as e:
+            return jsonify({'success': False, 'message': str(e)}), 429
         
         return jsonify({
             'success': True,
@@ -50,6 +50,89 @@ class Config:
     ADMIN_EMAIL = os.getenv('ADMIN_EMAIL', 'admin@equitycompass.com')
     ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'admin123456')
     ADMIN_NICKNAME = os.getenv('ADMIN_NICKNAME', '系统管理员')
+    
+    # 分析任务执行器（工作线程数、排队上限）
+    ANALYSIS_MAX_WORKERS = int(os.getenv('ANALYSIS_MAX_WORKERS', '3'))
+    ANALYSIS_MAX_QUEUED = int(os.getenv('ANALYSIS_MAX_QUEUED', '50'))
+    ANALYSIS_MAX_QUEUED_PER_USER = int(os.getenv('ANALYSIS_MAX_QUEUED_PER_USER', '5'))
+    # 任务执行租约：执行进程定期续租，租约过期的未完成任务由其他进程接管恢复
+    ANALYSIS_TASK_LEASE_SECONDS = int(os.getenv('ANALYSIS_TASK_LEASE_SECONDS', '300'))
+    ANALYSIS_RECOVER_INTERRUPTED_TASKS = os.getenv('ANALYSIS_RECOVER_INTERRUPTED_TASKS', 'true').lower() == 'true'
+    # 任务历史保留策略（只清理已结束的任务）
+    TASK_HISTORY_RETENTION_DAYS = int(os.getenv('TASK_HISTORY_RETENTION_DAYS', '90'))
+    TASK_HISTORY_MAX_PER_USER = int(os.getenv('TASK_HISTORY_MAX_PER_USER', '200'))
+    
+    # AI提供商节流（同时进行的分析数量、相邻请求的最小启动间隔秒数）
+    ANALYSIS_PROVIDER_CONCURRENCY = {'qwen': 2, 'deepseek': 3, 'gemini': 4}
+    ANALYSIS_PROVIDER_MIN_INTERVAL = {'qwen': 2.0, 'deepseek': 1.0, 'gemini': 0.5}
+    ANALYSIS_PROVIDER_DEFAULT_CONCURRENCY = int(os.getenv('ANALYSIS_PROVIDER_DEFAULT_CONCURRENCY', '2'))
+    ANALYSIS_PROVIDER_DEFAULT_MIN_INTERVAL = float(os.getenv('ANALYSIS_PROVIDER_DEFAULT_MIN_INTERVAL', '2'))
+    
+    # AI提供商客户端限流（每分钟请求数rpm、每分钟Token数tpm），键为提供商或“提供商:模型”
+    # 存储文件供同一台机器上的多个worker共享额度，为空时只在进程内限流
+    ANALYSIS_PROVIDER_RATE_LIMITS = {
+        'qwen': {'rpm': 60, 'tpm': 1000000},
+        'deepseek': {'rpm': 60, 'tpm': 1000000},
+        'gemini': {'rpm': 15, 'tpm': 1000000}
+    }
+    ANALYSIS_RATE_LIMIT_STORE = os.getenv('ANALYSIS_RATE_LIMIT_STORE', 'data/rate_limits.db')
+    
+    # AI提供商熔断：连续失败次数阈值、熔断秒数；熔断时按优先顺序切换到其他激活的提供商
+    ANALYSIS_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('ANALYSIS_CIRCUIT_FAILURE_THRESHOLD', '3'))
+    ANALYSIS_CIRCUIT_RESET_SECONDS = float(os.getenv('ANALYSIS_CIRCUIT_RESET_SECONDS', '120'))
+    ANALYSIS_CIRCUIT_TRIP_ERRORS = ['network_error', 'timeout_error', 'rate_limit_error', 'authentication_error']
+    ANALYSIS_PROVIDER_FAILOVER_ORDER = os.getenv('ANALYSIS_PROVIDER_FAILOVER_ORDER', 'qwen,deepseek,gemini').split(',')
+    
+    # 分析重试预算：每只股票的墙钟截止秒数和重试次数上限（任务、Provider各层共用），以及每个任务的总重试次数
+    ANALYSIS_STOCK_DEADLINE_SECONDS = float(os.getenv('ANALYSIS_STOCK_DEADLINE_SECONDS', '1800'))
+    ANALYSIS_STOCK_MAX_RETRIES = int(os.getenv('ANALYSIS_STOCK_MAX_RETRIES', '5'))
+    ANALYSIS_TASK_RETRY_BUDGET = int(os.getenv('ANALYSIS_TASK_RETRY_BUDGET', '50'))
+    
+    # 流式生成：生成中的报告写入部分报告文件供实时查看（SSE轮询间隔秒数），全部重试失败时超过最小长度的部分内容保存为报告
+    ANALYSIS_STREAM_REPORTS = os.getenv('ANALYSIS_STREAM_REPORTS', 'true').lower() == 'true'
+    ANALYSIS_STREAM_POLL_INTERVAL = float(os.getenv('ANALYSIS_STREAM_POLL_INTERVAL', '0.5'))
+    ANALYSIS_PARTIAL_REPORT_MIN_CHARS = int(os.getenv('ANALYSIS_PARTIAL_REPORT_MIN_CHARS', '1000'))
+    
+    # 分析结果缓存（默认关闭）：相同模型、提示词和分析日期的请求复用结果，同时进行的相同请求只生成一次
+    ANALYSIS_RESPONSE_CACHE_ENABLED = os.getenv('ANALYSIS_RESPONSE_CACHE_ENABLED', 'false').lower() == 'true'
+    ANALYSIS_RESPONSE_CACHE_TTL_SECONDS = float(os.getenv('ANALYSIS_RESPONSE_CACHE_TTL_SECONDS', '21600'))
+    ANALYSIS_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('ANALYSIS_RESPONSE_CACHE_MAX_ENTRIES', '100'))
+    ANALYSIS_RESPONSE_CACHE_MAX_BYTES = int(os.getenv('ANALYSIS_RESPONSE_CACHE_MAX_BYTES', str(20 * 1024 * 1024)))
+    
+    # 请求对冲（默认关闭）：请求超过同模型首字节耗时的p95（样本不足时用默认阈值）仍未返回时，
+    # 向AI配置高级参数 hedge_group 相同的另一个配置发送同样的请求；对冲请求数不超过请求总数的 MAX_RATIO
+    ANALYSIS_HEDGE_ENABLED = os.getenv('ANALYSIS_HEDGE_ENABLED', 'false').lower() == 'true'
+    ANALYSIS_HEDGE_PERCENTILE = float(os.getenv('ANALYSIS_HEDGE_PERCENTILE', '0.95'))
+    ANALYSIS_HEDGE_MIN_SAMPLES = int(os.getenv('ANALYSIS_HEDGE_MIN_SAMPLES', '20'))
+    ANALYSIS_HEDGE_DEFAULT_DELAY = float(os.getenv('ANALYSIS_HEDGE_DEFAULT_DELAY', '60'))
+    ANALYSIS_HEDGE_MIN_DELAY = float(os.getenv('ANALYSIS_HEDGE_MIN_DELAY', '5'))
+    ANALYSIS_HEDGE_MAX_RATIO = float(os.getenv('ANALYSIS_HEDGE_MAX_RATIO', '0.1'))
+    
+    # AI调用指标：时间桶长度和保留时长（秒）；Prometheus抓取令牌，为空时指标接口只允许超级管理员访问
+    LLM_METRICS_BUCKET_SECONDS = int(os.getenv('LLM_METRICS_BUCKET_SECONDS', '60'))
+    LLM_METRICS_RETENTION_SECONDS = int(os.getenv('LLM_METRICS_RETENTION_SECONDS', '86400'))
+    METRICS_AUTH_TOKEN = os.getenv('METRICS_AUTH_TOKEN')
+    
+    # 股票基础信息缓存：名称、市场、行业等在进程内缓存的秒数，过期后整表重新加载
+    STOCK_METADATA_CACHE_SECONDS = int(os.getenv('STOCK_METADATA_CACHE_SECONDS', '600'))
+    
+    # 股票行情获取：同时请求所有数据源并取最先返回的有效数据；总时限（秒）；
+    # 收到有效数据后等待更高优先级数据源的秒数；进程内所有并发请求共用的线程数
+    STOCK_DATA_CONCURRENT_FETCH = os.getenv('STOCK_DATA_CONCURRENT_FETCH', 'true').lower() == 'true'
+    STOCK_DATA_FETCH_DEADLINE_SECONDS = float(os.getenv('STOCK_DATA_FETCH_DEADLINE_SECONDS', '15'))
+    STOCK_DATA_PRIORITY_GRACE_SECONDS = float(os.getenv('STOCK_DATA_PRIORITY_GRACE_SECONDS', '0.5'))
+    STOCK_DATA_FETCH_WORKERS = int(os.getenv('STOCK_DATA_FETCH_WORKERS', '16'))
+    
+    # 股票行情缓存：最多缓存的股票数；开盘期间和收盘后的有效期（秒）；过期后仍直接返回并在后台刷新的秒数
+    QUOTE_CACHE_MAX_ENTRIES = int(os.getenv('QUOTE_CACHE_MAX_ENTRIES', '1000'))
+    QUOTE_CACHE_TTL_SECONDS = float(os.getenv('QUOTE_CACHE_TTL_SECONDS', '300'))
+    QUOTE_CACHE_CLOSED_TTL_SECONDS = float(os.getenv('QUOTE_CACHE_CLOSED_TTL_SECONDS', '3600'))
+    QUOTE_CACHE_STALE_SECONDS = float(os.getenv('QUOTE_CACHE_STALE_SECONDS', '300'))
+    
+    # 行情共享缓存文件（如 data/quote_cache.db）：同一台机器上的多个worker共享行情和数据源请求次数，为空时只在进程内缓存；
+    # 其他进程正在获取同一股票时最多等待的秒数
+    QUOTE_CACHE_SHARED_STORE = os.getenv('QUOTE_CACHE_SHARED_STORE', '')
+    QUOTE_CACHE_SHARED_WAIT_SECONDS = float(os.getenv('QUOTE_CACHE_SHARED_WAIT_SECONDS', '15'))
 
 
 class DevelopmentConfig(Config):
@@ -69,3 +152,9 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    
+    # 测试环境不自动恢复中断的分析任务
+    ANALYSIS_RECOVER_INTERRUPTED_TASKS = False
+    
+    # 测试环境只在进程内限流
+    ANALYSIS_RATE_LIMIT_STORE = None
@@ -3,7 +3,7 @@
 """
 from .user import User, UserPlan
 from .stock import Stock, UserWatchlist
-from .analysis import AnalysisTask, PromptTemplate, ReportIndex, ReportStatistics, ReportViewLog, ReportDownloadLog
+from .analysis import AnalysisTask, TaskRecord, TaskStockStatus, PromptTemplate, ReportIndex, ReportCounter, ReportStatistics, ReportViewLog, ReportDownloadLog
 from .email import EmailSubscription
 from .payment import PaymentTransaction
 from .admin import Admin, SystemConfig
@@ -14,8 +14,11 @@ __all__ = [
     'Stock',
     'UserWatchlist',
     'AnalysisTask',
+    'TaskRecord',
+    'TaskStockStatus',
     'PromptTemplate',
     'ReportIndex',
+    'ReportCounter',
     'ReportStatistics',
     'ReportViewLog',
     'ReportDownloadLog',
@@ -4,6 +4,7 @@ AI模型配置数据模型
 from app import db
 from datetime import datetime
 from sqlalchemy import JSON
+from sqlalchemy.orm.attributes import flag_modified
 
 
 class AIConfig(db.Model):
@@ -95,6 +96,8 @@ class AIConfig(db.Model):
         else:
             self.failed_requests += 1
         self.last_used_at = datetime.utcnow()
+        # 使用统计不算配置变更，保持更新时间不变（Provider实例缓存以此判断配置版本）
+        flag_modified(self, 'updated_at')
         db.session.commit()
     
     @staticmethod
@@ -45,6 +45,143 @@ class AnalysisTask(db.Model):
         }
 
 
+class TaskRecord(db.Model):
+    """分析任务记录表（单个/批量分析任务的状态和进度）"""
+    __tablename__ = 'task_records'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    task_id = db.Column(db.String(100), unique=True, nullable=False, comment='任务ID')
+    task_type = db.Column(db.String(20), nullable=False, comment='任务类型 single/batch')
+    user_id = db.Column(db.BigInteger, nullable=False, comment='用户ID')
+    user_email = db.Column(db.String(255), comment='用户邮箱')
+    stock_code = db.Column(db.String(20), comment='股票代码（单个分析任务）')
+    stocks = db.Column(db.JSON, comment='股票列表（批量分析任务）')
+    analysis_type = db.Column(db.String(50), comment='分析类型')
+    ai_provider = db.Column(db.String(50), comment='AI提供商')
+    ai_model = db.Column(db.String(100), comment='AI模型')
+    prompt_id = db.Column(db.Integer, comment='提示词ID')
+    status = db.Column(db.String(20), nullable=False, default='pending', comment='pending/running/paused/completed/failed/stopped')
+    total_count = db.Column(db.Integer, default=0, comment='股票总数')
+    completed_count = db.Column(db.Integer, default=0, comment='成功数量')
+    failed_count = db.Column(db.Integer, default=0, comment='失败数量')
+    progress = db.Column(db.Float, default=0, comment='进度百分比')
+    retry_count = db.Column(db.Integer, default=0, comment='重试次数')
+    max_retries = db.Column(db.Integer, default=5, comment='最大重试次数')
+    retry_history = db.Column(db.JSON, comment='重试历史')
+    error = db.Column(db.Text, comment='错误信息')
+    final_error = db.Column(db.Text, comment='最终错误信息')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    paused_at = db.Column(db.DateTime)
+    resumed_at = db.Column(db.DateTime)
+    stopped_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+    failed_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # 断点恢复：金币只扣一次；执行进程定期续租，租约过期的未完成任务由其他进程接管
+    coins_charged = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false(), comment='是否已扣除金币')
+    lease_owner = db.Column(db.String(100), comment='执行任务的进程标识')
+    lease_expires_at = db.Column(db.DateTime, comment='执行租约过期时间')
+    
+    # 关系
+    stock_statuses = db.relationship('TaskStockStatus', backref='task', lazy='selectin',
+                                     cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.Index('ix_task_records_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_task_records_status_created_at', 'status', 'created_at'),
+    )
+    
+    def __repr__(self):
+        return f'<TaskRecord {self.task_id}:{self.status}>'
+    
+    def to_dict(self):
+        """转换为字典（与原任务文件结构一致）"""
+        def _iso(value):
+            return value.isoformat() + 'Z' if value else None
+        
+        stock_names = {stock.get('code'): stock.get('name', '') for stock in (self.stocks or [])}
+        stock_status = {}
+        failed_stocks = []
+        for item in self.stock_statuses:
+            stock_status[item.stock_code] = item.to_dict()
+            if item.status == 'failed':
+                failed_stocks.append({
+                    'code': item.stock_code,
+                    'name': stock_names.get(item.stock_code, ''),
+                    'error': item.error,
+                    'retry_count': item.retry_count
+                })
+        
+        data = {
+            'task_id': self.task_id,
+            'task_type': self.task_type,
+            'user_id': self.user_id,
+            'analysis_type': self.analysis_type,
+            'ai_provider': self.ai_provider,
+            'ai_model': self.ai_model,
+            'prompt_id': self.prompt_id,
+            'status': self.status,
+            'total_count': self.total_count,
+            'completed_count': self.completed_count,
+            'failed_count': self.failed_count,
+            'progress': self.progress,
+            'retry_count': self.retry_count,
+            'max_retries': self.max_retries,
+            'retry_history': self.retry_history or [],
+            'error': self.error,
+            'final_error': self.final_error,
+            'created_at': _iso(self.created_at),
+            'started_at': _iso(self.started_at),
+            'paused_at': _iso(self.paused_at),
+            'resumed_at': _iso(self.resumed_at),
+            'stopped_at': _iso(self.stopped_at),
+            'completed_at': _iso(self.completed_at),
+            'failed_at': _iso(self.failed_at),
+            'updated_at': _iso(self.updated_at)
+        }
+        if self.task_type == 'batch':
+            data.update({
+                'user_email': self.user_email,
+                'stocks': self.stocks or [],
+                'stock_status': stock_status,
+                'failed_stocks': failed_stocks
+            })
+        else:
+            data['stock_code'] = self.stock_code
+        return data
+
+
+class TaskStockStatus(db.Model):
+    """任务中单只股票的分析状态"""
+    __tablename__ = 'task_stock_status'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    task_id = db.Column(db.String(100), db.ForeignKey('task_records.task_id', ondelete='CASCADE'), nullable=False)
+    stock_code = db.Column(db.String(20), nullable=False, comment='股票代码')
+    status = db.Column(db.String(20), nullable=False, comment='completed/failed')
+    retry_count = db.Column(db.Integer, default=0, comment='重试次数')
+    error = db.Column(db.Text, comment='错误信息')
+    completed_at = db.Column(db.DateTime)
+    failed_at = db.Column(db.DateTime)
+    
+    __table_args__ = (db.UniqueConstraint('task_id', 'stock_code'),)
+    
+    def __repr__(self):
+        return f'<TaskStockStatus {self.task_id}:{self.stock_code}:{self.status}>'
+    
+    def to_dict(self):
+        """转换为字典"""
+        data = {'status': self.status, 'retry_count': self.retry_count}
+        if self.status == 'completed':
+            data['completed_at'] = self.completed_at.isoformat() + 'Z' if self.completed_at else None
+        else:
+            data['error'] = self.error
+            data['failed_at'] = self.failed_at.isoformat() + 'Z' if self.failed_at else None
+        return data
+
+
 class PromptTemplate(db.Model):
     """Prompt模板表"""
     __tablename__ = 'prompt_templates'
@@ -89,11 +226,28 @@ class ReportIndex(db.Model):
     generated_at = db.Column(db.DateTime, default=datetime.utcnow)
     generated_by_task_id = db.Column(db.BigInteger, db.ForeignKey('analysis_tasks.id'))
     
+    # 报告目录元数据（列表页直接从索引表读取，无需打开报告文件）
+    report_id = db.Column(db.String(100), index=True, comment='报告ID，格式: 股票代码_时间戳')
+    stock_code = db.Column(db.String(20), index=True, comment='股票代码')
+    stock_name = db.Column(db.String(200), comment='股票名称')
+    provider = db.Column(db.String(50), comment='AI提供商')
+    ai_model = db.Column(db.String(100), comment='AI模型')
+    analysis_type = db.Column(db.String(50), comment='分析类型 fundamental/technical')
+    task_id = db.Column(db.String(100), index=True, comment='生成报告的分析任务ID')
+    is_partial = db.Column(db.Boolean, default=False, nullable=False, comment='是否为生成中断后保存的部分报告')
+    
     # 关系
     statistics = db.relationship('ReportStatistics', backref='report', uselist=False)
     
     # 移除唯一约束，允许同一股票同一天有多个报告
     # __table_args__ = (db.UniqueConstraint('stock_id', 'analysis_date'),)
+    # 列表页按生成时间倒序分页，筛选条件与排序字段组成复合索引
+    __table_args__ = (
+        db.Index('ix_report_index_generated_at_id', 'generated_at', 'id'),
+        db.Index('ix_report_index_stock_code_generated_at', 'stock_code', 'generated_at'),
+        db.Index('ix_report_index_provider_generated_at', 'provider', 'generated_at'),
+        db.Index('ix_report_index_analysis_type_generated_at', 'analysis_type', 'generated_at'),
+    )
     
     def __repr__(self):
         return f'<ReportIndex {self.stock_id}:{self.analysis_date}>'
@@ -106,11 +260,32 @@ class ReportIndex(db.Model):
             'file_path': self.file_path,
             'summary': self.summary,
             'generated_at': self.generated_at.isoformat() if self.generated_at else None,
+            'report_id': self.report_id,
+            'stock_code': self.stock_code,
+            'stock_name': self.stock_name,
+            'provider': self.provider,
+            'ai_model': self.ai_model,
+            'analysis_type': self.analysis_type,
             'stock': self.stock.to_dict() if self.stock else None,
             'statistics': self.statistics.to_dict() if self.statistics else None
         }
 
 
+class ReportCounter(db.Model):
+    """报告计数表（按股票计数，保存/删除报告时增量维护）"""
+    __tablename__ = 'report_counters'
+    
+    # 全局计数使用的特殊键
+    GLOBAL_KEY = '*'
+    
+    stock_code = db.Column(db.String(20), primary_key=True, comment='股票代码，* 表示全局')
+    report_count = db.Column(db.Integer, nullable=False, default=0, comment='报告数量')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ReportCounter {self.stock_code}:{self.report_count}>'
+
+
 class ReportStatistics(db.Model):
     """报告统计表"""
     __tablename__ = 'report_statistics'
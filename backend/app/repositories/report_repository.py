@@ -0,0 +1,178 @@
+"""
+报告索引数据访问层
+"""
+from typing import Optional, List, Tuple
+from datetime import date, datetime
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.repositories.base import SQLAlchemyRepository
+from app.models.analysis import ReportIndex, ReportCounter, ReportStatistics, ReportViewLog, ReportDownloadLog
+
+
+class ReportIndexRepository(SQLAlchemyRepository):
+    """报告索引（报告目录）数据访问接口"""
+
+    def __init__(self, session: Session):
+        super().__init__(ReportIndex, session)
+
+    def get_by_report_id(self, report_id: str) -> Optional[ReportIndex]:
+        """根据报告ID获取索引记录"""
+        return self.session.query(ReportIndex).filter(
+            ReportIndex.report_id == report_id
+        ).first()
+
+    def get_latest_for_stock(self, stock_code: str, start: datetime, end: datetime) -> Optional[ReportIndex]:
+        """获取股票在指定时间范围内最新生成的报告"""
+        return self.session.query(ReportIndex).filter(
+            ReportIndex.stock_code == stock_code,
+            ReportIndex.generated_at >= start,
+            ReportIndex.generated_at < end
+        ).order_by(ReportIndex.generated_at.desc()).first()
+
+    def get_complete_for_task(self, task_id: str, stock_code: str) -> Optional[ReportIndex]:
+        """获取任务为股票生成的完整报告（不含部分报告）"""
+        return self.session.query(ReportIndex).filter(
+            ReportIndex.task_id == task_id,
+            ReportIndex.stock_code == stock_code,
+            ReportIndex.is_partial.is_(False)
+        ).order_by(ReportIndex.generated_at.desc()).first()
+
+    def list_for_task(self, task_id: str) -> List[ReportIndex]:
+        """获取任务生成的全部报告（包括部分报告）"""
+        return self.session.query(ReportIndex).filter(ReportIndex.task_id == task_id).all()
+
+    def _build_query(self, stock_code: str = None, stock_codes: List[str] = None,
+                     provider: str = None, analysis_type: str = None,
+                     analysis_date: date = None, generated_from: datetime = None,
+                     generated_to: datetime = None):
+        """构建带过滤条件的查询"""
+        query = self.session.query(ReportIndex).filter(ReportIndex.report_id.isnot(None))
+
+        if stock_code:
+            query = query.filter(ReportIndex.stock_code == stock_code)
+        if stock_codes is not None:
+            query = query.filter(ReportIndex.stock_code.in_(stock_codes))
+        if provider:
+            query = query.filter(ReportIndex.provider == provider)
+        if analysis_type:
+            query = query.filter(ReportIndex.analysis_type == analysis_type)
+        if analysis_date:
+            query = query.filter(ReportIndex.analysis_date == analysis_date)
+        if generated_from:
+            query = query.filter(ReportIndex.generated_at >= generated_from)
+        if generated_to:
+            query = query.filter(ReportIndex.generated_at < generated_to)
+
+        return query
+
+    def list_reports(self, limit: int = 20, offset: int = 0, **filters) -> List[ReportIndex]:
+        """按生成时间倒序分页获取报告索引"""
+        return self._build_query(**filters).order_by(
+            ReportIndex.generated_at.desc(), ReportIndex.id.desc()
+        ).offset(offset).limit(limit).all()
+
+    def count_reports(self, **filters) -> int:
+        """统计符合条件的报告数量"""
+        return self._build_query(**filters).count()
+
+    def list_report_stocks(self) -> List[Tuple[str, str]]:
+        """获取有报告的股票代码和名称"""
+        return self.session.query(ReportIndex.stock_code, func.max(ReportIndex.stock_name)).filter(
+            ReportIndex.report_id.isnot(None)
+        ).group_by(ReportIndex.stock_code).order_by(ReportIndex.stock_code).all()
+
+    def delete_by_report_id(self, report_id: str) -> bool:
+        """删除报告索引及其统计记录"""
+        report = self.get_by_report_id(report_id)
+        if not report:
+            return False
+
+        self.session.query(ReportViewLog).filter(ReportViewLog.report_id == report.id).delete()
+        self.session.query(ReportDownloadLog).filter(ReportDownloadLog.report_id == report.id).delete()
+        self.session.query(ReportStatistics).filter(ReportStatistics.report_id == report.id).delete()
+        self.session.delete(report)
+        self.session.commit()
+        ReportCounterRepository(self.session).increment(report.stock_code, -1)
+        return True
+
+
+class ReportCounterRepository:
+    """报告计数数据访问接口"""
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    def increment(self, stock_code: str, delta: int = 1) -> None:
+        """增减股票和全局报告计数"""
+        if not self._is_initialized():
+            # 尚未初始化时不做增量，首次读取时统一重建
+            return
+
+        keys = [ReportCounter.GLOBAL_KEY]
+        if stock_code:
+            keys.append(stock_code)
+
+        try:
+            self._apply(keys, delta)
+            self.session.commit()
+        except IntegrityError:
+            # 其他进程同时插入了同一股票的计数行，重试一次即可走更新分支
+            self.session.rollback()
+            self._apply(keys, delta)
+            self.session.commit()
+
+    def _apply(self, keys: List[str], delta: int) -> None:
+        """原子地更新计数行，不存在时插入"""
+        for key in keys:
+            updated = self.session.query(ReportCounter).filter(
+                ReportCounter.stock_code == key
+            ).update({
+                ReportCounter.report_count: ReportCounter.report_count + delta,
+                ReportCounter.updated_at: datetime.utcnow()
+            }, synchronize_session=False)
+            if not updated and delta > 0:
+                self.session.add(ReportCounter(stock_code=key, report_count=delta))
+                self.session.flush()
+
+    def get_global_count(self) -> int:
+        """获取全局报告数量"""
+        self.ensure_initialized()
+        counter = self.session.get(ReportCounter, ReportCounter.GLOBAL_KEY)
+        return counter.report_count if counter else 0
+
+    def get_count_for_stocks(self, stock_codes: List[str]) -> int:
+        """获取多只股票的报告数量之和"""
+        if not stock_codes:
+            return 0
+        self.ensure_initialized()
+        total = self.session.query(func.sum(ReportCounter.report_count)).filter(
+            ReportCounter.stock_code.in_(stock_codes)
+        ).scalar()
+        return total or 0
+
+    def ensure_initialized(self) -> None:
+        """计数表为空时从报告索引重建"""
+        if not self._is_initialized():
+            self.rebuild()
+
+    def rebuild(self) -> None:
+        """从报告索引一次聚合查询重建全部计数"""
+        rows = self.session.query(ReportIndex.stock_code, func.count(ReportIndex.id)).filter(
+            ReportIndex.report_id.isnot(None)
+        ).group_by(ReportIndex.stock_code).all()
+
+        self.session.query(ReportCounter).delete()
+        counters = [ReportCounter(stock_code=code, report_count=count) for code, count in rows if code]
+        counters.append(ReportCounter(
+            stock_code=ReportCounter.GLOBAL_KEY,
+            report_count=sum(count for _, count in rows)
+        ))
+        self.session.add_all(counters)
+        self.session.commit()
+
+    def _is_initialized(self) -> bool:
+        """全局计数行存在即视为已初始化"""
+        return self.session.query(ReportCounter.stock_code).filter(
+            ReportCounter.stock_code == ReportCounter.GLOBAL_KEY
+        ).first() is not None
@@ -0,0 +1,204 @@
+"""
+分析任务数据访问层
+"""
+from typing import Optional, List, Dict, Any
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.repositories.base import SQLAlchemyRepository
+from app.models.analysis import TaskRecord, TaskStockStatus
+
+# 已结束的任务状态，历史清理只处理这些任务
+FINISHED_STATUSES = ('completed', 'failed', 'stopped')
+
+# 未结束且需要执行进程持有租约的任务状态（暂停的任务不会自动恢复）
+RESUMABLE_STATUSES = ('pending', 'running')
+
+
+class TaskRepository(SQLAlchemyRepository):
+    """分析任务数据访问接口"""
+
+    def __init__(self, session: Session):
+        super().__init__(TaskRecord, session)
+
+    def get_by_task_id(self, task_id: str) -> Optional[TaskRecord]:
+        """根据任务ID获取任务"""
+        return self.session.query(TaskRecord).filter(TaskRecord.task_id == task_id).first()
+
+    def list_tasks(self, user_id: int = None, status: str = None,
+                   limit: int = 20, offset: int = 0) -> List[TaskRecord]:
+        """按创建时间倒序分页获取任务"""
+        return self._build_query(user_id, status).order_by(
+            TaskRecord.created_at.desc(), TaskRecord.id.desc()
+        ).offset(offset).limit(limit).all()
+
+    def count_tasks(self, user_id: int = None, status: str = None) -> int:
+        """统计任务数量"""
+        return self._build_query(user_id, status).count()
+
+    def _build_query(self, user_id: int = None, status: str = None):
+        """构建带过滤条件的查询"""
+        query = self.session.query(TaskRecord)
+        if user_id is not None:
+            query = query.filter(TaskRecord.user_id == user_id)
+        if status:
+            query = query.filter(TaskRecord.status == status)
+        return query
+
+    def update_fields(self, task_id: str, **fields) -> bool:
+        """原子地更新任务的部分字段"""
+        fields['updated_at'] = datetime.utcnow()
+        updated = self.session.query(TaskRecord).filter(
+            TaskRecord.task_id == task_id
+        ).update(fields, synchronize_session=False)
+        self.session.commit()
+        self.session.expire_all()
+        return updated > 0
+
+    def record_stock_result(self, task_id: str, stock_code: str, status: str,
+                            retry_count: int = 0, error: str = None) -> None:
+        """记录单只股票的分析结果，并原子地累加任务计数和进度"""
+        now = datetime.utcnow()
+        item = self._get_stock_status(task_id, stock_code)
+        previous_status = item.status if item else None
+
+        if not item:
+            try:
+                # 在保存点中插入，冲突时只回滚这次插入，不影响会话中的其他修改
+                with self.session.begin_nested():
+                    item = TaskStockStatus(task_id=task_id, stock_code=stock_code, status=status)
+                    self.session.add(item)
+            except IntegrityError:
+                # 其他线程同时写入了该股票的状态，重新查询后按更新处理
+                item = self._get_stock_status(task_id, stock_code)
+                previous_status = item.status
+        item.status = status
+        item.retry_count = retry_count
+        item.error = error
+        item.completed_at = now if status == 'completed' else None
+        item.failed_at = now if status == 'failed' else None
+
+        # 同一股票重复记录时只调整计数差值
+        completed_delta = int(status == 'completed') - int(previous_status == 'completed')
+        failed_delta = int(status == 'failed') - int(previous_status == 'failed')
+        total_count = self.session.query(TaskRecord.total_count).filter(
+            TaskRecord.task_id == task_id
+        ).scalar() or 1
+
+        self.session.query(TaskRecord).filter(TaskRecord.task_id == task_id).update({
+            TaskRecord.completed_count: TaskRecord.completed_count + completed_delta,
+            TaskRecord.failed_count: TaskRecord.failed_count + failed_delta,
+            TaskRecord.progress: (TaskRecord.completed_count + TaskRecord.failed_count
+                                  + completed_delta + failed_delta) * 100.0 / total_count,
+            TaskRecord.updated_at: now
+        }, synchronize_session=False)
+
+        self.session.commit()
+        self.session.expire_all()
+
+    def _get_stock_status(self, task_id: str, stock_code: str) -> Optional[TaskStockStatus]:
+        """获取任务中单只股票的状态记录"""
+        return self.session.query(TaskStockStatus).filter(
+            TaskStockStatus.task_id == task_id,
+            TaskStockStatus.stock_code == stock_code
+        ).first()
+
+    def append_retry(self, task_id: str, record: Dict[str, Any]) -> None:
+        """追加一条重试记录"""
+        task = self.get_by_task_id(task_id)
+        if not task:
+            return
+        task.retry_history = (task.retry_history or []) + [record]
+        task.retry_count = record.get('attempt', (task.retry_count or 0) + 1)
+        task.updated_at = datetime.utcnow()
+        self.session.commit()
+
+    def reset_for_retry(self, task_id: str, **fields) -> None:
+        """重置任务状态，用于手动重试（fields 为需要同时写入的字段，如执行租约）"""
+        self.session.query(TaskStockStatus).filter(TaskStockStatus.task_id == task_id).delete()
+        self.update_fields(
+            task_id, status='pending', retry_count=0, retry_history=[],
+            completed_count=0, failed_count=0, progress=0,
+            started_at=None, completed_at=None, failed_at=None, error=None, final_error=None,
+            **fields
+        )
+
+    def claim_coin_charge(self, task_id: str) -> bool:
+        """标记任务已扣除金币，返回False表示之前已经扣过（用于防止恢复任务时重复扣费）"""
+        updated = self.session.query(TaskRecord).filter(
+            TaskRecord.task_id == task_id,
+            TaskRecord.coins_charged.is_(False)
+        ).update({'coins_charged': True, 'updated_at': datetime.utcnow()}, synchronize_session=False)
+        self.session.commit()
+        return updated > 0
+
+    def release_coin_charge(self, task_id: str) -> None:
+        """扣费失败时撤销扣费标记"""
+        self.update_fields(task_id, coins_charged=False)
+
+    def renew_leases(self, task_ids: List[str], owner: str, expires_at: datetime) -> int:
+        """为本进程正在执行或排队的任务续租"""
+        if not task_ids:
+            return 0
+        updated = self.session.query(TaskRecord).filter(
+            TaskRecord.task_id.in_(task_ids),
+            TaskRecord.lease_owner == owner
+        ).update({'lease_expires_at': expires_at}, synchronize_session=False)
+        self.session.commit()
+        return updated
+
+    def list_interrupted(self, now: datetime, limit: int = 20) -> List[TaskRecord]:
+        """获取租约已过期的未完成任务（执行进程已退出）"""
+        return self.session.query(TaskRecord).filter(
+            TaskRecord.status.in_(RESUMABLE_STATUSES),
+            or_(TaskRecord.lease_expires_at.is_(None), TaskRecord.lease_expires_at < now)
+        ).order_by(TaskRecord.created_at).limit(limit).all()
+
+    def claim_lease(self, task_id: str, owner: str, expires_at: datetime, now: datetime) -> bool:
+        """原子地接管租约已过期的任务，多个进程同时接管时只有一个成功"""
+        updated = self.session.query(TaskRecord).filter(
+            TaskRecord.task_id == task_id,
+            TaskRecord.status.in_(RESUMABLE_STATUSES),
+            or_(TaskRecord.lease_expires_at.is_(None), TaskRecord.lease_expires_at < now)
+        ).update({'lease_owner': owner, 'lease_expires_at': expires_at}, synchronize_session=False)
+        self.session.commit()
+        return updated > 0
+
+    def delete_by_task_id(self, task_id: str) -> bool:
+        """删除任务及其股票状态"""
+        self.session.query(TaskStockStatus).filter(TaskStockStatus.task_id == task_id).delete()
+        deleted = self.session.query(TaskRecord).filter(TaskRecord.task_id == task_id).delete()
+        self.session.commit()
+        return deleted > 0
+
+    def purge_history(self, retention_days: int, max_per_user: int) -> int:
+        """清理已结束的历史任务：超过保留天数的任务，以及每个用户超出数量上限的旧任务"""
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+        expired = [row[0] for row in self.session.query(TaskRecord.task_id).filter(
+            TaskRecord.status.in_(FINISHED_STATUSES),
+            TaskRecord.created_at < cutoff
+        ).all()]
+
+        # 每个用户只保留最近 max_per_user 个已结束任务
+        overflow_users = self.session.query(TaskRecord.user_id).filter(
+            TaskRecord.status.in_(FINISHED_STATUSES)
+        ).group_by(TaskRecord.user_id).having(func.count(TaskRecord.id) > max_per_user).all()
+        for (user_id,) in overflow_users:
+            expired.extend(row[0] for row in self.session.query(TaskRecord.task_id).filter(
+                TaskRecord.user_id == user_id,
+                TaskRecord.status.in_(FINISHED_STATUSES)
+            ).order_by(TaskRecord.created_at.desc()).offset(max_per_user).all())
+
+        if not expired:
+            return 0
+
+        expired = list(set(expired))
+        self.session.query(TaskStockStatus).filter(
+            TaskStockStatus.task_id.in_(expired)
+        ).delete(synchronize_session=False)
+        self.session.query(TaskRecord).filter(
+            TaskRecord.task_id.in_(expired)
+        ).delete(synchronize_session=False)
+        self.session.commit()
+        return len(expired)
@@ -6,6 +6,10 @@ from typing import List, Dict, Any, Optional
 from sqlalchemy.orm import Session
 from app.repositories.ai_config_repository import AIConfigRepository
 from app.models.ai_config import AIConfig
+from app.services.ai.circuit_breaker import circuit_breaker
+from app.services.ai.hedging import request_hedger
+from app.services.ai.llm_metrics import llm_metrics
+from app.services.ai.llm_provider import LLMProviderFactory
 
 logger = logging.getLogger(__name__)
 
@@ -21,11 +25,41 @@ class AIConfigService:
         """获取所有AI配置"""
         try:
             configs = self.repo.get_all()
-            return [config.to_dict(include_sensitive=include_sensitive) for config in configs]
+            return [self._with_circuit_state(config.to_dict(include_sensitive=include_sensitive)) for config in configs]
         except Exception as e:
             logger.error(f"获取AI配置失败: {str(e)}")
             return []
     
+    def _with_circuit_state(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """附加提供商的熔断状态和切换次数"""
+        config['circuit_breaker'] = circuit_breaker.get_state(config['provider_name'])
+        return config
+    
+    def get_circuit_breaker_states(self) -> Dict[str, Dict[str, Any]]:
+        """获取所有配置的提供商熔断状态"""
+        return {config.provider_name: circuit_breaker.get_state(config.provider_name) for config in self.repo.get_all()}
+    
+    def reset_circuit_breaker(self, config_id: int) -> Optional[Dict[str, Any]]:
+        """手动恢复配置对应提供商的熔断状态"""
+        config = self.repo.get_by_id(config_id)
+        if not config:
+            return None
+        circuit_breaker.reset(config.provider_name)
+        logger.info(f"手动恢复提供商熔断: {config.provider_name}")
+        return circuit_breaker.get_state(config.provider_name)
+    
+    def get_hedging_stats(self) -> Dict[str, Any]:
+        """获取请求对冲统计（额外请求次数、胜出次数和估算的额外Token消耗）"""
+        return request_hedger.get_stats()
+    
+    def get_llm_metrics(self, window_seconds: int = 3600) -> Dict[str, Any]:
+        """获取时间窗口内各模型的调用指标（耗时分位数、直方图、重试率、每秒Token数）"""
+        return llm_metrics.summary(window_seconds)
+    
+    def get_prometheus_metrics(self) -> str:
+        """获取Prometheus文本格式的累计调用指标"""
+        return llm_metrics.render_prometheus()
+    
     def get_config_by_id(self, config_id: int, include_sensitive: bool = False) -> Optional[Dict[str, Any]]:
         """根据ID获取配置"""
         try:
@@ -105,6 +139,7 @@ class AIConfigService:
             
             # 更新配置
             updated_config = self.repo.update_config(config_id, config_data)
+            LLMProviderFactory.invalidate_cache(config_id)
             if updated_config:
                 logger.info(f"更新AI配置成功: {updated_config.provider_name}")
                 return {
@@ -132,6 +167,7 @@ class AIConfigService:
             
             provider_name = config.provider_name
             success = self.repo.delete_config(config_id)
+            LLMProviderFactory.invalidate_cache(config_id)
             
             if success:
                 logger.info(f"删除AI配置成功: {provider_name}")
@@ -158,6 +194,7 @@ class AIConfigService:
                     return {'success': False, 'error': '不能停用最后一个激活的配置'}
             
             updated_config = self.repo.toggle_active(config_id)
+            LLMProviderFactory.invalidate_cache(config_id)
             if updated_config:
                 status = '激活' if updated_config.is_active else '停用'
                 logger.info(f"{status}AI配置: {updated_config.provider_name}")
@@ -184,6 +221,7 @@ class AIConfigService:
                 return {'success': False, 'error': '不能设置非激活配置为默认'}
             
             success = self.repo.set_default_config(config_id)
+            LLMProviderFactory.invalidate_cache()
             if success:
                 logger.info(f"设置默认AI配置: {config.provider_name}")
                 return {'success': True, 'message': f'已设置 {config.display_name} 为默认配置'}
@@ -5,11 +5,16 @@ AI分析服务 - 简化版本
 import os
 import json
 import logging
+import time
 from datetime import datetime, timedelta
+from functools import partial
 from typing import Dict, Any, List, Optional
 from sqlalchemy.orm import Session
 from app.repositories.stock_repository import StockRepository
 from app.repositories.watchlist_repository import WatchlistRepository
+from app.repositories.report_repository import ReportIndexRepository, ReportCounterRepository
+from app.repositories.task_repository import TaskRepository
+from app.services.data.report_storage import ReportStorage, REPORT_EXTENSION, is_report_file
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +26,11 @@ class AnalysisService:
         self.session = session
         self.stock_repo = StockRepository(session)
         self.watchlist_repo = WatchlistRepository(session)
+        self.report_repo = ReportIndexRepository(session)
+        self.counter_repo = ReportCounterRepository(session)
+        self.task_repo = TaskRepository(session)
         self.reports_dir = 'data/reports'
+        self.report_storage = ReportStorage()
         self._ensure_directories()
     
     def _ensure_directories(self):
@@ -126,8 +135,12 @@ class AnalysisService:
         logger.info(f"创建分析任务: {task_id}")
         return task_id
     
-    def run_analysis(self, stock_code: str, user_id: int, analysis_type: str = 'fundamental', ai_provider: str = 'qwen', prompt_id: int = None, skip_coin_check: bool = False) -> Dict[str, Any]:
-        """运行分析（同步版本）"""
+    def run_analysis(self, stock_code: str, user_id: int, analysis_type: str = 'fundamental', ai_provider: str = 'qwen', prompt_id: int = None, skip_coin_check: bool = False, retry_budget=None, report_stream=None, task_id: str = None) -> Dict[str, Any]:
+        """运行分析（同步版本）
+        
+        retry_budget 为该股票的重试预算，AI请求和重试都受其限制；report_stream 为部分报告文件，生成中的内容实时写入；
+        task_id 为所属的分析任务，写入报告头和报告索引，任务中断恢复时据此判断股票是否已完成
+        """
         try:
             # 检查并消耗金币（除非跳过）
             if not skip_coin_check:
@@ -141,7 +154,8 @@ class AnalysisService:
                 raise Exception(f"股票不存在: {stock_code}")
             
             # 生成分析报告
-            report_data = self._generate_analysis_report(stock, analysis_type, ai_provider, prompt_id)
+            report_data = self._generate_analysis_report(stock, analysis_type, ai_provider, prompt_id, retry_budget,
+                                                         report_stream)
             
             # 检查分析是否成功
             if not report_data.get('success', True):  # 默认True是为了兼容旧代码
@@ -151,6 +165,8 @@ class AnalysisService:
                 }
             
             # 保存报告
+            if task_id:
+                report_data['task_id'] = task_id
             self.save_analysis_report(stock_code, report_data)
             
             return {
@@ -167,157 +183,165 @@ class AnalysisService:
             }
     
     def _run_analysis_with_retry(self, stock_code: str, user_id: int, analysis_type: str, 
-                                ai_provider: str, task_data: Dict, task_file: str) -> Dict[str, Any]:
-        """带重试机制的分析执行"""
-        import time
+                                ai_provider: str, task_data: Dict) -> Dict[str, Any]:
+        """带重试机制的分析执行（单个分析任务），失败的尝试写入任务的重试历史"""
+        return self._run_analysis_with_budget(stock_code, user_id, analysis_type, ai_provider, task_data,
+                                              record_history=True)
+    
+    def _run_analysis_with_retry_for_batch(self, stock_code: str, user_id: int, analysis_type: str, 
+                                         ai_provider: str, task_data: Dict) -> Dict[str, Any]:
+        """批量分析中的单个股票重试机制（任务被停止时不再重试）"""
+        return self._run_analysis_with_budget(stock_code, user_id, analysis_type, ai_provider, task_data,
+                                              record_history=False)
+    
+    def _run_analysis_with_budget(self, stock_code: str, user_id: int, analysis_type: str, ai_provider: str,
+                                  task_data: Dict, record_history: bool) -> Dict[str, Any]:
+        """在一个重试预算内分析股票：任务层和Provider层的重试共用该股票的截止时间和重试次数，
+        所有尝试都记录在预算中。生成中的内容写入部分报告文件，全部尝试失败时保存为部分报告"""
+        from app.services.ai.task_manager import task_manager
         
-        max_retries = task_data.get('max_retries', 5)
-        retry_count = 0
+        task_id = task_data['task_id']
+        budget = self._create_retry_budget(task_data)
+        report_stream = self._create_report_stream(task_id, stock_code)
+        # 未注册到任务管理器的任务（如直接调用）不支持暂停/停止
+        registered = task_manager.get_task_status(task_id) is not None
+        if registered:
+            # 等待提供商并发槽位期间也响应暂停/停止
+            budget.should_continue = lambda: task_manager.wait_if_paused(task_id)
+        last_error = None
+        attempt = 0
         
-        while retry_count <= max_retries:
-            try:
-                logger.info(f"尝试分析 {stock_code} (第 {retry_count + 1} 次)")
-                
-                # 执行分析
-                prompt_id = task_data.get('prompt_id')
-                result = self.run_analysis(stock_code, user_id, analysis_type, ai_provider, prompt_id, skip_coin_check=True)
+        try:
+            while True:
+                if registered and not task_manager.wait_if_paused(task_id):
+                    logger.info(f"任务 {task_id} 已停止，跳过股票 {stock_code}")
+                    return {'success': False, 'stopped': True, 'error': '任务已停止',
+                            'retry_count': budget.retries_used}
                 
-                if result['success']:
-                    logger.info(f"股票 {stock_code} 分析成功")
-                    return result
-                else:
-                    # 分析失败，记录错误
-                    error_msg = result.get('error', '未知错误')
-                    logger.warning(f"股票 {stock_code} 分析失败 (第 {retry_count + 1} 次): {error_msg}")
-                    
-                    # 记录重试历史
-                    retry_record = {
-                        'attempt': retry_count + 1,
-                        'timestamp': datetime.utcnow().isoformat() + 'Z',
-                        'error': error_msg
-                    }
-                    task_data['retry_history'].append(retry_record)
-                    task_data['retry_count'] = retry_count + 1
-                    
-                    # 更新任务文件
-                    with open(task_file, 'w', encoding='utf-8') as f:
-                        json.dump(task_data, f, ensure_ascii=False, indent=2)
-                    
-                    # 如果还有重试机会，等待后重试
-                    if retry_count < max_retries:
-                        wait_time = min(30, (retry_count + 1) * 10)  # 递增等待时间，最多30秒
-                        logger.info(f"等待 {wait_time} 秒后重试...")
-                        time.sleep(wait_time)
-                        retry_count += 1
-                    else:
-                        # 重试次数用完，返回失败
-                        logger.error(f"股票 {stock_code} 分析失败，已重试 {max_retries} 次")
-                        return {
-                            'success': False,
-                            'error': f"分析失败，已重试 {max_retries} 次。最后一次错误: {error_msg}"
-                        }
-                        
-            except Exception as e:
-                error_msg = str(e)
-                logger.error(f"股票 {stock_code} 分析异常 (第 {retry_count + 1} 次): {error_msg}")
+                attempt += 1
+                recorded = len(budget.attempts)
+                try:
+                    logger.info(f"尝试分析 {stock_code} (第 {attempt} 次)")
+                    prompt_id = task_data.get('prompt_id')
+                    result = self.run_analysis(stock_code, user_id, analysis_type, ai_provider, prompt_id,
+                                               skip_coin_check=True, retry_budget=budget,
+                                               report_stream=report_stream, task_id=task_id)
+                    if result['success']:
+                        logger.info(f"股票 {stock_code} 分析成功")
+                        result['retry_count'] = budget.retries_used
+                        return result
+                    last_error = result.get('error', '未知错误')
+                    logger.warning(f"股票 {stock_code} 分析失败 (第 {attempt} 次): {last_error}")
+                except Exception as e:
+                    last_error = str(e)
+                    logger.error(f"股票 {stock_code} 分析异常 (第 {attempt} 次): {last_error}")
                 
-                # 记录重试历史
-                retry_record = {
-                    'attempt': retry_count + 1,
-                        'timestamp': datetime.utcnow().isoformat() + 'Z',
-                    'error': error_msg
-                }
-                task_data['retry_history'].append(retry_record)
-                task_data['retry_count'] = retry_count + 1
+                # 等待并发槽位或重试期间任务被停止，不记录为失败
+                if registered and task_manager.is_task_stopped(task_id):
+                    logger.info(f"任务 {task_id} 已停止，股票 {stock_code} 停止分析")
+                    return {'success': False, 'stopped': True, 'error': '任务已停止',
+                            'retry_count': budget.retries_used}
                 
-                # 更新任务文件
-                with open(task_file, 'w', encoding='utf-8') as f:
-                    json.dump(task_data, f, ensure_ascii=False, indent=2)
+                # Provider未发出请求就失败时（如股票不存在、报告保存失败），由本层记录这次尝试
+                if len(budget.attempts) == recorded:
+                    budget.record_attempt('analysis', False, last_error)
+                if record_history:
+                    self._record_retry_history(task_data, budget.attempts[recorded:], budget.retries_used)
                 
-                # 如果还有重试机会，等待后重试
-                if retry_count < max_retries:
-                    wait_time = min(30, (retry_count + 1) * 10)  # 递增等待时间，最多30秒
-                    logger.info(f"等待 {wait_time} 秒后重试...")
-                    time.sleep(wait_time)
-                    retry_count += 1
+                wait_time = budget.consume_retry(min(30, attempt * 10))  # 递增等待时间，最多30秒
+                if wait_time is None:
+                    reason = budget.exhausted_reason()
+                    logger.error(f"股票 {stock_code} 分析失败，{reason}")
+                    error = f"分析失败，{reason}。最后一次错误: {last_error}"
+                    result = {'success': False, 'error': error, 'retry_count': budget.retries_used}
+                    partial_report_id = self._save_partial_report(task_id, stock_code, analysis_type, ai_provider,
+                                                                  report_stream, error)
+                    if partial_report_id:
+                        result['error'] = f"{error}（已保存部分报告）"
+                        result['partial_report_id'] = partial_report_id
+                    return result
+                logger.info(f"等待 {wait_time} 秒后重试...")
+                if registered:
+                    task_manager.wait_for_stop(task_id, wait_time)
                 else:
-                    # 重试次数用完，返回失败
-                    logger.error(f"股票 {stock_code} 分析异常，已重试 {max_retries} 次")
-                    return {
-                        'success': False,
-                        'error': f"分析异常，已重试 {max_retries} 次。最后一次错误: {error_msg}"
-                    }
+                    time.sleep(wait_time)
+        finally:
+            if report_stream:
+                report_stream.discard()
+    
+    def _create_retry_budget(self, task_data: Dict):
+        """创建股票的重试预算，重试次数同时计入任务的总重试预算（同一任务的股票共享）"""
+        from flask import current_app
+        from app.services.ai.retry_budget import RetryBudget
         
-        # 理论上不会到达这里
-        return {
-            'success': False,
-            'error': '重试机制异常'
-        }
+        config = current_app.config
+        task_budget = task_data.get('_retry_budget')
+        if task_budget is None:
+            task_budget = task_data.setdefault(
+                '_retry_budget', RetryBudget(max_retries=config.get('ANALYSIS_TASK_RETRY_BUDGET', 50))
+            )
+        max_retries = task_data.get('max_retries')
+        if max_retries is None:
+            max_retries = config.get('ANALYSIS_STOCK_MAX_RETRIES', 5)
+        return RetryBudget(max_retries=max_retries,
+                           deadline_seconds=config.get('ANALYSIS_STOCK_DEADLINE_SECONDS', 1800),
+                           parent=task_budget)
     
-    def _run_analysis_with_retry_for_batch(self, stock_code: str, user_id: int, analysis_type: str, 
-                                         ai_provider: str, task_data: Dict, task_file: str) -> Dict[str, Any]:
-        """批量分析中的单个股票重试机制"""
-        import time
+    def _record_retry_history(self, task_data: Dict, attempts: List[Dict[str, Any]], retry_count: int):
+        """把失败的尝试写入任务的重试历史"""
+        for record in attempts:
+            if record['success']:
+                continue
+            retry_record = dict(record, attempt=len(task_data['retry_history']) + 1)
+            task_data['retry_history'].append(retry_record)
+            self.task_repo.append_retry(task_data['task_id'], retry_record)
+        task_data['retry_count'] = retry_count
+    
+    def _create_report_stream(self, task_id: str, stock_code: str):
+        """创建股票的部分报告文件（关闭流式生成时返回None）"""
+        from flask import current_app
+        from app.services.ai.report_stream import PartialReportWriter, partial_report_path
         
-        max_retries = task_data.get('max_retries', 5)
-        retry_count = 0
+        if not current_app.config.get('ANALYSIS_STREAM_REPORTS', True):
+            return None
+        return PartialReportWriter(partial_report_path(task_id, stock_code))
+    
+    def _save_partial_report(self, task_id: str, stock_code: str, analysis_type: str, ai_provider: str,
+                             report_stream, error: str) -> Optional[str]:
+        """全部尝试失败后，把已生成的最长输出保存为部分报告（内容过短时不保存），返回报告ID"""
+        from flask import current_app
         
-        while retry_count <= max_retries:
-            try:
-                logger.info(f"尝试分析 {stock_code} (第 {retry_count + 1} 次)")
-                
-                # 执行分析
-                prompt_id = task_data.get('prompt_id')
-                result = self.run_analysis(stock_code, user_id, analysis_type, ai_provider, prompt_id, skip_coin_check=True)
-                
-                if result['success']:
-                    logger.info(f"股票 {stock_code} 分析成功")
-                    return result
-                else:
-                    # 分析失败，记录错误
-                    error_msg = result.get('error', '未知错误')
-                    logger.warning(f"股票 {stock_code} 分析失败 (第 {retry_count + 1} 次): {error_msg}")
-                    
-                    # 如果还有重试机会，等待后重试
-                    if retry_count < max_retries:
-                        wait_time = min(30, (retry_count + 1) * 10)  # 递增等待时间，最多30秒
-                        logger.info(f"等待 {wait_time} 秒后重试...")
-                        time.sleep(wait_time)
-                        retry_count += 1
-                    else:
-                        # 重试次数用完，返回失败
-                        logger.error(f"股票 {stock_code} 分析失败，已重试 {max_retries} 次")
-                        return {
-                            'success': False,
-                            'error': f"分析失败，已重试 {max_retries} 次。最后一次错误: {error_msg}",
-                            'retry_count': retry_count
-                        }
-                        
-            except Exception as e:
-                error_msg = str(e)
-                logger.error(f"股票 {stock_code} 分析异常 (第 {retry_count + 1} 次): {error_msg}")
-                
-                # 如果还有重试机会，等待后重试
-                if retry_count < max_retries:
-                    wait_time = min(30, (retry_count + 1) * 10)  # 递增等待时间，最多30秒
-                    logger.info(f"等待 {wait_time} 秒后重试...")
-                    time.sleep(wait_time)
-                    retry_count += 1
-                else:
-                    # 重试次数用完，返回失败
-                    logger.error(f"股票 {stock_code} 分析异常，已重试 {max_retries} 次")
-                    return {
-                        'success': False,
-                        'error': f"分析异常，已重试 {max_retries} 次。最后一次错误: {error_msg}",
-                        'retry_count': retry_count
-                    }
+        if report_stream is None:
+            return None
+        content, provider, model = report_stream.salvage()
+        if len(content) < current_app.config.get('ANALYSIS_PARTIAL_REPORT_MIN_CHARS', 1000):
+            return None
         
-        # 理论上不会到达这里
-        return {
-            'success': False,
-            'error': '重试机制异常',
-            'retry_count': 0
+        stock = self.stock_repo.get_by_code(stock_code)
+        report_data = {
+            'stock_code': stock_code,
+            'stock_name': stock.name if stock else stock_code,
+            'market': stock.market if stock else None,
+            'analysis_date': datetime.utcnow().strftime('%Y-%m-%d'),
+            'content': f"{content}\n\n---\n\n> 报告生成中断，以上为已生成的部分内容。{error}\n",
+            'provider': provider or ai_provider,
+            'analysis_type': analysis_type,
+            'ai_model': model,
+            'status': 'partial',
+            'partial': True,
+            'task_id': task_id,
+            'metadata': {
+                'error': error,
+                'timestamp': datetime.utcnow().isoformat()
+            }
         }
+        try:
+            self.save_analysis_report(stock_code, report_data)
+        except Exception as e:
+            logger.error(f"保存部分报告失败 - 股票: {stock_code}, 错误: {str(e)}")
+            return None
+        logger.warning(f"股票 {stock_code} 分析失败，已保存部分报告: {report_data['report_id']}（{len(content)} 字符）")
+        return report_data['report_id']
     
     def _create_provider_from_env(self, ai_provider: str):
         """从环境变量创建Provider（回退方法）"""
@@ -380,10 +404,7 @@ class AnalysisService:
                 # 根据提供商名称查找配置
                 config = AIConfig.query.filter_by(provider_name=ai_provider, is_active=True).first()
                 if config:
-                    provider = LLMProviderFactory.create_provider(
-                        config.provider_name,
-                        config.get_config_dict()
-                    )
+                    provider = LLMProviderFactory.get_provider_for_config(config)
                     logger.info(f"使用数据库配置: {config.provider_name} - {config.model_name}")
                     return provider
                 else:
@@ -406,7 +427,135 @@ class AnalysisService:
             logger.warning(f"环境变量配置也失败: {str(e)}")
             return None
     
-    def _generate_analysis_report(self, stock, analysis_type: str = 'fundamental', ai_provider: str = 'qwen', prompt_id: int = None) -> Dict[str, Any]:
+    def _generate_with_failover(self, provider, ai_provider: str, prompt_template: str, stock_info: Dict[str, Any],
+                                retry_budget=None, report_stream=None):
+        """调用AI生成分析，提供商熔断时按优先顺序切换到下一个激活的提供商
+        
+        Returns:
+            (分析结果, 实际使用的Provider, 切换前的提供商名称；未切换时为None)
+        """
+        from app.services.ai.circuit_breaker import circuit_breaker
+        from app.services.ai.provider_pacer import provider_pacer
+        
+        original_name = provider.name
+        candidates = None
+        result = None
+        while True:
+            if circuit_breaker.is_open(provider.name):
+                logger.warning(f"提供商 {provider.name} 处于熔断中，尝试切换")
+                result = None
+            else:
+                should_continue = retry_budget.should_continue if retry_budget else None
+                with provider_pacer.slot(provider.name, should_continue) as slot:
+                    if retry_budget is not None:
+                        retry_budget.slot = slot
+                    try:
+                        result = provider.generate_analysis(prompt_template, stock_info, retry_budget,
+                                                            report_stream, self._get_hedge_provider(provider))
+                    finally:
+                        if retry_budget is not None:
+                            retry_budget.slot = None
+                # 成功或不是熔断引起的失败，交给调用方处理
+                if result.success or not circuit_breaker.is_open(provider.name):
+                    break
+            
+            if candidates is None:
+                candidates = self._get_failover_candidates(original_name)
+            next_provider = self._next_failover_provider(candidates)
+            if next_provider is None:
+                logger.error(f"提供商 {provider.name} 已熔断，没有可切换的提供商")
+                break
+            circuit_breaker.record_failover(provider.name, next_provider.name)
+            provider = next_provider
+        
+        if result is None:
+            # 所有候选提供商都在熔断中，直接返回熔断结果，不占用并发槽位
+            result = provider._circuit_open_result(stock_info.get('code'), None, 0)
+        failover_from = original_name if provider.name != original_name else None
+        return result, provider, failover_from
+    
+    def _generate_with_cache(self, provider, ai_provider: str, prompt_template: str, stock_info: Dict[str, Any],
+                             retry_budget=None, report_stream=None):
+        """先查分析结果缓存，未命中时调用AI生成；相同请求同时进行时只生成一次
+        
+        缓存键按请求的提供商和模型计算，熔断切换后的结果也缓存在该键下
+        
+        Returns:
+            (分析结果, 实际使用的Provider, 切换前的提供商名称, 缓存状态 miss/hit/shared)
+        """
+        from dataclasses import replace
+        from app.services.ai.response_cache import make_cache_key, response_cache, STATUS_MISS
+        
+        def generate():
+            return self._generate_with_failover(provider, ai_provider, prompt_template, stock_info,
+                                                retry_budget, report_stream)
+        
+        if not response_cache.is_enabled():
+            return (*generate(), STATUS_MISS)
+        
+        key = make_cache_key(provider.name, provider.model, provider.format_prompt(prompt_template, stock_info),
+                             stock_info.get('analysis_date') or datetime.utcnow().strftime('%Y-%m-%d'))
+        (result, used_provider, failover_from), status = response_cache.get_or_generate(
+            key, generate,
+            size_of=lambda value: len((value[0].content or '').encode('utf-8')),
+            cacheable=lambda value: value[0].success,
+            wait_timeout=retry_budget.remaining() if retry_budget else None
+        )
+        if status != STATUS_MISS:
+            logger.info(f"复用分析结果（{status}） - 股票: {stock_info.get('code')}, 模型: {result.model}")
+            result = replace(result, retry_count=0)
+        return result, used_provider, failover_from, status
+    
+    def _get_hedge_provider(self, provider):
+        """获取与Provider等价（AI配置高级参数中 hedge_group 相同）的另一个激活配置，用于对冲慢请求"""
+        from app.services.ai.circuit_breaker import circuit_breaker
+        from app.services.ai.hedging import request_hedger
+        
+        group = provider.config.get('hedge_group')
+        if not group or not request_hedger.is_enabled():
+            return None
+        try:
+            from app.models.ai_config import AIConfig
+            from app.services.ai.llm_provider import LLMProviderFactory
+            
+            configs = {config.provider_name: config for config in AIConfig.query.filter_by(is_active=True).all()}
+            for name in self._get_failover_candidates(provider.name):
+                config = configs.get(name)
+                if not config or (config.advanced_config or {}).get('hedge_group') != group:
+                    continue
+                if circuit_breaker.is_open(name):
+                    continue
+                hedge_provider = LLMProviderFactory.get_provider_for_config(config)
+                if hedge_provider and hedge_provider.api_key:
+                    return hedge_provider
+        except Exception as e:
+            logger.warning(f"获取对冲配置失败: {str(e)}")
+        return None
+    
+    def _next_failover_provider(self, candidates: List[str]):
+        """从候选列表中取出下一个未熔断且配置了密钥的Provider"""
+        from app.services.ai.circuit_breaker import circuit_breaker
+        
+        while candidates:
+            name = candidates.pop(0)
+            if circuit_breaker.is_open(name):
+                continue
+            provider = self._get_llm_provider(name)
+            if provider and provider.api_key:
+                return provider
+        return None
+    
+    def _get_failover_candidates(self, provider_name: str) -> List[str]:
+        """按配置的优先顺序列出可接替的激活提供商"""
+        from flask import current_app
+        from app.models.ai_config import AIConfig
+        
+        active = [config.provider_name for config in AIConfig.query.filter_by(is_active=True).all()]
+        order = current_app.config.get('ANALYSIS_PROVIDER_FAILOVER_ORDER', [])
+        ranked = [name for name in order if name in active] + sorted(name for name in active if name not in order)
+        return [name for name in ranked if name != provider_name]
+    
+    def _generate_analysis_report(self, stock, analysis_type: str = 'fundamental', ai_provider: str = 'qwen', prompt_id: int = None, retry_budget=None, report_stream=None) -> Dict[str, Any]:
         """生成分析报告"""
         try:
             from app.services.ai.llm_provider import LLMProviderFactory
@@ -462,7 +611,10 @@ class AnalysisService:
             prompt_template = self._get_analysis_prompt(analysis_type, prompt_id)
             logger.info(f"获取到提示词模板，长度: {len(prompt_template)} 字符")
             logger.info(f"开始调用{ai_provider}生成分析...")
-            result = provider.generate_analysis(prompt_template, stock_info)
+            result, provider, failover_from, cache_status = self._generate_with_cache(
+                provider, ai_provider, prompt_template, stock_info, retry_budget, report_stream)
+            if failover_from:
+                ai_provider = provider.name
             
             if result.success:
                 logger.info(f"AI分析成功 - 股票: {stock.code}, 提供商: {ai_provider}, 内容长度: {len(result.content)} 字符")
@@ -508,7 +660,10 @@ class AnalysisService:
                         'model': result.model,
                         'timestamp': result.timestamp,
                         'retry_count': result.retry_count,
-                        'error_type': result.error_type.value if result.error_type else None
+                        'error_type': result.error_type.value if result.error_type else None,
+                        'failover_from': failover_from,
+                        'response_cache': cache_status,
+                        'hedge': result.metadata.get('hedge')
                     }
                 }
             else:
@@ -526,8 +681,9 @@ class AnalysisService:
                     'provider': ai_provider,
                     'analysis_type': analysis_type,
                     'metadata': {
-                        'error': result.get('error'),
-                        'timestamp': datetime.utcnow().isoformat()
+                        'error': result.error,
+                        'timestamp': datetime.utcnow().isoformat(),
+                        'failover_from': failover_from
                     }
                 }
                 
@@ -561,8 +717,8 @@ class AnalysisService:
             ai_provider = report_data.get('provider', 'unknown')
             analysis_type = report_data.get('analysis_type', 'fundamental')
             
-            # 文件名格式：股票代码_时间戳_模型_分析类型.json
-            filename = f"{stock_code}_{timestamp}_{ai_provider}_{analysis_type}.json"
+            # 文件名格式：股票代码_时间戳_模型_分析类型.report
+            filename = f"{stock_code}_{timestamp}_{ai_provider}_{analysis_type}{REPORT_EXTENSION}"
             report_file = os.path.join(date_dir, filename)
             
             # 添加元数据
@@ -570,8 +726,8 @@ class AnalysisService:
             report_data['created_at'] = datetime.utcnow().isoformat() + 'Z'
             report_data['analysis_type'] = analysis_type
             
-            with open(report_file, 'w', encoding='utf-8') as f:
-                json.dump(report_data, f, ensure_ascii=False, indent=2)
+            # 元数据头+正文格式，完整提示词单独存储
+            self.report_storage.write_report(report_file, report_data)
             
             # 注册到数据库
             self._register_report_to_database(stock_code, report_data, report_file)
@@ -607,23 +763,45 @@ class AnalysisService:
             else:
                 analysis_date = analysis_date_str
             
+            created_at_str = report_data.get('created_at')
+            generated_at = datetime.fromisoformat(created_at_str.rstrip('Z')) if created_at_str else datetime.utcnow()
+            
             report_index = ReportIndex(
                 stock_id=stock.id,
                 analysis_date=analysis_date,
                 file_path=report_file,
                 summary=report_data.get('content', '')[:500] if report_data.get('content') else '',  # 截取前500字符作为摘要
-                generated_at=datetime.utcnow()
+                generated_at=generated_at,
+                report_id=report_data.get('report_id'),
+                stock_code=stock.code,
+                stock_name=report_data.get('stock_name') or stock.name,
+                provider=report_data.get('provider'),
+                ai_model=report_data.get('ai_model'),
+                analysis_type=report_data.get('analysis_type'),
+                task_id=report_data.get('task_id'),
+                is_partial=bool(report_data.get('partial'))
             )
             
             db.session.add(report_index)
             db.session.commit()
             
+            # 增量更新报告计数
+            self.counter_repo.increment(stock.code, 1)
+            
             logger.info(f"成功注册报告到数据库: {stock_code} - {report_data.get('analysis_date')}")
             
         except Exception as e:
             logger.error(f"注册报告到数据库失败: {str(e)}")
             # 不抛出异常，避免影响报告保存
     
+    def _read_report_file(self, report_file: str, include_prompt: bool = False) -> Optional[Dict[str, Any]]:
+        """读取单个报告文件"""
+        try:
+            return self.report_storage.read_report(report_file, include_prompt=include_prompt)
+        except Exception as e:
+            logger.error(f"读取报告文件失败: {report_file}, {str(e)}")
+            return None
+    
     def get_analysis_report(self, stock_code: str, date: str = None, report_id: str = None) -> Optional[Dict[str, Any]]:
         """获取分析报告"""
         try:
@@ -633,87 +811,52 @@ class AnalysisService:
             logger.info(f"获取分析报告 - 股票代码: {stock_code}, 日期: {date}, 报告ID: {report_id}")
             
             if report_id:
-                # 如果指定了report_id，需要解析report_id来找到对应的文件
-                # report_id格式: stock_code_timestamp
-                logger.info(f"使用report_id查找报告: {report_id}")
-                
-                # 遍历所有日期目录，查找包含该report_id的文件
-                if os.path.exists(self.reports_dir):
-                    for date_dir in sorted(os.listdir(self.reports_dir), reverse=True):
-                        date_path = os.path.join(self.reports_dir, date_dir)
-                        if not os.path.isdir(date_path):
-                            continue
-                        
-                        for filename in os.listdir(date_path):
-                            if filename.endswith('.json'):
-                                report_file = os.path.join(date_path, filename)
-                                try:
-                                    with open(report_file, 'r', encoding='utf-8') as f:
-                                        report_data = json.load(f)
-                                        # 检查文件中的report_id是否匹配
-                                        if report_data.get('report_id') == report_id:
-                                            logger.info(f"找到报告文件: {report_file}")
-                                            logger.info(f"成功读取报告文件: {report_file}")
-                                            return report_data
-                                except Exception as e:
-                                    logger.error(f"读取报告文件失败: {report_file}, {str(e)}")
-                
-                logger.warning(f"未找到report_id为 {report_id} 的报告")
-                return None
+                # 通过报告目录定位文件，只读取一个文件
+                entry = self.report_repo.get_by_report_id(report_id)
             else:
-                # 否则查找该股票最新的报告
-                date_dir = os.path.join(self.reports_dir, date)
-                if os.path.exists(date_dir):
-                    # 查找该股票的所有报告文件
-                    stock_reports = []
-                    for filename in os.listdir(date_dir):
-                        if filename.startswith(f"{stock_code}_") and filename.endswith('.json'):
-                            report_file = os.path.join(date_dir, filename)
-                            try:
-                                with open(report_file, 'r', encoding='utf-8') as f:
-                                    report_data = json.load(f)
-                                    stock_reports.append((report_data.get('created_at', ''), report_data))
-                            except Exception as e:
-                                logger.error(f"读取报告文件失败: {report_file}, {str(e)}")
-                    
-                    # 返回最新的报告
-                    if stock_reports:
-                        stock_reports.sort(key=lambda x: x[0], reverse=True)
-                        logger.info(f"返回最新报告: {stock_reports[0][1].get('report_id', 'unknown')}")
-                        return stock_reports[0][1]
+                # 否则查找该股票当天最新的报告
+                day = datetime.strptime(date, '%Y-%m-%d')
+                entry = self.report_repo.get_latest_for_stock(stock_code, day, day + timedelta(days=1))
             
-            logger.warning(f"未找到股票 {stock_code} 的报告")
-            return None
+            if not entry:
+                logger.warning(f"未找到股票 {stock_code} 的报告 (report_id: {report_id})")
+                return None
+            
+            report_data = self._read_report_file(entry.file_path)
+            if report_data is not None:
+                logger.info(f"成功读取报告文件: {entry.file_path}")
+            return report_data
                 
         except Exception as e:
             logger.error(f"获取分析报告失败: {str(e)}")
             return None
     
-    def get_all_reports_for_stock(self, stock_code: str) -> List[Dict[str, Any]]:
+    def _catalog_entry_to_report(self, entry, is_watched: bool = False) -> Dict[str, Any]:
+        """将报告索引记录转换为列表页使用的报告字典（不读取报告文件）"""
+        created_at = entry.generated_at.isoformat() + 'Z' if entry.generated_at else ''
+        return {
+            'report_id': entry.report_id,
+            'stock_code': entry.stock_code,
+            'stock_name': entry.stock_name,
+            'provider': entry.provider,
+            'ai_provider': entry.provider,
+            'ai_model': entry.ai_model,
+            'analysis_type': entry.analysis_type,
+            'analysis_date': entry.analysis_date.strftime('%Y-%m-%d') if entry.analysis_date else '',
+            'date': entry.generated_at.strftime('%Y-%m-%d') if entry.generated_at else '',
+            'created_at': created_at,
+            'content': entry.summary or '',
+            'summary': entry.summary or '',
+            'file_path': entry.file_path,
+            'is_watched': is_watched,
+            'metadata': {'timestamp': created_at}
+        }
+    
+    def get_all_reports_for_stock(self, stock_code: str, limit: int = None) -> List[Dict[str, Any]]:
         """获取指定股票的所有分析报告"""
         try:
-            reports = []
-            
-            # 遍历所有日期目录，查找该股票的所有报告
-            if os.path.exists(self.reports_dir):
-                for date_dir in sorted(os.listdir(self.reports_dir), reverse=True):
-                    date_path = os.path.join(self.reports_dir, date_dir)
-                    if not os.path.isdir(date_path):
-                        continue
-                    
-                    for filename in os.listdir(date_path):
-                        if filename.startswith(f"{stock_code}_") and filename.endswith('.json'):
-                            report_file = os.path.join(date_path, filename)
-                            try:
-                                with open(report_file, 'r', encoding='utf-8') as f:
-                                    report_data = json.load(f)
-                                    report_data['date'] = date_dir
-                                    reports.append(report_data)
-                            except Exception as e:
-                                logger.error(f"读取报告文件失败: {report_file}, {str(e)}")
-            
-            # 按创建时间倒序排列
-            reports.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+            entries = self.report_repo.list_reports(limit=limit, stock_code=stock_code)
+            reports = [self._catalog_entry_to_report(entry) for entry in entries]
             
             logger.info(f"找到股票 {stock_code} 的 {len(reports)} 个报告")
             return reports
@@ -722,138 +865,53 @@ class AnalysisService:
             logger.error(f"获取股票 {stock_code} 的所有报告失败: {str(e)}")
             return []
     
-    def get_user_reports(self, user_id: int, limit: int = 20) -> List[Dict[str, Any]]:
+    def get_user_reports(self, user_id: int, limit: int = 20, offset: int = 0, **filters) -> List[Dict[str, Any]]:
         """获取用户的分析报告"""
         try:
-            reports = []
-            
             # 获取用户关注的股票
-            user_stocks = self.watchlist_repo.get_user_stock_codes(user_id)
-            
-            # 遍历报告目录，获取所有报告
-            if os.path.exists(self.reports_dir):
-                for date_dir in sorted(os.listdir(self.reports_dir), reverse=True):
-                    date_path = os.path.join(self.reports_dir, date_dir)
-                    if not os.path.isdir(date_path):
-                        continue
-                    
-                    for file_name in os.listdir(date_path):
-                        if file_name.endswith('.json'):
-                            # 解析文件名：股票代码_时间戳_毫秒数_模型_分析类型.json 或 股票代码_描述_序号.json
-                            parts = file_name.replace('.json', '').split('_')
-                            if len(parts) >= 5:
-                                # 标准格式：股票代码_时间戳_毫秒数_模型_分析类型.json
-                                stock_code = parts[0]
-                                timestamp = f"{parts[1]}_{parts[2]}"  # 重新组合时间戳
-                                ai_provider = parts[3]
-                                analysis_type = parts[4]
-                            elif len(parts) >= 3:
-                                # 简化格式：股票代码_描述_序号.json
-                                stock_code = parts[0]
-                                timestamp = parts[1] if len(parts) > 1 else 'test'
-                                ai_provider = 'qwen-deep-research'  # 默认模型
-                                analysis_type = 'comprehensive'  # 默认分析类型
-                            else:
-                                # 跳过格式不正确的文件
-                                continue
-                                
-                            report_file = os.path.join(date_path, file_name)
-                            try:
-                                with open(report_file, 'r', encoding='utf-8') as f:
-                                    report_data = json.load(f)
-                                    report_data['date'] = date_dir
-                                    report_data['stock_code'] = stock_code
-                                    report_data['ai_provider'] = ai_provider
-                                    report_data['analysis_type'] = analysis_type
-                                    report_data['timestamp'] = timestamp
-                                    # 标记是否为用户关注的股票
-                                    report_data['is_watched'] = stock_code in user_stocks
-                                    reports.append(report_data)
-                            except Exception as e:
-                                logger.error(f"读取报告文件失败: {report_file}, {str(e)}")
-                    
-                    if len(reports) >= limit:
-                        break
-            
-            # 按创建时间排序，最新的在前
-            reports.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+            user_stocks = set(self.watchlist_repo.get_user_stock_codes(user_id))
             
-            return reports[:limit]
+            entries = self.report_repo.list_reports(limit=limit, offset=offset, **filters)
+            return [
+                self._catalog_entry_to_report(entry, is_watched=entry.stock_code in user_stocks)
+                for entry in entries
+            ]
             
         except Exception as e:
             logger.error(f"获取用户报告失败: {str(e)}")
             return []
 
-    def get_all_reports(self, limit: int = 20) -> List[Dict[str, Any]]:
+    def get_all_reports(self, limit: int = 20, offset: int = 0, **filters) -> List[Dict[str, Any]]:
         """获取所有分析报告（不需要登录）"""
         try:
-            reports = []
-            
-            # 遍历报告目录，获取所有报告
-            if os.path.exists(self.reports_dir):
-                for date_dir in sorted(os.listdir(self.reports_dir), reverse=True):
-                    date_path = os.path.join(self.reports_dir, date_dir)
-                    if not os.path.isdir(date_path):
-                        continue
-                    
-                    for file_name in os.listdir(date_path):
-                        if file_name.endswith('.json'):
-                            # 解析文件名：股票代码_时间戳_毫秒数_模型_分析类型.json 或 股票代码_描述_序号.json
-                            parts = file_name.replace('.json', '').split('_')
-                            if len(parts) >= 5:
-                                # 标准格式：股票代码_时间戳_毫秒数_模型_分析类型.json
-                                stock_code = parts[0]
-                                timestamp = f"{parts[1]}_{parts[2]}"  # 重新组合时间戳
-                                ai_provider = parts[3]
-                                analysis_type = parts[4]
-                            elif len(parts) >= 3:
-                                # 简化格式：股票代码_描述_序号.json
-                                stock_code = parts[0]
-                                timestamp = parts[1] if len(parts) > 1 else 'test'
-                                ai_provider = 'qwen-deep-research'  # 默认模型
-                                analysis_type = 'comprehensive'  # 默认分析类型
-                            else:
-                                # 跳过格式不正确的文件
-                                continue
-                                
-                            report_file = os.path.join(date_path, file_name)
-                            try:
-                                with open(report_file, 'r', encoding='utf-8') as f:
-                                    report_data = json.load(f)
-                                    report_data['date'] = date_dir
-                                    report_data['stock_code'] = stock_code
-                                    report_data['ai_provider'] = ai_provider
-                                    report_data['analysis_type'] = analysis_type
-                                    report_data['timestamp'] = timestamp
-                                    # 未登录用户，不标记关注状态
-                                    report_data['is_watched'] = False
-                                    reports.append(report_data)
-                            except Exception as e:
-                                logger.error(f"读取报告文件失败: {report_file}, {str(e)}")
-                    
-                    if len(reports) >= limit:
-                        break
-            
-            # 按创建时间排序，最新的在前
-            reports.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-            
-            return reports[:limit]
+            entries = self.report_repo.list_reports(limit=limit, offset=offset, **filters)
+            # 未登录用户，不标记关注状态
+            return [self._catalog_entry_to_report(entry) for entry in entries]
             
         except Exception as e:
             logger.error(f"获取所有报告失败: {str(e)}")
             return []
 
+    def count_reports(self, **filters) -> int:
+        """统计符合筛选条件的报告数量"""
+        try:
+            return self.report_repo.count_reports(**filters)
+        except Exception as e:
+            logger.error(f"统计报告数量失败: {str(e)}")
+            return 0
+
+    def get_report_stocks(self) -> List[Dict[str, str]]:
+        """获取有报告的股票列表（用于筛选下拉框）"""
+        try:
+            return [{'code': code, 'name': name} for code, name in self.report_repo.list_report_stocks() if code and name]
+        except Exception as e:
+            logger.error(f"获取报告股票列表失败: {str(e)}")
+            return []
+
     def get_global_reports_count(self) -> int:
         """获取全局报告总数（管理员功能）"""
         try:
-            total_count = 0
-            if os.path.exists(self.reports_dir):
-                for date_dir in os.listdir(self.reports_dir):
-                    date_path = os.path.join(self.reports_dir, date_dir)
-                    if os.path.isdir(date_path):
-                        json_files = [f for f in os.listdir(date_path) if f.endswith('.json')]
-                        total_count += len(json_files)
-            return total_count
+            return self.counter_repo.get_global_count()
         except Exception as e:
             logger.error(f"获取全局报告数量失败: {str(e)}")
             return 0
@@ -863,36 +921,38 @@ class AnalysisService:
         try:
             # 获取用户关注的股票
             user_stocks = self.watchlist_repo.get_user_stock_codes(user_id)
-            
-            accessible_count = 0
-            if os.path.exists(self.reports_dir):
-                for date_dir in os.listdir(self.reports_dir):
-                    date_path = os.path.join(self.reports_dir, date_dir)
-                    if os.path.isdir(date_path):
-                        for file_name in os.listdir(date_path):
-                            if file_name.endswith('.json'):
-                                stock_code = file_name.replace('.json', '')
-                                if stock_code in user_stocks:
-                                    accessible_count += 1
-            return accessible_count
+            return self.counter_repo.get_count_for_stocks(user_stocks)
         except Exception as e:
             logger.error(f"获取用户可访问报告数量失败: {str(e)}")
             return 0
-
+    
+    def _purge_task_history(self):
+        """按保留策略清理已结束的历史任务"""
+        try:
+            from flask import current_app
+            retention_days = current_app.config.get('TASK_HISTORY_RETENTION_DAYS', 90)
+            max_per_user = current_app.config.get('TASK_HISTORY_MAX_PER_USER', 200)
+            purged = self.task_repo.purge_history(retention_days, max_per_user)
+            if purged:
+                logger.info(f"清理历史任务 {purged} 个")
+        except Exception as e:
+            logger.warning(f"清理历史任务失败: {str(e)}")
+    
     def create_single_analysis_task(self, user_id: int, stock_code: str, 
                                   analysis_type: str = 'fundamental', ai_provider: str = 'gemini', ai_model: str = None, prompt_id: int = None) -> str:
         """创建单个分析任务"""
         try:
-            import threading
             import time
             from app.services.ai.task_manager import task_manager
+            from app.services.ai.task_executor import analysis_executor, PRIORITY_HIGH
             
             # 生成任务ID
             task_id = f"single_{stock_code}_{user_id}_{int(time.time())}"
             
-            # 创建任务记录
-            task_data = {
+            # 创建任务记录（同时由本进程持有执行租约）
+            self.task_repo.create({
                 'task_id': task_id,
+                'task_type': 'single',
                 'user_id': user_id,
                 'stock_code': stock_code,
                 'analysis_type': analysis_type,
@@ -900,96 +960,19 @@ class AnalysisService:
                 'ai_model': ai_model,
                 'prompt_id': prompt_id,
                 'status': 'pending',
-                'created_at': datetime.utcnow().isoformat() + 'Z',
                 'total_count': 1,
                 'completed_count': 0,
                 'failed_count': 0,
                 'retry_count': 0,
                 'max_retries': 5,
-                'retry_history': []
-            }
-            
-            # 保存任务信息到文件
-            task_file = os.path.join(self.reports_dir, f"{task_id}.task.json")
-            with open(task_file, 'w', encoding='utf-8') as f:
-                json.dump(task_data, f, ensure_ascii=False, indent=2)
-            
-            # 在后台线程中执行单个分析
-            def run_single_analysis():
-                try:
-                    # 创建Flask应用上下文
-                    from app import create_app
-                    app = create_app()
-                    
-                    with app.app_context():
-                        logger.info(f"开始执行单个分析任务: {task_id}")
-                        
-                        # 更新任务状态为进行中
-                        task_data['status'] = 'running'
-                        task_data['started_at'] = datetime.utcnow().isoformat() + 'Z'
-                        with open(task_file, 'w', encoding='utf-8') as f:
-                            json.dump(task_data, f, ensure_ascii=False, indent=2)
-                        
-                        # 检查是否被暂停或停止
-                        if not task_manager.wait_if_paused(task_id):
-                            logger.info(f"任务 {task_id} 被停止，退出执行")
-                            task_data['status'] = 'stopped'
-                            task_data['stopped_at'] = datetime.utcnow().isoformat() + 'Z'
-                            with open(task_file, 'w', encoding='utf-8') as f:
-                                json.dump(task_data, f, ensure_ascii=False, indent=2)
-                            
-                            # 从任务管理器中注销被停止的任务
-                            task_manager.unregister_task(task_id)
-                            return
-                        
-                        # 执行分析（带重试机制）
-                        # 在新应用上下文中重新创建服务实例
-                        from app.services.ai.analysis_service import AnalysisService
-                        from app import db
-                        analysis_service = AnalysisService(db.session)
-                        result = analysis_service._run_analysis_with_retry(stock_code, user_id, analysis_type, ai_provider, task_data, task_file)
-                        
-                        if result['success']:
-                            task_data['completed_count'] = 1
-                            task_data['status'] = 'completed'
-                            task_data['progress'] = 100
-                            logger.info(f"股票 {stock_code} 分析成功")
-                        else:
-                            task_data['failed_count'] = 1
-                            task_data['status'] = 'failed'
-                            task_data['error'] = result.get('error', '分析失败')
-                            task_data['final_error'] = result.get('error', '分析失败')
-                            logger.error(f"股票 {stock_code} 分析失败: {result.get('error')}")
-                        
-                        # 更新任务状态
-                        task_data['completed_at'] = datetime.utcnow().isoformat() + 'Z'
-                        with open(task_file, 'w', encoding='utf-8') as f:
-                            json.dump(task_data, f, ensure_ascii=False, indent=2)
-                        
-                        # 从任务管理器中注销已完成的任务
-                        task_manager.unregister_task(task_id)
-                        
-                        logger.info(f"单个分析任务完成: {task_id}")
-                    
-                except Exception as e:
-                    logger.error(f"单个分析任务执行失败: {task_id}, 错误: {str(e)}")
-                    task_data['status'] = 'failed'
-                    task_data['error'] = str(e)
-                    task_data['final_error'] = str(e)
-                    task_data['failed_at'] = datetime.utcnow().isoformat() + 'Z'
-                    with open(task_file, 'w', encoding='utf-8') as f:
-                        json.dump(task_data, f, ensure_ascii=False, indent=2)
-                    
-                    # 从任务管理器中注销失败的任务
-                    task_manager.unregister_task(task_id)
-            
-            # 启动后台线程
-            analysis_thread = threading.Thread(target=run_single_analysis)
-            analysis_thread.daemon = True
-            analysis_thread.start()
+                'retry_history': [],
+                **analysis_executor.new_lease()
+            })
+            self._purge_task_history()
             
-            # 注册到任务管理器
-            task_manager.register_task(task_id, analysis_thread, 'single_analysis')
+            # 先注册到任务管理器，排队期间也可以暂停/停止
+            task_manager.register_task(task_id, None, 'single_analysis')
+            self._submit_task(task_id, partial(self._run_single_task, task_id), user_id, PRIORITY_HIGH)
             
             logger.info(f"单个分析任务已创建: {task_id}")
             return task_id
@@ -997,21 +980,115 @@ class AnalysisService:
         except Exception as e:
             logger.error(f"创建单个分析任务失败: {str(e)}")
             raise e
+    
+    def _run_single_task(self, task_id: str):
+        """在分析执行器的工作线程中执行单个分析任务（执行器提供应用上下文）"""
+        from app.services.ai.task_manager import task_manager
+        
+        try:
+            logger.info(f"开始执行单个分析任务: {task_id}")
+            
+            task = self.task_repo.get_by_task_id(task_id)
+            if not task:
+                logger.warning(f"任务不存在: {task_id}")
+                task_manager.unregister_task(task_id)
+                return
+            task_data = task.to_dict()
+            stock_code = task.stock_code
+            
+            # 检查是否被暂停或停止
+            if not task_manager.wait_if_paused(task_id):
+                logger.info(f"任务 {task_id} 被停止，退出执行")
+                self.task_repo.update_fields(task_id, status='stopped', stopped_at=datetime.utcnow())
+                
+                # 从任务管理器中注销被停止的任务
+                task_manager.unregister_task(task_id)
+                return
+            
+            # 更新任务状态为进行中
+            self.task_repo.update_fields(task_id, status='running', started_at=task.started_at or datetime.utcnow())
+            
+            if not self._get_unfinished_stocks(task):
+                # 中断前已完成分析，不再重复调用大模型
+                result = {'success': True}
+            else:
+                # 执行分析（带重试机制）
+                result = self._run_analysis_with_retry(stock_code, task.user_id, task.analysis_type, task.ai_provider, task_data)
+            
+            if result['success']:
+                self.task_repo.record_stock_result(task_id, stock_code, 'completed')
+                self.task_repo.update_fields(task_id, status='completed', completed_at=datetime.utcnow())
+                logger.info(f"股票 {stock_code} 分析成功")
+            else:
+                error = result.get('error', '分析失败')
+                self.task_repo.record_stock_result(task_id, stock_code, 'failed', error=error)
+                self.task_repo.update_fields(
+                    task_id, status='failed', error=error, final_error=error, completed_at=datetime.utcnow()
+                )
+                logger.error(f"股票 {stock_code} 分析失败: {result.get('error')}")
+            
+            # 从任务管理器中注销已完成的任务
+            task_manager.unregister_task(task_id)
+            
+            logger.info(f"单个分析任务完成: {task_id}")
+            
+        except Exception as e:
+            logger.error(f"单个分析任务执行失败: {task_id}, 错误: {str(e)}")
+            self._mark_task_failed(task_id, str(e))
+            
+            # 从任务管理器中注销失败的任务
+            task_manager.unregister_task(task_id)
+
+    def _submit_task(self, task_id: str, fn, user_id: int, priority: int, is_retry: bool = False):
+        """提交任务到分析执行器，队列已满时清理任务记录并抛出异常"""
+        from app.services.ai.task_manager import task_manager
+        from app.services.ai.task_executor import analysis_executor, ExecutorFullError
+        
+        try:
+            position = analysis_executor.submit(task_id, fn, user_id=user_id, priority=priority)
+        except ExecutorFullError as e:
+            task_manager.unregister_task(task_id)
+            if is_retry:
+                # 重试的任务保留记录，恢复为失败状态
+                self.task_repo.update_fields(task_id, status='failed', failed_at=datetime.utcnow(), final_error=str(e))
+            else:
+                self.task_repo.delete_by_task_id(task_id)
+            raise
+        
+        if position > 0:
+            logger.info(f"任务 {task_id} 排队中，位置: {position}")
+        return position
+    
+    def get_task_queue_position(self, task_id: str) -> Optional[int]:
+        """获取任务在分析执行器中的排队位置（0表示执行中）"""
+        from app.services.ai.task_executor import analysis_executor
+        return analysis_executor.get_queue_position(task_id)
+
+    def _mark_task_failed(self, task_id: str, error: str):
+        """在工作线程中任务异常退出时标记任务失败"""
+        try:
+            self.session.rollback()
+            self.task_repo.update_fields(
+                task_id, status='failed', error=error, final_error=error, failed_at=datetime.utcnow()
+            )
+        except Exception as e:
+            logger.error(f"更新任务失败状态出错: {task_id}, {str(e)}")
 
     def create_batch_analysis_task(self, user_id: int, user_email: str, stocks: List[Dict], 
                                   analysis_type: str = 'fundamental', ai_provider: str = 'qwen', ai_model: str = None, prompt_id: int = None) -> str:
         """创建批量分析任务"""
         try:
-            import threading
             import time
             from app.services.ai.task_manager import task_manager
+            from app.services.ai.task_executor import analysis_executor, PRIORITY_NORMAL
             
             # 生成任务ID
             task_id = f"batch_{user_id}_{int(time.time())}"
             
-            # 创建任务记录
-            task_data = {
+            # 创建任务记录（同时由本进程持有执行租约）
+            self.task_repo.create({
                 'task_id': task_id,
+                'task_type': 'batch',
                 'user_id': user_id,
                 'user_email': user_email,
                 'stocks': stocks,
@@ -1020,171 +1097,17 @@ class AnalysisService:
                 'ai_model': ai_model,
                 'prompt_id': prompt_id,
                 'status': 'pending',
-                'created_at': datetime.utcnow().isoformat() + 'Z',
                 'total_count': len(stocks),
                 'completed_count': 0,
                 'failed_count': 0,
                 'max_retries': 5,
-                'failed_stocks': [],
-                'stock_status': {}  # 记录每个股票的状态
-            }
+                **analysis_executor.new_lease()
+            })
+            self._purge_task_history()
             
-            # 保存任务信息到文件
-            task_file = os.path.join(self.reports_dir, f"{task_id}.task.json")
-            with open(task_file, 'w', encoding='utf-8') as f:
-                json.dump(task_data, f, ensure_ascii=False, indent=2)
-            
-            # 在后台线程中执行批量分析
-            def run_batch_analysis():
-                try:
-                    # 创建Flask应用上下文
-                    from app import create_app
-                    app = create_app()
-                    
-                    with app.app_context():
-                        logger.info(f"开始执行批量分析任务: {task_id}")
-                        
-                        # 检查用户是否为管理员（管理员不消耗金币）
-                        from app.models.user import User
-                        from app import db
-                        user = db.session.query(User).get(user_id)
-                        if not user or user.user_role not in ['SUPER_ADMIN', 'SITE_ADMIN']:
-                            # 非管理员用户需要扣除金币
-                            from app.services.coin.coin_service import CoinService
-                            coin_service = CoinService(db.session)
-                            
-                            # 计算总金币数量
-                            total_coins = len(stocks) * 10
-                            
-                            # 扣除金币
-                            spend_result = coin_service.spend_coins(
-                                user_id=user_id,
-                                amount=total_coins,
-                                description=f'批量分析：{len(stocks)}个股票',
-                                related_type='BATCH_ANALYSIS'
-                            )
-                            
-                            if not spend_result['success']:
-                                logger.error(f"批量分析金币扣除失败: {spend_result.get('error')}")
-                                task_data['status'] = 'failed'
-                                task_data['error'] = f"金币不足: {spend_result.get('error')}"
-                                with open(task_file, 'w', encoding='utf-8') as f:
-                                    json.dump(task_data, f, ensure_ascii=False, indent=2)
-                                return
-                            
-                            logger.info(f"用户 {user_id} 消耗{total_coins}金币进行批量分析")
-                        
-                        # 更新任务状态为进行中
-                        task_data['status'] = 'running'
-                        task_data['started_at'] = datetime.utcnow().isoformat() + 'Z'
-                        with open(task_file, 'w', encoding='utf-8') as f:
-                            json.dump(task_data, f, ensure_ascii=False, indent=2)
-                        
-                        # 逐个分析股票
-                        for i, stock in enumerate(stocks):
-                            try:
-                                # 检查是否被暂停或停止
-                                if not task_manager.wait_if_paused(task_id):
-                                    logger.info(f"任务 {task_id} 被停止，退出执行")
-                                    task_data['status'] = 'stopped'
-                                    task_data['stopped_at'] = datetime.utcnow().isoformat() + 'Z'
-                                    with open(task_file, 'w', encoding='utf-8') as f:
-                                        json.dump(task_data, f, ensure_ascii=False, indent=2)
-                                    
-                                    # 从任务管理器中注销被停止的任务
-                                    task_manager.unregister_task(task_id)
-                                    return
-                                
-                                stock_code = stock['code']
-                                logger.info(f"分析股票 {i+1}/{len(stocks)}: {stock_code}")
-                                
-                                # 执行分析（带重试机制）
-                                result = self._run_analysis_with_retry_for_batch(stock_code, user_id, analysis_type, ai_provider, task_data, task_file)
-                                
-                                if result['success']:
-                                    task_data['completed_count'] += 1
-                                    task_data['stock_status'][stock_code] = {
-                                        'status': 'completed',
-                                        'retry_count': result.get('retry_count', 0),
-                                        'completed_at': datetime.utcnow().isoformat() + 'Z'
-                                    }
-                                    logger.info(f"股票 {stock_code} 分析成功")
-                                else:
-                                    task_data['failed_count'] += 1
-                                    # 记录失败的股票信息
-                                    failed_stock_info = {
-                                        'code': stock_code,
-                                        'name': stock.get('name', ''),
-                                        'error': result.get('error', '分析失败'),
-                                        'retry_count': result.get('retry_count', 0)
-                                    }
-                                    task_data['failed_stocks'].append(failed_stock_info)
-                                    task_data['stock_status'][stock_code] = {
-                                        'status': 'failed',
-                                        'retry_count': result.get('retry_count', 0),
-                                        'error': result.get('error', '分析失败'),
-                                        'failed_at': datetime.utcnow().isoformat() + 'Z'
-                                    }
-                                    logger.error(f"股票 {stock_code} 分析失败: {result.get('error')}")
-                                
-                                # 更新进度
-                                task_data['progress'] = (i + 1) / len(stocks) * 100
-                                with open(task_file, 'w', encoding='utf-8') as f:
-                                    json.dump(task_data, f, ensure_ascii=False, indent=2)
-                                
-                                # 避免请求过于频繁
-                                time.sleep(2)
-                                
-                            except Exception as e:
-                                task_data['failed_count'] += 1
-                                # 记录失败的股票信息
-                                failed_stock_info = {
-                                    'code': stock['code'],
-                                    'name': stock.get('name', ''),
-                                    'error': str(e),
-                                    'retry_count': 0
-                                }
-                                task_data['failed_stocks'].append(failed_stock_info)
-                                task_data['stock_status'][stock['code']] = {
-                                    'status': 'failed',
-                                    'retry_count': 0,
-                                    'error': str(e),
-                                    'failed_at': datetime.utcnow().isoformat()
-                                }
-                                logger.error(f"分析股票 {stock['code']} 时发生错误: {str(e)}")
-                        
-                        # 更新任务状态为完成
-                        task_data['status'] = 'completed'
-                        task_data['completed_at'] = datetime.utcnow().isoformat() + 'Z'
-                        with open(task_file, 'w', encoding='utf-8') as f:
-                            json.dump(task_data, f, ensure_ascii=False, indent=2)
-                        
-                        # 从任务管理器中注销已完成的任务
-                        task_manager.unregister_task(task_id)
-                        
-                        # 发送完成邮件通知
-                        self._send_batch_analysis_completion_email(task_data)
-                        
-                        logger.info(f"批量分析任务完成: {task_id}")
-                    
-                except Exception as e:
-                    logger.error(f"批量分析任务执行失败: {task_id}, 错误: {str(e)}")
-                    task_data['status'] = 'failed'
-                    task_data['error'] = str(e)
-                    task_data['failed_at'] = datetime.utcnow().isoformat() + 'Z'
-                    with open(task_file, 'w', encoding='utf-8') as f:
-                        json.dump(task_data, f, ensure_ascii=False, indent=2)
-                    
-                    # 从任务管理器中注销失败的任务
-                    task_manager.unregister_task(task_id)
-            
-            # 启动后台线程
-            analysis_thread = threading.Thread(target=run_batch_analysis)
-            analysis_thread.daemon = True
-            analysis_thread.start()
-            
-            # 注册到任务管理器
-            task_manager.register_task(task_id, analysis_thread, 'batch_analysis')
+            # 先注册到任务管理器，排队期间也可以暂停/停止
+            task_manager.register_task(task_id, None, 'batch_analysis')
+            self._submit_task(task_id, partial(self._run_batch_task, task_id), user_id, PRIORITY_NORMAL)
             
             logger.info(f"批量分析任务已创建: {task_id}")
             return task_id
@@ -1193,6 +1116,239 @@ class AnalysisService:
             logger.error(f"创建批量分析任务失败: {str(e)}")
             raise e
     
+    def _run_batch_task(self, task_id: str):
+        """在分析执行器的工作线程中执行批量分析任务，中断后重新执行时只分析尚未完成的股票"""
+        from app.services.ai.task_manager import task_manager
+        
+        try:
+            logger.info(f"开始执行批量分析任务: {task_id}")
+            
+            task = self.task_repo.get_by_task_id(task_id)
+            if not task:
+                logger.warning(f"任务不存在: {task_id}")
+                task_manager.unregister_task(task_id)
+                return
+            task_data = task.to_dict()
+            stocks = task.stocks or []
+            started_at = task.started_at
+            
+            # 扣除金币（每个任务只扣一次）
+            if not self._charge_batch_coins(task_id, task.user_id, len(stocks)):
+                task_manager.unregister_task(task_id)
+                return
+            
+            # 更新任务状态为进行中
+            self.task_repo.update_fields(task_id, status='running', started_at=started_at or datetime.utcnow())
+            
+            pending_stocks = self._get_unfinished_stocks(self.task_repo.get_by_task_id(task_id))
+            if len(pending_stocks) < len(stocks):
+                logger.info(f"任务 {task_id} 从断点继续，剩余 {len(pending_stocks)}/{len(stocks)} 个股票")
+            
+            # 并发分析股票，任务被停止时退出
+            if not self._analyze_batch_stocks(task_id, pending_stocks, task_data['user_id'],
+                                              task_data['analysis_type'], task_data['ai_provider'], task_data):
+                logger.info(f"任务 {task_id} 被停止，退出执行")
+                self.task_repo.update_fields(task_id, status='stopped', stopped_at=datetime.utcnow())
+                
+                # 从任务管理器中注销被停止的任务
+                task_manager.unregister_task(task_id)
+                return
+            
+            # 更新任务状态为完成
+            self.task_repo.update_fields(task_id, status='completed', completed_at=datetime.utcnow())
+            
+            # 从任务管理器中注销已完成的任务
+            task_manager.unregister_task(task_id)
+            
+            # 发送完成邮件通知
+            self._send_batch_analysis_completion_email(self.task_repo.get_by_task_id(task_id).to_dict())
+            
+            logger.info(f"批量分析任务完成: {task_id}")
+            
+            # 连接池统计（复用连接节省的握手时间）
+            from app.services.ai.http_pool import get_pool_stats
+            for stats in get_pool_stats():
+                logger.info(f"HTTP连接池 {stats['endpoint']}: 请求 {stats['requests']} 次，"
+                            f"新建连接 {stats['new_connections']} 个，节省握手 {stats['handshake_saved_ms']}ms")
+            
+            # 请求对冲统计（额外发出的请求和Token消耗）
+            from app.services.ai.hedging import request_hedger
+            if request_hedger.is_enabled():
+                hedge_stats = request_hedger.get_stats()
+                logger.info(f"请求对冲: 对冲 {hedge_stats['hedges']}/{hedge_stats['requests']} 次，"
+                            f"对冲胜出 {hedge_stats['hedge_wins']} 次，额外消耗约 {hedge_stats['extra_tokens']} Token")
+            
+        except Exception as e:
+            logger.error(f"批量分析任务执行失败: {task_id}, 错误: {str(e)}")
+            self._mark_task_failed(task_id, str(e))
+            
+            # 从任务管理器中注销失败的任务
+            task_manager.unregister_task(task_id)
+    
+    def _charge_batch_coins(self, task_id: str, user_id: int, stock_count: int) -> bool:
+        """扣除批量分析金币，已扣过的任务不再重复扣除。返回False表示扣费失败"""
+        from app.models.user import User
+        
+        # 检查用户是否为管理员（管理员不消耗金币）
+        user = self.session.get(User, user_id)
+        if user and user.user_role in ['SUPER_ADMIN', 'SITE_ADMIN']:
+            return True
+        
+        if not self.task_repo.claim_coin_charge(task_id):
+            logger.info(f"任务 {task_id} 已扣除过金币，不再重复扣除")
+            return True
+        
+        # 非管理员用户需要扣除金币
+        from app.services.coin.coin_service import CoinService
+        coin_service = CoinService(self.session)
+        
+        # 计算总金币数量
+        total_coins = stock_count * 10
+        
+        # 扣除金币
+        spend_result = coin_service.spend_coins(
+            user_id=user_id,
+            amount=total_coins,
+            description=f'批量分析：{stock_count}个股票',
+            related_type='BATCH_ANALYSIS'
+        )
+        
+        if not spend_result['success']:
+            logger.error(f"批量分析金币扣除失败: {spend_result.get('error')}")
+            self.task_repo.release_coin_charge(task_id)
+            self.task_repo.update_fields(task_id, status='failed', error=f"金币不足: {spend_result.get('error')}")
+            return False
+        
+        logger.info(f"用户 {user_id} 消耗{total_coins}金币进行批量分析")
+        return True
+    
+    def _get_unfinished_stocks(self, task) -> List[Dict]:
+        """获取任务中尚未完成分析的股票
+        
+        任务中断后重新执行时，本任务在中断前已生成完整报告但未来得及记录状态的股票直接标记为完成，避免重复调用大模型。
+        其他任务或其他用户的报告、以及全部尝试失败后保存的部分报告不算完成
+        """
+        stocks = task.stocks or ([{'code': task.stock_code}] if task.stock_code else [])
+        finished = {item.stock_code for item in task.stock_statuses if item.status == 'completed'}
+        unfinished = []
+        
+        for stock in stocks:
+            stock_code = stock['code']
+            if stock_code in finished:
+                continue
+            if task.started_at:
+                report = self.report_repo.get_complete_for_task(task.task_id, stock_code)
+                if report:
+                    logger.info(f"股票 {stock_code} 在任务中断前已生成报告 {report.report_id}，不再重复分析")
+                    if task.task_type == 'batch':
+                        self.task_repo.record_stock_result(task.task_id, stock_code, 'completed')
+                    continue
+            unfinished.append(stock)
+        
+        return unfinished
+    
+    def recover_interrupted_tasks(self) -> int:
+        """接管并重新提交租约已过期的未完成任务（执行进程重启或崩溃），返回恢复的任务数"""
+        from app.services.ai.task_manager import task_manager
+        from app.services.ai.task_executor import analysis_executor, ExecutorFullError, PRIORITY_HIGH, PRIORITY_NORMAL
+        
+        recovered = 0
+        now = datetime.utcnow()
+        for task in self.task_repo.list_interrupted(now):
+            task_id = task.task_id
+            lease = analysis_executor.new_lease()
+            if not self.task_repo.claim_lease(task_id, lease['lease_owner'], lease['lease_expires_at'], now):
+                # 已被其他进程接管
+                continue
+            
+            if task.task_type == 'batch':
+                runner, task_type, priority = partial(self._run_batch_task, task_id), 'batch_analysis', PRIORITY_NORMAL
+            else:
+                runner, task_type, priority = partial(self._run_single_task, task_id), 'single_analysis', PRIORITY_HIGH
+            
+            task_manager.register_task(task_id, None, task_type)
+            try:
+                analysis_executor.submit(task_id, runner, user_id=task.user_id, priority=priority)
+            except ExecutorFullError:
+                # 队列已满，释放租约等待下次恢复
+                task_manager.unregister_task(task_id)
+                self.task_repo.update_fields(task_id, lease_expires_at=None)
+                break
+            
+            recovered += 1
+            logger.info(f"已恢复中断的任务: {task_id}（状态: {task.status}）")
+        
+        return recovered
+    
+    def _analyze_batch_stocks(self, task_id: str, stocks: List[Dict], user_id: int, analysis_type: str,
+                              ai_provider: str, task_data: Dict[str, Any]) -> bool:
+        """并发分析批量任务中的股票，并发数不超过提供商上限。返回False表示任务被停止"""
+        from concurrent.futures import ThreadPoolExecutor
+        from flask import current_app
+        from app.services.ai.task_manager import task_manager
+        from app.services.ai.provider_pacer import provider_pacer
+        
+        if not stocks:
+            return task_manager.wait_if_paused(task_id)
+        
+        app = current_app._get_current_object()
+        max_workers = min(len(stocks), provider_pacer.get_concurrency(ai_provider))
+        
+        # 开始AI分析前批量预取行情，每只股票分析时直接读取缓存
+        self._prefetch_quotes(stocks, ai_provider)
+        
+        def analyze_stock(index: int, stock: Dict) -> None:
+            stock_code = stock['code']
+            with app.app_context():
+                from app import db
+                service = AnalysisService(db.session)
+                try:
+                    logger.info(f"分析股票 {index + 1}/{len(stocks)}: {stock_code}")
+                    
+                    # 执行分析（带重试机制）
+                    result = service._run_analysis_with_retry_for_batch(stock_code, user_id, analysis_type,
+                                                                        ai_provider, task_data)
+                    if result.get('stopped'):
+                        # 任务被停止，未分析的股票不记录状态
+                        return
+                    
+                    # 记录股票状态并更新进度
+                    if result['success']:
+                        service.task_repo.record_stock_result(task_id, stock_code, 'completed',
+                                                              retry_count=result.get('retry_count', 0))
+                        logger.info(f"股票 {stock_code} 分析成功")
+                    else:
+                        service.task_repo.record_stock_result(task_id, stock_code, 'failed',
+                                                              retry_count=result.get('retry_count', 0),
+                                                              error=result.get('error', '分析失败'))
+                        logger.error(f"股票 {stock_code} 分析失败: {result.get('error')}")
+                        
+                except Exception as e:
+                    db.session.rollback()
+                    service.task_repo.record_stock_result(task_id, stock_code, 'failed', error=str(e))
+                    logger.error(f"分析股票 {stock_code} 时发生错误: {str(e)}")
+        
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"batch-{task_id}") as pool:
+            futures = [pool.submit(analyze_stock, i, stock) for i, stock in enumerate(stocks)]
+            for future in futures:
+                future.result()
+        
+        return not task_manager.is_task_stopped(task_id)
+    
+    def _prefetch_quotes(self, stocks: List[Dict], ai_provider: str) -> None:
+        """批量获取任务中股票的行情并写入缓存（未配置API密钥时生成demo内容，不需要行情）"""
+        try:
+            provider = self._get_llm_provider(ai_provider)
+            if not provider or not provider.api_key:
+                return
+            
+            from app.services.data.multi_source_data_service import multi_source_service
+            quotes = multi_source_service.get_stock_data_batch([stock['code'] for stock in stocks], fallback=False)
+            logger.info(f"预取行情完成: {sum(1 for data in quotes.values() if data)}/{len(quotes)} 只股票")
+            logger.info(f"行情缓存统计: {multi_source_service.get_cache_stats()}")
+        except Exception as e:
+            logger.warning(f"预取行情失败，分析时逐只获取: {str(e)}")
+    
     def _send_batch_analysis_completion_email(self, task_data: Dict[str, Any]):
         """发送批量分析完成邮件"""
         try:
@@ -1228,112 +1384,159 @@ class AnalysisService:
         except Exception as e:
             logger.error(f"发送批量分析完成邮件失败: {str(e)}")
 
-    def get_task_status(self, task_id: str, user_id: int) -> Optional[Dict[str, Any]]:
-        """获取任务状态"""
+    def get_task_status(self, task_id: str, user_id: int = None) -> Optional[Dict[str, Any]]:
+        """获取任务状态（user_id为空时不检查用户权限）"""
         try:
-            task_file = os.path.join(self.reports_dir, f"{task_id}.task.json")
-            
-            if not os.path.exists(task_file):
+            task = self.task_repo.get_by_task_id(task_id)
+            if not task:
                 return None
             
-            with open(task_file, 'r', encoding='utf-8') as f:
-                task_data = json.load(f)
-            
             # 检查用户权限
-            if task_data.get('user_id') != user_id:
+            if user_id is not None and task.user_id != user_id:
                 return None
             
-            return task_data
+            return task.to_dict()
             
         except Exception as e:
             logger.error(f"获取任务状态失败: {str(e)}")
             return None
     
-    def get_user_tasks(self, user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+    def iter_task_events(self, task_id: str, poll_interval: float = None, heartbeat_seconds: float = 15.0):
+        """实时查看任务：逐个产生 (事件名, 数据) ，事件名为None表示保活
+        
+        - progress：任务状态或进度变化
+        - chunk：股票正在生成的报告新增内容（从部分报告文件按偏移读取，只在内存中保留读取位置）
+        - reset：股票的生成重新开始（重试），之前收到的内容作废
+        - done：任务结束；完成的股票部分报告文件已删除，完整报告通过报告接口获取
+        """
+        import codecs
+        from flask import current_app
+        from app.services.ai.report_stream import partial_report_path, read_partial_report
+        
+        if poll_interval is None:
+            poll_interval = current_app.config.get('ANALYSIS_STREAM_POLL_INTERVAL', 0.5)
+        offsets: Dict[str, int] = {}
+        decoders: Dict[str, Any] = {}
+        last_progress = None
+        last_sent = time.monotonic()
+        
+        while True:
+            # 结束上一次查询的事务，读取其他线程/进程写入的最新状态
+            self.session.rollback()
+            task = self.task_repo.get_by_task_id(task_id)
+            if not task:
+                yield 'done', {'task_id': task_id, 'status': 'deleted'}
+                return
+            task_data = task.to_dict()
+            progress = {key: task_data.get(key) for key in
+                        ('task_id', 'status', 'progress', 'total_count', 'completed_count', 'failed_count',
+                         'stock_status', 'final_error')}
+            if progress != last_progress:
+                last_progress = progress
+                last_sent = time.monotonic()
+                yield 'progress', progress
+            
+            more_data = False
+            stock_codes = [stock.get('code') for stock in task.stocks or []] or [task.stock_code]
+            for stock_code in stock_codes:
+                data, offset, reset = read_partial_report(partial_report_path(task_id, stock_code),
+                                                          offsets.get(stock_code, 0))
+                if reset or stock_code not in decoders:
+                    decoders[stock_code] = codecs.getincrementaldecoder('utf-8')(errors='replace')
+                    if reset:
+                        yield 'reset', {'stock_code': stock_code}
+                offsets[stock_code] = offset
+                text = decoders[stock_code].decode(data)
+                if text:
+                    more_data = True
+                    last_sent = time.monotonic()
+                    yield 'chunk', {'stock_code': stock_code, 'text': text, 'offset': offset}
+            
+            if task.status in ('completed', 'failed', 'stopped'):
+                yield 'done', progress
+                return
+            if time.monotonic() - last_sent >= heartbeat_seconds:
+                last_sent = time.monotonic()
+                yield None, None
+            if not more_data:
+                time.sleep(poll_interval)
+    
+    def get_user_tasks(self, user_id: int, limit: int = 10, offset: int = 0) -> List[Dict[str, Any]]:
         """获取用户的任务列表"""
         try:
-            tasks = []
-            
-            if os.path.exists(self.reports_dir):
-                for file_name in os.listdir(self.reports_dir):
-                    if file_name.endswith('.task.json'):
-                        task_file = os.path.join(self.reports_dir, file_name)
-                        try:
-                            with open(task_file, 'r', encoding='utf-8') as f:
-                                task_data = json.load(f)
-                            
-                            # 只返回当前用户的任务
-                            if task_data.get('user_id') == user_id:
-                                tasks.append(task_data)
-                        except Exception as e:
-                            logger.error(f"读取任务文件失败: {task_file}, {str(e)}")
-            
             # 按创建时间排序，最新的在前
-            tasks.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-            
-            return tasks[:limit]
+            tasks = self.task_repo.list_tasks(user_id=user_id, limit=limit, offset=offset)
+            return [task.to_dict() for task in tasks]
             
         except Exception as e:
             logger.error(f"获取用户任务列表失败: {str(e)}")
             return []
 
+    def count_tasks(self, user_id: int = None) -> int:
+        """统计任务数量（user_id为空时统计所有任务）"""
+        try:
+            return self.task_repo.count_tasks(user_id=user_id)
+        except Exception as e:
+            logger.error(f"统计任务数量失败: {str(e)}")
+            return 0
+
+    def retry_task(self, task_id: str) -> bool:
+        """重置失败的任务并重新启动"""
+        from app.services.ai.task_executor import analysis_executor
+        self.task_repo.reset_for_retry(task_id, **analysis_executor.new_lease())
+        task_data = self.get_task_status(task_id)
+        if not task_data:
+            return False
+        
+        if task_data.get('task_type') == 'single':
+            # 单个分析任务
+            self._retry_single_task(task_data)
+        else:
+            # 批量分析任务
+            self._retry_batch_task(task_data)
+        return True
+
     def _retry_single_task(self, task_data: Dict[str, Any]):
         """重试单个分析任务"""
         try:
-            import threading
+            from app.services.ai.task_executor import PRIORITY_HIGH
             
             def run_retry_analysis():
-                import os
-                from app import create_app
-                app = create_app()
-                with app.app_context():
-                    try:
-                        logger.info(f"开始重试单个分析任务: {task_data['task_id']}")
-                        
-                        # 更新任务状态为进行中
-                        task_data['status'] = 'running'
-                        task_data['started_at'] = datetime.utcnow().isoformat() + 'Z'
-                        task_file = os.path.join(self.reports_dir, f"{task_data['task_id']}.task.json")
-                        with open(task_file, 'w', encoding='utf-8') as f:
-                            json.dump(task_data, f, ensure_ascii=False, indent=2)
-                        
-                        # 执行分析（带重试机制）
-                        stock_code = task_data['stock_code']
-                        user_id = task_data['user_id']
-                        analysis_type = task_data['analysis_type']
-                        ai_provider = task_data['ai_provider']
-                        
-                        result = self._run_analysis_with_retry(stock_code, user_id, analysis_type, ai_provider, task_data, task_file)
-                        
-                        if result['success']:
-                            task_data['status'] = 'completed'
-                            task_data['completed_count'] = 1
-                            task_data['completed_at'] = datetime.utcnow().isoformat() + 'Z'
-                            logger.info(f"重试单个分析任务成功: {task_data['task_id']}")
-                        else:
-                            task_data['status'] = 'failed'
-                            task_data['failed_count'] = 1
-                            task_data['failed_at'] = datetime.utcnow().isoformat() + 'Z'
-                            task_data['final_error'] = result.get('error', '分析失败')
-                            logger.error(f"重试单个分析任务失败: {task_data['task_id']}, 错误: {result.get('error')}")
+                from app import db
+                task_repo = TaskRepository(db.session)
+                try:
+                    logger.info(f"开始重试单个分析任务: {task_data['task_id']}")
+                    
+                    # 更新任务状态为进行中
+                    task_repo.update_fields(task_data['task_id'], status='running', started_at=datetime.utcnow())
+                    
+                    # 执行分析（带重试机制）
+                    stock_code = task_data['stock_code']
+                    user_id = task_data['user_id']
+                    analysis_type = task_data['analysis_type']
+                    ai_provider = task_data['ai_provider']
+                    
+                    result = self._run_analysis_with_retry(stock_code, user_id, analysis_type, ai_provider, task_data)
+                    
+                    # 保存最终状态
+                    if result['success']:
+                        task_repo.record_stock_result(task_data['task_id'], stock_code, 'completed')
+                        task_repo.update_fields(task_data['task_id'], status='completed', completed_at=datetime.utcnow())
+                        logger.info(f"重试单个分析任务成功: {task_data['task_id']}")
+                    else:
+                        error = result.get('error', '分析失败')
+                        task_repo.record_stock_result(task_data['task_id'], stock_code, 'failed', error=error)
+                        task_repo.update_fields(task_data['task_id'], status='failed', failed_at=datetime.utcnow(),
+                                                final_error=error)
+                        logger.error(f"重试单个分析任务失败: {task_data['task_id']}, 错误: {result.get('error')}")
                         
-                        # 保存最终状态
-                        with open(task_file, 'w', encoding='utf-8') as f:
-                            json.dump(task_data, f, ensure_ascii=False, indent=2)
-                            
-                    except Exception as e:
-                        logger.error(f"重试单个分析任务异常: {task_data['task_id']}, 错误: {str(e)}")
-                        task_data['status'] = 'failed'
-                        task_data['failed_at'] = datetime.utcnow().isoformat() + 'Z'
-                        task_data['final_error'] = str(e)
-                        task_file = os.path.join(self.reports_dir, f"{task_data['task_id']}.task.json")
-                        with open(task_file, 'w', encoding='utf-8') as f:
-                            json.dump(task_data, f, ensure_ascii=False, indent=2)
-            
-            # 启动后台线程（非daemon，避免被主进程重启影响）
-            retry_thread = threading.Thread(target=run_retry_analysis)
-            retry_thread.daemon = False
-            retry_thread.start()
+                except Exception as e:
+                    logger.error(f"重试单个分析任务异常: {task_data['task_id']}, 错误: {str(e)}")
+                    db.session.rollback()
+                    task_repo.update_fields(task_data['task_id'], status='failed', failed_at=datetime.utcnow(),
+                                            final_error=str(e))
+            
+            self._submit_task(task_data['task_id'], run_retry_analysis, task_data['user_id'], PRIORITY_HIGH, is_retry=True)
             
             logger.info(f"单个分析任务重试已启动: {task_data['task_id']}")
             
@@ -1344,104 +1547,49 @@ class AnalysisService:
     def _retry_batch_task(self, task_data: Dict[str, Any]):
         """重试批量分析任务"""
         try:
-            import threading
+            from app.services.ai.task_manager import task_manager
+            from app.services.ai.task_executor import PRIORITY_NORMAL
             
             def run_retry_batch_analysis():
-                import os
-                from app import create_app
-                app = create_app()
-                with app.app_context():
-                    try:
-                        logger.info(f"开始重试批量分析任务: {task_data['task_id']}")
-                        
-                        # 更新任务状态为进行中
-                        task_data['status'] = 'running'
-                        task_data['started_at'] = datetime.utcnow().isoformat() + 'Z'
-                        task_file = os.path.join(self.reports_dir, f"{task_data['task_id']}.task.json")
-                        with open(task_file, 'w', encoding='utf-8') as f:
-                            json.dump(task_data, f, ensure_ascii=False, indent=2)
-                        
-                        # 逐个分析股票
-                        stocks = task_data['stocks']
-                        for i, stock in enumerate(stocks):
-                            try:
-                                stock_code = stock['code']
-                                logger.info(f"重试分析股票 {i+1}/{len(stocks)}: {stock_code}")
-                                
-                                # 执行分析（带重试机制）
-                                result = self._run_analysis_with_retry_for_batch(stock_code, task_data['user_id'], 
-                                                                               task_data['analysis_type'], task_data['ai_provider'], 
-                                                                               task_data, task_file)
-                                
-                                if result['success']:
-                                    task_data['completed_count'] += 1
-                                    task_data['stock_status'][stock_code] = {
-                                        'status': 'completed',
-                                        'retry_count': result.get('retry_count', 0),
-                                        'completed_at': datetime.utcnow().isoformat() + 'Z'
-                                    }
-                                    logger.info(f"重试股票 {stock_code} 分析成功")
-                                else:
-                                    task_data['failed_count'] += 1
-                                    # 记录失败的股票信息
-                                    failed_stock_info = {
-                                        'code': stock_code,
-                                        'name': stock.get('name', ''),
-                                        'error': result.get('error', '分析失败'),
-                                        'retry_count': result.get('retry_count', 0)
-                                    }
-                                    task_data['failed_stocks'].append(failed_stock_info)
-                                    task_data['stock_status'][stock_code] = {
-                                        'status': 'failed',
-                                        'retry_count': result.get('retry_count', 0),
-                                        'error': result.get('error', '分析失败')
-                                    }
-                                    logger.error(f"重试股票 {stock_code} 分析失败: {result.get('error')}")
-                                
-                                # 更新进度
-                                task_data['progress'] = ((i + 1) / len(stocks)) * 100
-                                with open(task_file, 'w', encoding='utf-8') as f:
-                                    json.dump(task_data, f, ensure_ascii=False, indent=2)
-                                    
-                            except Exception as e:
-                                logger.error(f"重试分析股票 {stock_code} 异常: {str(e)}")
-                                task_data['failed_count'] += 1
-                                failed_stock_info = {
-                                    'code': stock_code,
-                                    'name': stock.get('name', ''),
-                                    'error': str(e),
-                                    'retry_count': 0
-                                }
-                                task_data['failed_stocks'].append(failed_stock_info)
-                        
-                        # 更新最终状态
-                        if task_data['failed_count'] == 0:
-                            task_data['status'] = 'completed'
-                            task_data['completed_at'] = datetime.utcnow().isoformat() + 'Z'
-                            logger.info(f"重试批量分析任务全部成功: {task_data['task_id']}")
-                        else:
-                            task_data['status'] = 'failed'
-                            task_data['failed_at'] = datetime.utcnow().isoformat() + 'Z'
-                            task_data['final_error'] = f"部分股票分析失败，成功: {task_data['completed_count']}，失败: {task_data['failed_count']}"
-                            logger.warning(f"重试批量分析任务部分失败: {task_data['task_id']}")
+                from app import db
+                task_id = task_data['task_id']
+                task_repo = TaskRepository(db.session)
+                try:
+                    logger.info(f"开始重试批量分析任务: {task_id}")
+                    
+                    # 更新任务状态为进行中
+                    task_repo.update_fields(task_id, status='running', started_at=datetime.utcnow())
+                    
+                    # 并发分析股票，任务被停止时退出
+                    if not self._analyze_batch_stocks(task_id, task_data['stocks'], task_data['user_id'],
+                                                      task_data['analysis_type'], task_data['ai_provider'], task_data):
+                        logger.info(f"重试任务 {task_id} 被停止，退出执行")
+                        task_repo.update_fields(task_id, status='stopped', stopped_at=datetime.utcnow())
+                        return
+                    
+                    # 更新最终状态
+                    task = task_repo.get_by_task_id(task_id)
+                    if task.failed_count == 0:
+                        task_repo.update_fields(task_id, status='completed', completed_at=datetime.utcnow())
+                        logger.info(f"重试批量分析任务全部成功: {task_id}")
+                    else:
+                        task_repo.update_fields(
+                            task_id, status='failed', failed_at=datetime.utcnow(),
+                            final_error=f"部分股票分析失败，成功: {task.completed_count}，失败: {task.failed_count}"
+                        )
+                        logger.warning(f"重试批量分析任务部分失败: {task_id}")
                         
-                        # 保存最终状态
-                        with open(task_file, 'w', encoding='utf-8') as f:
-                            json.dump(task_data, f, ensure_ascii=False, indent=2)
-                            
-                    except Exception as e:
-                        logger.error(f"重试批量分析任务异常: {task_data['task_id']}, 错误: {str(e)}")
-                        task_data['status'] = 'failed'
-                        task_data['failed_at'] = datetime.utcnow().isoformat() + 'Z'
-                        task_data['final_error'] = str(e)
-                        task_file = os.path.join(self.reports_dir, f"{task_data['task_id']}.task.json")
-                        with open(task_file, 'w', encoding='utf-8') as f:
-                            json.dump(task_data, f, ensure_ascii=False, indent=2)
-            
-            # 启动后台线程（非daemon，避免被主进程重启影响）
-            retry_thread = threading.Thread(target=run_retry_batch_analysis)
-            retry_thread.daemon = False
-            retry_thread.start()
+                except Exception as e:
+                    logger.error(f"重试批量分析任务异常: {task_id}, 错误: {str(e)}")
+                    db.session.rollback()
+                    task_repo.update_fields(task_id, status='failed', failed_at=datetime.utcnow(), final_error=str(e))
+                finally:
+                    task_manager.unregister_task(task_id)
+            
+            # 注册到任务管理器，重试期间也可以暂停/停止
+            task_manager.register_task(task_data['task_id'], None, 'batch_analysis')
+            self._submit_task(task_data['task_id'], run_retry_batch_analysis, task_data['user_id'], PRIORITY_NORMAL,
+                              is_retry=True)
             
             logger.info(f"批量分析任务重试已启动: {task_data['task_id']}")
             
@@ -1454,36 +1602,51 @@ class AnalysisService:
         try:
             logger.info(f"删除分析报告 - 股票代码: {stock_code}, 报告ID: {report_id}")
             
-            # 遍历所有日期目录，查找包含该report_id的文件
-            if os.path.exists(self.reports_dir):
+            # 优先从报告目录定位文件
+            report_file = None
+            entry = self.report_repo.get_by_report_id(report_id)
+            if entry:
+                report_file = entry.file_path
+            elif os.path.exists(self.reports_dir):
+                # 兼容尚未登记到报告目录的旧报告
                 for date_dir in sorted(os.listdir(self.reports_dir), reverse=True):
                     date_path = os.path.join(self.reports_dir, date_dir)
                     if not os.path.isdir(date_path):
                         continue
                     
                     for filename in os.listdir(date_path):
-                        if filename.endswith('.json') and report_id in filename:
+                        if is_report_file(filename) and report_id in filename:
                             report_file = os.path.join(date_path, filename)
-                            logger.info(f"找到要删除的报告文件: {report_file}")
-                            
-                            try:
-                                # 删除文件
-                                os.remove(report_file)
-                                logger.info(f"成功删除报告文件: {report_file}")
-                                
-                                # 检查目录是否为空，如果为空则删除目录
-                                if not os.listdir(date_path):
-                                    os.rmdir(date_path)
-                                    logger.info(f"删除空目录: {date_path}")
-                                
-                                return True
-                                
-                            except Exception as e:
-                                logger.error(f"删除报告文件失败: {report_file}, {str(e)}")
-                                return False
-            
-            logger.warning(f"未找到report_id为 {report_id} 的报告文件")
-            return False
+                            break
+                    if report_file:
+                        break
+            
+            if not report_file:
+                logger.warning(f"未找到report_id为 {report_id} 的报告文件")
+                return False
+            
+            logger.info(f"找到要删除的报告文件: {report_file}")
+            
+            try:
+                # 删除文件
+                if os.path.exists(report_file):
+                    os.remove(report_file)
+                    logger.info(f"成功删除报告文件: {report_file}")
+                
+                # 从报告目录中移除
+                self.report_repo.delete_by_report_id(report_id)
+                
+                # 检查目录是否为空，如果为空则删除目录
+                date_path = os.path.dirname(report_file)
+                if os.path.isdir(date_path) and not os.listdir(date_path):
+                    os.rmdir(date_path)
+                    logger.info(f"删除空目录: {date_path}")
+                
+                return True
+                
+            except Exception as e:
+                logger.error(f"删除报告文件失败: {report_file}, {str(e)}")
+                return False
             
         except Exception as e:
             logger.error(f"删除分析报告失败: {str(e)}")
@@ -1494,53 +1657,30 @@ class AnalysisService:
         try:
             from app.services.ai.task_manager import task_manager
             
-            task_file = os.path.join(self.reports_dir, f"{task_id}.task.json")
-            
-            if not os.path.exists(task_file):
-                logger.warning(f"任务文件不存在: {task_file}")
+            task = self.task_repo.get_by_task_id(task_id)
+            if not task:
+                logger.warning(f"任务不存在: {task_id}")
                 return False
             
-            # 读取任务数据
-            with open(task_file, 'r', encoding='utf-8') as f:
-                task_data = json.load(f)
-            
             # 检查用户权限
-            if task_data.get('user_id') != user_id:
+            if task.user_id != user_id:
                 logger.warning(f"用户 {user_id} 无权限操作任务 {task_id}")
                 return False
             
             # 检查任务状态
-            current_status = task_data.get('status')
+            current_status = task.status
             if current_status not in ['pending', 'running']:
                 logger.warning(f"任务 {task_id} 状态为 {current_status}，无法暂停")
                 return False
             
             # 使用任务管理器暂停任务
-            if task_manager.pause_task(task_id):
-                # 更新任务文件状态
-                task_data['status'] = 'paused'
-                task_data['paused_at'] = datetime.utcnow().isoformat() + 'Z'
-                task_data['updated_at'] = datetime.utcnow().isoformat() + 'Z'
-                
-                # 保存任务数据
-                with open(task_file, 'w', encoding='utf-8') as f:
-                    json.dump(task_data, f, ensure_ascii=False, indent=2)
-                
-                logger.info(f"任务 {task_id} 已暂停")
-                return True
-            else:
-                # 如果任务管理器暂停失败（可能任务不在管理器中），直接更新文件状态
-                logger.warning(f"任务管理器暂停任务失败: {task_id}，尝试直接更新文件状态")
-                task_data['status'] = 'paused'
-                task_data['paused_at'] = datetime.utcnow().isoformat() + 'Z'
-                task_data['updated_at'] = datetime.utcnow().isoformat() + 'Z'
-                
-                # 保存任务数据
-                with open(task_file, 'w', encoding='utf-8') as f:
-                    json.dump(task_data, f, ensure_ascii=False, indent=2)
-                
-                logger.info(f"任务 {task_id} 已暂停（直接更新文件状态）")
-                return True
+            if not task_manager.pause_task(task_id):
+                # 如果任务管理器暂停失败（可能任务不在管理器中），直接更新任务状态
+                logger.warning(f"任务管理器暂停任务失败: {task_id}，直接更新任务状态")
+            
+            self.task_repo.update_fields(task_id, status='paused', paused_at=datetime.utcnow())
+            logger.info(f"任务 {task_id} 已暂停")
+            return True
             
         except Exception as e:
             logger.error(f"暂停任务失败: {str(e)}")
@@ -1551,53 +1691,30 @@ class AnalysisService:
         try:
             from app.services.ai.task_manager import task_manager
             
-            task_file = os.path.join(self.reports_dir, f"{task_id}.task.json")
-            
-            if not os.path.exists(task_file):
-                logger.warning(f"任务文件不存在: {task_file}")
+            task = self.task_repo.get_by_task_id(task_id)
+            if not task:
+                logger.warning(f"任务不存在: {task_id}")
                 return False
             
-            # 读取任务数据
-            with open(task_file, 'r', encoding='utf-8') as f:
-                task_data = json.load(f)
-            
             # 检查用户权限
-            if task_data.get('user_id') != user_id:
+            if task.user_id != user_id:
                 logger.warning(f"用户 {user_id} 无权限操作任务 {task_id}")
                 return False
             
             # 检查任务状态
-            current_status = task_data.get('status')
+            current_status = task.status
             if current_status != 'paused':
                 logger.warning(f"任务 {task_id} 状态为 {current_status}，无法恢复")
                 return False
             
             # 使用任务管理器恢复任务
-            if task_manager.resume_task(task_id):
-                # 更新任务文件状态
-                task_data['status'] = 'running'
-                task_data['resumed_at'] = datetime.utcnow().isoformat()
-                task_data['updated_at'] = datetime.utcnow().isoformat() + 'Z'
-                
-                # 保存任务数据
-                with open(task_file, 'w', encoding='utf-8') as f:
-                    json.dump(task_data, f, ensure_ascii=False, indent=2)
-                
-                logger.info(f"任务 {task_id} 已恢复")
-                return True
-            else:
-                # 如果任务管理器恢复失败（可能任务不在管理器中），直接更新文件状态
-                logger.warning(f"任务管理器恢复任务失败: {task_id}，尝试直接更新文件状态")
-                task_data['status'] = 'running'
-                task_data['resumed_at'] = datetime.utcnow().isoformat()
-                task_data['updated_at'] = datetime.utcnow().isoformat() + 'Z'
-                
-                # 保存任务数据
-                with open(task_file, 'w', encoding='utf-8') as f:
-                    json.dump(task_data, f, ensure_ascii=False, indent=2)
-                
-                logger.info(f"任务 {task_id} 已恢复（直接更新文件状态）")
-                return True
+            if not task_manager.resume_task(task_id):
+                # 如果任务管理器恢复失败（可能任务不在管理器中），直接更新任务状态
+                logger.warning(f"任务管理器恢复任务失败: {task_id}，直接更新任务状态")
+            
+            self.task_repo.update_fields(task_id, status='running', resumed_at=datetime.utcnow())
+            logger.info(f"任务 {task_id} 已恢复")
+            return True
             
         except Exception as e:
             logger.error(f"恢复任务失败: {str(e)}")
@@ -1607,45 +1724,36 @@ class AnalysisService:
         """删除任务"""
         try:
             from app.services.ai.task_manager import task_manager
+            from app.services.ai.task_executor import analysis_executor
             
-            task_file = os.path.join(self.reports_dir, f"{task_id}.task.json")
-            
-            if not os.path.exists(task_file):
-                logger.warning(f"任务文件不存在: {task_file}")
+            task = self.task_repo.get_by_task_id(task_id)
+            if not task:
+                logger.warning(f"任务不存在: {task_id}")
                 return False
             
-            # 读取任务数据
-            with open(task_file, 'r', encoding='utf-8') as f:
-                task_data = json.load(f)
-            
             # 检查用户权限
-            if task_data.get('user_id') != user_id:
+            if task.user_id != user_id:
                 logger.warning(f"用户 {user_id} 无权限操作任务 {task_id}")
                 return False
             
             # 如果任务正在运行或暂停，先停止任务
-            current_status = task_data.get('status')
+            current_status = task.status
             if current_status in ['pending', 'running', 'paused']:
                 logger.info(f"任务 {task_id} 状态为 {current_status}，先停止任务")
+                analysis_executor.cancel(task_id)
                 task_manager.stop_task(task_id)
                 task_manager.unregister_task(task_id)
             
-            # 删除任务文件
-            os.remove(task_file)
+            # 删除任务记录
+            self.task_repo.delete_by_task_id(task_id)
             
-            # 删除相关的报告文件（如果有的话）
+            # 删除任务生成的报告（如果有的话）
             try:
-                # 获取任务相关的股票代码
-                stocks = task_data.get('stocks', [])
-                if not stocks and task_data.get('stock_code'):
-                    # 单个分析任务
-                    stocks = [{'code': task_data.get('stock_code')}]
+                self._delete_task_reports(task_id)
                 
-                # 删除相关报告文件
-                for stock in stocks:
-                    stock_code = stock.get('code')
-                    if stock_code:
-                        self._delete_task_reports(task_id, stock_code)
+                # 删除中断时遗留的部分报告文件
+                from app.services.ai.report_stream import remove_partial_reports
+                remove_partial_reports(task_id)
                         
             except Exception as e:
                 logger.warning(f"删除任务相关报告文件时出错: {str(e)}")
@@ -1657,62 +1765,18 @@ class AnalysisService:
             logger.error(f"删除任务失败: {str(e)}")
             return False
     
-    def _delete_task_reports(self, task_id: str, stock_code: str):
-        """删除任务相关的报告文件"""
-        try:
-            reports_dir = 'data/reports'
-            if not os.path.exists(reports_dir):
-                return
-            
-            # 遍历所有日期目录
-            for date_dir in os.listdir(reports_dir):
-                date_path = os.path.join(reports_dir, date_dir)
-                if not os.path.isdir(date_path):
-                    continue
-                
-                # 查找匹配的报告文件
-                for filename in os.listdir(date_path):
-                    if filename.startswith(f'{stock_code}_') and filename.endswith('.json'):
-                        file_path = os.path.join(date_path, filename)
-                        
-                        # 读取文件内容，检查是否属于该任务
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                report_data = json.load(f)
-                            
-                            # 如果报告属于该任务，删除文件
-                            if report_data.get('task_id') == task_id:
-                                os.remove(file_path)
-                                logger.info(f"删除任务相关报告文件: {file_path}")
-                                
-                        except Exception as e:
-                            logger.warning(f"读取报告文件失败: {file_path}, {str(e)}")
-                            
-        except Exception as e:
-            logger.error(f"删除任务相关报告文件失败: {str(e)}")
-
-    def get_all_tasks(self, limit: int = 1000) -> List[Dict[str, Any]]:
+    def _delete_task_reports(self, task_id: str):
+        """删除任务生成的报告：通过报告目录查找，文件、索引记录和报告计数一起删除"""
+        for entry in self.report_repo.list_for_task(task_id):
+            if self.delete_analysis_report(entry.stock_code, entry.report_id):
+                logger.info(f"删除任务相关报告: {entry.report_id}")
+    
+    def get_all_tasks(self, limit: int = 1000, offset: int = 0) -> List[Dict[str, Any]]:
         """获取所有任务列表（管理员功能）"""
         try:
-            tasks = []
-            
-            if os.path.exists(self.reports_dir):
-                for file_name in os.listdir(self.reports_dir):
-                    if file_name.endswith('.task.json'):
-                        task_file = os.path.join(self.reports_dir, file_name)
-                        try:
-                            with open(task_file, 'r', encoding='utf-8') as f:
-                                task_data = json.load(f)
-                            
-                            # 返回所有任务（不限制用户）
-                            tasks.append(task_data)
-                        except Exception as e:
-                            logger.error(f"读取任务文件失败: {task_file}, {str(e)}")
-            
             # 按创建时间排序，最新的在前
-            tasks.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-            
-            return tasks[:limit]
+            tasks = self.task_repo.list_tasks(limit=limit, offset=offset)
+            return [task.to_dict() for task in tasks]
             
         except Exception as e:
             logger.error(f"获取所有任务列表失败: {str(e)}")
@@ -1728,58 +1792,13 @@ class AnalysisService:
             if not report:
                 return None
             
-            # 获取报告文件
-            report_file = None
-            reports_dir = 'data/reports'
-            
-            # 查找报告文件
-            stock_code = report.stock.code if report.stock else None
-            if stock_code:
-                for date_dir in os.listdir(reports_dir):
-                    date_path = os.path.join(reports_dir, date_dir)
-                    if os.path.isdir(date_path):
-                        for filename in os.listdir(date_path):
-                            if filename.endswith('.json') and stock_code in filename:
-                                report_file = os.path.join(date_path, filename)
-                                break
-                        if report_file:
-                            break
-            
-            # 读取报告文件
+            # 直接读取索引记录对应的报告文件
             report_data = {}
-            if report_file and os.path.exists(report_file):
-                with open(report_file, 'r', encoding='utf-8') as f:
-                    report_data = json.load(f)
+            if report.file_path and os.path.exists(report.file_path):
+                report_data = self._read_report_file(report.file_path, include_prompt=True) or {}
             else:
-                # 如果文件不存在，尝试使用数据库中的文件路径
-                if report.file_path and os.path.exists(report.file_path):
-                    with open(report.file_path, 'r', encoding='utf-8') as f:
-                        report_data = json.load(f)
-                else:
-                    logger.warning(f"报告文件不存在: {report.file_path}")
-                    # 返回基本信息，即使没有详细数据
-            
-            # 获取任务文件
-            task_file = None
-            task_data = {}
-            
-            # 查找任务文件
-            for filename in os.listdir(reports_dir):
-                if filename.endswith('.task.json'):
-                    task_file_path = os.path.join(reports_dir, filename)
-                    try:
-                        with open(task_file_path, 'r', encoding='utf-8') as f:
-                            temp_task_data = json.load(f)
-                        
-                        # 检查是否包含此股票
-                        if (temp_task_data.get('stock_code') == stock_code or 
-                            any(stock.get('code') == stock_code for stock in temp_task_data.get('stocks', []))):
-                            task_file = task_file_path
-                            task_data = temp_task_data
-                            break
-                    except Exception as e:
-                        logger.warning(f"读取任务文件失败: {task_file_path}, {str(e)}")
-                        continue
+                logger.warning(f"报告文件不存在: {report.file_path}")
+                # 返回基本信息，即使没有详细数据
             
             # 构建分析详情
             details = {
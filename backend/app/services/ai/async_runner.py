@@ -0,0 +1,114 @@
+"""
+异步分析运行器
+- 后台事件循环：同步代码通过 run_sync 在同一个事件循环上执行协程，共享异步连接池
+- AsyncBatchRunner：在一个事件循环中同时进行大量分析生成（如深度研究），每个生成不再占用一个线程
+"""
+import asyncio
+import os
+import threading
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Coroutine, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _BackgroundLoop:
+    """在守护线程中运行的事件循环，按进程懒加载"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pid = None
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            # fork 出的子进程没有父进程的事件循环线程，需要重新创建
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                thread = threading.Thread(target=self._loop.run_forever, name='llm-event-loop', daemon=True)
+                thread.start()
+                logger.info("LLM后台事件循环已启动")
+            return self._loop
+
+
+_background_loop = _BackgroundLoop()
+
+
+def run_sync(coro: Coroutine) -> Any:
+    """在后台事件循环中执行协程并阻塞等待结果"""
+    loop = _background_loop.get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("不能在后台事件循环中同步等待协程，请直接 await")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+@dataclass
+class AnalysisJob:
+    """批量生成中的一项分析"""
+    provider: Any  # LLMProvider
+    prompt: str
+    stock_info: Dict[str, Any]
+
+
+class AsyncBatchRunner:
+    """在一个事件循环中并发执行多项分析生成"""
+
+    DEFAULT_MAX_IN_FLIGHT = 32
+
+    def __init__(self, max_in_flight: int = None, timeout: float = None):
+        """
+        Args:
+            max_in_flight: 同时进行的生成数量上限
+            timeout: 单项生成（含重试）的超时秒数，为空不限制
+        """
+        self.max_in_flight = max(1, int(max_in_flight or self.DEFAULT_MAX_IN_FLIGHT))
+        self.timeout = timeout
+
+    async def run(self, jobs: List[AnalysisJob],
+                  on_result: Callable[[int, Any], None] = None) -> List[Any]:
+        """执行全部分析，按 jobs 顺序返回 AnalysisResult；on_result 在每项完成时于事件循环线程中调用"""
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        async def run_one(index: int, job: AnalysisJob):
+            async with semaphore:
+                result = await self._generate(job)
+            if on_result:
+                try:
+                    on_result(index, result)
+                except Exception as e:
+                    logger.error(f"批量生成结果回调失败: {str(e)}")
+            return result
+
+        logger.info(f"开始批量异步生成: {len(jobs)} 项，并发上限 {self.max_in_flight}")
+        return list(await asyncio.gather(*(run_one(index, job) for index, job in enumerate(jobs))))
+
+    def run_sync(self, jobs: List[AnalysisJob], on_result: Callable[[int, Any], None] = None) -> List[Any]:
+        """在后台事件循环中执行批量生成并等待全部完成"""
+        return run_sync(self.run(jobs, on_result))
+
+    async def _generate(self, job: AnalysisJob):
+        from app.services.ai.llm_provider import AnalysisResult
+
+        from app.services.ai.retry_budget import RetryBudget
+
+        provider = job.provider
+        try:
+            # 超时作为重试预算的截止时间，由Provider在截止时停止请求和重试
+            budget = RetryBudget(max_retries=provider.retry_config.max_retries, deadline_seconds=self.timeout)
+            return await provider.agenerate_analysis(job.prompt, job.stock_info, budget)
+        except Exception as e:
+            logger.error(f"批量生成异常 - 股票: {job.stock_info.get('code', 'unknown')}, 错误: {str(e)}")
+            return AnalysisResult(
+                success=False,
+                error=str(e),
+                error_type=provider._classify_error(e),
+                provider=provider.name,
+                model=provider.model
+            )
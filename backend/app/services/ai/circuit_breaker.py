@@ -0,0 +1,206 @@
+"""
+AI提供商熔断器 - 按提供商统计连续失败，达到阈值后熔断，熔断期间的请求直接失败并切换到其他提供商
+- 只有反映提供商不可用的错误类型（网络、超时、限流、认证）计入失败，解析错误等单次请求问题不计入
+- 熔断一段时间后进入半开状态，放行一个探测请求：成功则恢复，失败则继续熔断
+- 状态保存在进程内，管理页面显示的是处理该请求的进程的状态
+"""
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class ProviderCircuitBreaker:
+    """AI提供商熔断器单例"""
+    _instance = None
+    _lock = threading.Lock()
+
+    DEFAULT_FAILURE_THRESHOLD = 3
+    DEFAULT_RESET_SECONDS = 120.0
+    DEFAULT_TRIP_ERRORS = ('network_error', 'timeout_error', 'rate_limit_error', 'authentication_error')
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(ProviderCircuitBreaker, cls).__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self._state_lock = threading.Lock()
+            self._circuits: Dict[str, Dict[str, Any]] = {}
+            self.failure_threshold = self.DEFAULT_FAILURE_THRESHOLD
+            self.reset_seconds = self.DEFAULT_RESET_SECONDS
+            self.trip_errors = set(self.DEFAULT_TRIP_ERRORS)
+            self._configured = False
+            self._initialized = True
+
+    def configure(self, failure_threshold: int = None, reset_seconds: float = None,
+                  trip_errors: Iterable[str] = None) -> None:
+        """设置熔断阈值（连续失败次数）、熔断时长和计入失败的错误类型"""
+        with self._state_lock:
+            if failure_threshold is not None:
+                self.failure_threshold = max(1, int(failure_threshold))
+            if reset_seconds is not None:
+                self.reset_seconds = max(0.0, float(reset_seconds))
+            if trip_errors is not None:
+                self.trip_errors = set(trip_errors)
+            self._configured = True
+
+    def allow_request(self, provider: str) -> bool:
+        """判断是否可以向提供商发送请求（半开状态只放行一个探测请求）"""
+        self._ensure_configured()
+        with self._state_lock:
+            circuit = self._get_circuit(provider)
+            if circuit['state'] == STATE_CLOSED:
+                return True
+            now = time.monotonic()
+            if circuit['state'] == STATE_OPEN:
+                if now - circuit['opened_at'] < self.reset_seconds:
+                    return False
+                circuit['state'] = STATE_HALF_OPEN
+                logger.info(f"提供商 {provider} 熔断结束，进入半开状态，放行探测请求")
+            elif circuit['probe_started_at'] and now - circuit['probe_started_at'] < self.reset_seconds:
+                return False
+            circuit['probe_started_at'] = now
+            return True
+
+    def is_open(self, provider: str) -> bool:
+        """提供商是否处于熔断中（不占用半开探测名额）"""
+        self._ensure_configured()
+        with self._state_lock:
+            circuit = self._circuits.get(provider)
+            if not circuit or circuit['state'] == STATE_CLOSED:
+                return False
+            if circuit['state'] == STATE_OPEN:
+                return time.monotonic() - circuit['opened_at'] < self.reset_seconds
+            return bool(circuit['probe_started_at']) and \
+                time.monotonic() - circuit['probe_started_at'] < self.reset_seconds
+
+    def record_result(self, provider: str, success: bool, error_type: str = None) -> None:
+        """记录一次请求结果，error_type 为 ErrorType 的值"""
+        self._ensure_configured()
+        with self._state_lock:
+            circuit = self._get_circuit(provider)
+            circuit['probe_started_at'] = None
+            if success:
+                if circuit['state'] != STATE_CLOSED:
+                    logger.info(f"提供商 {provider} 探测成功，熔断恢复")
+                circuit['state'] = STATE_CLOSED
+                circuit['consecutive_failures'] = 0
+                return
+            if error_type not in self.trip_errors:
+                return
+
+            circuit['consecutive_failures'] += 1
+            circuit['last_error_type'] = error_type
+            if circuit['state'] == STATE_HALF_OPEN or circuit['consecutive_failures'] >= self.failure_threshold:
+                if circuit['state'] != STATE_OPEN:
+                    circuit['open_count'] += 1
+                    logger.warning(f"提供商 {provider} 连续失败 {circuit['consecutive_failures']} 次"
+                                   f"（{error_type}），熔断 {self.reset_seconds:.0f} 秒")
+                circuit['state'] = STATE_OPEN
+                circuit['opened_at'] = time.monotonic()
+                circuit['opened_at_wall'] = datetime.utcnow()
+
+    def release_probe(self, provider: str) -> None:
+        """请求被取消（不计入成功或失败）时释放半开状态的探测名额，下一个请求可以继续探测"""
+        with self._state_lock:
+            circuit = self._circuits.get(provider)
+            if circuit:
+                circuit['probe_started_at'] = None
+
+    def record_failover(self, from_provider: str, to_provider: str) -> None:
+        """记录一次从熔断提供商切换到其他提供商"""
+        with self._state_lock:
+            self._get_circuit(from_provider)['failovers_out'] += 1
+            self._get_circuit(to_provider)['failovers_in'] += 1
+        logger.warning(f"提供商 {from_provider} 已熔断，切换到 {to_provider}")
+
+    def reset(self, provider: str = None) -> None:
+        """手动恢复提供商（为空时恢复全部），保留切换次数统计"""
+        with self._state_lock:
+            names = [provider] if provider else list(self._circuits)
+            for name in names:
+                circuit = self._get_circuit(name)
+                circuit.update(state=STATE_CLOSED, consecutive_failures=0, probe_started_at=None)
+
+    def get_state(self, provider: str) -> Dict[str, Any]:
+        """获取提供商的熔断状态和切换次数"""
+        self._ensure_configured()
+        with self._state_lock:
+            circuit = self._circuits.get(provider)
+            if not circuit:
+                return {'provider': provider, 'state': STATE_CLOSED, 'consecutive_failures': 0,
+                        'open_count': 0, 'failovers_out': 0, 'failovers_in': 0,
+                        'last_error_type': None, 'opened_at': None, 'retry_after': 0}
+            state = circuit['state']
+            retry_after = 0
+            if state == STATE_OPEN:
+                remaining = self.reset_seconds - (time.monotonic() - circuit['opened_at'])
+                if remaining > 0:
+                    retry_after = round(remaining)
+                else:
+                    state = STATE_HALF_OPEN
+            return {
+                'provider': provider,
+                'state': state,
+                'consecutive_failures': circuit['consecutive_failures'],
+                'open_count': circuit['open_count'],
+                'failovers_out': circuit['failovers_out'],
+                'failovers_in': circuit['failovers_in'],
+                'last_error_type': circuit['last_error_type'],
+                'opened_at': circuit['opened_at_wall'].isoformat() + 'Z' if circuit['opened_at_wall'] else None,
+                'retry_after': retry_after
+            }
+
+    def get_all_states(self) -> Dict[str, Dict[str, Any]]:
+        """获取所有提供商的熔断状态"""
+        with self._state_lock:
+            providers = list(self._circuits)
+        return {provider: self.get_state(provider) for provider in providers}
+
+    def _get_circuit(self, provider: str) -> Dict[str, Any]:
+        """获取提供商的熔断记录（调用方持有锁）"""
+        circuit = self._circuits.get(provider)
+        if circuit is None:
+            circuit = {
+                'state': STATE_CLOSED,
+                'consecutive_failures': 0,
+                'opened_at': 0.0,
+                'opened_at_wall': None,
+                'probe_started_at': None,
+                'open_count': 0,
+                'failovers_out': 0,
+                'failovers_in': 0,
+                'last_error_type': None
+            }
+            self._circuits[provider] = circuit
+        return circuit
+
+    def _ensure_configured(self) -> None:
+        """首次使用时从应用配置读取熔断参数"""
+        if self._configured:
+            return
+        from flask import current_app, has_app_context
+        if not has_app_context():
+            return
+        config = current_app.config
+        self.configure(
+            failure_threshold=config.get('ANALYSIS_CIRCUIT_FAILURE_THRESHOLD', self.DEFAULT_FAILURE_THRESHOLD),
+            reset_seconds=config.get('ANALYSIS_CIRCUIT_RESET_SECONDS', self.DEFAULT_RESET_SECONDS),
+            trip_errors=config.get('ANALYSIS_CIRCUIT_TRIP_ERRORS', self.DEFAULT_TRIP_ERRORS)
+        )
+
+
+# 全局熔断器实例
+circuit_breaker = ProviderCircuitBreaker()
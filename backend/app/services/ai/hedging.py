@@ -0,0 +1,191 @@
+"""
+AI请求对冲（hedged request） - 慢请求超过历史首字节耗时的分位数后，向等价的另一个AI配置发送同样的请求
+- 等价配置由AI配置的高级参数 hedge_group 声明，同组的激活配置可以互相替代
+- 对冲阈值取该 提供商:模型 最近成功请求首字节耗时（非流式请求为总耗时）的p95，样本不足时使用默认阈值
+- 先成功返回的请求胜出，另一个请求被取消；在线程中执行的同步请求无法中断，只是不再等待它的结果
+- 对冲请求数不超过请求总数的 max_ratio，额外发出的请求次数和估算的Token消耗计入统计
+"""
+import threading
+import time
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from app.services.ai.rate_limiter import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+MAX_SAMPLES = 200
+
+
+class AttemptWriter:
+    """竞速请求各自的报告输出：先收到片段的请求占用部分报告文件，另一个请求的片段只保留在它自己的结果中"""
+
+    def __init__(self, arbiter: 'StreamArbiter', on_first_byte: Callable[[], None] = None):
+        self.arbiter = arbiter
+        self.on_first_byte = on_first_byte
+        self.first_byte_at: Optional[float] = None
+        self.output_tokens = 0  # 已收到片段的估算Token数
+
+    def write(self, text: str) -> None:
+        if not text:
+            return
+        if self.first_byte_at is None:
+            self.first_byte_at = time.monotonic()
+            if self.on_first_byte:
+                self.on_first_byte()
+        self.output_tokens += estimate_tokens(text)
+        self.arbiter.write(self, text)
+
+
+class StreamArbiter:
+    """在竞速请求之间分配部分报告文件"""
+
+    def __init__(self, report_stream=None):
+        self.report_stream = report_stream
+        self.owner: Optional[AttemptWriter] = None
+        self._lock = threading.Lock()
+
+    def writer(self, on_first_byte: Callable[[], None] = None) -> AttemptWriter:
+        return AttemptWriter(self, on_first_byte)
+
+    def write(self, writer: AttemptWriter, text: str) -> None:
+        with self._lock:
+            if self.owner is None:
+                self.owner = writer
+            if self.owner is writer and self.report_stream is not None:
+                self.report_stream.write(text)
+
+
+class RequestHedger:
+    """AI请求对冲单例：记录各模型的首字节耗时，决定对冲阈值和是否还有对冲额度"""
+    _instance = None
+    _lock = threading.Lock()
+
+    DEFAULT_PERCENTILE = 0.95
+    DEFAULT_MIN_SAMPLES = 20
+    DEFAULT_DELAY = 60.0
+    DEFAULT_MIN_DELAY = 5.0
+    DEFAULT_MAX_RATIO = 0.1
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(RequestHedger, cls).__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self._state_lock = threading.Lock()
+            self._samples: Dict[str, Deque[float]] = {}
+            self._stats = {
+                'requests': 0,
+                'hedges': 0,
+                'hedge_wins': 0,
+                'primary_wins': 0,
+                'skipped_by_ratio': 0,
+                'extra_tokens': 0
+            }
+            self.enabled = False
+            self.percentile = self.DEFAULT_PERCENTILE
+            self.min_samples = self.DEFAULT_MIN_SAMPLES
+            self.default_delay = self.DEFAULT_DELAY
+            self.min_delay = self.DEFAULT_MIN_DELAY
+            self.max_ratio = self.DEFAULT_MAX_RATIO
+            self._configured = False
+            self._initialized = True
+
+    def configure(self, enabled: bool = None, percentile: float = None, min_samples: int = None,
+                  default_delay: float = None, min_delay: float = None, max_ratio: float = None) -> None:
+        """设置是否启用、对冲阈值的分位数、最少样本数、默认阈值、最小阈值和对冲请求占比上限"""
+        with self._state_lock:
+            if enabled is not None:
+                self.enabled = bool(enabled)
+            if percentile is not None:
+                self.percentile = min(1.0, max(0.0, float(percentile)))
+            if min_samples is not None:
+                self.min_samples = max(1, int(min_samples))
+            if default_delay is not None:
+                self.default_delay = max(0.0, float(default_delay))
+            if min_delay is not None:
+                self.min_delay = max(0.0, float(min_delay))
+            if max_ratio is not None:
+                self.max_ratio = max(0.0, float(max_ratio))
+            self._configured = True
+
+    def is_enabled(self) -> bool:
+        self._ensure_configured()
+        return self.enabled
+
+    def record_latency(self, key: str, seconds: float) -> None:
+        """记录一次成功请求的首字节耗时"""
+        with self._state_lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = deque(maxlen=MAX_SAMPLES)
+                self._samples[key] = samples
+            samples.append(seconds)
+
+    def hedge_delay(self, key: str) -> float:
+        """请求发出多少秒后仍未收到首字节时发送对冲请求"""
+        self._ensure_configured()
+        with self._state_lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return max(self.min_delay, self.default_delay)
+        index = min(len(samples) - 1, int(self.percentile * len(samples)))
+        return max(self.min_delay, samples[index])
+
+    def record_request(self) -> None:
+        """记录一次可以对冲的请求（用于计算对冲占比）"""
+        with self._state_lock:
+            self._stats['requests'] += 1
+
+    def try_acquire(self) -> bool:
+        """对冲请求数未超过占比上限时占用一次对冲额度"""
+        self._ensure_configured()
+        with self._state_lock:
+            if self._stats['hedges'] + 1 > self.max_ratio * self._stats['requests']:
+                self._stats['skipped_by_ratio'] += 1
+                return False
+            self._stats['hedges'] += 1
+            return True
+
+    def record_outcome(self, hedge_won: bool, extra_tokens: int) -> None:
+        """记录一次对冲的结果和落败请求估算消耗的Token数"""
+        with self._state_lock:
+            self._stats['hedge_wins' if hedge_won else 'primary_wins'] += 1
+            self._stats['extra_tokens'] += max(0, int(extra_tokens))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取对冲统计：额外请求次数、胜出次数、额外Token消耗和各模型当前的对冲阈值"""
+        with self._state_lock:
+            stats = dict(self._stats)
+            keys = list(self._samples)
+        stats['enabled'] = self.enabled
+        stats['hedge_ratio'] = round(stats['hedges'] / stats['requests'], 4) if stats['requests'] else 0.0
+        stats['thresholds'] = {key: round(self.hedge_delay(key), 2) for key in keys}
+        return stats
+
+    def _ensure_configured(self) -> None:
+        """首次使用时从应用配置读取对冲参数"""
+        if self._configured:
+            return
+        from flask import current_app, has_app_context
+        if not has_app_context():
+            return
+        config = current_app.config
+        self.configure(
+            enabled=config.get('ANALYSIS_HEDGE_ENABLED', False),
+            percentile=config.get('ANALYSIS_HEDGE_PERCENTILE', self.DEFAULT_PERCENTILE),
+            min_samples=config.get('ANALYSIS_HEDGE_MIN_SAMPLES', self.DEFAULT_MIN_SAMPLES),
+            default_delay=config.get('ANALYSIS_HEDGE_DEFAULT_DELAY', self.DEFAULT_DELAY),
+            min_delay=config.get('ANALYSIS_HEDGE_MIN_DELAY', self.DEFAULT_MIN_DELAY),
+            max_ratio=config.get('ANALYSIS_HEDGE_MAX_RATIO', self.DEFAULT_MAX_RATIO)
+        )
+
+
+# 全局请求对冲实例
+request_hedger = RequestHedger()
@@ -0,0 +1,317 @@
+"""
+AI提供商HTTP连接池 - 同一端点的Provider实例共享keep-alive连接
+- 每个端点（协议+主机+端口）一个连接池，线程安全，可配置连接数、keep-alive和连接重试
+- 记录每次调用是否复用了已有连接以及新建连接的握手耗时，用于统计批量分析节省的握手时间
+- 异步客户端基于httpx（可选依赖），每个事件循环各自持有连接池；未安装httpx时异步调用回退到同步客户端
+"""
+import asyncio
+import contextlib
+import threading
+import weakref
+import time
+import logging
+from http.cookiejar import DefaultCookiePolicy
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:  # 可选依赖
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_RETRIES = 2
+
+# 同步和异步客户端的超时、连接错误类型
+TIMEOUT_ERRORS = (requests.exceptions.Timeout,) + ((httpx.TimeoutException,) if httpx else ())
+CONNECTION_ERRORS = (requests.exceptions.ConnectionError,) + ((httpx.TransportError,) if httpx else ())
+
+# 当前线程正在进行的请求中新建连接的握手耗时
+_call_state = threading.local()
+
+
+def _record_handshake(elapsed: float) -> None:
+    handshakes = getattr(_call_state, 'handshakes', None)
+    if handshakes is not None:
+        handshakes.append(elapsed)
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    """记录建连耗时的HTTP连接"""
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _record_handshake(time.perf_counter() - start)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    """记录建连耗时（TCP + TLS握手）的HTTPS连接"""
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _record_handshake(time.perf_counter() - start)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _PooledAdapter(HTTPAdapter):
+    """使用计时连接的连接池适配器"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool
+        }
+
+
+class _PoolStats:
+    """连接池调用统计"""
+
+    def __init__(self, endpoint: str, pool_size: int, keep_alive: bool, max_retries: int):
+        self.endpoint = endpoint
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.max_retries = max_retries
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'new_connections': 0,
+            'reused_connections': 0,
+            'handshake_time': 0.0
+        }
+
+    def _record_call(self, handshakes) -> Dict[str, Any]:
+        handshake_time = sum(handshakes)
+        with self._stats_lock:
+            self._stats['requests'] += 1
+            self._stats['new_connections'] += len(handshakes)
+            self._stats['handshake_time'] += handshake_time
+            if not handshakes:
+                self._stats['reused_connections'] += 1
+            avg_handshake = self._average_handshake()
+
+        metrics = {
+            'endpoint': self.endpoint,
+            'connection_reused': not handshakes,
+            'handshake_ms': round(handshake_time * 1000, 2),
+            # 复用连接时按该端点的平均握手耗时估算节省的时间
+            'handshake_saved_ms': round(avg_handshake * 1000, 2) if not handshakes else 0.0
+        }
+        logger.debug(f"HTTP连接 {self.endpoint}: {'复用' if not handshakes else '新建'}，"
+                     f"握手 {metrics['handshake_ms']}ms")
+        return metrics
+
+    def _average_handshake(self) -> float:
+        """平均握手耗时（调用方持有锁）"""
+        if not self._stats['new_connections']:
+            return 0.0
+        return self._stats['handshake_time'] / self._stats['new_connections']
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接池统计"""
+        with self._stats_lock:
+            avg_handshake = self._average_handshake()
+            return {
+                'endpoint': self.endpoint,
+                'pool_size': self.pool_size,
+                'requests': self._stats['requests'],
+                'new_connections': self._stats['new_connections'],
+                'reused_connections': self._stats['reused_connections'],
+                'avg_handshake_ms': round(avg_handshake * 1000, 2),
+                'handshake_saved_ms': round(avg_handshake * self._stats['reused_connections'] * 1000, 2)
+            }
+
+
+class PooledHTTPClient(_PoolStats):
+    """共享连接池的HTTP客户端"""
+
+    def __init__(self, endpoint: str, pool_size: int = DEFAULT_POOL_SIZE, keep_alive: bool = True,
+                 max_retries: int = DEFAULT_MAX_RETRIES):
+        super().__init__(endpoint, pool_size, keep_alive, max_retries)
+
+        # 只重试建连失败和网关不可用，请求已被处理的情况交给Provider自己的重试逻辑
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,
+            status=max_retries,
+            status_forcelist=(502, 503),
+            allowed_methods=None,
+            backoff_factor=0.5,
+            raise_on_status=False
+        )
+        adapter = _PooledAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # 多线程共享会话，不保存Cookie
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """发送POST请求，响应对象的 connection_metrics 属性记录本次调用的连接情况"""
+        _call_state.handshakes = []
+        try:
+            response = self.session.post(url, **kwargs)
+        finally:
+            handshakes = _call_state.handshakes
+            _call_state.handshakes = None
+            metrics = self._record_call(handshakes)
+        response.connection_metrics = metrics
+        return response
+
+
+class AsyncPooledHTTPClient(_PoolStats):
+    """共享连接池的异步HTTP客户端（httpx），只能在创建它的事件循环中使用"""
+
+    def __init__(self, endpoint: str, pool_size: int = DEFAULT_POOL_SIZE, keep_alive: bool = True,
+                 max_retries: int = DEFAULT_MAX_RETRIES):
+        super().__init__(endpoint, pool_size, keep_alive, max_retries)
+
+        # httpx只重试建连失败，5xx交给Provider自己的重试逻辑
+        limits = httpx.Limits(max_connections=pool_size,
+                              max_keepalive_connections=pool_size if keep_alive else 0)
+        transport = httpx.AsyncHTTPTransport(limits=limits, retries=max_retries)
+        self.client = httpx.AsyncClient(transport=transport,
+                                        headers=None if keep_alive else {'Connection': 'close'})
+        self.client.cookies.jar.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+    async def post(self, url: str, timeout=None, **kwargs):
+        """发送POST请求，timeout 与 requests 一致可传 (连接超时, 读取超时)"""
+        connects, trace = self._connect_trace()
+        try:
+            response = await self.client.post(url, timeout=self._timeout(timeout), extensions={'trace': trace},
+                                              **kwargs)
+        finally:
+            metrics = self._record_call([end - start for start, end in connects if end is not None])
+        response.connection_metrics = metrics
+        return response
+
+    @contextlib.asynccontextmanager
+    async def stream(self, url: str, timeout=None, **kwargs):
+        """发送流式POST请求，在上下文中通过响应的 aiter_lines() 逐行读取"""
+        connects, trace = self._connect_trace()
+        metrics = None
+        try:
+            async with self.client.stream('POST', url, timeout=self._timeout(timeout),
+                                          extensions={'trace': trace}, **kwargs) as response:
+                metrics = self._record_call([end - start for start, end in connects if end is not None])
+                response.connection_metrics = metrics
+                yield response
+        finally:
+            if metrics is None:
+                self._record_call([end - start for start, end in connects if end is not None])
+
+    @staticmethod
+    def _timeout(timeout):
+        if isinstance(timeout, tuple):
+            return httpx.Timeout(timeout[1], connect=timeout[0])
+        return timeout
+
+    @staticmethod
+    def _connect_trace():
+        """通过httpcore的trace事件记录新建连接（TCP + TLS）的耗时"""
+        connects = []
+
+        async def trace(event_name: str, info: Dict[str, Any]):
+            if event_name == 'connection.connect_tcp.started':
+                connects.append([time.perf_counter(), None])
+            elif event_name in ('connection.connect_tcp.complete', 'connection.start_tls.complete') and connects:
+                connects[-1][1] = time.perf_counter()
+
+        return connects, trace
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+_clients: Dict[Tuple, PooledHTTPClient] = {}
+_clients_lock = threading.Lock()
+
+
+def _endpoint_of(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def get_http_client(url: str, pool_config: Optional[Dict[str, Any]] = None) -> PooledHTTPClient:
+    """获取端点的共享HTTP客户端，同一端点和连接池配置的Provider实例复用同一个连接池"""
+    pool_config = pool_config or {}
+    endpoint = _endpoint_of(url)
+    pool_size = int(pool_config.get('pool_size', DEFAULT_POOL_SIZE))
+    keep_alive = bool(pool_config.get('keep_alive', True))
+    max_retries = int(pool_config.get('max_retries', DEFAULT_MAX_RETRIES))
+    key = (endpoint, pool_size, keep_alive, max_retries)
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = PooledHTTPClient(endpoint, pool_size, keep_alive, max_retries)
+            _clients[key] = client
+            logger.info(f"创建HTTP连接池: {endpoint}, 连接数: {pool_size}, keep-alive: {keep_alive}")
+        return client
+
+
+# 事件循环 -> {连接池参数: 异步客户端}，事件循环结束后自动释放
+_async_clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, AsyncPooledHTTPClient]]' = \
+    weakref.WeakKeyDictionary()
+
+
+def get_async_http_client(url: str, pool_config: Optional[Dict[str, Any]] = None) -> Optional[AsyncPooledHTTPClient]:
+    """获取当前事件循环中端点的共享异步HTTP客户端，未安装httpx时返回None"""
+    if httpx is None:
+        return None
+    pool_config = pool_config or {}
+    endpoint = _endpoint_of(url)
+    pool_size = int(pool_config.get('pool_size', DEFAULT_POOL_SIZE))
+    keep_alive = bool(pool_config.get('keep_alive', True))
+    max_retries = int(pool_config.get('max_retries', DEFAULT_MAX_RETRIES))
+    key = (endpoint, pool_size, keep_alive, max_retries)
+    loop = asyncio.get_running_loop()
+
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = AsyncPooledHTTPClient(endpoint, pool_size, keep_alive, max_retries)
+            clients[key] = client
+            logger.info(f"创建异步HTTP连接池: {endpoint}, 连接数: {pool_size}, keep-alive: {keep_alive}")
+        return client
+
+
+async def close_async_clients() -> None:
+    """关闭当前事件循环的异步客户端（临时事件循环结束前调用）"""
+    with _clients_lock:
+        clients = list(_async_clients.pop(asyncio.get_running_loop(), {}).values())
+    for client in clients:
+        await client.aclose()
+
+
+def get_pool_stats() -> list:
+    """获取所有连接池的统计"""
+    with _clients_lock:
+        clients = list(_clients.values())
+        async_clients = [client for loop_clients in list(_async_clients.values())
+                         for client in loop_clients.values()]
+    stats = [client.get_stats() for client in clients]
+    stats.extend({**client.get_stats(), 'async': True} for client in async_clients)
+    return stats
@@ -0,0 +1,323 @@
+"""
+AI调用指标 - 记录每次Provider请求的总耗时、首字节耗时、Token数、错误类型，以及重试次数
+- 按 提供商/模型 分组，按时间分桶（默认每分钟一个桶，保留24小时），每个桶保存固定边界的直方图计数，
+  记录一次调用只更新计数，查询时合并时间窗口内的桶计算p50/p95/p99
+- 另外保存进程启动以来的累计值，以Prometheus文本格式输出（计数器和直方图）
+- 指标保存在进程内，多个worker时每个进程各自统计
+"""
+import bisect
+import math
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 直方图边界：分析请求通常需要数十秒到数十分钟
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+TOKEN_BUCKETS = (100, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)
+QUANTILES = (0.5, 0.95, 0.99)
+
+METRIC_PREFIX = 'equitycompass_llm'
+
+
+class _Histogram:
+    """固定边界的直方图，最后一个计数为超过最大边界的值"""
+    __slots__ = ('bounds', 'counts', 'total', 'count', 'max')
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def merge(self, other: '_Histogram') -> None:
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.total += other.total
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶内线性插值估算分位数"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                upper = min(upper, self.max)
+                return round(lower + (upper - lower) * max(0.0, rank - seen) / count, 3)
+            seen += count
+        return round(self.max, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [str(bound) for bound in self.bounds] + ['+Inf']
+        return {
+            'buckets': [{'le': label, 'count': count} for label, count in zip(labels, self.counts)],
+            'count': self.count,
+            'sum': round(self.total, 3),
+            **{f"p{int(q * 100)}": self.quantile(q) for q in QUANTILES}
+        }
+
+
+class _Stats:
+    """一组调用的统计"""
+    __slots__ = ('calls', 'successes', 'errors', 'retries', 'tokens', 'generation_seconds',
+                 'latency', 'ttft', 'token_counts')
+
+    def __init__(self):
+        self.calls = 0
+        self.successes = 0
+        self.errors: Dict[str, int] = {}
+        self.retries = 0
+        self.tokens = 0
+        self.generation_seconds = 0.0  # 有Token数的成功调用从首字节到完成的耗时，用于计算每秒Token数
+        self.latency = _Histogram(LATENCY_BUCKETS)
+        self.ttft = _Histogram(LATENCY_BUCKETS)
+        self.token_counts = _Histogram(TOKEN_BUCKETS)
+
+    def record_call(self, total_seconds: float, ttft_seconds: Optional[float], tokens: Optional[int],
+                    success: bool, error_type: Optional[str]) -> None:
+        self.calls += 1
+        self.latency.observe(total_seconds)
+        if success:
+            self.successes += 1
+            self.ttft.observe(ttft_seconds if ttft_seconds is not None else total_seconds)
+            if tokens:
+                self.tokens += tokens
+                self.token_counts.observe(tokens)
+                self.generation_seconds += max(total_seconds - (ttft_seconds or 0.0), 0.001)
+        else:
+            error_type = error_type or 'unknown_error'
+            self.errors[error_type] = self.errors.get(error_type, 0) + 1
+
+    def merge(self, other: '_Stats') -> None:
+        self.calls += other.calls
+        self.successes += other.successes
+        for error_type, count in other.errors.items():
+            self.errors[error_type] = self.errors.get(error_type, 0) + count
+        self.retries += other.retries
+        self.tokens += other.tokens
+        self.generation_seconds += other.generation_seconds
+        self.latency.merge(other.latency)
+        self.ttft.merge(other.ttft)
+        self.token_counts.merge(other.token_counts)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'successes': self.successes,
+            'success_rate': round(self.successes / self.calls * 100, 2) if self.calls else 0.0,
+            'errors': dict(self.errors),
+            'retries': self.retries,
+            'retry_rate': round(self.retries / self.calls, 4) if self.calls else 0.0,
+            'tokens': self.tokens,
+            'tokens_per_second': round(self.tokens / self.generation_seconds, 2) if self.generation_seconds else None,
+            'latency': self.latency.to_dict(),
+            'ttft': self.ttft.to_dict(),
+            'tokens_per_call': self.token_counts.to_dict()
+        }
+
+
+class LLMMetrics:
+    """AI调用指标单例"""
+    _instance = None
+    _lock = threading.Lock()
+
+    DEFAULT_BUCKET_SECONDS = 60
+    DEFAULT_RETENTION_SECONDS = 24 * 3600
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(LLMMetrics, cls).__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self._state_lock = threading.Lock()
+            # (提供商, 模型) -> {时间桶序号: 统计}
+            self._buckets: Dict[Tuple[str, str], Dict[int, _Stats]] = {}
+            self._totals: Dict[Tuple[str, str], _Stats] = {}
+            self.bucket_seconds = self.DEFAULT_BUCKET_SECONDS
+            self.retention_seconds = self.DEFAULT_RETENTION_SECONDS
+            self._configured = False
+            self._initialized = True
+
+    def configure(self, bucket_seconds: int = None, retention_seconds: int = None) -> None:
+        """设置时间桶长度和保留时长（修改桶长度会清空已有的时间桶，累计值保留）"""
+        with self._state_lock:
+            if bucket_seconds is not None and max(1, int(bucket_seconds)) != self.bucket_seconds:
+                self.bucket_seconds = max(1, int(bucket_seconds))
+                self._buckets = {}
+            if retention_seconds is not None:
+                self.retention_seconds = max(self.bucket_seconds, int(retention_seconds))
+            self._configured = True
+
+    def record_call(self, provider: str, model: str, total_seconds: float, ttft_seconds: Optional[float] = None,
+                    tokens: Optional[int] = None, success: bool = True, error_type: Optional[str] = None,
+                    now: float = None) -> None:
+        """记录一次Provider请求；ttft_seconds 为首字节耗时，非流式请求为空（按总耗时计）"""
+        self._ensure_configured()
+        with self._state_lock:
+            for stats in self._series(provider, model, now):
+                stats.record_call(total_seconds, ttft_seconds, tokens, success, error_type)
+
+    def record_retry(self, provider: str, model: str, now: float = None) -> None:
+        """记录一次重试"""
+        self._ensure_configured()
+        with self._state_lock:
+            for stats in self._series(provider, model, now):
+                stats.retries += 1
+
+    def summary(self, window_seconds: int = 3600, now: float = None) -> Dict[str, Any]:
+        """按 提供商:模型 汇总最近 window_seconds 秒内的调用：成功率、重试率、每秒Token数、耗时分位数和直方图"""
+        self._ensure_configured()
+        now = time.time() if now is None else now
+        first_bucket = int((now - window_seconds) // self.bucket_seconds) + 1
+        result = {}
+        with self._state_lock:
+            for (provider, model), buckets in self._buckets.items():
+                merged = _Stats()
+                for index, stats in buckets.items():
+                    if index >= first_bucket:
+                        merged.merge(stats)
+                if merged.calls or merged.retries:
+                    result[f"{provider}:{model}"] = {'provider': provider, 'model': model, **merged.summary()}
+        return {'window_seconds': window_seconds, 'bucket_seconds': self.bucket_seconds, 'models': result}
+
+    def timeline(self, provider: str, model: str, window_seconds: int = 3600, now: float = None) -> List[Dict[str, Any]]:
+        """按时间桶列出调用数、错误数和p95耗时，用于绘制趋势"""
+        self._ensure_configured()
+        now = time.time() if now is None else now
+        first_bucket = int((now - window_seconds) // self.bucket_seconds) + 1
+        with self._state_lock:
+            buckets = sorted((index, stats) for index, stats in self._buckets.get((provider, model), {}).items()
+                             if index >= first_bucket)
+            return [{
+                'timestamp': index * self.bucket_seconds,
+                'calls': stats.calls,
+                'errors': stats.calls - stats.successes,
+                'retries': stats.retries,
+                'p95': stats.latency.quantile(0.95)
+            } for index, stats in buckets]
+
+    def render_prometheus(self) -> str:
+        """以Prometheus文本格式输出累计指标"""
+        with self._state_lock:
+            totals = {key: _copy_stats(stats) for key, stats in self._totals.items()}
+
+        lines: List[str] = []
+
+        def metric(name: str, metric_type: str, help_text: str) -> str:
+            full_name = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {metric_type}")
+            return full_name
+
+        name = metric('calls_total', 'counter', 'LLM provider calls by outcome')
+        for (provider, model), stats in totals.items():
+            lines.append(f'{name}{{{_labels(provider, model, status="success")}}} {stats.successes}')
+            for error_type, count in sorted(stats.errors.items()):
+                lines.append(f'{name}{{{_labels(provider, model, status="error", error_type=error_type)}}} {count}')
+
+        name = metric('retries_total', 'counter', 'LLM provider retries')
+        for (provider, model), stats in totals.items():
+            lines.append(f'{name}{{{_labels(provider, model)}}} {stats.retries}')
+
+        name = metric('tokens_total', 'counter', 'Tokens used by successful LLM calls')
+        for (provider, model), stats in totals.items():
+            lines.append(f'{name}{{{_labels(provider, model)}}} {stats.tokens}')
+
+        name = metric('generation_seconds_total', 'counter',
+                      'Time from first byte to completion of successful calls with token usage')
+        for (provider, model), stats in totals.items():
+            lines.append(f'{name}{{{_labels(provider, model)}}} {_format(stats.generation_seconds)}')
+
+        for attr, metric_name, help_text in (
+                ('latency', 'request_duration_seconds', 'LLM call duration'),
+                ('ttft', 'time_to_first_token_seconds', 'Time to first token of successful LLM calls'),
+                ('token_counts', 'tokens_per_call', 'Tokens used per successful LLM call')):
+            name = metric(metric_name, 'histogram', help_text)
+            for (provider, model), stats in totals.items():
+                histogram = getattr(stats, attr)
+                cumulative = 0
+                for bound, count in zip(list(histogram.bounds) + [math.inf], histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == math.inf else _format(bound)
+                    lines.append(f'{name}_bucket{{{_labels(provider, model, le=le)}}} {cumulative}')
+                lines.append(f'{name}_sum{{{_labels(provider, model)}}} {_format(histogram.total)}')
+                lines.append(f'{name}_count{{{_labels(provider, model)}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        """清空全部指标"""
+        with self._state_lock:
+            self._buckets = {}
+            self._totals = {}
+
+    def _series(self, provider: str, model: str, now: float = None) -> Tuple[_Stats, _Stats]:
+        """获取当前时间桶和累计值的统计，并清理过期的时间桶（调用方持有锁）"""
+        key = (provider or 'unknown', model or 'unknown')
+        now = time.time() if now is None else now
+        index = int(now // self.bucket_seconds)
+        buckets = self._buckets.setdefault(key, {})
+        stats = buckets.get(index)
+        if stats is None:
+            oldest = index - self.retention_seconds // self.bucket_seconds
+            for expired in [i for i in buckets if i <= oldest]:
+                del buckets[expired]
+            stats = buckets[index] = _Stats()
+        totals = self._totals.get(key)
+        if totals is None:
+            totals = self._totals[key] = _Stats()
+        return stats, totals
+
+    def _ensure_configured(self) -> None:
+        """首次使用时从应用配置读取分桶参数"""
+        if self._configured:
+            return
+        from flask import current_app, has_app_context
+        if not has_app_context():
+            return
+        config = current_app.config
+        self.configure(
+            bucket_seconds=config.get('LLM_METRICS_BUCKET_SECONDS', self.DEFAULT_BUCKET_SECONDS),
+            retention_seconds=config.get('LLM_METRICS_RETENTION_SECONDS', self.DEFAULT_RETENTION_SECONDS)
+        )
+
+
+def _copy_stats(stats: _Stats) -> _Stats:
+    copy = _Stats()
+    copy.merge(stats)
+    return copy
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(provider: str, model: str, **extra: str) -> str:
+    labels = {'provider': provider, 'model': model, **extra}
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+def _format(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+# 全局AI调用指标实例
+llm_metrics = LLMMetrics()
@@ -3,15 +3,25 @@ LLM Provider抽象层
 支持多种大语言模型：Gemini、ChatGPT、Qwen
 """
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List, Union
+from typing import Dict, Any, Optional, List, Tuple, Union
+import asyncio
 import logging
 import json
 import time
 import random
+import threading
 import requests
 from datetime import datetime
 from enum import Enum
 from dataclasses import dataclass
+from app.services.ai.async_runner import run_sync
+from app.services.ai.circuit_breaker import circuit_breaker
+from app.services.ai.hedging import StreamArbiter, request_hedger
+from app.services.ai.llm_metrics import llm_metrics
+from app.services.ai.http_pool import CONNECTION_ERRORS, TIMEOUT_ERRORS, get_async_http_client, get_http_client
+from app.services.ai.rate_limiter import estimate_tokens, rate_limiter
+from app.services.ai.report_stream import PartialReportWriter, current_report_stream
+from app.services.ai.retry_budget import RetryBudget, current_retry_budget
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +35,7 @@ class ErrorType(Enum):
     TIMEOUT_ERROR = "timeout_error"
     PARSE_ERROR = "parse_error"
     UNKNOWN_ERROR = "unknown_error"
+    CIRCUIT_OPEN = "circuit_open"
 
 
 class StructuredLogger:
@@ -160,6 +171,12 @@ class RetryManager:
         delay = self.get_delay(retry_count)
         logger.info(f"等待 {delay:.2f} 秒后重试 (第 {retry_count + 1} 次)")
         time.sleep(delay)
+    
+    async def async_wait(self, retry_count: int):
+        """等待重试（不阻塞事件循环）"""
+        delay = self.get_delay(retry_count)
+        logger.info(f"等待 {delay:.2f} 秒后重试 (第 {retry_count + 1} 次)")
+        await asyncio.sleep(delay)
 
 
 class LLMProvider(ABC):
@@ -188,106 +205,359 @@ class LLMProvider(ABC):
         self.timeout_config = config.get('timeout_config', {})
         self.request_timeout = self.timeout_config.get('request_timeout', 120)  # 增加到120秒
         self.connect_timeout = self.timeout_config.get('connect_timeout', 30)
+        
+        # HTTP连接池配置（pool_size / keep_alive / max_retries），同一端点的实例共享连接池
+        self.http_pool_config = config.get('http_pool_config', {})
+        
+        # 客户端限流（rpm / tpm），config['rate_limit'] 覆盖应用配置中的额度
+        self.rate_limits = rate_limiter.get_limits(self.name, self.model, config.get('rate_limit'))
+        self.rate_limit_key = rate_limiter.bucket_key(self.name, self.model, self.api_key)
     
     @abstractmethod
     def _make_api_request(self, prompt: str, stock_info: Dict[str, Any]) -> AnalysisResult:
         """执行API请求（子类实现）"""
         pass
     
-    def generate_analysis(self, prompt: str, stock_info: Dict[str, Any]) -> AnalysisResult:
-        """生成股票分析报告（带重试机制）"""
+    async def _amake_api_request(self, prompt: str, stock_info: Dict[str, Any]) -> AnalysisResult:
+        """异步执行API请求，默认在线程中执行同步请求（支持异步HTTP的子类覆盖）"""
+        return await asyncio.to_thread(self._make_api_request, prompt, stock_info)
+    
+    def generate_analysis(self, prompt: str, stock_info: Dict[str, Any],
+                          retry_budget: Optional[RetryBudget] = None,
+                          report_stream: Optional[PartialReportWriter] = None,
+                          hedge_provider: Optional['LLMProvider'] = None) -> AnalysisResult:
+        """生成股票分析报告（带重试机制），在后台事件循环中执行 agenerate_analysis"""
+        return run_sync(self.agenerate_analysis(prompt, stock_info, retry_budget, report_stream, hedge_provider))
+    
+    async def agenerate_analysis(self, prompt: str, stock_info: Dict[str, Any],
+                                 retry_budget: Optional[RetryBudget] = None,
+                                 report_stream: Optional[PartialReportWriter] = None,
+                                 hedge_provider: Optional['LLMProvider'] = None) -> AnalysisResult:
+        """异步生成股票分析报告（带重试机制）
+        
+        retry_budget 为调用方的重试预算：请求不会超过其截止时间，每次重试都从中扣除并记录尝试；
+        为空时只按本Provider的 max_retries 重试。
+        report_stream 不为空时以流式方式请求，收到的报告片段实时写入部分报告文件。
+        hedge_provider 为等价的另一个配置，请求超过对冲阈值仍未收到首字节时向它发送同样的请求，先成功的胜出
+        """
         stock_code = stock_info.get('code', 'unknown')
         StructuredLogger.log_api_call(self.name, self.model, stock_code, 'start_analysis')
         
+        budget = retry_budget or RetryBudget(max_retries=self.retry_config.max_retries)
         retry_count = 0
         last_error = None
+        estimated_tokens = estimate_tokens(self.format_prompt(prompt, stock_info)) if self.rate_limits else 0
         
-        while retry_count <= self.retry_config.max_retries:
-            try:
-                start_time = time.time()
-                result = self._make_api_request(prompt, stock_info)
-                result.response_time = time.time() - start_time
+        # Provider内部的多轮请求（如深度研究的确认和后续请求）通过上下文读取同一个预算
+        budget_token = current_retry_budget.set(budget)
+        stream_token = current_report_stream.set(report_stream)
+        try:
+            while True:
+                if budget.expired():
+                    return self._deadline_result(stock_code, last_error, budget, retry_count)
+                # 提供商熔断时不再请求（包括本次调用中的后续重试），由调用方切换提供商
+                if not circuit_breaker.allow_request(self.name):
+                    return self._circuit_open_result(stock_code, last_error, retry_count)
+                if report_stream:
+                    report_stream.begin_attempt(self.name, self.model)
+                try:
+                    result = await self._attempt_with_deadline(prompt, stock_info, stock_code,
+                                                               estimated_tokens, budget, report_stream,
+                                                               hedge_provider)
+                    hedge_won = result.metadata.get('hedge', {}).get('hedge_won', False)
+                    # 对冲请求胜出时，本提供商被取消的请求不计入熔断
+                    circuit_breaker.record_result(self.name, result.success and not hedge_won,
+                                                  result.error_type.value if result.error_type else None)
+                except asyncio.TimeoutError:
+                    # 截止时间到达时取消的请求不计入熔断，只释放可能占用的半开探测名额
+                    circuit_breaker.release_probe(self.name)
+                    result = self._deadline_result(stock_code, last_error, budget, retry_count)
+                    hedge_won = False
+                except Exception as e:
+                    error_type = self._classify_error(e)
+                    result = AnalysisResult(
+                        success=False,
+                        error=str(e),
+                        error_type=error_type,
+                        provider=self.name,
+                        model=self.model
+                    )
+                    circuit_breaker.record_result(self.name, False, error_type.value)
+                    hedge_won = False
                 result.retry_count = retry_count
+                budget.record_attempt('provider', result.success, result.error,
+                                      result.error_type.value if result.error_type else None,
+                                      hedge_provider.name if hedge_won else self.name)
                 
                 if result.success:
+                    if report_stream and not report_stream.length:
+                        # 不支持流式输出的模型在完成后一次写入
+                        report_stream.write(result.content)
                     StructuredLogger.log_api_success(
                         self.name, self.model, stock_code, 
                         result.response_time, result.tokens_used,
                         retry_count=retry_count
                     )
                     return result
-                else:
-                    # 分析失败，检查是否需要重试
-                    if self.retry_manager.should_retry(result.error_type, retry_count):
-                        delay = self.retry_manager.get_delay(retry_count)
-                        StructuredLogger.log_retry_attempt(
-                            self.name, self.model, stock_code, 
-                            retry_count + 1, delay, result.error_type
-                        )
-                        self.retry_manager.wait(retry_count)
-                        retry_count += 1
-                        last_error = result
-                        continue
-                    else:
-                        StructuredLogger.log_api_error(
-                            self.name, self.model, stock_code,
-                            result.error_type, result.error, retry_count
-                        )
-                        return result
-                        
-            except Exception as e:
-                error_type = self._classify_error(e)
-                error_result = AnalysisResult(
-                    success=False,
-                    error=str(e),
-                    error_type=error_type,
-                    provider=self.name,
-                    model=self.model,
-                    retry_count=retry_count
-                )
                 
-                if self.retry_manager.should_retry(error_type, retry_count):
-                    delay = self.retry_manager.get_delay(retry_count)
-                    StructuredLogger.log_retry_attempt(
-                        self.name, self.model, stock_code,
-                        retry_count + 1, delay, error_type
-                    )
-                    self.retry_manager.wait(retry_count)
-                    retry_count += 1
-                    last_error = error_result
-                    continue
-                else:
+                # 分析失败，检查是否需要重试（错误类型可重试、本Provider和预算都还有重试次数）
+                last_error = result
+                if not self.retry_manager.should_retry(result.error_type, retry_count):
                     StructuredLogger.log_api_error(
                         self.name, self.model, stock_code,
-                        error_type, str(e), retry_count
+                        result.error_type, result.error, retry_count
                     )
-                    return error_result
+                    return result
+                if circuit_breaker.is_open(self.name):
+                    return self._circuit_open_result(stock_code, last_error, retry_count)
+                delay = budget.consume_retry(self.retry_manager.get_delay(retry_count))
+                if delay is None:
+                    break
+                StructuredLogger.log_retry_attempt(
+                    self.name, self.model, stock_code, 
+                    retry_count + 1, delay, result.error_type
+                )
+                llm_metrics.record_retry(self.name, self.model)
+                if not await self._backoff(delay, budget):
+                    logger.info(f"任务已停止，不再重试 - 股票: {stock_code}")
+                    return last_error
+                retry_count += 1
+        finally:
+            current_report_stream.reset(stream_token)
+            current_retry_budget.reset(budget_token)
         
-        # 所有重试都失败了
-        if last_error:
-            last_error.retry_count = retry_count
-            StructuredLogger.log_api_error(
-                self.name, self.model, stock_code,
-                last_error.error_type, f"所有重试都失败，总重试次数: {retry_count}", retry_count
-            )
-            return last_error
+        # 重试预算用完
+        StructuredLogger.log_api_error(
+            self.name, self.model, stock_code,
+            last_error.error_type, f"重试预算用完（{budget.exhausted_reason()}），总重试次数: {retry_count}",
+            retry_count
+        )
+        return last_error
+    
+    async def _backoff(self, delay: float, budget: RetryBudget) -> bool:
+        """等待重试，期间释放调用方占用的提供商并发槽位；重新占用槽位前任务被停止时返回False"""
+        slot = budget.slot
+        if slot is not None:
+            slot.release()
+        await asyncio.sleep(delay)
+        if slot is not None:
+            return await asyncio.to_thread(slot.acquire)
+        return True
+    
+    async def _attempt_with_deadline(self, prompt: str, stock_info: Dict[str, Any], stock_code: str,
+                                     estimated_tokens: int, budget: RetryBudget,
+                                     report_stream: Optional[PartialReportWriter] = None,
+                                     hedge_provider: Optional['LLMProvider'] = None) -> AnalysisResult:
+        """执行一次请求（包括限流等待），超过预算的截止时间时抛出 asyncio.TimeoutError"""
+        if hedge_provider is not None and request_hedger.is_enabled():
+            attempt = self._hedged_attempt(prompt, stock_info, stock_code, estimated_tokens,
+                                           report_stream, hedge_provider)
         else:
-            return AnalysisResult(
-                success=False,
-                error="未知错误",
-                error_type=ErrorType.UNKNOWN_ERROR,
-                provider=self.name,
-                model=self.model,
-                retry_count=retry_count
-            )
+            writer = StreamArbiter(report_stream).writer() if report_stream else None
+            attempt = self._timed_attempt(prompt, stock_info, stock_code, estimated_tokens, writer)
+        
+        remaining = budget.remaining()
+        if remaining is None:
+            return await attempt
+        return await asyncio.wait_for(attempt, remaining)
+    
+    async def _timed_attempt(self, prompt: str, stock_info: Dict[str, Any], stock_code: str,
+                             estimated_tokens: int, writer=None) -> AnalysisResult:
+        """执行一次请求（包括限流等待）并记录调用指标；writer 为本次请求的报告输出，用于记录首字节耗时"""
+        await self._wait_for_rate_limit(stock_code, estimated_tokens)
+        if writer is not None:
+            # 竞速的请求在各自的任务中执行，只影响本次请求读取的部分报告文件
+            current_report_stream.set(writer)
+        start_time = time.time()
+        started = time.monotonic()
+        try:
+            result = await self._amake_api_request(prompt, stock_info)
+        except asyncio.CancelledError:
+            llm_metrics.record_call(self.name, self.model, time.monotonic() - started,
+                                    success=False, error_type='cancelled')
+            raise
+        except Exception as e:
+            llm_metrics.record_call(self.name, self.model, time.monotonic() - started,
+                                    success=False, error_type=self._classify_error(e).value)
+            raise
+        result.response_time = time.time() - start_time
+        if self.rate_limits and result.tokens_used is not None:
+            rate_limiter.record_usage(self.rate_limit_key, self.rate_limits,
+                                      estimated_tokens, result.tokens_used)
+        
+        first_byte = writer.first_byte_at - started if writer is not None and writer.first_byte_at else None
+        llm_metrics.record_call(self.name, self.model, result.response_time, first_byte, result.tokens_used,
+                                result.success, result.error_type.value if result.error_type else None)
+        if result.success and request_hedger.is_enabled():
+            request_hedger.record_latency(self._latency_key(writer),
+                                          first_byte if first_byte is not None else result.response_time)
+        return result
+    
+    def _latency_key(self, writer=None) -> str:
+        """首字节耗时的统计键，流式和非流式请求分开统计"""
+        return f"{self.name}:{self.model}:{'stream' if writer is not None else 'full'}"
+    
+    async def _hedged_attempt(self, prompt: str, stock_info: Dict[str, Any], stock_code: str,
+                              estimated_tokens: int, report_stream: Optional[PartialReportWriter],
+                              hedge_provider: 'LLMProvider') -> AnalysisResult:
+        """执行一次可对冲的请求：超过对冲阈值仍未收到首字节时向等价配置发送同样的请求，先成功的胜出"""
+        loop = asyncio.get_running_loop()
+        arbiter = StreamArbiter(report_stream)
+        first_byte = asyncio.Event()
+        primary_writer = arbiter.writer(lambda: loop.call_soon_threadsafe(first_byte.set)) if report_stream else None
+        delay = request_hedger.hedge_delay(self._latency_key(primary_writer))
+        request_hedger.record_request()
+        
+        primary = asyncio.ensure_future(self._timed_attempt(prompt, stock_info, stock_code, estimated_tokens,
+                                                            primary_writer))
+        first_byte_waiter = asyncio.ensure_future(first_byte.wait())
+        hedge = None
+        try:
+            await asyncio.wait({primary, first_byte_waiter}, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+            if primary.done() or first_byte.is_set():
+                return await primary
+            if not circuit_breaker.allow_request(hedge_provider.name) or not request_hedger.try_acquire():
+                return await primary
+            
+            logger.warning(f"{self.name}:{self.model} 超过 {delay:.1f} 秒未返回，"
+                           f"向 {hedge_provider.name}:{hedge_provider.model} 发送对冲请求 - 股票: {stock_code}")
+            hedge_tokens = estimate_tokens(hedge_provider.format_prompt(prompt, stock_info)) \
+                if hedge_provider.rate_limits else 0
+            hedge_writer = arbiter.writer() if report_stream else None
+            hedge = asyncio.ensure_future(hedge_provider._timed_attempt(prompt, stock_info, stock_code, hedge_tokens,
+                                                                        hedge_writer))
+            hedge.add_done_callback(lambda task: self._record_hedge_result(hedge_provider, task))
+            
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if not task.exception() and task.result().success), None)
+                if winner is not None:
+                    break
+            else:
+                winner = None
+            
+            for task in (primary, hedge):
+                if not task.done():
+                    task.cancel()
+            hedge_won = winner is hedge
+            loser_provider, loser, loser_writer = (self, primary, primary_writer) if hedge_won else \
+                (hedge_provider, hedge, hedge_writer)
+            request_hedger.record_outcome(hedge_won, self._hedge_extra_tokens(loser_provider, loser, loser_writer,
+                                                                             prompt, stock_info))
+            if winner is None:
+                return await primary
+            
+            result = winner.result()
+            winner_writer = hedge_writer if hedge_won else primary_writer
+            if report_stream and arbiter.owner is not winner_writer:
+                # 部分报告文件被落败的请求占用，改为写入胜出请求的完整内容
+                report_stream.begin_attempt(result.provider, result.model)
+                report_stream.write(result.content)
+            result.metadata['hedge'] = {
+                'delay': round(delay, 2),
+                'hedge_won': hedge_won,
+                'winner': f"{result.provider}:{result.model}",
+                'hedge_provider': hedge_provider.name
+            }
+            logger.info(f"对冲请求完成，胜出: {result.provider}:{result.model} - 股票: {stock_code}")
+            return result
+        finally:
+            for task in (primary, first_byte_waiter, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+    
+    @staticmethod
+    def _record_hedge_result(hedge_provider: 'LLMProvider', task: asyncio.Future) -> None:
+        """对冲请求完成后计入对冲提供商的熔断统计（被取消的请求不计入）"""
+        if task.cancelled():
+            circuit_breaker.record_result(hedge_provider.name, False)
+            return
+        if task.exception() is not None:
+            circuit_breaker.record_result(hedge_provider.name, False,
+                                          hedge_provider._classify_error(task.exception()).value)
+            return
+        result = task.result()
+        circuit_breaker.record_result(hedge_provider.name, result.success,
+                                      result.error_type.value if result.error_type else None)
+    
+    @staticmethod
+    def _hedge_extra_tokens(provider: 'LLMProvider', task: asyncio.Future, writer, prompt: str,
+                            stock_info: Dict[str, Any]) -> int:
+        """估算对冲中落败请求消耗的Token：完成的请求按实际用量，被取消的按提示词和已收到的片段估算"""
+        if task.done() and not task.cancelled() and not task.exception() and task.result().tokens_used:
+            return task.result().tokens_used
+        return estimate_tokens(provider.format_prompt(prompt, stock_info)) + (writer.output_tokens if writer else 0)
+    
+    def _deadline_result(self, stock_code: str, last_error: Optional[AnalysisResult], budget: RetryBudget,
+                         retry_count: int) -> AnalysisResult:
+        """超过分析截止时间时的分析结果"""
+        error = f"{self.name} 分析超时，{budget.exhausted_reason()}"
+        if last_error and last_error.error:
+            error += f"，最后一次错误: {last_error.error}"
+        logger.warning(f"{error} - 股票: {stock_code}")
+        return AnalysisResult(
+            success=False,
+            error=error,
+            error_type=ErrorType.TIMEOUT_ERROR,
+            provider=self.name,
+            model=self.model,
+            retry_count=retry_count
+        )
+    
+    def _circuit_open_result(self, stock_code: str, last_error: Optional[AnalysisResult],
+                             retry_count: int) -> AnalysisResult:
+        """提供商熔断时的分析结果"""
+        error = f"{self.name} 已熔断，暂停请求"
+        if last_error and last_error.error:
+            error += f"，最后一次错误: {last_error.error}"
+        logger.warning(f"{error} - 股票: {stock_code}")
+        return AnalysisResult(
+            success=False,
+            error=error,
+            error_type=ErrorType.CIRCUIT_OPEN,
+            provider=self.name,
+            model=self.model,
+            retry_count=retry_count
+        )
+    
+    async def _wait_for_rate_limit(self, stock_code: str, estimated_tokens: int) -> None:
+        """预约限流额度，额度不足时等待到可以发送"""
+        if not self.rate_limits:
+            return
+        wait = await asyncio.to_thread(rate_limiter.reserve, self.rate_limit_key, self.rate_limits, estimated_tokens)
+        if wait > 0:
+            logger.info(f"{self.name}:{self.model} 达到客户端限流额度，等待 {wait:.1f} 秒后发送 - 股票: {stock_code}")
+            await asyncio.sleep(wait)
+    
+    @staticmethod
+    def _emit_chunk(chunks: List[str], text: str) -> None:
+        """收集流式响应的报告片段，同时写入当前的部分报告文件"""
+        if not text:
+            return
+        chunks.append(text)
+        report_stream = current_report_stream.get()
+        if report_stream:
+            report_stream.write(text)
+    
+    @staticmethod
+    async def _aiter_sse_events(response):
+        """逐个读取Server-Sent Events响应中的JSON数据"""
+        async for line in response.aiter_lines():
+            if not line.startswith('data:'):
+                continue
+            payload = line[5:].strip()
+            if not payload or payload == '[DONE]':
+                continue
+            yield json.loads(payload)
     
     def _classify_error(self, error: Exception) -> ErrorType:
         """分类错误类型"""
         error_str = str(error).lower()
         
-        if isinstance(error, requests.exceptions.Timeout):
+        if isinstance(error, TIMEOUT_ERRORS):
             return ErrorType.TIMEOUT_ERROR
-        elif isinstance(error, requests.exceptions.ConnectionError):
+        elif isinstance(error, CONNECTION_ERRORS):
             return ErrorType.NETWORK_ERROR
         elif isinstance(error, requests.exceptions.HTTPError):
             if "401" in error_str or "403" in error_str:
@@ -307,6 +577,25 @@ class LLMProvider(ABC):
         else:
             return ErrorType.UNKNOWN_ERROR
     
+    def _request_error_result(self, error: Exception, stock_code: str, label: str, model: str) -> AnalysisResult:
+        """把HTTP请求异常转换为分析结果"""
+        if isinstance(error, TIMEOUT_ERRORS):
+            logger.error(f"{label} API请求超时 - 股票: {stock_code}")
+            error_msg, error_type = 'Request timeout', ErrorType.TIMEOUT_ERROR
+        elif isinstance(error, CONNECTION_ERRORS):
+            logger.error(f"{label} API连接错误 - 股票: {stock_code}, 错误: {str(error)}")
+            error_msg, error_type = f'Connection error: {str(error)}', ErrorType.NETWORK_ERROR
+        else:
+            logger.error(f"{label} API请求异常 - 股票: {stock_code}, 错误: {str(error)}")
+            error_msg, error_type = str(error), ErrorType.UNKNOWN_ERROR
+        return AnalysisResult(
+            success=False,
+            error=error_msg,
+            error_type=error_type,
+            provider=label.lower(),
+            model=model
+        )
+    
     @abstractmethod
     def test_connection(self) -> bool:
         """测试API连接"""
@@ -334,10 +623,92 @@ class GeminiProvider(LLMProvider):
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
         self.api_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+        self.stream_url = self.api_url.replace(':generateContent', ':streamGenerateContent') + '?alt=sse'
         self.model_name = self.model if self.model else 'gemini-2.0-flash'
+        self.http = get_http_client(self.api_url, self.http_pool_config)
     
     def _make_api_request(self, prompt: str, stock_info: Dict[str, Any]) -> AnalysisResult:
         """执行Gemini API请求"""
+        stock_code, headers, data = self._prepare_request(prompt, stock_info)
+        
+        try:
+            # 调用Gemini API，使用新的超时配置
+            response = self.http.post(
+                self.api_url, 
+                headers=headers, 
+                json=data, 
+                timeout=(self.connect_timeout, self.request_timeout)
+            )
+            return self._parse_response(response, stock_code)
+        except Exception as e:
+            return self._request_error_result(e, stock_code, 'Gemini', self.model_name)
+    
+    async def _amake_api_request(self, prompt: str, stock_info: Dict[str, Any]) -> AnalysisResult:
+        """异步执行Gemini API请求"""
+        client = get_async_http_client(self.api_url, self.http_pool_config)
+        if client is None:
+            return await super()._amake_api_request(prompt, stock_info)
+        if current_report_stream.get() is not None:
+            return await self._astream_api_request(client, prompt, stock_info)
+        
+        stock_code, headers, data = self._prepare_request(prompt, stock_info)
+        try:
+            response = await client.post(
+                self.api_url,
+                headers=headers,
+                json=data,
+                timeout=(self.connect_timeout, self.request_timeout)
+            )
+            return self._parse_response(response, stock_code)
+        except Exception as e:
+            return self._request_error_result(e, stock_code, 'Gemini', self.model_name)
+    
+    async def _astream_api_request(self, client, prompt: str, stock_info: Dict[str, Any]) -> AnalysisResult:
+        """以流式方式执行Gemini API请求，报告片段到达时写入部分报告文件"""
+        stock_code, headers, data = self._prepare_request(prompt, stock_info)
+        chunks = []
+        usage_metadata = {}
+        try:
+            async with client.stream(
+                self.stream_url,
+                headers=headers,
+                json=data,
+                timeout=(self.connect_timeout, self.request_timeout)
+            ) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    return self._parse_response(response, stock_code)
+                async for event in self._aiter_sse_events(response):
+                    for candidate in event.get('candidates', [])[:1]:
+                        for part in candidate.get('content', {}).get('parts', []):
+                            self._emit_chunk(chunks, part.get('text'))
+                    usage_metadata = event.get('usageMetadata', usage_metadata)
+                connection = response.connection_metrics
+        except Exception as e:
+            return self._request_error_result(e, stock_code, 'Gemini', self.model_name)
+        
+        if not chunks:
+            logger.error(f"Gemini API返回成功但无内容 - 股票: {stock_code}")
+            return AnalysisResult(
+                success=False,
+                error='No response content from Gemini API',
+                error_type=ErrorType.PARSE_ERROR,
+                provider='gemini',
+                model=self.model_name
+            )
+        content = ''.join(chunks)
+        logger.info(f"Gemini流式分析成功 - 股票: {stock_code}, 内容长度: {len(content)} 字符, 片段数: {len(chunks)}")
+        return AnalysisResult(
+            success=True,
+            content=content,
+            provider='gemini',
+            model=self.model_name,
+            tokens_used=usage_metadata.get('totalTokenCount'),
+            metadata={'usage_metadata': usage_metadata, 'stream_mode': True, 'connection': connection}
+        )
+    
+    def _prepare_request(self, prompt: str, stock_info: Dict[str, Any]) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """准备请求头和请求数据"""
         stock_code = stock_info.get('code', 'unknown')
         
         logger.info(f"调用Gemini API - 股票: {stock_code}, 模型: {self.model_name}")
@@ -365,85 +736,51 @@ class GeminiProvider(LLMProvider):
                 }
             ]
         }
+        return stock_code, headers, data
+    
+    def _parse_response(self, response, stock_code: str) -> AnalysisResult:
+        """解析Gemini API响应（requests或httpx响应）"""
+        logger.debug(f"Gemini API响应状态码: {response.status_code}")
         
-        try:
-            # 调用Gemini API，使用新的超时配置
-            response = requests.post(
-                self.api_url, 
-                headers=headers, 
-                json=data, 
-                timeout=(self.connect_timeout, self.request_timeout)
-            )
+        if response.status_code == 200:
+            result = response.json()
+            logger.debug(f"Gemini API返回成功，响应内容长度: {len(str(result))}")
             
-            logger.debug(f"Gemini API响应状态码: {response.status_code}")
-            
-            if response.status_code == 200:
-                result = response.json()
-                logger.debug(f"Gemini API返回成功，响应内容长度: {len(str(result))}")
-                
-                if 'candidates' in result and len(result['candidates']) > 0:
-                    content = result['candidates'][0]['content']['parts'][0]['text']
-                    usage_metadata = result.get('usageMetadata', {})
-                    
-                    logger.info(f"Gemini分析成功 - 股票: {stock_code}, 内容长度: {len(content)} 字符")
-                    logger.debug(f"Token使用情况: {usage_metadata}")
-                    
-                    return AnalysisResult(
-                        success=True,
-                        content=content,
-                        provider='gemini',
-                        model=self.model_name,
-                        tokens_used=usage_metadata.get('totalTokenCount'),
-                        metadata={'usage_metadata': usage_metadata}
-                    )
-                else:
-                    logger.error(f"Gemini API返回成功但无内容 - 股票: {stock_code}")
-                    return AnalysisResult(
-                        success=False,
-                        error='No response content from Gemini API',
-                        error_type=ErrorType.PARSE_ERROR,
-                        provider='gemini',
-                        model=self.model_name
-                    )
-            else:
-                # 根据状态码分类错误
-                error_type = self._classify_http_error(response.status_code)
-                error_msg = f'Gemini API request failed: {response.status_code} - {response.text}'
+            if 'candidates' in result and len(result['candidates']) > 0:
+                content = result['candidates'][0]['content']['parts'][0]['text']
+                usage_metadata = result.get('usageMetadata', {})
                 
-                logger.error(f"Gemini API请求失败 - 股票: {stock_code}, 状态码: {response.status_code}")
+                logger.info(f"Gemini分析成功 - 股票: {stock_code}, 内容长度: {len(content)} 字符")
+                logger.debug(f"Token使用情况: {usage_metadata}")
                 
+                return AnalysisResult(
+                    success=True,
+                    content=content,
+                    provider='gemini',
+                    model=self.model_name,
+                    tokens_used=usage_metadata.get('totalTokenCount'),
+                    metadata={'usage_metadata': usage_metadata, 'connection': response.connection_metrics}
+                )
+            else:
+                logger.error(f"Gemini API返回成功但无内容 - 股票: {stock_code}")
                 return AnalysisResult(
                     success=False,
-                    error=error_msg,
-                    error_type=error_type,
+                    error='No response content from Gemini API',
+                    error_type=ErrorType.PARSE_ERROR,
                     provider='gemini',
                     model=self.model_name
                 )
-                
-        except requests.exceptions.Timeout:
-            logger.error(f"Gemini API请求超时 - 股票: {stock_code}")
-            return AnalysisResult(
-                success=False,
-                error='Request timeout',
-                error_type=ErrorType.TIMEOUT_ERROR,
-                provider='gemini',
-                model=self.model_name
-            )
-        except requests.exceptions.ConnectionError as e:
-            logger.error(f"Gemini API连接错误 - 股票: {stock_code}, 错误: {str(e)}")
-            return AnalysisResult(
-                success=False,
-                error=f'Connection error: {str(e)}',
-                error_type=ErrorType.NETWORK_ERROR,
-                provider='gemini',
-                model=self.model_name
-            )
-        except Exception as e:
-            logger.error(f"Gemini API请求异常 - 股票: {stock_code}, 错误: {str(e)}")
+        else:
+            # 根据状态码分类错误
+            error_type = self._classify_http_error(response.status_code)
+            error_msg = f'Gemini API request failed: {response.status_code} - {response.text}'
+            
+            logger.error(f"Gemini API请求失败 - 股票: {stock_code}, 状态码: {response.status_code}")
+            
             return AnalysisResult(
                 success=False,
-                error=str(e),
-                error_type=ErrorType.UNKNOWN_ERROR,
+                error=error_msg,
+                error_type=error_type,
                 provider='gemini',
                 model=self.model_name
             )
@@ -481,7 +818,7 @@ class GeminiProvider(LLMProvider):
                 ]
             }
             
-            response = requests.post(
+            response = self.http.post(
                 self.api_url, 
                 headers=headers, 
                 json=data, 
@@ -712,7 +1049,7 @@ class QwenProvider(LLMProvider):
                 return AnalysisResult(
                     success=False,
                     error=f"Qwen深度研究分析失败: {error_msg}",
-                    error_type=ErrorType.UNKNOWN_ERROR,
+                    error_type=result.get('error_type', ErrorType.UNKNOWN_ERROR),
                     provider='qwen',
                     model=self.model
                 )
@@ -733,8 +1070,8 @@ class QwenProvider(LLMProvider):
             logger.info(f"开始处理Qwen深度研究流式响应 - 股票: {stock_code}")
             
             current_phase = None
-            phase_content = ""
-            final_content = ""
+            phase_has_content = False
+            chunks = []
             chunk_count = 0
             
             for response_chunk in response:
@@ -757,19 +1094,21 @@ class QwenProvider(LLMProvider):
                     
                     # 阶段变化检测
                     if phase != current_phase:
-                        if current_phase and phase_content:
+                        if current_phase and phase_has_content:
                             logger.info(f"qwen-deep-research {current_phase} 阶段完成")
                         current_phase = phase
-                        phase_content = ""
+                        phase_has_content = False
                         if phase:
                             logger.info(f"qwen-deep-research 进入 {phase} 阶段")
                     
                     # 累积阶段内容
                     if content:
-                        phase_content += content
-                        final_content += content
-                        logger.debug(f"Chunk {chunk_count}: 累积内容长度: {len(final_content)} 字符, 当前内容: '{content}'")
+                        phase_has_content = True
+                        self._emit_chunk(chunks, content)
+                        logger.debug(f"Chunk {chunk_count}: 当前内容长度: {len(content)} 字符")
             
+            final_content = ''.join(chunks)
+
             logger.info(f"Qwen深度研究流式响应处理完成 - 股票: {stock_code}, 处理了{chunk_count}个chunk, 总内容长度: {len(final_content)} 字符")
             
             if not final_content:
@@ -903,8 +1242,8 @@ class QwenProvider(LLMProvider):
             responses = Generation.call(**api_params)
             
             current_phase = None
-            phase_content = ""
-            final_content = ""
+            phase_content = []
+            chunks = []
             research_goal = ""
             web_sites = []
             
@@ -930,13 +1269,13 @@ class QwenProvider(LLMProvider):
                         if current_phase and phase_content:
                             logger.info(f"qwen-deep-research {current_phase} 阶段完成")
                         current_phase = phase
-                        phase_content = ""
+                        phase_content = []
                         logger.info(f"qwen-deep-research 进入 {phase} 阶段")
                     
                     # 累积阶段内容
                     if content:
-                        phase_content += content
-                        final_content += content
+                        phase_content.append(content)
+                        self._emit_chunk(chunks, content)
                     
                     # 处理WebResearch阶段的特殊信息
                     if phase == "WebResearch":
@@ -965,8 +1304,7 @@ class QwenProvider(LLMProvider):
                         break
             
             # 如果没有获取到内容，使用阶段内容
-            if not final_content and phase_content:
-                final_content = phase_content
+            final_content = ''.join(chunks) or ''.join(phase_content)
             
             logger.info(f"qwen-deep-research 分析成功 - 股票: {stock_code}, 内容长度: {len(final_content)} 字符")
             
@@ -999,15 +1337,23 @@ class QwenProvider(LLMProvider):
             
             logger.info(f"开始处理 qwen-deep-research 流式响应（支持反问确认）- 股票: {stock_code}")
             
+            # 两轮流式请求共用调用方的重试预算，超过截止时间后不再读取响应或发起后续请求
+            budget = current_retry_budget.get()
+            
             # 第一步：获取反问确认问题
             logger.info("第一步：获取反问确认问题")
             responses = Generation.call(**api_params)
             
             current_phase = None
-            phase_content = ""
-            confirmation_questions = ""
+            phase_has_content = False
+            question_parts = []
+            chunks = []
+            research_goal = ""
+            web_sites = []
             
             for response in responses:
+                if budget and budget.expired():
+                    return self._deep_research_deadline_result(stock_code, budget)
                 if hasattr(response, 'status_code') and response.status_code != 200:
                     logger.error(f"qwen-deep-research HTTP返回码：{response.status_code}")
                     continue
@@ -1019,18 +1365,18 @@ class QwenProvider(LLMProvider):
                     status = message.get('status')
                     
                     if phase != current_phase:
-                        if current_phase and phase_content:
+                        if current_phase and phase_has_content:
                             logger.info(f"qwen-deep-research {current_phase} 阶段完成")
                         current_phase = phase
-                        phase_content = ""
+                        phase_has_content = False
                         logger.info(f"qwen-deep-research 进入 {phase} 阶段")
                     
                     if content:
-                        phase_content += content
+                        phase_has_content = True
                         
                         # 如果是反问确认阶段，记录问题
                         if phase == "answer" and status == "typing":
-                            confirmation_questions += content
+                            question_parts.append(content)
                     
                     # 检查反问确认是否完成
                     if status == "finished" and phase == "answer":
@@ -1038,7 +1384,10 @@ class QwenProvider(LLMProvider):
                         break
             
             # 第二步：自动回答反问问题并继续分析
+            confirmation_questions = ''.join(question_parts)
             if confirmation_questions:
+                if budget and budget.expired():
+                    return self._deep_research_deadline_result(stock_code, budget)
                 logger.info("第二步：自动回答反问问题并继续分析")
                 
                 # 构建自动回答
@@ -1074,14 +1423,15 @@ class QwenProvider(LLMProvider):
                     }
                 }
                 
+                # 部分报告先写入确认问题，与最终报告的结构一致
+                self._emit_chunk(chunks, f"## 分析确认问题\n\n{confirmation_questions}\n\n## 详细分析报告\n\n")
+                
                 logger.info("发送包含自动回答的请求...")
                 follow_up_responses = Generation.call(**follow_up_params)
                 
-                final_content = ""
-                research_goal = ""
-                web_sites = []
-                
                 for response in follow_up_responses:
+                    if budget and budget.expired():
+                        return self._deep_research_deadline_result(stock_code, budget)
                     if hasattr(response, 'status_code') and response.status_code != 200:
                         continue
                     
@@ -1093,7 +1443,7 @@ class QwenProvider(LLMProvider):
                         extra = message.get('extra', {})
                         
                         if content:
-                            final_content += content
+                            self._emit_chunk(chunks, content)
                         
                         # 处理WebResearch阶段的特殊信息
                         if phase == "WebResearch":
@@ -1118,16 +1468,8 @@ class QwenProvider(LLMProvider):
                             logger.info("最终报告生成完成")
                             break
             
-            # 构建完整的报告内容
-            complete_report = ""
-            
-            # 如果有反问确认问题，添加到报告中
-            if confirmation_questions:
-                complete_report += f"## 分析确认问题\n\n{confirmation_questions}\n\n"
-                complete_report += "## 详细分析报告\n\n"
-            
-            # 添加最终分析内容
-            complete_report += final_content
+            # 完整的报告内容（有反问确认问题时以确认问题开头）
+            complete_report = ''.join(chunks)
             
             logger.info(f"qwen-deep-research 分析成功 - 股票: {stock_code}, 内容长度: {len(complete_report)} 字符")
             
@@ -1154,6 +1496,20 @@ class QwenProvider(LLMProvider):
                 'timestamp': datetime.utcnow().isoformat()
             }
 
+    
+    def _deep_research_deadline_result(self, stock_code: str, budget: RetryBudget) -> Dict[str, Any]:
+        """qwen-deep-research 超过分析截止时间时的处理结果"""
+        error = f"Request timeout: {budget.exhausted_reason()}"
+        logger.warning(f"qwen-deep-research 停止读取响应 - 股票: {stock_code}, {error}")
+        return {
+            'success': False,
+            'error': error,
+            'error_type': ErrorType.TIMEOUT_ERROR,
+            'provider': 'qwen',
+            'model': self.model,
+            'timestamp': datetime.utcnow().isoformat()
+        }
+
 
 class DeepSeekProvider(LLMProvider):
     """DeepSeek Provider - 支持深度思考模型"""
@@ -1161,6 +1517,7 @@ class DeepSeekProvider(LLMProvider):
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
         self.api_url = "https://api.deepseek.com/v1/chat/completions"
+        self.http = get_http_client(self.api_url, self.http_pool_config)
         # 深度思考和全网搜索相关配置
         self.enable_deep_thinking = config.get('enable_deep_thinking', True)
         self.enable_web_search = config.get('enable_web_search', True)
@@ -1168,8 +1525,158 @@ class DeepSeekProvider(LLMProvider):
     
     def _make_api_request(self, prompt: str, stock_info: Dict[str, Any]) -> AnalysisResult:
         """执行DeepSeek API请求"""
-        stock_code = stock_info.get('code', 'unknown')
         start_time = time.time()
+        stock_code, headers, data = self._prepare_request(prompt, stock_info)
+        
+        try:
+            # 调用DeepSeek API，使用新的超时配置
+            response = self.http.post(
+                self.api_url, 
+                headers=headers, 
+                json=data, 
+                timeout=(self.connect_timeout, self.request_timeout)
+            )
+            result, tool_message = self._parse_response(response, stock_code)
+            if tool_message:
+                # 如果返回工具调用，需要继续对话获取最终结果
+                return self._continue_conversation_with_tools(data, tool_message, headers, stock_code, start_time)
+            return result
+        except Exception as e:
+            return self._request_error_result(e, stock_code, 'DeepSeek', self.model)
+    
+    async def _amake_api_request(self, prompt: str, stock_info: Dict[str, Any]) -> AnalysisResult:
+        """异步执行DeepSeek API请求"""
+        client = get_async_http_client(self.api_url, self.http_pool_config)
+        if client is None:
+            return await super()._amake_api_request(prompt, stock_info)
+        if current_report_stream.get() is not None:
+            return await self._astream_api_request(client, prompt, stock_info)
+        
+        start_time = time.time()
+        stock_code, headers, data = self._prepare_request(prompt, stock_info)
+        try:
+            response = await client.post(
+                self.api_url,
+                headers=headers,
+                json=data,
+                timeout=(self.connect_timeout, self.request_timeout)
+            )
+            result, tool_message = self._parse_response(response, stock_code)
+            if not tool_message:
+                return result
+        except Exception as e:
+            return self._request_error_result(e, stock_code, 'DeepSeek', self.model)
+        
+        try:
+            logger.info(f"继续对话获取最终结果 - 股票: {stock_code}")
+            response = await client.post(
+                self.api_url,
+                headers=headers,
+                json=self._build_continue_data(data, tool_message),
+                timeout=(self.connect_timeout, self.request_timeout)
+            )
+            return self._parse_continue_response(response, stock_code, time.time() - start_time)
+        except Exception as e:
+            logger.error(f"继续对话时出错: {str(e)}")
+            return AnalysisResult(
+                success=False,
+                error=f'Continue conversation error: {str(e)}',
+                error_type=ErrorType.UNKNOWN_ERROR,
+                provider='deepseek',
+                model=self.model
+            )
+    
+    async def _astream_api_request(self, client, prompt: str, stock_info: Dict[str, Any]) -> AnalysisResult:
+        """以流式方式执行DeepSeek API请求（包括工具调用后的继续对话），报告片段到达时写入部分报告文件"""
+        start_time = time.time()
+        stock_code, headers, data = self._prepare_request(prompt, stock_info)
+        chunks = []
+        try:
+            error, tool_message, usage = await self._astream_completion(client, headers, data, stock_code, chunks)
+            if error:
+                return error
+            if tool_message:
+                logger.info(f"继续对话获取最终结果 - 股票: {stock_code}")
+                error, _, usage = await self._astream_completion(
+                    client, headers, self._build_continue_data(data, tool_message), stock_code, chunks
+                )
+                if error:
+                    return error
+        except Exception as e:
+            return self._request_error_result(e, stock_code, 'DeepSeek', self.model)
+        
+        if not chunks:
+            logger.error(f"DeepSeek API返回成功但无内容 - 股票: {stock_code}")
+            return AnalysisResult(
+                success=False,
+                error='No response content from DeepSeek API',
+                error_type=ErrorType.PARSE_ERROR,
+                provider='deepseek',
+                model=self.model
+            )
+        content = ''.join(chunks)
+        logger.info(f"DeepSeek流式分析成功 - 股票: {stock_code}, 内容长度: {len(content)} 字符, 片段数: {len(chunks)}")
+        return AnalysisResult(
+            success=True,
+            content=content,
+            provider='deepseek',
+            model=self.model,
+            tokens_used=usage.get('total_tokens') if usage else None,
+            response_time=time.time() - start_time,
+            metadata={'stream_mode': True, 'deep_thinking': tool_message is not None}
+        )
+    
+    async def _astream_completion(self, client, headers: Dict[str, str], data: Dict[str, Any], stock_code: str,
+                                  chunks: List[str]) -> Tuple[Optional[AnalysisResult], Optional[Dict[str, Any]],
+                                                              Optional[Dict[str, Any]]]:
+        """发送一次流式对话请求，正文片段追加到 chunks
+        
+        Returns:
+            (请求失败时的分析结果, 需要继续对话时的工具调用消息, Token用量)
+        """
+        tool_calls: Dict[int, Dict[str, Any]] = {}
+        reasoning = []
+        usage = None
+        finish_reason = None
+        async with client.stream(
+            self.api_url,
+            headers=headers,
+            json=dict(data, stream=True, stream_options={'include_usage': True}),
+            timeout=(self.connect_timeout, self.request_timeout)
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                return self._parse_response(response, stock_code)[0], None, None
+            async for event in self._aiter_sse_events(response):
+                usage = event.get('usage') or usage
+                for choice in event.get('choices', [])[:1]:
+                    delta = choice.get('delta') or {}
+                    self._emit_chunk(chunks, delta.get('content'))
+                    if delta.get('reasoning_content'):
+                        reasoning.append(delta['reasoning_content'])
+                    for call in delta.get('tool_calls') or []:
+                        # 工具调用的参数分多个片段返回，按序号拼接
+                        merged = tool_calls.setdefault(call.get('index', 0), {
+                            'id': None, 'type': 'function', 'function': {'name': '', 'arguments': ''}
+                        })
+                        merged['id'] = call.get('id') or merged['id']
+                        function = call.get('function') or {}
+                        merged['function']['name'] += function.get('name') or ''
+                        merged['function']['arguments'] += function.get('arguments') or ''
+                    finish_reason = choice.get('finish_reason') or finish_reason
+        
+        if finish_reason == 'tool_calls' and tool_calls:
+            logger.info("检测到工具调用，继续对话获取最终结果")
+            return None, {'role': 'assistant', 'content': None,
+                          'tool_calls': [tool_calls[index] for index in sorted(tool_calls)]}, usage
+        if not chunks and reasoning:
+            # 与非流式响应一致：没有正文时使用推理内容
+            self._emit_chunk(chunks, ''.join(reasoning))
+        return None, None, usage
+    
+    def _prepare_request(self, prompt: str, stock_info: Dict[str, Any]) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """准备请求头和请求数据"""
+        stock_code = stock_info.get('code', 'unknown')
         
         logger.info(f"调用DeepSeek API - 股票: {stock_code}, 模型: {self.model}")
         logger.debug(f"API URL: {self.api_url}")
@@ -1245,83 +1752,49 @@ class DeepSeekProvider(LLMProvider):
             data["messages"][0]["content"] = f"请深入思考，进行多步推理分析。\n\n{formatted_prompt}"
             logger.debug("DeepSeek Chat 使用深度思考模式，在用户提示词前添加深度思考提示")
         
-        try:
-            # 调用DeepSeek API，使用新的超时配置
-            response = requests.post(
-                self.api_url, 
-                headers=headers, 
-                json=data, 
-                timeout=(self.connect_timeout, self.request_timeout)
-            )
+        return stock_code, headers, data
+    
+    def _parse_response(self, response, stock_code: str) -> Tuple[Optional[AnalysisResult], Optional[Dict[str, Any]]]:
+        """解析DeepSeek API响应，返回 (分析结果, 工具调用消息)，后者不为空时需要继续对话"""
+        logger.debug(f"DeepSeek API响应状态码: {response.status_code}")
+        
+        if response.status_code == 200:
+            result = response.json()
+            logger.debug(f"DeepSeek API返回成功 - 股票: {stock_code}")
             
-            logger.debug(f"DeepSeek API响应状态码: {response.status_code}")
+            message = result['choices'][0]['message']
+            finish_reason = result['choices'][0].get('finish_reason', '')
+            
+            if finish_reason == 'tool_calls' and 'tool_calls' in message:
+                logger.info("检测到工具调用，继续对话获取最终结果")
+                return None, message
+            
+            content = self._extract_deepseek_content(message)
+            
+            logger.info(f"DeepSeek分析成功 - 股票: {stock_code}, 内容长度: {len(content)} 字符")
             
-            if response.status_code == 200:
-                result = response.json()
-                logger.debug(f"DeepSeek API返回成功 - 股票: {stock_code}")
-                
-                message = result['choices'][0]['message']
-                finish_reason = result['choices'][0].get('finish_reason', '')
-                
-                # 如果返回工具调用，需要继续对话获取最终结果
-                if finish_reason == 'tool_calls' and 'tool_calls' in message:
-                    logger.info("检测到工具调用，继续对话获取最终结果")
-                    return self._continue_conversation_with_tools(data, message, headers, stock_code, start_time)
-                
-                content = self._extract_deepseek_content(message)
-                
-                logger.info(f"DeepSeek分析成功 - 股票: {stock_code}, 内容长度: {len(content)} 字符")
-                
-                return AnalysisResult(
-                    success=True,
-                    content=content,
-                    provider='deepseek',
-                    model=self.model,
-                    tokens_used=result['usage']['total_tokens'] if 'usage' in result else None,
-                    metadata={'response_status': response.status_code}
-                )
-            else:
-                # 根据状态码分类错误
-                error_type = self._classify_http_error(response.status_code)
-                error_msg = f'DeepSeek API request failed: {response.status_code} - {response.text}'
-                
-                logger.error(f"DeepSeek API请求失败 - 股票: {stock_code}, 状态码: {response.status_code}")
-                
-                return AnalysisResult(
-                    success=False,
-                    error=error_msg,
-                    error_type=error_type,
-                    provider='deepseek',
-                    model=self.model
-                )
-                
-        except requests.exceptions.Timeout:
-            logger.error(f"DeepSeek API请求超时 - 股票: {stock_code}")
-            return AnalysisResult(
-                success=False,
-                error='Request timeout',
-                error_type=ErrorType.TIMEOUT_ERROR,
-                provider='deepseek',
-                model=self.model
-            )
-        except requests.exceptions.ConnectionError as e:
-            logger.error(f"DeepSeek API连接错误 - 股票: {stock_code}, 错误: {str(e)}")
             return AnalysisResult(
-                success=False,
-                error=f'Connection error: {str(e)}',
-                error_type=ErrorType.NETWORK_ERROR,
+                success=True,
+                content=content,
                 provider='deepseek',
-                model=self.model
-            )
-        except Exception as e:
-            logger.error(f"DeepSeek API请求异常 - 股票: {stock_code}, 错误: {str(e)}")
+                model=self.model,
+                tokens_used=result['usage']['total_tokens'] if 'usage' in result else None,
+                metadata={'response_status': response.status_code, 'connection': response.connection_metrics}
+            ), None
+        else:
+            # 根据状态码分类错误
+            error_type = self._classify_http_error(response.status_code)
+            error_msg = f'DeepSeek API request failed: {response.status_code} - {response.text}'
+            
+            logger.error(f"DeepSeek API请求失败 - 股票: {stock_code}, 状态码: {response.status_code}")
+            
             return AnalysisResult(
                 success=False,
-                error=str(e),
-                error_type=ErrorType.UNKNOWN_ERROR,
+                error=error_msg,
+                error_type=error_type,
                 provider='deepseek',
                 model=self.model
-            )
+            ), None
     
     def _extract_deepseek_content(self, message: Dict[str, Any]) -> str:
         """从DeepSeek响应中提取内容"""
@@ -1384,56 +1857,17 @@ class DeepSeekProvider(LLMProvider):
         try:
             # 计算响应时间
             response_time = time.time() - start_time
-            # 构建继续对话的请求
-            continue_data = {
-                "model": original_data["model"],
-                "messages": original_data["messages"] + [
-                    tool_message,  # 添加工具调用消息
-                    {
-                        "role": "tool",
-                        "content": "工具调用已完成，请提供最终的分析结果。",
-                        "tool_call_id": tool_message["tool_calls"][0]["id"] if tool_message.get("tool_calls") else None
-                    }
-                ],
-                "max_tokens": original_data["max_tokens"],
-                "temperature": original_data["temperature"]
-            }
             
             logger.info(f"继续对话获取最终结果 - 股票: {stock_code}")
             
             # 发送继续对话请求
-            response = requests.post(
+            response = self.http.post(
                 self.api_url,
                 headers=headers,
-                json=continue_data,
+                json=self._build_continue_data(original_data, tool_message),
                 timeout=(self.connect_timeout, self.request_timeout)
             )
-            
-            if response.status_code == 200:
-                result = response.json()
-                message = result['choices'][0]['message']
-                content = self._extract_deepseek_content(message)
-                
-                logger.info(f"DeepSeek深度思考分析完成 - 股票: {stock_code}, 内容长度: {len(content)} 字符")
-                
-                return AnalysisResult(
-                    success=True,
-                    content=content,
-                    provider='deepseek',
-                    model=self.model,
-                    tokens_used=result['usage']['total_tokens'] if 'usage' in result else None,
-                    response_time=response_time,
-                    metadata={'response_status': response.status_code, 'deep_thinking': True}
-                )
-            else:
-                logger.error(f"继续对话失败: {response.status_code} - {response.text}")
-                return AnalysisResult(
-                    success=False,
-                    error=f'Continue conversation failed: {response.status_code}',
-                    error_type=ErrorType.API_ERROR,
-                    provider='deepseek',
-                    model=self.model
-                )
+            return self._parse_continue_response(response, stock_code, response_time)
                 
         except Exception as e:
             logger.error(f"继续对话时出错: {str(e)}")
@@ -1445,6 +1879,51 @@ class DeepSeekProvider(LLMProvider):
                 model=self.model
             )
     
+    def _build_continue_data(self, original_data: Dict[str, Any], tool_message: Dict[str, Any]) -> Dict[str, Any]:
+        """构建继续对话的请求"""
+        return {
+            "model": original_data["model"],
+            "messages": original_data["messages"] + [
+                tool_message,  # 添加工具调用消息
+                {
+                    "role": "tool",
+                    "content": "工具调用已完成，请提供最终的分析结果。",
+                    "tool_call_id": tool_message["tool_calls"][0]["id"] if tool_message.get("tool_calls") else None
+                }
+            ],
+            "max_tokens": original_data["max_tokens"],
+            "temperature": original_data["temperature"]
+        }
+    
+    def _parse_continue_response(self, response, stock_code: str, response_time: float) -> AnalysisResult:
+        """解析继续对话的响应"""
+        if response.status_code == 200:
+            result = response.json()
+            message = result['choices'][0]['message']
+            content = self._extract_deepseek_content(message)
+            
+            logger.info(f"DeepSeek深度思考分析完成 - 股票: {stock_code}, 内容长度: {len(content)} 字符")
+            
+            return AnalysisResult(
+                success=True,
+                content=content,
+                provider='deepseek',
+                model=self.model,
+                tokens_used=result['usage']['total_tokens'] if 'usage' in result else None,
+                response_time=response_time,
+                metadata={'response_status': response.status_code, 'deep_thinking': True,
+                          'connection': response.connection_metrics}
+            )
+        else:
+            logger.error(f"继续对话失败: {response.status_code} - {response.text}")
+            return AnalysisResult(
+                success=False,
+                error=f'Continue conversation failed: {response.status_code}',
+                error_type=ErrorType.API_ERROR,
+                provider='deepseek',
+                model=self.model
+            )
+    
     def _classify_http_error(self, status_code: int) -> ErrorType:
         """根据HTTP状态码分类错误类型"""
         if status_code == 401 or status_code == 403:
@@ -1473,7 +1952,7 @@ class DeepSeekProvider(LLMProvider):
                 "max_tokens": 10
             }
             
-            response = requests.post(
+            response = self.http.post(
                 self.api_url, 
                 headers=headers, 
                 json=data, 
@@ -1495,6 +1974,10 @@ class DeepSeekProvider(LLMProvider):
 class LLMProviderFactory:
     """LLM Provider工厂类"""
     
+    # 数据库配置对应的Provider实例缓存：(配置ID, 更新时间) -> Provider
+    _provider_cache: Dict[tuple, LLMProvider] = {}
+    _cache_lock = threading.Lock()
+    
     @staticmethod
     def create_provider(provider_name: str, config: Dict[str, Any]) -> LLMProvider:
         """创建LLM Provider实例"""
@@ -1523,10 +2006,7 @@ class LLMProviderFactory:
             if not config.is_active:
                 raise ValueError(f"配置未激活: {config.provider_name}")
             
-            return LLMProviderFactory.create_provider(
-                config.provider_name, 
-                config.get_config_dict()
-            )
+            return LLMProviderFactory.get_provider_for_config(config)
         except Exception as e:
             logger.error(f"从数据库配置创建Provider失败: {str(e)}")
             raise
@@ -1547,14 +2027,39 @@ class LLMProviderFactory:
             if not default_config:
                 raise ValueError("没有可用的AI配置")
             
-            return LLMProviderFactory.create_provider(
-                default_config.provider_name,
-                default_config.get_config_dict()
-            )
+            return LLMProviderFactory.get_provider_for_config(default_config)
         except Exception as e:
             logger.error(f"创建默认Provider失败: {str(e)}")
             raise
     
+    @staticmethod
+    def get_provider_for_config(config) -> LLMProvider:
+        """获取数据库配置对应的Provider实例，按配置ID和更新时间缓存，配置修改后自动重建"""
+        key = (config.id, config.updated_at)
+        with LLMProviderFactory._cache_lock:
+            provider = LLMProviderFactory._provider_cache.get(key)
+        if provider:
+            return provider
+        
+        provider = LLMProviderFactory.create_provider(config.provider_name, config.get_config_dict())
+        with LLMProviderFactory._cache_lock:
+            # 同一配置只保留最新版本的实例
+            for stale_key in [k for k in LLMProviderFactory._provider_cache if k[0] == config.id and k != key]:
+                del LLMProviderFactory._provider_cache[stale_key]
+            provider = LLMProviderFactory._provider_cache.setdefault(key, provider)
+        logger.info(f"创建Provider实例: {config.provider_name}（配置ID: {config.id}）")
+        return provider
+    
+    @staticmethod
+    def invalidate_cache(config_id: int = None) -> None:
+        """清除Provider实例缓存（config_id为空时清除全部）"""
+        with LLMProviderFactory._cache_lock:
+            if config_id is None:
+                LLMProviderFactory._provider_cache.clear()
+            else:
+                for key in [k for k in LLMProviderFactory._provider_cache if k[0] == config_id]:
+                    del LLMProviderFactory._provider_cache[key]
+    
     @staticmethod
     def get_available_providers() -> List[str]:
         """获取可用的Provider列表"""
@@ -0,0 +1,153 @@
+"""
+AI提供商调用节流 - 按提供商限制同时进行的分析数量和请求启动间隔
+- 所有任务共享同一组并发槽位，批量任务的并发数也以此为上限
+- 同一提供商相邻两次请求的启动时间至少间隔 min_interval 秒
+- 等待槽位时定期检查任务是否被暂停或停止；Provider等待重试期间临时释放槽位
+"""
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+ACQUIRE_POLL_SECONDS = 1.0  # 等待槽位时检查任务状态的间隔
+
+
+class SlotWaitCancelled(Exception):
+    """等待并发槽位期间任务被停止"""
+
+
+class PacerSlot:
+    """一个提供商并发槽位的占用"""
+
+    def __init__(self, pacer: 'ProviderPacer', provider: str, semaphore: threading.BoundedSemaphore,
+                 should_continue: Optional[Callable[[], bool]] = None):
+        """should_continue 在等待期间定期调用（暂停时阻塞），返回False表示任务已停止、放弃等待"""
+        self.pacer = pacer
+        self.provider = provider
+        self.semaphore = semaphore
+        self.should_continue = should_continue
+        self.held = False
+
+    def acquire(self) -> bool:
+        """占用槽位并等待到允许的启动时间，任务被停止时返回False"""
+        while not self.semaphore.acquire(timeout=ACQUIRE_POLL_SECONDS):
+            if self.should_continue is not None and not self.should_continue():
+                return False
+        self.held = True
+        delay = self.pacer._reserve_start(self.provider)
+        if delay > 0:
+            logger.debug(f"提供商 {self.provider} 请求节流，等待 {delay:.1f} 秒")
+            time.sleep(delay)
+        return True
+
+    def release(self) -> None:
+        """释放槽位（可以在之后重新 acquire）"""
+        if self.held:
+            self.held = False
+            self.semaphore.release()
+
+
+class ProviderPacer:
+    """AI提供商节流器单例"""
+    _instance = None
+    _lock = threading.Lock()
+
+    DEFAULT_CONCURRENCY = 2
+    DEFAULT_MIN_INTERVAL = 2.0
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(ProviderPacer, cls).__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self._state_lock = threading.Lock()
+            self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+            self._next_start: Dict[str, float] = {}
+            self._concurrency: Dict[str, int] = {}
+            self._min_interval: Dict[str, float] = {}
+            self.default_concurrency = self.DEFAULT_CONCURRENCY
+            self.default_min_interval = self.DEFAULT_MIN_INTERVAL
+            self._configured = False
+            self._initialized = True
+
+    def configure(self, concurrency: Dict[str, int] = None, min_interval: Dict[str, float] = None,
+                  default_concurrency: int = None, default_min_interval: float = None) -> None:
+        """设置各提供商的并发上限和请求间隔（已创建的并发槽位会按新上限重建）"""
+        with self._state_lock:
+            if concurrency is not None:
+                self._concurrency = {name: max(1, int(value)) for name, value in concurrency.items()}
+            if min_interval is not None:
+                self._min_interval = {name: max(0.0, float(value)) for name, value in min_interval.items()}
+            if default_concurrency is not None:
+                self.default_concurrency = max(1, int(default_concurrency))
+            if default_min_interval is not None:
+                self.default_min_interval = max(0.0, float(default_min_interval))
+            self._semaphores = {}
+            self._configured = True
+
+    def get_concurrency(self, provider: str) -> int:
+        """获取提供商的并发上限"""
+        self._ensure_configured()
+        return self._concurrency.get(provider or 'default', self.default_concurrency)
+
+    def get_min_interval(self, provider: str) -> float:
+        """获取提供商相邻请求的最小启动间隔（秒）"""
+        self._ensure_configured()
+        return self._min_interval.get(provider or 'default', self.default_min_interval)
+
+    @contextmanager
+    def slot(self, provider: str, should_continue: Optional[Callable[[], bool]] = None):
+        """占用提供商的一个并发槽位，必要时等待到允许的启动时间；等待期间任务被停止时抛出 SlotWaitCancelled"""
+        provider = provider or 'default'
+        slot = PacerSlot(self, provider, self._get_semaphore(provider), should_continue)
+        if not slot.acquire():
+            raise SlotWaitCancelled(f"任务已停止，不再等待提供商 {provider} 的并发槽位")
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    def _get_semaphore(self, provider: str) -> threading.BoundedSemaphore:
+        concurrency = self.get_concurrency(provider)
+        with self._state_lock:
+            semaphore = self._semaphores.get(provider)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(concurrency)
+                self._semaphores[provider] = semaphore
+            return semaphore
+
+    def _reserve_start(self, provider: str) -> float:
+        """预约下一次请求的启动时间，返回需要等待的秒数"""
+        interval = self.get_min_interval(provider)
+        with self._state_lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(provider, 0.0))
+            self._next_start[provider] = start + interval
+            return start - now
+
+    def _ensure_configured(self) -> None:
+        """首次使用时从应用配置读取节流参数"""
+        if self._configured:
+            return
+        from flask import current_app, has_app_context
+        if not has_app_context():
+            return
+        config = current_app.config
+        self.configure(
+            concurrency=config.get('ANALYSIS_PROVIDER_CONCURRENCY', {}),
+            min_interval=config.get('ANALYSIS_PROVIDER_MIN_INTERVAL', {}),
+            default_concurrency=config.get('ANALYSIS_PROVIDER_DEFAULT_CONCURRENCY', self.DEFAULT_CONCURRENCY),
+            default_min_interval=config.get('ANALYSIS_PROVIDER_DEFAULT_MIN_INTERVAL', self.DEFAULT_MIN_INTERVAL)
+        )
+
+
+# 全局提供商节流器实例
+provider_pacer = ProviderPacer()
@@ -0,0 +1,170 @@
+"""
+AI提供商客户端限流 - 按 提供商/模型/API密钥 的令牌桶限制每分钟请求数（rpm）和每分钟Token数（tpm）
+- 发送前预约额度，额度不足时返回需要等待的秒数，调用方等待后再发送，而不是等到服务端返回限流错误再重试
+- 配置了存储文件时桶状态保存在SQLite中，同一台机器上的多个gunicorn worker共享额度；否则只在进程内共享
+- 发送前按提示词估算输入Token，响应返回后按实际用量修正
+"""
+import os
+import sqlite3
+import hashlib
+import threading
+import time
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的Token数：中文等非ASCII字符按1个Token，ASCII字符按4个字符1个Token"""
+    if not text:
+        return 0
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+
+def _refill(level: float, updated_at: float, capacity: float, rate: float, now: float) -> float:
+    return min(capacity, level + max(0.0, now - updated_at) * rate)
+
+
+class MemoryBucketStore:
+    """进程内令牌桶存储"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, tuple] = {}
+
+    def take(self, key: str, capacity: float, rate: float, amount: float, now: float) -> float:
+        """从桶中取出 amount（可为负数表示归还），返回取出后的余量（可能为负）"""
+        with self._lock:
+            level, updated_at = self._buckets.get(key, (capacity, now))
+            level = _refill(level, updated_at, capacity, rate, now) - amount
+            self._buckets[key] = (level, now)
+            return level
+
+
+class SQLiteBucketStore:
+    """SQLite文件令牌桶存储，多进程通过写事务串行更新同一个桶"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS rate_buckets ('
+            'key TEXT PRIMARY KEY, level REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        """每个线程一个连接，fork 后的子进程重新连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key: str, capacity: float, rate: float, amount: float, now: float) -> float:
+        """从桶中取出 amount（可为负数表示归还），返回取出后的余量（可能为负）"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT level, updated_at FROM rate_buckets WHERE key = ?', (key,)).fetchone()
+            level, updated_at = row if row else (capacity, now)
+            level = _refill(level, updated_at, capacity, rate, now) - amount
+            conn.execute('INSERT OR REPLACE INTO rate_buckets (key, level, updated_at) VALUES (?, ?, ?)',
+                         (key, level, now))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return level
+
+
+class ProviderRateLimiter:
+    """AI提供商客户端限流器单例"""
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(ProviderRateLimiter, cls).__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self._limits: Dict[str, Dict[str, Any]] = {}
+            self._store = MemoryBucketStore()
+            self._configured = False
+            self._initialized = True
+
+    def configure(self, limits: Dict[str, Dict[str, Any]] = None, store_path: str = None) -> None:
+        """设置限流额度（键为提供商或“提供商:模型”）和共享存储文件（为空时只在进程内共享）"""
+        self._limits = dict(limits or {})
+        self._store = SQLiteBucketStore(store_path) if store_path else MemoryBucketStore()
+        self._configured = True
+        logger.info(f"AI提供商限流配置: {self._limits}, 存储: {store_path or '进程内'}")
+
+    def get_limits(self, provider: str, model: str = None, override: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
+        """获取 提供商/模型 的限流额度，override 为Provider配置中的 rate_limit"""
+        self._ensure_configured()
+        limits = override or self._limits.get(f"{provider}:{model}") or self._limits.get(provider)
+        if not limits or not (limits.get('rpm') or limits.get('tpm')):
+            return None
+        return limits
+
+    @staticmethod
+    def bucket_key(provider: str, model: str, api_key: str) -> str:
+        """限流桶标识，API密钥只保存摘要"""
+        key_digest = hashlib.sha256((api_key or '').encode()).hexdigest()[:12]
+        return f"{provider}:{model}:{key_digest}"
+
+    def reserve(self, key: str, limits: Dict[str, Any], tokens: int = 0, now: float = None) -> float:
+        """预约一次请求和 tokens 个Token的额度，返回发送前需要等待的秒数"""
+        now = time.time() if now is None else now
+        wait = 0.0
+        try:
+            for kind, amount in (('rpm', 1), ('tpm', tokens)):
+                per_minute = limits.get(kind)
+                if not per_minute or not amount:
+                    continue
+                rate = per_minute / 60.0
+                level = self._store.take(f"{key}:{kind}", per_minute, rate, amount, now)
+                wait = max(wait, -level / rate)
+        except sqlite3.Error as e:
+            logger.warning(f"限流存储不可用，本次请求不限流: {str(e)}")
+            return 0.0
+        return wait
+
+    def record_usage(self, key: str, limits: Dict[str, Any], estimated_tokens: int, actual_tokens: int) -> None:
+        """按实际Token用量修正预约时的估算值"""
+        per_minute = limits.get('tpm')
+        if not per_minute or actual_tokens is None:
+            return
+        try:
+            self._store.take(f"{key}:tpm", per_minute, per_minute / 60.0,
+                             actual_tokens - estimated_tokens, time.time())
+        except sqlite3.Error as e:
+            logger.warning(f"限流存储不可用，未记录Token用量: {str(e)}")
+
+    def _ensure_configured(self) -> None:
+        """首次使用时从应用配置读取限流参数"""
+        if self._configured:
+            return
+        from flask import current_app, has_app_context
+        if not has_app_context():
+            return
+        config = current_app.config
+        self.configure(
+            limits=config.get('ANALYSIS_PROVIDER_RATE_LIMITS', {}),
+            store_path=config.get('ANALYSIS_RATE_LIMIT_STORE')
+        )
+
+
+# 全局限流器实例
+rate_limiter = ProviderRateLimiter()
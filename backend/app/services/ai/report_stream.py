@@ -0,0 +1,129 @@
+"""
+流式报告生成 - 生成过程中把收到的报告片段追加写入部分报告文件
+- 每只股票一个部分报告文件（data/reports/partial/<任务ID>/<股票代码>.partial），实时进度接口按字节偏移读取新增内容，
+  查看者和worker进程之间只通过文件共享，不在内存中保留已生成的片段
+- 重试时保留目前最长的一次输出，全部重试失败后由服务层把它保存为部分报告，而不是丢弃
+"""
+import os
+import shutil
+import threading
+import logging
+from contextvars import ContextVar
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PARTIAL_REPORTS_DIR = 'data/reports/partial'
+PARTIAL_EXTENSION = '.partial'
+
+# 当前生成使用的部分报告文件，Provider收到片段时写入（包括在线程中执行的同步请求）
+current_report_stream: ContextVar = ContextVar('current_report_stream', default=None)
+
+
+def _safe_name(value: str) -> str:
+    return ''.join(ch if ch.isalnum() or ch in '-_.' else '_' for ch in str(value))
+
+
+def partial_report_path(task_id: str, stock_code: str, base_dir: str = PARTIAL_REPORTS_DIR) -> str:
+    """任务中股票的部分报告文件路径"""
+    return os.path.join(base_dir, _safe_name(task_id), f"{_safe_name(stock_code)}{PARTIAL_EXTENSION}")
+
+
+def remove_partial_reports(task_id: str, base_dir: str = PARTIAL_REPORTS_DIR) -> None:
+    """删除任务的全部部分报告文件"""
+    shutil.rmtree(os.path.join(base_dir, _safe_name(task_id)), ignore_errors=True)
+
+
+def read_partial_report(path: str, offset: int = 0, max_bytes: int = 64 * 1024) -> Tuple[bytes, int, bool]:
+    """从字节偏移 offset 读取部分报告的新增内容，最多 max_bytes 字节
+
+    Returns:
+        (新增内容, 新的偏移, 是否从头重新读取)；文件比偏移短说明生成重新开始（重试），从头读取
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return b'', offset, False
+    reset = size < offset
+    if reset:
+        offset = 0
+    if size == offset:
+        return b'', offset, reset
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(max_bytes)
+    return data, offset + len(data), reset
+
+
+class PartialReportWriter:
+    """部分报告文件写入（线程安全）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.best_path = f"{path}.best"
+        self.length = 0  # 当前尝试已写入的字符数
+        self.best_length = 0
+        self.provider = None
+        self.model = None
+        self._best_provider = None
+        self._best_model = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def begin_attempt(self, provider: str = None, model: str = None) -> None:
+        """开始一次新的生成尝试：当前输出比保留的更长时保留它，然后从头写入部分报告文件"""
+        with self._lock:
+            self._close()
+            if self.length > self.best_length and os.path.exists(self.path):
+                os.replace(self.path, self.best_path)
+                self.best_length = self.length
+                self._best_provider, self._best_model = self.provider, self.model
+            self._open()
+            self.length = 0
+            self.provider, self.model = provider, model
+
+    def write(self, text: str) -> None:
+        """追加报告片段"""
+        if not text:
+            return
+        with self._lock:
+            if self._file is None:
+                self._open(append=True)
+            self._file.write(text)
+            self._file.flush()
+            self.length += len(text)
+
+    def salvage(self) -> Tuple[str, Optional[str], Optional[str]]:
+        """读取目前最长的一次输出，返回 (内容, 提供商, 模型)，用于全部尝试失败后保存部分报告"""
+        with self._lock:
+            self._close()
+            if self.length >= self.best_length:
+                path, provider, model = self.path, self.provider, self.model
+            else:
+                path, provider, model = self.best_path, self._best_provider, self._best_model
+            try:
+                with open(path, 'r', encoding='utf-8', newline='') as f:
+                    return f.read(), provider, model
+            except FileNotFoundError:
+                return '', provider, model
+
+    def discard(self) -> None:
+        """删除部分报告文件"""
+        with self._lock:
+            self._close()
+            for path in (self.path, self.best_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"删除部分报告文件失败: {path}, {str(e)}")
+
+    def _open(self, append: bool = False) -> None:
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._file = open(self.path, 'a' if append else 'w', encoding='utf-8', newline='')
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,210 @@
+"""
+AI分析结果缓存 - 相同模型、相同提示词（格式化后）、相同分析日期的请求复用一次生成结果
+- 缓存键为 提供商/模型/格式化提示词/分析日期 的SHA-256，提示词或模型变化后自然失效
+- 按过期时间、条目数和内容总字节数淘汰，超出上限时先淘汰最久未使用的条目
+- 单飞（single-flight）：同一个键正在生成时，其他请求等待这次生成的结果而不是重复调用AI；
+  生成失败不缓存，等待的请求中的一个接着自己生成
+- 缓存和单飞都只在进程内生效，默认关闭（ANALYSIS_RESPONSE_CACHE_ENABLED）
+"""
+import hashlib
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STATUS_MISS = 'miss'
+STATUS_HIT = 'hit'
+STATUS_SHARED = 'shared'  # 等待其他请求正在进行的生成
+
+
+def make_cache_key(provider: str, model: str, formatted_prompt: str, analysis_date: str) -> str:
+    """计算分析请求的缓存键"""
+    digest = hashlib.sha256()
+    for part in (provider, model, analysis_date, formatted_prompt):
+        digest.update(str(part or '').encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class _Flight:
+    """一次进行中的生成"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class LLMResponseCache:
+    """AI分析结果缓存单例"""
+    _instance = None
+    _lock = threading.Lock()
+
+    DEFAULT_TTL_SECONDS = 6 * 3600.0
+    DEFAULT_MAX_ENTRIES = 100
+    DEFAULT_MAX_BYTES = 20 * 1024 * 1024
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(LLMResponseCache, cls).__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self._state_lock = threading.Lock()
+            self._entries: 'OrderedDict[str, Tuple[Any, int, float]]' = OrderedDict()  # 键 -> (值, 字节数, 过期时间)
+            self._flights: Dict[str, _Flight] = {}
+            self._total_bytes = 0
+            self._stats = {'hits': 0, 'misses': 0, 'shared': 0, 'evictions': 0}
+            self.enabled = False
+            self.ttl_seconds = self.DEFAULT_TTL_SECONDS
+            self.max_entries = self.DEFAULT_MAX_ENTRIES
+            self.max_bytes = self.DEFAULT_MAX_BYTES
+            self._configured = False
+            self._initialized = True
+
+    def configure(self, enabled: bool = None, ttl_seconds: float = None, max_entries: int = None,
+                  max_bytes: int = None) -> None:
+        """设置是否启用、过期时间和容量上限（缩小上限时立即淘汰多出的条目）"""
+        with self._state_lock:
+            if enabled is not None:
+                self.enabled = bool(enabled)
+            if ttl_seconds is not None:
+                self.ttl_seconds = max(0.0, float(ttl_seconds))
+            if max_entries is not None:
+                self.max_entries = max(1, int(max_entries))
+            if max_bytes is not None:
+                self.max_bytes = max(1, int(max_bytes))
+            self._evict(time.monotonic())
+            self._configured = True
+
+    def is_enabled(self) -> bool:
+        self._ensure_configured()
+        return self.enabled
+
+    def get_or_generate(self, key: str, generate: Callable[[], Any], size_of: Callable[[Any], int] = None,
+                        cacheable: Callable[[Any], bool] = None, wait_timeout: float = None) -> Tuple[Any, str]:
+        """读取缓存，未命中时生成并缓存
+
+        Args:
+            key: 缓存键（make_cache_key）
+            generate: 生成函数，同一个键同时只有一个请求在执行
+            size_of: 计算值占用的字节数，用于按总字节数淘汰
+            cacheable: 判断生成结果是否可以缓存（例如只缓存成功的结果）
+            wait_timeout: 等待其他请求生成的最长秒数，超时后自己生成
+
+        Returns:
+            (值, 状态)；状态为 miss（自己生成）、hit（命中缓存）或 shared（复用同时进行的生成）
+        """
+        self._ensure_configured()
+        if not self.enabled:
+            return generate(), STATUS_MISS
+
+        waited = False
+        deadline = time.monotonic() + wait_timeout if wait_timeout is not None else None
+        while True:
+            with self._state_lock:
+                value = self._get(key)
+                if value is not None:
+                    status = STATUS_SHARED if waited else STATUS_HIT
+                    self._stats['shared' if waited else 'hits'] += 1
+                    return value, status
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = _Flight()
+                    self._flights[key] = flight
+                    self._stats['misses'] += 1
+                    break
+
+            # 同一个键正在生成，等待完成后重新读取缓存
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            logger.info(f"相同的分析请求正在生成，等待结果: {key[:12]}")
+            if not flight.done.wait(timeout):
+                logger.warning(f"等待相同分析请求超时，单独生成: {key[:12]}")
+                return generate(), STATUS_MISS
+            waited = True
+
+        try:
+            value = generate()
+            if value is not None and (cacheable is None or cacheable(value)):
+                self._put(key, value, size_of(value) if size_of else 0)
+            return value, STATUS_MISS
+        finally:
+            with self._state_lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def clear(self) -> None:
+        """清空缓存（进行中的生成不受影响）"""
+        with self._state_lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        with self._state_lock:
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'in_flight': len(self._flights),
+                **self._stats
+            }
+
+    def _get(self, key: str) -> Optional[Any]:
+        """读取未过期的条目并标记为最近使用（调用方持有锁）"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, size, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self._total_bytes -= size
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _put(self, key: str, value: Any, size: int) -> None:
+        with self._state_lock:
+            if size > self.max_bytes:
+                logger.info(f"分析结果过大（{size} 字节），不缓存")
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[1]
+            now = time.monotonic()
+            self._entries[key] = (value, size, now + self.ttl_seconds)
+            self._total_bytes += size
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        """淘汰过期条目，再按最久未使用淘汰到容量以内（调用方持有锁）"""
+        for key in [key for key, (_, _, expires_at) in self._entries.items() if expires_at <= now]:
+            self._total_bytes -= self._entries.pop(key)[1]
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            _, (_, size, _) = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self._stats['evictions'] += 1
+
+    def _ensure_configured(self) -> None:
+        """首次使用时从应用配置读取缓存参数"""
+        if self._configured:
+            return
+        from flask import current_app, has_app_context
+        if not has_app_context():
+            return
+        config = current_app.config
+        self.configure(
+            enabled=config.get('ANALYSIS_RESPONSE_CACHE_ENABLED', False),
+            ttl_seconds=config.get('ANALYSIS_RESPONSE_CACHE_TTL_SECONDS', self.DEFAULT_TTL_SECONDS),
+            max_entries=config.get('ANALYSIS_RESPONSE_CACHE_MAX_ENTRIES', self.DEFAULT_MAX_ENTRIES),
+            max_bytes=config.get('ANALYSIS_RESPONSE_CACHE_MAX_BYTES', self.DEFAULT_MAX_BYTES)
+        )
+
+
+# 全局分析结果缓存实例
+response_cache = LLMResponseCache()
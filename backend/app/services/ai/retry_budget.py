@@ -0,0 +1,88 @@
+"""
+分析重试预算 - 一只股票的分析在各层（任务重试、Provider重试、深度研究多轮请求）共享同一个预算
+- 截止时间：从开始分析起的墙钟时间上限，任何一层都不会在截止时间之后再发起请求或等待重试
+- 重试次数：每只股票的重试次数上限，同时从所属任务的总重试次数中扣除，避免一个批量任务被少数股票的重试拖住
+- 每次尝试（成功或失败）都记录在预算中，由服务层统一写入任务的重试历史
+"""
+import contextvars
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+# 当前协程/线程正在使用的预算，供Provider内部的多轮请求（如qwen-deep-research）检查截止时间
+current_retry_budget: contextvars.ContextVar = contextvars.ContextVar('current_retry_budget', default=None)
+
+
+class RetryBudget:
+    """重试预算（线程安全）"""
+
+    def __init__(self, max_retries: Optional[int] = None, deadline_seconds: Optional[float] = None,
+                 parent: 'RetryBudget' = None):
+        """
+        Args:
+            max_retries: 重试次数上限，为空不限制
+            deadline_seconds: 从现在起的墙钟时间上限（秒），为空不限制
+            parent: 上级预算（如任务预算），每次重试同时扣除上级的次数
+        """
+        self.max_retries = max_retries
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + deadline_seconds if deadline_seconds else None
+        self.parent = parent
+        self.retries_used = 0
+        self.attempts: List[Dict[str, Any]] = []
+        # 任务的暂停/停止检查（暂停时阻塞，返回False表示任务已停止），以及调用方占用的提供商并发槽位，
+        # Provider等待重试期间释放槽位
+        self.should_continue: Optional[Callable[[], bool]] = None
+        self.slot = None
+        self._lock = threading.Lock()
+
+    def remaining(self) -> Optional[float]:
+        """距离截止时间的秒数，无截止时间时为None"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def consume_retry(self, delay: float = 0.0) -> Optional[float]:
+        """申请一次重试，返回重试前应等待的秒数；次数用完或等待后已过截止时间时返回None"""
+        remaining = self.remaining()
+        if remaining is not None and remaining <= delay:
+            return None
+        with self._lock:
+            if self.max_retries is not None and self.retries_used >= self.max_retries:
+                return None
+            if self.parent is not None and self.parent.consume_retry() is None:
+                return None
+            self.retries_used += 1
+        return delay
+
+    def exhausted_reason(self) -> str:
+        """预算用尽的原因（用于错误信息）"""
+        if self.expired():
+            return f"已超过分析截止时间（{self.deadline - self.started_at:.0f}秒）"
+        if self.max_retries is not None and self.retries_used >= self.max_retries:
+            return f"已重试 {self.retries_used} 次"
+        if self.parent is not None:
+            return f"任务重试次数已用完（{self.parent.retries_used} 次）"
+        return "无法继续重试"
+
+    def record_attempt(self, layer: str, success: bool, error: str = None, error_type: str = None,
+                       provider: str = None) -> Dict[str, Any]:
+        """记录一次尝试，layer 为发起尝试的层（provider / analysis）"""
+        with self._lock:
+            record = {
+                'attempt': len(self.attempts) + 1,
+                'timestamp': datetime.utcnow().isoformat() + 'Z',
+                'layer': layer,
+                'provider': provider,
+                'success': success,
+                'error': error,
+                'error_type': error_type,
+                'elapsed': round(time.monotonic() - self.started_at, 2)
+            }
+            self.attempts.append(record)
+        return record
@@ -0,0 +1,303 @@
+"""
+分析任务执行器 - 固定数量的工作线程 + 优先级队列
+- 同一优先级内按用户轮转调度，避免单个用户的批量任务占满所有工作线程
+- 队列总长度和单用户排队数量有上限，超出时拒绝提交
+- 工作线程共用提交时的Flask应用，不再为每个任务创建应用
+- 维护线程定期为本进程的任务续租，并接管租约过期（执行进程已退出）的中断任务
+"""
+import os
+import socket
+import threading
+import itertools
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 任务优先级（数值越小越优先）
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+
+class ExecutorFullError(Exception):
+    """分析队列已满，拒绝提交"""
+
+
+def get_worker_id() -> str:
+    """当前进程标识（主机名:进程号），作为任务执行租约的持有者"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class _Job:
+    """队列中的任务"""
+    __slots__ = ('task_id', 'fn', 'user_id', 'priority', 'seq', 'app', 'submitted_at')
+
+    def __init__(self, task_id: str, fn: Callable[[], Any], user_id: Any, priority: int, seq: int, app):
+        self.task_id = task_id
+        self.fn = fn
+        self.user_id = user_id
+        self.priority = priority
+        self.seq = seq
+        self.app = app
+        self.submitted_at = datetime.utcnow()
+
+
+class AnalysisExecutor:
+    """分析任务执行器单例"""
+    _instance = None
+    _lock = threading.Lock()
+
+    DEFAULT_MAX_WORKERS = 3
+    DEFAULT_MAX_QUEUED = 50
+    DEFAULT_MAX_QUEUED_PER_USER = 5
+    DEFAULT_LEASE_SECONDS = 300
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(AnalysisExecutor, cls).__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self._cond = threading.Condition()
+            self._queues: Dict[Any, deque] = {}      # user_id -> 等待中的任务
+            self._last_served: Dict[Any, int] = {}   # user_id -> 最近一次被调度的序号
+            self._running: Dict[str, _Job] = {}      # task_id -> 执行中的任务
+            self._workers: List[threading.Thread] = []
+            self._seq = itertools.count()
+            self._dispatch_seq = itertools.count(1)
+            self._idle_workers = 0
+            self._fallback_app = None
+            self.max_workers = self.DEFAULT_MAX_WORKERS
+            self.max_queued = self.DEFAULT_MAX_QUEUED
+            self.max_queued_per_user = self.DEFAULT_MAX_QUEUED_PER_USER
+            self.lease_seconds = self.DEFAULT_LEASE_SECONDS
+            self._maintenance_pid = None
+            self._configured = False
+            self._initialized = True
+
+    def configure(self, max_workers: int = None, max_queued: int = None, max_queued_per_user: int = None,
+                  lease_seconds: int = None) -> None:
+        """设置工作线程数、队列上限和任务租约时长（已启动的工作线程不会减少）"""
+        with self._cond:
+            if max_workers is not None:
+                self.max_workers = max(1, int(max_workers))
+            if max_queued is not None:
+                self.max_queued = max(0, int(max_queued))
+            if max_queued_per_user is not None:
+                self.max_queued_per_user = max(0, int(max_queued_per_user))
+            if lease_seconds is not None:
+                self.lease_seconds = max(30, int(lease_seconds))
+            self._configured = True
+
+    def submit(self, task_id: str, fn: Callable[[], Any], user_id: Any = None,
+               priority: int = PRIORITY_NORMAL) -> int:
+        """提交任务，返回排队位置（0表示有空闲工作线程，立即执行）"""
+        app = self._get_app()
+        with self._cond:
+            queued_total = sum(len(q) for q in self._queues.values())
+            free_slots = self._idle_workers + self.max_workers - len(self._workers)
+            if free_slots <= queued_total:
+                # 没有空闲工作线程，检查队列上限
+                if queued_total >= self.max_queued:
+                    raise ExecutorFullError(f"分析队列已满（{queued_total}个任务排队中），请稍后再试")
+                if len(self._queues.get(user_id, ())) >= self.max_queued_per_user:
+                    raise ExecutorFullError(f"您已有{self.max_queued_per_user}个任务在排队，请等待完成后再提交")
+
+            job = _Job(task_id, fn, user_id, priority, next(self._seq), app)
+            self._queues.setdefault(user_id, deque()).append(job)
+            self._ensure_workers()
+            self._cond.notify()
+
+            position = self._position_of(task_id)
+            logger.info(f"任务 {task_id} 已提交到分析执行器，排队位置: {position}")
+            return position
+
+    def cancel(self, task_id: str) -> bool:
+        """从队列中移除尚未开始执行的任务"""
+        with self._cond:
+            for user_id, queue in self._queues.items():
+                for job in queue:
+                    if job.task_id == task_id:
+                        queue.remove(job)
+                        if not queue:
+                            del self._queues[user_id]
+                        logger.info(f"任务 {task_id} 已从分析队列移除")
+                        return True
+            return False
+
+    def get_queue_position(self, task_id: str) -> Optional[int]:
+        """获取任务的排队位置（0表示执行中，None表示不在执行器中）"""
+        with self._cond:
+            if task_id in self._running:
+                return 0
+            return self._position_of(task_id)
+
+    def new_lease(self) -> Dict[str, Any]:
+        """生成本进程的任务执行租约字段"""
+        self._ensure_configured()
+        return {
+            'lease_owner': get_worker_id(),
+            'lease_expires_at': datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+        }
+
+    def start_maintenance(self, app) -> None:
+        """启动维护线程（每个进程只启动一次，兼容 gunicorn --preload 的 fork）"""
+        pid = os.getpid()
+        if self._maintenance_pid == pid:
+            return
+        with self._cond:
+            if self._maintenance_pid == pid:
+                return
+            self._maintenance_pid = pid
+        thread = threading.Thread(target=self._maintenance_loop, args=(app,),
+                                  name='analysis-maintenance', daemon=True)
+        thread.start()
+        logger.info(f"分析任务维护线程已启动: {get_worker_id()}")
+
+    def run_maintenance(self) -> int:
+        """为本进程执行中和排队中的任务续租，并接管中断的任务（需在应用上下文中调用），返回恢复的任务数"""
+        from app import db
+        from app.repositories.task_repository import TaskRepository
+        from app.services.ai.analysis_service import AnalysisService
+
+        with self._cond:
+            task_ids = list(self._running) + [job.task_id for queue in self._queues.values() for job in queue]
+        lease = self.new_lease()
+        TaskRepository(db.session).renew_leases(task_ids, lease['lease_owner'], lease['lease_expires_at'])
+        return AnalysisService(db.session).recover_interrupted_tasks()
+
+    def _maintenance_loop(self, app) -> None:
+        """维护线程主循环，间隔为租约时长的四分之一"""
+        while True:
+            try:
+                with app.app_context():
+                    self.run_maintenance()
+            except Exception as e:
+                logger.error(f"分析任务维护失败: {str(e)}")
+            time.sleep(max(5, self.lease_seconds // 4))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取执行器状态"""
+        with self._cond:
+            return {
+                'max_workers': self.max_workers,
+                'workers': len(self._workers),
+                'running': len(self._running),
+                'queued': sum(len(q) for q in self._queues.values()),
+                'max_queued': self.max_queued,
+                'max_queued_per_user': self.max_queued_per_user
+            }
+
+    def _ensure_configured(self) -> None:
+        """首次使用时从应用配置读取执行器参数"""
+        from flask import current_app, has_app_context
+        if self._configured or not has_app_context():
+            return
+        config = current_app.config
+        self.configure(
+            config.get('ANALYSIS_MAX_WORKERS', self.DEFAULT_MAX_WORKERS),
+            config.get('ANALYSIS_MAX_QUEUED', self.DEFAULT_MAX_QUEUED),
+            config.get('ANALYSIS_MAX_QUEUED_PER_USER', self.DEFAULT_MAX_QUEUED_PER_USER),
+            config.get('ANALYSIS_TASK_LEASE_SECONDS', self.DEFAULT_LEASE_SECONDS)
+        )
+
+    def _get_app(self):
+        """获取任务执行时使用的Flask应用"""
+        from flask import current_app, has_app_context
+        if has_app_context():
+            self._ensure_configured()
+            return current_app._get_current_object()
+
+        # 在应用上下文之外提交（如脚本），只创建一次应用
+        if self._fallback_app is None:
+            from app import create_app
+            self._fallback_app = create_app()
+        return self._fallback_app
+
+    def _ensure_workers(self) -> None:
+        """按需启动工作线程，不超过上限"""
+        queued_total = sum(len(q) for q in self._queues.values())
+        while len(self._workers) < self.max_workers and self._idle_workers < queued_total:
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"analysis-worker-{len(self._workers) + 1}",
+                daemon=True
+            )
+            self._workers.append(worker)
+            self._idle_workers += 1
+            worker.start()
+
+    def _select_user(self, queues: Dict[Any, deque], last_served: Dict[Any, int]) -> Any:
+        """选择下一个调度的用户：队首优先级最高者，同优先级下最久未被调度者"""
+        return min(
+            queues,
+            key=lambda user_id: (queues[user_id][0].priority,
+                                 last_served.get(user_id, 0),
+                                 queues[user_id][0].seq)
+        )
+
+    def _pop_next(self) -> _Job:
+        """取出下一个要执行的任务（调用方持有锁）"""
+        user_id = self._select_user(self._queues, self._last_served)
+        queue = self._queues[user_id]
+        job = queue.popleft()
+        if not queue:
+            del self._queues[user_id]
+        self._last_served[user_id] = next(self._dispatch_seq)
+        return job
+
+    def _position_of(self, task_id: str) -> Optional[int]:
+        """模拟调度顺序计算排队位置（调用方持有锁）"""
+        queues = {user_id: deque(queue) for user_id, queue in self._queues.items()}
+        last_served = dict(self._last_served)
+        dispatch_seq = max(last_served.values(), default=0)
+        free_slots = self._idle_workers
+        position = 0
+
+        while queues:
+            user_id = self._select_user(queues, last_served)
+            job = queues[user_id].popleft()
+            if not queues[user_id]:
+                del queues[user_id]
+            dispatch_seq += 1
+            last_served[user_id] = dispatch_seq
+
+            if free_slots > 0:
+                free_slots -= 1
+            else:
+                position += 1
+            if job.task_id == task_id:
+                return position
+        return None
+
+    def _worker_loop(self) -> None:
+        """工作线程主循环"""
+        while True:
+            with self._cond:
+                while not self._queues:
+                    self._cond.wait()
+                job = self._pop_next()
+                self._idle_workers -= 1
+                self._running[job.task_id] = job
+
+            try:
+                logger.info(f"工作线程 {threading.current_thread().name} 开始执行任务 {job.task_id}")
+                with job.app.app_context():
+                    job.fn()
+            except Exception as e:
+                logger.error(f"分析任务 {job.task_id} 执行异常: {str(e)}")
+            finally:
+                with self._cond:
+                    self._running.pop(job.task_id, None)
+                    self._idle_workers += 1
+
+
+# 全局分析执行器实例
+analysis_executor = AnalysisExecutor()
@@ -1,5 +1,7 @@
 """
 任务管理器 - 管理异步任务的暂停、恢复和取消
+- 注册表锁只保护任务字典的读写，等待暂停恢复时不持有该锁
+- 每个任务有独立的恢复事件，暂停中的任务阻塞等待，恢复或停止时立即唤醒
 """
 import threading
 import logging
@@ -30,9 +32,12 @@ class TaskManager:
     def register_task(self, task_id: str, thread: threading.Thread, task_type: str = 'analysis') -> None:
         """注册任务"""
         with self._task_lock:
+            resume_event = threading.Event()
+            resume_event.set()
             self._tasks[task_id] = {
                 'thread': thread,
-                'pause_event': threading.Event(),  # 用于暂停/恢复
+                'pause_event': threading.Event(),  # 已暂停时设置
+                'resume_event': resume_event,      # 允许执行时设置，暂停的任务在此等待
                 'stop_event': threading.Event(),   # 用于停止任务
                 'task_type': task_type,
                 'created_at': datetime.utcnow(),
@@ -43,8 +48,11 @@ class TaskManager:
     def unregister_task(self, task_id: str) -> None:
         """注销任务"""
         with self._task_lock:
-            if task_id in self._tasks:
-                del self._tasks[task_id]
+            task_info = self._tasks.pop(task_id, None)
+            if task_info:
+                # 唤醒仍在等待的执行线程，已注销的任务按停止处理
+                task_info['stop_event'].set()
+                task_info['resume_event'].set()
                 logger.info(f"任务 {task_id} 已从任务管理器注销")
     
     def pause_task(self, task_id: str) -> bool:
@@ -59,7 +67,8 @@ class TaskManager:
                 logger.warning(f"任务 {task_id} 状态为 {task_info['status']}，无法暂停")
                 return False
             
-            # 设置暂停事件
+            # 清除恢复事件，执行线程在下一个检查点阻塞
+            task_info['resume_event'].clear()
             task_info['pause_event'].set()
             task_info['status'] = 'paused'
             task_info['paused_at'] = datetime.utcnow()
@@ -79,8 +88,9 @@ class TaskManager:
                 logger.warning(f"任务 {task_id} 状态为 {task_info['status']}，无法恢复")
                 return False
             
-            # 清除暂停事件
+            # 清除暂停事件并唤醒等待中的执行线程
             task_info['pause_event'].clear()
+            task_info['resume_event'].set()
             task_info['status'] = 'running'
             task_info['resumed_at'] = datetime.utcnow()
             
@@ -96,8 +106,9 @@ class TaskManager:
             
             task_info = self._tasks[task_id]
             
-            # 设置停止事件
+            # 设置停止事件，并唤醒暂停中等待的执行线程
             task_info['stop_event'].set()
+            task_info['resume_event'].set()
             task_info['status'] = 'stopped'
             task_info['stopped_at'] = datetime.utcnow()
             
@@ -119,36 +130,37 @@ class TaskManager:
             return self._tasks[task_id]['stop_event'].is_set()
     
     def wait_if_paused(self, task_id: str, timeout: Optional[float] = None) -> bool:
-        """如果任务被暂停，则等待恢复。返回True表示任务继续，False表示任务被停止"""
-        with self._task_lock:
-            if task_id not in self._tasks:
+        """如果任务被暂停，则等待恢复。返回True表示任务继续，False表示任务被停止（或等待超时仍未恢复）"""
+        task_info = self._get_task_info(task_id)
+        if not task_info:
+            return False
+        
+        # 如果任务被停止，直接返回False
+        if task_info['stop_event'].is_set():
+            return False
+        
+        # 如果任务被暂停，在任务自己的恢复事件上等待，不持有注册表锁
+        if not task_info['resume_event'].is_set():
+            logger.info(f"任务 {task_id} 被暂停，等待恢复...")
+            if not task_info['resume_event'].wait(timeout):
+                logger.info(f"任务 {task_id} 等待恢复超时")
                 return False
             
-            task_info = self._tasks[task_id]
-            
-            # 如果任务被停止，直接返回False
+            # 如果任务被停止，返回False
             if task_info['stop_event'].is_set():
+                logger.info(f"任务 {task_id} 在暂停期间被停止")
                 return False
             
-            # 如果任务被暂停，等待恢复
-            if task_info['pause_event'].is_set():
-                logger.info(f"任务 {task_id} 被暂停，等待恢复...")
-                # 等待暂停事件被清除（即恢复）或停止事件被设置
-                while task_info['pause_event'].is_set() and not task_info['stop_event'].is_set():
-                    # 使用更高效的等待方式，避免CPU占用过高
-                    if not task_info['pause_event'].wait(timeout=1.0):
-                        # 如果等待超时，重新检查状态
-                        continue
-                    break
-                
-                # 如果任务被停止，返回False
-                if task_info['stop_event'].is_set():
-                    logger.info(f"任务 {task_id} 在暂停期间被停止")
-                    return False
-                
-                logger.info(f"任务 {task_id} 已恢复，继续执行")
-            
-            return True
+            logger.info(f"任务 {task_id} 已恢复，继续执行")
+        
+        return True
+    
+    def wait_for_stop(self, task_id: str, timeout: float) -> bool:
+        """等待指定时间或直到任务被停止，返回True表示任务已停止"""
+        task_info = self._get_task_info(task_id)
+        if not task_info:
+            return False
+        return task_info['stop_event'].wait(timeout)
     
     def get_task_status(self, task_id: str) -> Optional[str]:
         """获取任务状态"""
@@ -157,6 +169,11 @@ class TaskManager:
                 return None
             return self._tasks[task_id]['status']
     
+    def _get_task_info(self, task_id: str) -> Optional[Dict]:
+        """获取任务信息（只在查找时持有注册表锁）"""
+        with self._task_lock:
+            return self._tasks.get(task_id)
+    
     def get_all_tasks(self) -> Dict[str, Dict]:
         """获取所有任务信息"""
         with self._task_lock:
@@ -3,11 +3,18 @@
 """
 import requests
 import logging
+import os
 import time
 import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional, List
 from datetime import datetime, timedelta
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict
+
+from app.services.data.quote_cache import QuoteCache
+from app.services.data.stock_metadata_cache import stock_metadata_cache
 
 logger = logging.getLogger(__name__)
 
@@ -24,12 +31,55 @@ class StockData:
     timestamp: datetime = None
     source: str = "unknown"
 
+def _encode_stock_data(data: StockData) -> str:
+    """行情序列化为JSON，用于多进程共享缓存"""
+    payload = asdict(data)
+    payload['timestamp'] = data.timestamp.isoformat() if data.timestamp else None
+    return json.dumps(payload, ensure_ascii=False)
+
+
+def _decode_stock_data(text: str) -> StockData:
+    payload = json.loads(text)
+    if payload.get('timestamp'):
+        payload['timestamp'] = datetime.fromisoformat(payload['timestamp'])
+    return StockData(**payload)
+
+
+class _FetchPool:
+    """并发获取行情共用的线程池，按进程懒加载，线程数见 STOCK_DATA_FETCH_WORKERS"""
+    
+    DEFAULT_MAX_WORKERS = 16
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid = None
+    
+    def get_executor(self, max_workers: int = None) -> ThreadPoolExecutor:
+        with self._lock:
+            # fork 出的子进程没有父进程的线程，需要重新创建
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=max_workers or self.DEFAULT_MAX_WORKERS,
+                                                    thread_name_prefix='quote-fetch')
+                self._pid = os.getpid()
+            return self._executor
+
+
+_fetch_pool = _FetchPool()
+
+
 class MultiSourceDataService:
     """多数据源股票数据服务"""
     
+    BATCH_SIZE = 50  # 批量行情接口每次请求的股票数
+    SHARED_POLL_INTERVAL = 0.2  # 等待其他进程获取行情时查询共享缓存的间隔（秒）
+    
     def __init__(self):
-        self.cache = {}
-        self.cache_duration = 300  # 5分钟缓存
+        # 有效期、容量和多进程共享存储见 QUOTE_CACHE_* 配置
+        self.cache = QuoteCache(encode=_encode_stock_data, decode=_decode_stock_data)
+        # Yahoo Finance批量行情接口需要的 (crumb, cookie)
+        self._yahoo_crumb = None
+        self._yahoo_lock = threading.Lock()
         
         # 数据源配置
         self.sources = [
@@ -40,14 +90,56 @@ class MultiSourceDataService:
             self._get_iex_cloud_data
         ]
     
-    def get_stock_data(self, symbol: str) -> Optional[StockData]:
-        """获取股票数据（尝试多个数据源）"""
+    def get_stock_data(self, symbol: str, concurrent: bool = None) -> Optional[StockData]:
+        """获取股票数据（尝试多个数据源）
+        
+        concurrent为True时同时请求所有数据源，取最先返回的有效数据；为空时按配置 STOCK_DATA_CONCURRENT_FETCH
+        """
         try:
-            # 检查缓存
-            cache_key = f"stock_{symbol}"
-            if self._is_cache_valid(cache_key):
-                return self.cache[cache_key]['data']
+            # 检查缓存，稍微过期的数据直接返回并在后台刷新
+            data, status = self.cache.get(f"stock_{symbol}")
+            if status == QuoteCache.STALE:
+                self._refresh_in_background(symbol, concurrent)
+            if status != QuoteCache.MISS:
+                return data
+            
+            return self._fetch_stock_data(symbol, concurrent)
             
+        except Exception as e:
+            logger.error(f"获取股票数据失败 {symbol}: {str(e)}")
+            return None
+    
+    def _fetch_stock_data(self, symbol: str, concurrent: bool = None) -> Optional[StockData]:
+        """从数据源获取股票数据并写入缓存，其他进程正在获取同一股票时先等待它的结果"""
+        cache_key = f"stock_{symbol}"
+        if not self.cache.acquire_fetch(cache_key):
+            data = self._wait_for_shared_fetch(cache_key)
+            if data:
+                logger.info(f"使用其他进程获取的数据: {symbol} from {data.source}")
+                return data
+            logger.info(f"其他进程没有获取到数据，直接获取: {symbol}")
+        try:
+            return self._fetch_from_sources(symbol, concurrent)
+        finally:
+            self.cache.release_fetch(cache_key)
+    
+    def _wait_for_shared_fetch(self, cache_key: str) -> Optional[StockData]:
+        """等待其他进程把行情写入共享缓存，最多等待租约时长；对方释放租约仍没有写入时（获取失败）不再等待"""
+        deadline = time.monotonic() + self.cache.lease_seconds
+        while time.monotonic() < deadline:
+            time.sleep(self.SHARED_POLL_INTERVAL)
+            # 先查租约再查缓存：对方写入缓存后才释放租约
+            in_progress = self.cache.fetch_in_progress(cache_key)
+            data, status = self.cache.get(cache_key)
+            if status == QuoteCache.HIT:
+                return data
+            if not in_progress:
+                break
+        return None
+    
+    def _fetch_from_sources(self, symbol: str, concurrent: bool = None) -> Optional[StockData]:
+        """依次或并发请求各数据源"""
+        try:
             logger.info(f"开始获取股票数据: {symbol}")
             
             # 处理港股代码格式
@@ -58,25 +150,22 @@ class MultiSourceDataService:
                 search_symbols = [hk_symbol, symbol]  # 先尝试.HK格式，再尝试原格式
                 logger.info(f"检测到港股代码，尝试格式: {search_symbols}")
             
-            # 尝试每个数据源
-            for source_func in self.sources:
-                for search_symbol in search_symbols:
-                    try:
-                        logger.info(f"尝试数据源: {source_func.__name__} with symbol: {search_symbol}")
-                        data = source_func(search_symbol)
-                        
-                        if data:
-                            # 缓存结果
-                            self.cache[cache_key] = {
-                                'data': data,
-                                'timestamp': datetime.now()
-                            }
-                            logger.info(f"成功获取数据: {symbol} from {data.source} (used symbol: {search_symbol})")
-                            return data
-                        
-                    except Exception as e:
-                        logger.warning(f"数据源 {source_func.__name__} 失败 (symbol: {search_symbol}): {str(e)}")
-                        continue
+            # 数据源和代码格式的组合，顺序即优先级
+            attempts = [(source_func, search_symbol)
+                        for source_func in self.sources for search_symbol in search_symbols]
+            
+            if concurrent is None:
+                concurrent = self._get_setting('STOCK_DATA_CONCURRENT_FETCH', True)
+            if concurrent:
+                data, search_symbol = self._fetch_concurrently(symbol, attempts)
+            else:
+                data, search_symbol = self._fetch_sequentially(attempts)
+            
+            if data:
+                # 缓存结果
+                self._cache_stock_data(symbol, data)
+                logger.info(f"成功获取数据: {symbol} from {data.source} (used symbol: {search_symbol})")
+                return data
             
             logger.error(f"所有数据源都失败: {symbol}")
             return None
@@ -85,6 +174,141 @@ class MultiSourceDataService:
             logger.error(f"获取股票数据失败 {symbol}: {str(e)}")
             return None
     
+    def get_stock_data_batch(self, symbols: List[str], fallback: bool = True) -> Dict[str, Optional[StockData]]:
+        """批量获取股票数据
+        
+        未缓存的股票按市场分组，港股用新浪财经的 list= 参数、其他股票用Yahoo Finance的多代码行情接口，
+        每 BATCH_SIZE 只股票一次请求；批量请求没有拿到的股票在fallback为True时逐只调用get_stock_data。
+        所有拿到的数据都写入缓存，返回 {代码: 数据}，获取失败的为None
+        """
+        results: Dict[str, Optional[StockData]] = {}
+        missing = []
+        for symbol in dict.fromkeys(symbols):
+            data, status = self.cache.get(f"stock_{symbol}")
+            if status == QuoteCache.STALE:
+                self._refresh_in_background(symbol)
+            if status != QuoteCache.MISS:
+                results[symbol] = data
+            else:
+                missing.append(symbol)
+        
+        if missing:
+            logger.info(f"开始批量获取股票数据: {len(missing)} 只（已缓存 {len(results)} 只）")
+            hk_symbols = [symbol for symbol in missing if self._is_hk_stock(symbol)]
+            fetched = self._get_hk_stock_data_batch(hk_symbols)
+            
+            # 港股新浪没有返回的也交给Yahoo
+            others = [symbol for symbol in missing if symbol not in fetched]
+            fetched.update(self._get_yahoo_quote_batch(others))
+            
+            for symbol, data in fetched.items():
+                self._cache_stock_data(symbol, data)
+                results[symbol] = data
+            logger.info(f"批量获取股票数据完成: {len(fetched)}/{len(missing)} 只")
+            
+            for symbol in missing:
+                if symbol not in results:
+                    results[symbol] = self.get_stock_data(symbol) if fallback else None
+        
+        return {symbol: results.get(symbol) for symbol in symbols}
+    
+    def _fetch_sequentially(self, attempts: List[tuple]) -> tuple:
+        """按优先级依次尝试每个数据源，返回 (数据, 使用的代码)"""
+        for source_func, search_symbol in attempts:
+            try:
+                logger.info(f"尝试数据源: {source_func.__name__} with symbol: {search_symbol}")
+                data = source_func(search_symbol)
+                
+                if self._is_valid_data(data):
+                    return data, search_symbol
+                
+            except Exception as e:
+                logger.warning(f"数据源 {source_func.__name__} 失败 (symbol: {search_symbol}): {str(e)}")
+                continue
+        
+        return None, None
+    
+    def _fetch_concurrently(self, symbol: str, attempts: List[tuple]) -> tuple:
+        """同时请求所有数据源，返回 (数据, 使用的代码)
+        
+        - 优先级更高的请求都已失败时，收到的有效数据立即返回
+        - 否则收到有效数据后最多再等待 STOCK_DATA_PRIORITY_GRACE_SECONDS 秒，期间返回的更高优先级数据胜出
+        - 总耗时不超过 STOCK_DATA_FETCH_DEADLINE_SECONDS 秒
+        - 请求在进程共用的线程池中执行（最多 STOCK_DATA_FETCH_WORKERS 个线程）；返回时仍在排队的请求被取消，
+          已开始的请求无法中断，会在后台继续执行到结束或超时，结果被丢弃
+        """
+        from concurrent.futures import FIRST_COMPLETED, wait
+        from flask import current_app, has_app_context
+        
+        deadline_seconds = self._get_setting('STOCK_DATA_FETCH_DEADLINE_SECONDS', 15.0)
+        grace_seconds = self._get_setting('STOCK_DATA_PRIORITY_GRACE_SECONDS', 0.5)
+        deadline = time.monotonic() + deadline_seconds
+        grace_until = None
+        
+        # 数据源在线程中执行，各自使用新的应用上下文（判断港股时可能查询数据库）
+        app = current_app._get_current_object() if has_app_context() else None
+        
+        def fetch(source_func, search_symbol):
+            if app is None:
+                return source_func(search_symbol)
+            with app.app_context():
+                return source_func(search_symbol)
+        
+        pool = _fetch_pool.get_executor(self._get_setting('STOCK_DATA_FETCH_WORKERS', _FetchPool.DEFAULT_MAX_WORKERS))
+        futures = {}
+        for index, (source_func, search_symbol) in enumerate(attempts):
+            logger.info(f"尝试数据源: {source_func.__name__} with symbol: {search_symbol}")
+            futures[pool.submit(fetch, source_func, search_symbol)] = index
+        
+        pending = set(futures)
+        best = None  # (优先级, 数据)
+        try:
+            while pending:
+                limit = deadline if grace_until is None else min(deadline, grace_until)
+                remaining = limit - time.monotonic()
+                if remaining <= 0:
+                    break
+                
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = futures[future]
+                    source_func, search_symbol = attempts[index]
+                    try:
+                        data = future.result()
+                    except Exception as e:
+                        logger.warning(f"数据源 {source_func.__name__} 失败 (symbol: {search_symbol}): {str(e)}")
+                        continue
+                    if self._is_valid_data(data) and (best is None or index < best[0]):
+                        best = (index, data)
+                
+                if best is None:
+                    continue
+                # 优先级更高的请求都已结束，不必再等待
+                if all(futures[future] > best[0] for future in pending):
+                    break
+                if grace_until is None:
+                    grace_until = time.monotonic() + grace_seconds
+        finally:
+            for future in pending:
+                future.cancel()
+        
+        if best is None:
+            if pending:
+                logger.warning(f"获取股票数据超时: {symbol}，{deadline_seconds}秒内没有数据源返回有效数据")
+            return None, None
+        return best[1], attempts[best[0]][1]
+    
+    def _is_valid_data(self, data: Optional[StockData]) -> bool:
+        """数据源返回的数据是否可用（价格为0视为无效）"""
+        return data is not None and (data.price or 0) > 0
+    
+    def _get_setting(self, key: str, default):
+        """读取应用配置，没有应用上下文时使用默认值"""
+        from flask import current_app, has_app_context
+        if not has_app_context():
+            return default
+        return current_app.config.get(key, default)
+    
     def _get_alpha_vantage_data(self, symbol: str) -> Optional[StockData]:
         """Alpha Vantage API（免费，需要注册）"""
         try:
@@ -98,7 +322,7 @@ class MultiSourceDataService:
                 'apikey': api_key
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            response = self._http_get('alpha_vantage', url, params=params, timeout=10)
             response.raise_for_status()
             
             data = response.json()
@@ -134,7 +358,7 @@ class MultiSourceDataService:
                 'token': api_key
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            response = self._http_get('finnhub', url, params=params, timeout=10)
             response.raise_for_status()
             
             data = response.json()
@@ -171,7 +395,7 @@ class MultiSourceDataService:
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             }
             
-            response = requests.get(url, params=params, headers=headers, timeout=10)
+            response = self._http_get('yahoo_direct', url, params=params, headers=headers, timeout=10)
             response.raise_for_status()
             
             data = response.json()
@@ -215,7 +439,7 @@ class MultiSourceDataService:
                 'token': api_key
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            response = self._http_get('iex_cloud', url, params=params, timeout=10)
             response.raise_for_status()
             
             data = response.json()
@@ -256,7 +480,7 @@ class MultiSourceDataService:
                 'Referer': 'https://finance.sina.com.cn/'
             }
             
-            response = requests.get(url, headers=headers, timeout=10)
+            response = self._http_get('sina_hk', url, headers=headers, timeout=10)
             response.raise_for_status()
             
             # 解析新浪财经返回的数据，处理编码问题
@@ -283,88 +507,199 @@ class MultiSourceDataService:
                 logger.debug(f"新浪财经API数据字段不足: {symbol}")
                 return None
             
-            # 新浪财经港股数据格式（实际测试结果）：
-            # 0: TENCENT, 1: 腾讯控股, 2: 599.500(当前价), 3: 592.500(昨收), 4: 609.000(今开), 
-            # 5: 595.500(最低), 6: 605.500(最高), 7: 13.000(涨跌额), 8: 2.194(涨跌幅), 
-            # 9: 605.50000, 10: 606.00000, 11: 11491491838(成交量), 12: 19047729(成交额), 
-            # 13-18: 其他字段, 17: 2025/09/05(日期), 18: 16:08(时间)
-            name = fields[1] if len(fields) > 1 and fields[1] else f"港股{clean_symbol}"
-            current_price = float(fields[2]) if len(fields) > 2 and fields[2] else 0.0
-            change = float(fields[7]) if len(fields) > 7 and fields[7] else 0.0
-            change_percent = float(fields[8]) if len(fields) > 8 and fields[8] else 0.0
-            volume = int(float(fields[11])) if len(fields) > 11 and fields[11] else 0
-            turnover = float(fields[12]) if len(fields) > 12 and fields[12] else 0.0
-            
-            # 计算市值（如果有成交额和价格）
-            market_cap = None
-            if current_price > 0 and volume > 0:
-                # 这是一个粗略估算，实际市值需要更多数据
-                market_cap = turnover / 1000000  # 转换为百万单位
-            
-            logger.info(f"成功获取港股数据: {symbol} - {name} - 价格: {current_price}")
-            
-            return StockData(
-                symbol=symbol,
-                name=name,
-                price=current_price,
-                change=change,
-                change_percent=change_percent,
-                volume=volume,
-                market_cap=market_cap,
-                timestamp=datetime.now(),
-                source="sina_hk"
-            )
+            data = self._parse_sina_hk_fields(symbol, clean_symbol, fields)
+            logger.info(f"成功获取港股数据: {symbol} - {data.name} - 价格: {data.price}")
+            return data
             
         except Exception as e:
             logger.debug(f"新浪财经港股API失败: {str(e)}")
             return None
     
+    def _get_hk_stock_data_batch(self, symbols: List[str]) -> Dict[str, StockData]:
+        """港股批量行情 - 新浪财经API的 list= 参数接受逗号分隔的多只股票"""
+        results = {}
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            'Referer': 'https://finance.sina.com.cn/'
+        }
+        
+        for start in range(0, len(symbols), self.BATCH_SIZE):
+            chunk = symbols[start:start + self.BATCH_SIZE]
+            # 新浪格式：00700 / 00700.HK -> hk00700
+            sina_symbols = {f"hk{symbol.replace('.HK', '')}": symbol for symbol in chunk}
+            try:
+                response = self._http_get('sina_hk_batch', f"https://hq.sinajs.cn/list={','.join(sina_symbols)}",
+                                          headers=headers, timeout=10)
+                response.raise_for_status()
+                content = response.content.decode('gbk', errors='ignore')
+                
+                # 每只股票一行：var hq_str_hk00700="字段1,字段2,...";
+                for sina_symbol, data_str in re.findall(r'var hq_str_(\w+)="([^"]*)"', content):
+                    symbol = sina_symbols.get(sina_symbol)
+                    fields = data_str.split(',')
+                    if not symbol or len(fields) < 6:
+                        continue
+                    data = self._parse_sina_hk_fields(symbol, sina_symbol[2:], fields)
+                    if self._is_valid_data(data):
+                        results[symbol] = data
+                        
+            except Exception as e:
+                logger.warning(f"新浪财经港股批量行情失败 ({len(chunk)} 只): {str(e)}")
+        
+        return results
+    
+    def _get_yahoo_quote_batch(self, symbols: List[str]) -> Dict[str, StockData]:
+        """Yahoo Finance多代码行情接口（需要crumb，返回401时重新获取crumb后重试一次）"""
+        results = {}
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        }
+        if not symbols:
+            return results
+        crumb = self._get_yahoo_crumb(headers)
+        
+        for start in range(0, len(symbols), self.BATCH_SIZE):
+            chunk = symbols[start:start + self.BATCH_SIZE]
+            # 港股使用.HK后缀的代码
+            yahoo_symbols = {(symbol if symbol.endswith('.HK') or not self._is_hk_stock(symbol)
+                              else f"{symbol}.HK"): symbol for symbol in chunk}
+            try:
+                response = self._request_yahoo_quotes(list(yahoo_symbols), headers, crumb)
+                if response.status_code == 401:
+                    crumb = self._get_yahoo_crumb(headers, refresh=True)
+                    response = self._request_yahoo_quotes(list(yahoo_symbols), headers, crumb)
+                response.raise_for_status()
+                quotes = response.json().get('quoteResponse', {}).get('result', [])
+                
+                for quote in quotes:
+                    symbol = yahoo_symbols.get(quote.get('symbol'))
+                    if not symbol:
+                        continue
+                    data = StockData(
+                        symbol=quote['symbol'],
+                        name=quote.get('longName') or quote.get('shortName') or quote['symbol'],
+                        price=float(quote.get('regularMarketPrice') or 0),
+                        change=float(quote.get('regularMarketChange') or 0),
+                        change_percent=float(quote.get('regularMarketChangePercent') or 0),
+                        volume=int(quote.get('regularMarketVolume') or 0),
+                        market_cap=quote.get('marketCap'),
+                        timestamp=datetime.now(),
+                        source="yahoo_direct"
+                    )
+                    if self._is_valid_data(data):
+                        results[symbol] = data
+                        
+            except requests.HTTPError as e:
+                logger.warning(f"Yahoo Finance批量行情失败 ({len(chunk)} 只): HTTP {e.response.status_code}")
+            except Exception as e:
+                logger.warning(f"Yahoo Finance批量行情失败 ({len(chunk)} 只): {str(e)}")
+        
+        return results
+    
+    def _request_yahoo_quotes(self, yahoo_symbols: List[str], headers: Dict[str, str],
+                              crumb: Optional[tuple]) -> requests.Response:
+        """请求Yahoo Finance多代码行情接口"""
+        params = {'symbols': ','.join(yahoo_symbols)}
+        cookies = None
+        if crumb:
+            params['crumb'], cookies = crumb
+        return self._http_get('yahoo_batch', "https://query1.finance.yahoo.com/v7/finance/quote",
+                              params=params, headers=headers, cookies=cookies, timeout=10)
+    
+    def _get_yahoo_crumb(self, headers: Dict[str, str], refresh: bool = False) -> Optional[tuple]:
+        """获取Yahoo Finance行情接口需要的crumb和对应的cookie，进程内缓存，refresh为True时重新获取"""
+        with self._yahoo_lock:
+            if self._yahoo_crumb is not None and not refresh:
+                return self._yahoo_crumb
+            self._yahoo_crumb = None
+            try:
+                # fc.yahoo.com 返回404，但会设置获取crumb需要的cookie
+                cookies = self._http_get('yahoo_crumb', "https://fc.yahoo.com",
+                                         headers=headers, timeout=10).cookies
+                response = self._http_get('yahoo_crumb', "https://query1.finance.yahoo.com/v1/test/getcrumb",
+                                          headers=headers, cookies=cookies, timeout=10)
+                response.raise_for_status()
+                crumb = response.text.strip()
+                if crumb:
+                    self._yahoo_crumb = (crumb, cookies)
+            except requests.HTTPError as e:
+                logger.warning(f"获取Yahoo Finance crumb失败: HTTP {e.response.status_code}")
+            except Exception as e:
+                logger.warning(f"获取Yahoo Finance crumb失败: {str(e)}")
+            return self._yahoo_crumb
+    
+    def _parse_sina_hk_fields(self, symbol: str, clean_symbol: str, fields: List[str]) -> StockData:
+        """解析新浪财经港股行情字段"""
+        # 新浪财经港股数据格式（实际测试结果）：
+        # 0: TENCENT, 1: 腾讯控股, 2: 599.500(当前价), 3: 592.500(昨收), 4: 609.000(今开), 
+        # 5: 595.500(最低), 6: 605.500(最高), 7: 13.000(涨跌额), 8: 2.194(涨跌幅), 
+        # 9: 605.50000, 10: 606.00000, 11: 11491491838(成交量), 12: 19047729(成交额), 
+        # 13-18: 其他字段, 17: 2025/09/05(日期), 18: 16:08(时间)
+        name = fields[1] if len(fields) > 1 and fields[1] else f"港股{clean_symbol}"
+        current_price = float(fields[2]) if len(fields) > 2 and fields[2] else 0.0
+        change = float(fields[7]) if len(fields) > 7 and fields[7] else 0.0
+        change_percent = float(fields[8]) if len(fields) > 8 and fields[8] else 0.0
+        volume = int(float(fields[11])) if len(fields) > 11 and fields[11] else 0
+        turnover = float(fields[12]) if len(fields) > 12 and fields[12] else 0.0
+        
+        # 计算市值（如果有成交额和价格）
+        market_cap = None
+        if current_price > 0 and volume > 0:
+            # 这是一个粗略估算，实际市值需要更多数据
+            market_cap = turnover / 1000000  # 转换为百万单位
+        
+        return StockData(
+            symbol=symbol,
+            name=name,
+            price=current_price,
+            change=change,
+            change_percent=change_percent,
+            volume=volume,
+            market_cap=market_cap,
+            timestamp=datetime.now(),
+            source="sina_hk"
+        )
+    
     def get_analysis_ready_data(self, symbol: str) -> Dict[str, Any]:
         """获取AI分析所需的数据"""
         try:
             stock_data = self.get_stock_data(symbol)
             
-            # 从数据库获取股票的基础信息
-            from app import create_app, db
-            from app.repositories.stock_repository import StockRepository
+            # 股票的基础信息（进程内缓存，使用调用方的应用上下文）
+            db_stock = stock_metadata_cache.get(symbol)
             
-            app = create_app()
-            with app.app_context():
-                stock_repo = StockRepository(db.session)
-                db_stock = stock_repo.get_by_code(symbol)
-                
-                if not stock_data:
-                    logger.warning(f"无法获取股票数据: {symbol}")
-                    return {
-                        'code': symbol,
-                        'name': db_stock.name if db_stock else symbol,
-                        'market': db_stock.market if db_stock else ('US' if '.' not in symbol else 'CN'),
-                        'industry': db_stock.industry if db_stock else '未知',
-                        'exchange': db_stock.exchange if db_stock else ('NASDAQ' if '.' not in symbol else 'SZSE'),
-                        'analysis_date': datetime.now().strftime('%Y-%m-%d'),
-                        'data_source': 'fallback',
-                        'data_timestamp': datetime.now().isoformat()
-                    }
-                
-                # 构建分析数据 - 字段名与提示词模板匹配
-                analysis_data = {
-                    # 提示词模板期望的字段
+            if not stock_data:
+                logger.warning(f"无法获取股票数据: {symbol}")
+                return {
                     'code': symbol,
-                    'name': stock_data.name,
+                    'name': db_stock.name if db_stock else symbol,
                     'market': db_stock.market if db_stock else ('US' if '.' not in symbol else 'CN'),
                     'industry': db_stock.industry if db_stock else '未知',
                     'exchange': db_stock.exchange if db_stock else ('NASDAQ' if '.' not in symbol else 'SZSE'),
                     'analysis_date': datetime.now().strftime('%Y-%m-%d'),
-                    # 额外的实时数据字段
-                    'current_price': stock_data.price,
-                    'price_change': stock_data.change,
-                    'price_change_percent': stock_data.change_percent,
-                    'volume': stock_data.volume,
-                    'market_cap': stock_data.market_cap,
-                    'data_source': stock_data.source,
-                    'data_timestamp': stock_data.timestamp.isoformat() if stock_data.timestamp else datetime.now().isoformat()
+                    'data_source': 'fallback',
+                    'data_timestamp': datetime.now().isoformat()
                 }
             
+            # 构建分析数据 - 字段名与提示词模板匹配
+            analysis_data = {
+                # 提示词模板期望的字段
+                'code': symbol,
+                'name': stock_data.name,
+                'market': db_stock.market if db_stock else ('US' if '.' not in symbol else 'CN'),
+                'industry': db_stock.industry if db_stock else '未知',
+                'exchange': db_stock.exchange if db_stock else ('NASDAQ' if '.' not in symbol else 'SZSE'),
+                'analysis_date': datetime.now().strftime('%Y-%m-%d'),
+                # 额外的实时数据字段
+                'current_price': stock_data.price,
+                'price_change': stock_data.change,
+                'price_change_percent': stock_data.change_percent,
+                'volume': stock_data.volume,
+                'market_cap': stock_data.market_cap,
+                'data_source': stock_data.source,
+                'data_timestamp': stock_data.timestamp.isoformat() if stock_data.timestamp else datetime.now().isoformat()
+            }
+            
             logger.info(f"构建分析数据成功: {symbol} - ${stock_data.price} from {stock_data.source}")
             return analysis_data
             
@@ -389,29 +724,45 @@ class MultiSourceDataService:
             return True
         
         if symbol.isdigit() and len(symbol) == 5:
-            # 5位数字，可能是港股，需要查询数据库确认
-            try:
-                from app import create_app, db
-                from app.repositories.stock_repository import StockRepository
-                
-                app = create_app()
-                with app.app_context():
-                    stock_repo = StockRepository(db.session)
-                    stock = stock_repo.get_by_code(symbol)
-                    return stock and stock.market == 'HK'
-            except Exception as e:
-                logger.debug(f"查询股票市场信息失败: {str(e)}")
-                return False
+            # 5位数字，可能是港股，按股票基础信息确认
+            stock = stock_metadata_cache.get(symbol)
+            return bool(stock and stock.market == 'HK')
         
         return False
     
-    def _is_cache_valid(self, cache_key: str) -> bool:
-        """检查缓存是否有效"""
-        if cache_key not in self.cache:
-            return False
+    def _cache_stock_data(self, symbol: str, data: StockData) -> None:
+        """写入行情缓存，按市场的开盘状态决定有效期"""
+        self.cache.set(f"stock_{symbol}", data, market='HK' if self._is_hk_stock(symbol) else 'US')
+    
+    def _refresh_in_background(self, symbol: str, concurrent: bool = None) -> None:
+        """在后台线程中刷新过期的行情，同一股票同时只刷新一次"""
+        from flask import current_app, has_app_context
+        
+        cache_key = f"stock_{symbol}"
+        if not self.cache.begin_refresh(cache_key):
+            return
+        app = current_app._get_current_object() if has_app_context() else None
+        
+        def refresh():
+            try:
+                if app is None:
+                    self._fetch_stock_data(symbol, concurrent)
+                else:
+                    with app.app_context():
+                        self._fetch_stock_data(symbol, concurrent)
+            finally:
+                self.cache.end_refresh(cache_key)
         
-        cache_time = self.cache[cache_key]['timestamp']
-        return (datetime.now() - cache_time).seconds < self.cache_duration
+        threading.Thread(target=refresh, name=f"quote-refresh-{symbol}", daemon=True).start()
+    
+    def _http_get(self, source: str, url: str, **kwargs) -> requests.Response:
+        """向数据源发送请求，并记录请求次数"""
+        self.cache.record_upstream(source)
+        return requests.get(url, **kwargs)
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取行情缓存的命中统计"""
+        return self.cache.get_stats()
 
 
 # 全局实例
@@ -0,0 +1,372 @@
+"""
+股票行情缓存 - 线程安全、有容量上限的进程内缓存
+- 开盘期间和收盘后使用不同的有效期，收盘期间获取的行情在开盘后按开盘有效期计算
+- 过期不久（stale_seconds内）的行情仍然返回，由调用方在后台刷新（stale-while-revalidate）
+- 超过容量上限时淘汰最久未使用的条目，并统计命中、过期命中和未命中次数
+- 开盘时间只按交易日和交易时段判断，不考虑节假日
+- 配置了共享存储文件时，进程内缓存之后还有一层SQLite（WAL）缓存，同一台机器上的多个gunicorn worker
+  共享行情、正在进行的获取（同一股票只由一个进程请求数据源，其他进程等待结果）和数据源请求次数
+"""
+import os
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime, time as dt_time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 各市场的时区和交易时段（当地时间）
+MARKET_SESSIONS = {
+    'US': ('America/New_York', [(dt_time(9, 30), dt_time(16, 0))]),
+    'HK': ('Asia/Hong_Kong', [(dt_time(9, 30), dt_time(12, 0)), (dt_time(13, 0), dt_time(16, 0))]),
+    'CN': ('Asia/Shanghai', [(dt_time(9, 30), dt_time(11, 30)), (dt_time(13, 0), dt_time(15, 0))])
+}
+
+
+def is_market_open(market: str, now: float = None) -> bool:
+    """市场当前是否在交易时段内（未知市场或缺少时区数据时视为开盘，使用较短的有效期）"""
+    session = MARKET_SESSIONS.get(market)
+    if not session:
+        return True
+    try:
+        from zoneinfo import ZoneInfo
+        local = datetime.fromtimestamp(time.time() if now is None else now, ZoneInfo(session[0]))
+    except Exception:
+        return True
+    if local.weekday() >= 5:
+        return False
+    return any(start <= local.time() < end for start, end in session[1])
+
+
+class SQLiteQuoteStore:
+    """SQLite文件行情存储，WAL模式下多个进程可以同时读取"""
+
+    PRUNE_EVERY = 100  # 每写入多少次清理一次过期行情
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS quotes ('
+            'key TEXT PRIMARY KEY, data TEXT NOT NULL, market TEXT, '
+            'stored_at REAL NOT NULL, stored_while_open INTEGER NOT NULL)'
+        )
+        conn.execute('CREATE TABLE IF NOT EXISTS quote_fetch_leases ('
+                     'key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS quote_upstream_requests ('
+                     'source TEXT PRIMARY KEY, count INTEGER NOT NULL)')
+
+    def _connection(self) -> sqlite3.Connection:
+        """每个线程一个连接，fork 后的子进程重新连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            'SELECT data, market, stored_at, stored_while_open FROM quotes WHERE key = ?', (key,)).fetchone()
+        if not row:
+            return None
+        return {'data': row[0], 'market': row[1], 'stored_at': row[2], 'stored_while_open': bool(row[3])}
+
+    def set(self, key: str, entry: Dict[str, Any], prune_before: float) -> None:
+        """写入行情，定期删除 prune_before 之前写入的行情"""
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO quotes (key, data, market, stored_at, stored_while_open) '
+                     'VALUES (?, ?, ?, ?, ?)',
+                     (key, entry['data'], entry['market'], entry['stored_at'], int(entry['stored_while_open'])))
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            conn.execute('DELETE FROM quotes WHERE stored_at < ?', (prune_before,))
+
+    def acquire_lease(self, key: str, owner: str, seconds: float, now: float) -> bool:
+        """占用获取行情的租约，其他进程持有未过期的租约时返回False"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT owner, expires_at FROM quote_fetch_leases WHERE key = ?', (key,)).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                conn.execute('COMMIT')
+                return False
+            conn.execute('INSERT OR REPLACE INTO quote_fetch_leases (key, owner, expires_at) VALUES (?, ?, ?)',
+                         (key, owner, now + seconds))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return True
+
+    def lease_held(self, key: str, now: float) -> bool:
+        """是否有进程持有未过期的获取租约"""
+        row = self._connection().execute('SELECT 1 FROM quote_fetch_leases WHERE key = ? AND expires_at > ?',
+                                         (key, now)).fetchone()
+        return row is not None
+
+    def release_lease(self, key: str, owner: str) -> None:
+        self._connection().execute('DELETE FROM quote_fetch_leases WHERE key = ? AND owner = ?', (key, owner))
+
+    def add_upstream_requests(self, source: str, count: int) -> None:
+        self._connection().execute(
+            'INSERT INTO quote_upstream_requests (source, count) VALUES (?, ?) '
+            'ON CONFLICT(source) DO UPDATE SET count = count + excluded.count', (source, count))
+
+    def upstream_requests(self) -> Dict[str, int]:
+        return dict(self._connection().execute('SELECT source, count FROM quote_upstream_requests').fetchall())
+
+
+class QuoteCache:
+    """股票行情缓存"""
+
+    HIT = 'hit'
+    STALE = 'stale'
+    MISS = 'miss'
+
+    DEFAULT_MAX_ENTRIES = 1000
+    DEFAULT_TTL_SECONDS = 300
+    DEFAULT_CLOSED_TTL_SECONDS = 3600
+    DEFAULT_STALE_SECONDS = 300
+    DEFAULT_LEASE_SECONDS = 15
+
+    def __init__(self, encode: Callable[[Any], str] = None, decode: Callable[[str], Any] = None):
+        """encode/decode 用于在共享存储中保存行情，未提供时不使用共享存储"""
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._refreshing = set()
+        self._stats = {
+            'hits': 0,
+            'stale_hits': 0,
+            'shared_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'refreshes': 0
+        }
+        self._upstream_requests: Dict[str, int] = {}
+        self._encode = encode
+        self._decode = decode
+        self._store: Optional[SQLiteQuoteStore] = None
+        self._owner = f"{os.getpid()}:{id(self)}"
+        self.max_entries = self.DEFAULT_MAX_ENTRIES
+        self.ttl = self.DEFAULT_TTL_SECONDS
+        self.closed_ttl = self.DEFAULT_CLOSED_TTL_SECONDS
+        self.stale_seconds = self.DEFAULT_STALE_SECONDS
+        self.lease_seconds = self.DEFAULT_LEASE_SECONDS
+        self._configured = False
+
+    def configure(self, max_entries: int = None, ttl: float = None, closed_ttl: float = None,
+                  stale_seconds: float = None, shared_store: str = None, lease_seconds: float = None) -> None:
+        """设置容量上限、开盘期间和收盘后的有效期（秒）、过期后仍可返回的秒数，
+        以及共享存储文件（空字符串表示不使用）和等待其他进程获取行情的最长秒数"""
+        if shared_store is not None:
+            store = None
+            if shared_store and self._encode and self._decode:
+                store = SQLiteQuoteStore(shared_store)
+            self._store = store
+            logger.info(f"行情缓存共享存储: {shared_store or '不使用'}")
+        with self._lock:
+            if lease_seconds is not None:
+                self.lease_seconds = max(0.0, float(lease_seconds))
+            if max_entries is not None:
+                self.max_entries = max(1, int(max_entries))
+            if ttl is not None:
+                self.ttl = max(0.0, float(ttl))
+            if closed_ttl is not None:
+                self.closed_ttl = max(0.0, float(closed_ttl))
+            if stale_seconds is not None:
+                self.stale_seconds = max(0.0, float(stale_seconds))
+            self._configured = True
+            self._evict()
+
+    def get(self, key: str, now: float = None) -> Tuple[Any, str]:
+        """获取行情，返回 (数据, 状态)，状态为 hit / stale / miss，miss时数据为None
+
+        进程内没有有效的行情时再查共享存储，其他进程写入的更新的行情同时写入进程内缓存
+        """
+        self._ensure_configured()
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            status = self._status(entry, now)
+            if status == self.HIT:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry['data'], status
+
+        shared = self._get_shared(key) if self._store is not None else None
+        with self._lock:
+            if shared and (entry is None or shared['stored_at'] > entry['stored_at']) \
+                    and self._status(shared, now) != self.MISS:
+                entry = shared
+                status = self._status(entry, now)
+                self._entries[key] = entry
+                self._stats['shared_hits'] += 1
+                self._evict()
+
+            if status == self.MISS:
+                if entry is not None and self._entries.get(key) is entry:
+                    del self._entries[key]
+                self._stats['misses'] += 1
+                return None, status
+
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._stats['hits' if status == self.HIT else 'stale_hits'] += 1
+            return entry['data'], status
+
+    def set(self, key: str, data: Any, market: str = None, now: float = None) -> None:
+        """写入行情，market用于判断开盘状态（US / HK / CN）"""
+        self._ensure_configured()
+        now = time.time() if now is None else now
+        entry = {
+            'data': data,
+            'market': market,
+            'stored_at': now,
+            'stored_while_open': is_market_open(market, now)
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict()
+
+        if self._store is not None:
+            try:
+                self._store.set(key, dict(entry, data=self._encode(data)),
+                                prune_before=now - self.closed_ttl - self.stale_seconds)
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                logger.warning(f"写入共享行情缓存失败: {key}, {str(e)}")
+
+    def acquire_fetch(self, key: str, now: float = None) -> bool:
+        """占用跨进程的获取租约，其他进程正在获取同一行情时返回False（未使用共享存储时总是True）"""
+        if self._store is None:
+            return True
+        try:
+            return self._store.acquire_lease(key, self._owner, self.lease_seconds,
+                                             time.time() if now is None else now)
+        except sqlite3.Error as e:
+            logger.warning(f"获取行情租约失败: {key}, {str(e)}")
+            return True
+
+    def fetch_in_progress(self, key: str, now: float = None) -> bool:
+        """是否有进程正在获取该行情（持有未过期的租约，未使用共享存储时总是False）"""
+        if self._store is None:
+            return False
+        try:
+            return self._store.lease_held(key, time.time() if now is None else now)
+        except sqlite3.Error as e:
+            logger.warning(f"查询行情租约失败: {key}, {str(e)}")
+            return False
+
+    def release_fetch(self, key: str) -> None:
+        if self._store is None:
+            return
+        try:
+            self._store.release_lease(key, self._owner)
+        except sqlite3.Error as e:
+            logger.warning(f"释放行情租约失败: {key}, {str(e)}")
+
+    def record_upstream(self, source: str, count: int = 1) -> None:
+        """记录向数据源发出的请求次数，使用共享存储时同一台机器的所有进程合计"""
+        with self._lock:
+            self._upstream_requests[source] = self._upstream_requests.get(source, 0) + count
+        if self._store is not None:
+            try:
+                self._store.add_upstream_requests(source, count)
+            except sqlite3.Error as e:
+                logger.warning(f"记录数据源请求次数失败: {source}, {str(e)}")
+
+    def begin_refresh(self, key: str) -> bool:
+        """占用后台刷新，同一条目已在刷新时返回False"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            self._stats['refreshes'] += 1
+            return True
+
+    def end_refresh(self, key: str) -> None:
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计：命中、过期命中、未命中、淘汰和后台刷新次数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+            stats['max_entries'] = self.max_entries
+            stats['upstream_requests'] = dict(self._upstream_requests)
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['stale_hits']) / lookups, 4) if lookups else 0.0
+        stats['shared'] = self._store is not None
+        if self._store is not None:
+            try:
+                stats['upstream_requests'] = self._store.upstream_requests()
+            except sqlite3.Error as e:
+                logger.warning(f"读取数据源请求次数失败: {str(e)}")
+        return stats
+
+    def _status(self, entry: Optional[Dict[str, Any]], now: float) -> str:
+        """条目的状态（调用方持有锁）"""
+        if entry is None:
+            return self.MISS
+        age = now - entry['stored_at']
+        ttl = self._entry_ttl(entry, now)
+        if age < ttl:
+            return self.HIT
+        if age < ttl + self.stale_seconds:
+            return self.STALE
+        return self.MISS
+
+    def _get_shared(self, key: str) -> Optional[Dict[str, Any]]:
+        """从共享存储读取行情"""
+        try:
+            entry = self._store.get(key)
+            if entry:
+                entry['data'] = self._decode(entry['data'])
+            return entry
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"读取共享行情缓存失败: {key}, {str(e)}")
+            return None
+
+    def _entry_ttl(self, entry: Dict[str, Any], now: float) -> float:
+        """开盘期间获取或当前处于开盘时段的行情使用开盘有效期"""
+        if entry['stored_while_open'] or is_market_open(entry['market'], now):
+            return self.ttl
+        return self.closed_ttl
+
+    def _evict(self) -> None:
+        """淘汰最久未使用的条目（调用方持有锁）"""
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _ensure_configured(self) -> None:
+        """首次使用时从应用配置读取缓存参数"""
+        if self._configured:
+            return
+        from flask import current_app, has_app_context
+        if not has_app_context():
+            return
+        config = current_app.config
+        self.configure(
+            max_entries=config.get('QUOTE_CACHE_MAX_ENTRIES', self.DEFAULT_MAX_ENTRIES),
+            ttl=config.get('QUOTE_CACHE_TTL_SECONDS', self.DEFAULT_TTL_SECONDS),
+            closed_ttl=config.get('QUOTE_CACHE_CLOSED_TTL_SECONDS', self.DEFAULT_CLOSED_TTL_SECONDS),
+            stale_seconds=config.get('QUOTE_CACHE_STALE_SECONDS', self.DEFAULT_STALE_SECONDS),
+            shared_store=config.get('QUOTE_CACHE_SHARED_STORE') or '',
+            lease_seconds=config.get('QUOTE_CACHE_SHARED_WAIT_SECONDS', self.DEFAULT_LEASE_SECONDS)
+        )
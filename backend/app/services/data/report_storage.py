@@ -0,0 +1,109 @@
+"""
+报告文件存储
+报告文件格式（.report）：
+  第一行：紧凑JSON元数据头（不含报告正文和完整提示词）
+  其余内容：Markdown报告正文
+完整提示词按内容哈希单独存储一次，报告头中只保存引用
+"""
+import os
+import json
+import hashlib
+import logging
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+REPORT_FORMAT = 'ecr/1'
+REPORT_EXTENSION = '.report'
+LEGACY_EXTENSION = '.json'
+
+# 不写入报告头的字段
+_BODY_FIELDS = ('content', 'full_prompt')
+
+
+def is_report_file(filename: str) -> bool:
+    """判断文件名是否为报告文件（新格式或旧JSON格式）"""
+    if filename.endswith('.task.json'):
+        return False
+    return filename.endswith(REPORT_EXTENSION) or filename.endswith(LEGACY_EXTENSION)
+
+
+class ReportStorage:
+    """报告文件读写"""
+
+    def __init__(self, prompts_dir: str = 'data/report_prompts'):
+        self.prompts_dir = prompts_dir
+
+    def store_prompt(self, content: str, prompt_version: str = None) -> Optional[str]:
+        """保存完整提示词（相同内容只保存一次），返回提示词引用"""
+        if not content:
+            return None
+
+        prompt_ref = hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+        prompt_file = os.path.join(self.prompts_dir, f"{prompt_ref}.json")
+        if not os.path.exists(prompt_file):
+            os.makedirs(self.prompts_dir, exist_ok=True)
+            self._atomic_write(prompt_file, json.dumps({
+                'prompt_ref': prompt_ref,
+                'prompt_version': prompt_version,
+                'content': content
+            }, ensure_ascii=False))
+        return prompt_ref
+
+    def load_prompt(self, prompt_ref: str) -> str:
+        """根据引用读取完整提示词"""
+        if not prompt_ref:
+            return ''
+        prompt_file = os.path.join(self.prompts_dir, f"{prompt_ref}.json")
+        try:
+            with open(prompt_file, 'r', encoding='utf-8') as f:
+                return json.load(f).get('content', '')
+        except Exception as e:
+            logger.error(f"读取提示词失败: {prompt_file}, {str(e)}")
+            return ''
+
+    def write_report(self, report_file: str, report_data: Dict[str, Any]) -> None:
+        """写入报告文件"""
+        header = {k: v for k, v in report_data.items() if k not in _BODY_FIELDS}
+        header['format'] = REPORT_FORMAT
+
+        full_prompt = report_data.get('full_prompt')
+        if full_prompt:
+            header['prompt_ref'] = self.store_prompt(full_prompt, report_data.get('prompt_version'))
+
+        content = report_data.get('content') or ''
+        header['content_length'] = len(content)
+
+        self._atomic_write(
+            report_file,
+            json.dumps(header, ensure_ascii=False, separators=(',', ':')) + '\n' + content
+        )
+
+    def read_header(self, report_file: str) -> Dict[str, Any]:
+        """只读取报告元数据头"""
+        with open(report_file, 'r', encoding='utf-8') as f:
+            if report_file.endswith(LEGACY_EXTENSION):
+                report_data = json.load(f)
+                for field in _BODY_FIELDS:
+                    report_data.pop(field, None)
+                return report_data
+            return json.loads(f.readline())
+
+    def read_report(self, report_file: str, include_prompt: bool = False) -> Dict[str, Any]:
+        """读取完整报告（元数据头+正文），可选加载完整提示词"""
+        with open(report_file, 'r', encoding='utf-8') as f:
+            if report_file.endswith(LEGACY_EXTENSION):
+                return json.load(f)
+            report_data = json.loads(f.readline())
+            report_data['content'] = f.read()
+
+        if include_prompt:
+            report_data['full_prompt'] = self.load_prompt(report_data.get('prompt_ref'))
+        return report_data
+
+    def _atomic_write(self, path: str, text: str) -> None:
+        """先写临时文件再替换，避免读到写了一半的文件"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
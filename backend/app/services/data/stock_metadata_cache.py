@@ -0,0 +1,112 @@
+"""
+股票基础信息缓存 - 进程内缓存股票的名称、市场、行业和交易所，获取行情时不再每次查询数据库
+- 首次使用时一次查询加载全部股票，之后按代码直接读取内存；不在表中的代码单独查询一次并记住结果
+- 本进程修改股票时通过ORM事件使对应条目失效，其他进程的修改在缓存过期（默认10分钟）后整体重新加载
+- 使用调用方的应用上下文和数据库会话，没有应用上下文时不查询数据库
+"""
+import threading
+import time
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from sqlalchemy import event, inspect
+
+from app.models.stock import Stock
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class StockMetadata:
+    """股票基础信息"""
+    code: str
+    name: str
+    market: str
+    industry: Optional[str] = None
+    exchange: Optional[str] = None
+
+
+class StockMetadataCache:
+    """股票基础信息缓存"""
+
+    DEFAULT_TTL_SECONDS = 600
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Optional[StockMetadata]] = {}
+        self._loaded_at: Optional[float] = None
+        self._version = 0  # 每次失效加1，加载期间发生失效时不使用加载的结果
+
+    def get(self, code: str) -> Optional[StockMetadata]:
+        """获取股票基础信息，不存在或没有应用上下文时返回None"""
+        from flask import has_app_context
+        if not has_app_context():
+            logger.debug(f"没有应用上下文，不查询股票信息: {code}")
+            return None
+
+        with self._lock:
+            fresh = self._loaded_at is not None and time.monotonic() - self._loaded_at < self._ttl()
+            if fresh and code in self._entries:
+                return self._entries[code]
+            version = self._version
+
+        try:
+            if not fresh:
+                return self._load_all(version).get(code)
+            return self._load_one(code, version)
+        except Exception as e:
+            logger.warning(f"查询股票信息失败: {code}, {str(e)}")
+            return None
+
+    def invalidate(self, code: str = None) -> None:
+        """使股票的缓存失效（为空时全部失效，下次使用时重新加载）"""
+        with self._lock:
+            self._version += 1
+            if code is None:
+                self._entries = {}
+                self._loaded_at = None
+            else:
+                self._entries.pop(code, None)
+
+    def _load_all(self, version: int) -> Dict[str, Optional[StockMetadata]]:
+        """一次查询加载全部股票"""
+        from app import db
+        rows = db.session.query(Stock.code, Stock.name, Stock.market, Stock.industry, Stock.exchange).all()
+        entries = {row.code: StockMetadata(row.code, row.name, row.market, row.industry, row.exchange)
+                   for row in rows}
+        with self._lock:
+            if self._version == version:
+                self._entries = dict(entries)
+                self._loaded_at = time.monotonic()
+        logger.info(f"加载股票基础信息缓存: {len(entries)} 只股票")
+        return entries
+
+    def _load_one(self, code: str, version: int) -> Optional[StockMetadata]:
+        """查询全部加载之后新增（或不存在）的股票"""
+        from app import db
+        row = db.session.query(Stock.code, Stock.name, Stock.market, Stock.industry, Stock.exchange) \
+            .filter(Stock.code == code).first()
+        metadata = StockMetadata(row.code, row.name, row.market, row.industry, row.exchange) if row else None
+        with self._lock:
+            if self._version == version:
+                self._entries[code] = metadata
+        return metadata
+
+    def _ttl(self) -> float:
+        from flask import current_app
+        return current_app.config.get('STOCK_METADATA_CACHE_SECONDS', self.DEFAULT_TTL_SECONDS)
+
+
+# 全局实例
+stock_metadata_cache = StockMetadataCache()
+
+
+@event.listens_for(Stock, 'after_insert')
+@event.listens_for(Stock, 'after_update')
+@event.listens_for(Stock, 'after_delete')
+def _invalidate_stock(mapper, connection, target):
+    stock_metadata_cache.invalidate(target.code)
+    # 修改了股票代码时旧代码的条目也失效
+    for old_code in inspect(target).attrs.code.history.deleted or ():
+        stock_metadata_cache.invalidate(old_code)
@@ -74,31 +74,23 @@ def tasks():
         
         # 检查用户权限，管理员可以看到所有任务
         user_context = get_user_context()
-        if user_context and user_context.get('is_admin'):
-            # 管理员获取所有任务
-            all_tasks = analysis_service.get_all_tasks(limit=1000)
-        else:
-            # 普通用户只获取自己的任务
-            all_tasks = analysis_service.get_user_tasks(user_id, limit=1000)
-        
-        # 不转换时间，让前端JavaScript处理时区转换
-        # for task in all_tasks:
-        #     if 'created_at' in task:
-        #         task['created_at'] = convert_to_beijing_time(task['created_at'])
-        #     if 'completed_at' in task:
-        #         task['completed_at'] = convert_to_beijing_time(task['completed_at'])
+        is_admin = bool(user_context and user_context.get('is_admin'))
         
         # 分页处理
-        total_tasks = len(all_tasks)
+        total_tasks = analysis_service.count_tasks(None if is_admin else user_id)
         total_pages = (total_tasks + per_page - 1) // per_page
         
         # 确保页码在有效范围内
         page = max(1, min(page, total_pages)) if total_pages > 0 else 1
+        offset = (page - 1) * per_page
         
-        # 计算分页切片
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        paginated_tasks = all_tasks[start_idx:end_idx]
+        # 不转换时间，让前端JavaScript处理时区转换
+        if is_admin:
+            # 管理员获取所有任务
+            paginated_tasks = analysis_service.get_all_tasks(limit=per_page, offset=offset)
+        else:
+            # 普通用户只获取自己的任务
+            paginated_tasks = analysis_service.get_user_tasks(user_id, limit=per_page, offset=offset)
         
         # 构建分页信息
         pagination = {
@@ -30,11 +30,7 @@ def index():
     watchlist_data = stock_service.get_user_watchlist(user_id)
     watchlist_count = watchlist_data['count']
     
-    # 获取报告数量
-    reports = analysis_service.get_user_reports(user_id, limit=100)
-    reports_count = len(reports)
-    
-    # 根据用户角色获取不同的报告统计
+    # 根据用户角色获取不同的报告统计（读取报告计数表，不遍历报告目录）
     if is_admin:
         # 管理员：显示全局报告总数
         global_reports_count = analysis_service.get_global_reports_count()
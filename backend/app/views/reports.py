@@ -70,46 +70,44 @@ def index():
     # 获取分析服务
     analysis_service = AnalysisService(db.session)
     
-    # 获取所有报告（不限制数量，用于筛选）
-    if user_id:
-        # 如果用户已登录，获取用户报告（包含关注标记）
-        all_reports = analysis_service.get_user_reports(user_id, limit=1000)
-    else:
-        # 如果用户未登录，获取所有报告
-        all_reports = analysis_service.get_all_reports(limit=1000)
-    
-    # 应用筛选
+    # 筛选条件下推到报告索引表查询
+    filters = {}
     if stock_filter:
-        all_reports = [r for r in all_reports if r.get('stock_code', '').upper() == stock_filter.upper()]
+        filters['stock_code'] = stock_filter.upper()
+    if date_filter == 'today':
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        filters['generated_from'] = today
+        filters['generated_to'] = today + timedelta(days=1)
+    if analysis_type_filter:
+        filters['analysis_type'] = analysis_type_filter.lower()
+    if model_filter:
+        filters['provider'] = model_filter.lower()
     
-    if date_filter:
-        if date_filter == 'today':
-            from datetime import datetime
-            today = datetime.utcnow().strftime('%Y-%m-%d')
-            all_reports = [r for r in all_reports if r.get('date', '') == today]
+    # 分页处理
+    per_page = max(1, min(per_page, 100))
+    total_reports = analysis_service.count_reports(**filters)
+    total_pages = (total_reports + per_page - 1) // per_page
     
-    if analysis_type_filter:
-        all_reports = [r for r in all_reports if r.get('analysis_type', '').lower() == analysis_type_filter.lower()]
+    # 确保页码在有效范围内
+    page = max(1, min(page, total_pages)) if total_pages > 0 else 1
+    offset = (page - 1) * per_page
     
-    if model_filter:
-        all_reports = [r for r in all_reports if r.get('provider', '').lower() == model_filter.lower()]
+    # 只查询当前页的报告
+    if user_id:
+        # 如果用户已登录，获取用户报告（包含关注标记）
+        page_reports = analysis_service.get_user_reports(user_id, limit=per_page, offset=offset, **filters)
+    else:
+        # 如果用户未登录，获取所有报告
+        page_reports = analysis_service.get_all_reports(limit=per_page, offset=offset, **filters)
     
     # 格式化报告数据以匹配模板期望的结构
-    formatted_reports = []
-    available_stocks = set()  # 用于收集可用的股票
-    
-    for report in all_reports:
+    paginated_reports = []
+    for report in page_reports:
         # 转换时间戳
         metadata = report.get('metadata', {})
         if metadata and 'timestamp' in metadata:
             metadata['timestamp'] = convert_to_beijing_time(metadata['timestamp'])
         
-        # 收集可用的股票
-        stock_code = report.get('stock_code', '')
-        stock_name = report.get('stock_name', '')
-        if stock_code and stock_name:
-            available_stocks.add((stock_code, stock_name))
-        
         # 转换created_at时间戳
         created_at = report.get('created_at', report.get('date', ''))
         if created_at:
@@ -128,22 +126,10 @@ def index():
             'report_id': report.get('report_id', ''),
             'metadata': metadata
         }
-        formatted_reports.append(formatted_report)
-    
-    # 转换为模板需要的格式
-    available_stocks_list = [{'code': code, 'name': name} for code, name in sorted(available_stocks)]
-    
-    # 分页处理
-    total_reports = len(formatted_reports)
-    total_pages = (total_reports + per_page - 1) // per_page
-    
-    # 确保页码在有效范围内
-    page = max(1, min(page, total_pages)) if total_pages > 0 else 1
+        paginated_reports.append(formatted_report)
     
-    # 计算分页切片
-    start_idx = (page - 1) * per_page
-    end_idx = start_idx + per_page
-    paginated_reports = formatted_reports[start_idx:end_idx]
+    # 可选股票列表
+    available_stocks_list = analysis_service.get_report_stocks()
     
     # 构建分页信息
     pagination = {
@@ -218,74 +204,14 @@ def detail(stock_code):
     # 获取数据库中的报告ID（用于统计功能）
     db_report_id = None
     try:
-        from app.models.analysis import ReportIndex
-        from app.models.stock import Stock
-        
-        # 获取股票信息
-        stock = Stock.query.filter_by(code=stock_code).first()
-        if stock:
-            # 根据report_id构建文件路径来查找对应的数据库记录
-            original_report_id = report.get('report_id', '')
-            if original_report_id:
-                # 构建可能的文件路径
-                analysis_date = report.get('analysis_date', '')
-                provider = report.get('provider', 'deepseek')
-                analysis_type = report.get('analysis_type', 'fundamental')
-                
-                # 尝试不同的文件路径格式
-                possible_paths = [
-                    f"data/reports/{analysis_date}/{original_report_id}_{provider}_{analysis_type}.json",
-                    f"data/reports/{analysis_date}/{original_report_id}.json",
-                    f"data/reports/{stock_code}_{original_report_id}_{provider}_{analysis_type}.json",
-                    f"data/reports/{stock_code}_{original_report_id}.json"
-                ]
-                
-                # 如果report_id包含时间戳，尝试构建完整的文件名
-                if '_' in original_report_id:
-                    # 从report_id中提取时间戳部分
-                    parts = original_report_id.split('_')
-                    if len(parts) >= 2:
-                        timestamp_part = '_'.join(parts[1:])  # 取时间戳部分
-                        possible_paths.insert(0, f"data/reports/{analysis_date}/{stock_code}_{timestamp_part}_{provider}_{analysis_type}.json")
-                
-                print(f"查找报告ID: {original_report_id}, 股票: {stock_code}")
-                for file_path in possible_paths:
-                    print(f"尝试文件路径: {file_path}")
-                    db_report = ReportIndex.query.filter_by(
-                        stock_id=stock.id,
-                        file_path=file_path
-                    ).first()
-                    if db_report:
-                        db_report_id = db_report.id
-                        print(f"找到数据库报告ID: {db_report_id}, 文件路径: {file_path}")
-                        break
-                
-                # 如果还是没找到，尝试根据analysis_date查找（兼容旧逻辑）
-                if not db_report_id:
-                    print(f"按文件路径未找到，尝试按日期查找: {analysis_date}")
-                    db_report = ReportIndex.query.filter_by(
-                        stock_id=stock.id,
-                        analysis_date=analysis_date
-                    ).first()
-                    if db_report:
-                        db_report_id = db_report.id
-                        print(f"数据库报告ID: {db_report_id} (按日期查找)")
-                
-                # 如果仍然没有找到，使用该股票同一天的任何记录用于统计
-                if not db_report_id:
-                    print(f"未找到数据库记录，使用同一天的其他记录用于统计")
-                    # 查找该股票同一天的任何记录
-                    any_report = ReportIndex.query.filter_by(
-                        stock_id=stock.id,
-                        analysis_date=analysis_date
-                    ).first()
-                    if any_report:
-                        db_report_id = any_report.id
-                        print(f"使用同一天的其他记录ID: {db_report_id}")
-                    else:
-                        print(f"该股票当天没有任何数据库记录，跳过统计功能")
-        else:
-            print(f"未找到股票: {stock_code}")
+        original_report_id = report.get('report_id', '')
+        if original_report_id:
+            db_report = analysis_service.report_repo.get_by_report_id(original_report_id)
+            if db_report:
+                db_report_id = db_report.id
+                print(f"找到数据库报告ID: {db_report_id}, 文件路径: {db_report.file_path}")
+            else:
+                print(f"该报告没有数据库记录，跳过统计功能")
     except Exception as e:
         print(f"获取数据库报告ID失败: {e}")
     
@@ -306,7 +232,8 @@ def detail(stock_code):
     # 获取同一公司的历史报告（排除当前报告）
     historical_reports = []
     try:
-        all_reports = analysis_service.get_all_reports_for_stock(stock_code)
+        # 最多需要5个历史报告，多取一个用于排除当前报告
+        all_reports = analysis_service.get_all_reports_for_stock(stock_code, limit=6)
         current_report_id = report.get('report_id', '')
         
         for hist_report in all_reports:
@@ -0,0 +1,47 @@
+"""Add report catalog fields to report_index
+
+Revision ID: 7c1e4a9b2d10
+Revises: 64054ef57582
+Create Date: 2025-09-20 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e4a9b2d10'
+down_revision = '64054ef57582'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('report_index', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('report_id', sa.String(length=100), nullable=True, comment='报告ID，格式: 股票代码_时间戳'))
+        batch_op.add_column(sa.Column('stock_code', sa.String(length=20), nullable=True, comment='股票代码'))
+        batch_op.add_column(sa.Column('stock_name', sa.String(length=200), nullable=True, comment='股票名称'))
+        batch_op.add_column(sa.Column('provider', sa.String(length=50), nullable=True, comment='AI提供商'))
+        batch_op.add_column(sa.Column('ai_model', sa.String(length=100), nullable=True, comment='AI模型'))
+        batch_op.add_column(sa.Column('analysis_type', sa.String(length=50), nullable=True, comment='分析类型 fundamental/technical'))
+        batch_op.create_index(batch_op.f('ix_report_index_report_id'), ['report_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_report_index_stock_code'), ['stock_code'], unique=False)
+
+    # 已有记录先回填股票代码和名称，其余字段由 scripts/register_existing_reports.py 从报告文件补齐
+    op.execute(
+        "UPDATE report_index SET "
+        "stock_code = (SELECT stocks.code FROM stocks WHERE stocks.id = report_index.stock_id), "
+        "stock_name = (SELECT stocks.name FROM stocks WHERE stocks.id = report_index.stock_id)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('report_index', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_report_index_stock_code'))
+        batch_op.drop_index(batch_op.f('ix_report_index_report_id'))
+        batch_op.drop_column('analysis_type')
+        batch_op.drop_column('ai_model')
+        batch_op.drop_column('provider')
+        batch_op.drop_column('stock_name')
+        batch_op.drop_column('stock_code')
+        batch_op.drop_column('report_id')
@@ -0,0 +1,32 @@
+"""Add composite indexes for report listing
+
+Revision ID: 9d2f3b6c8e41
+Revises: 7c1e4a9b2d10
+Create Date: 2025-09-21 09:30:12.540177
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2f3b6c8e41'
+down_revision = '7c1e4a9b2d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('report_index', schema=None) as batch_op:
+        batch_op.create_index('ix_report_index_generated_at_id', ['generated_at', 'id'], unique=False)
+        batch_op.create_index('ix_report_index_stock_code_generated_at', ['stock_code', 'generated_at'], unique=False)
+        batch_op.create_index('ix_report_index_provider_generated_at', ['provider', 'generated_at'], unique=False)
+        batch_op.create_index('ix_report_index_analysis_type_generated_at', ['analysis_type', 'generated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('report_index', schema=None) as batch_op:
+        batch_op.drop_index('ix_report_index_analysis_type_generated_at')
+        batch_op.drop_index('ix_report_index_provider_generated_at')
+        batch_op.drop_index('ix_report_index_stock_code_generated_at')
+        batch_op.drop_index('ix_report_index_generated_at_id')
@@ -0,0 +1,40 @@
+"""Add report_counters table
+
+Revision ID: b4e8a1c37f52
+Revises: 9d2f3b6c8e41
+Create Date: 2025-09-21 15:02:47.913356
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e8a1c37f52'
+down_revision = '9d2f3b6c8e41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('report_counters',
+    sa.Column('stock_code', sa.String(length=20), nullable=False, comment='股票代码，* 表示全局'),
+    sa.Column('report_count', sa.Integer(), nullable=False, comment='报告数量'),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('stock_code')
+    )
+
+    # 从报告索引一次聚合回填计数
+    op.execute(
+        "INSERT INTO report_counters (stock_code, report_count, updated_at) "
+        "SELECT stock_code, COUNT(id), CURRENT_TIMESTAMP FROM report_index "
+        "WHERE report_id IS NOT NULL AND stock_code IS NOT NULL GROUP BY stock_code"
+    )
+    op.execute(
+        "INSERT INTO report_counters (stock_code, report_count, updated_at) "
+        "SELECT '*', COUNT(id), CURRENT_TIMESTAMP FROM report_index WHERE report_id IS NOT NULL"
+    )
+
+
+def downgrade():
+    op.drop_table('report_counters')
@@ -0,0 +1,78 @@
+"""Add task_records and task_stock_status tables
+
+Revision ID: c7a2e95d1f03
+Revises: b4e8a1c37f52
+Create Date: 2025-09-22 11:18:05.662841
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7a2e95d1f03'
+down_revision = 'b4e8a1c37f52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('task_records',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('task_id', sa.String(length=100), nullable=False, comment='任务ID'),
+    sa.Column('task_type', sa.String(length=20), nullable=False, comment='任务类型 single/batch'),
+    sa.Column('user_id', sa.BigInteger(), nullable=False, comment='用户ID'),
+    sa.Column('user_email', sa.String(length=255), nullable=True, comment='用户邮箱'),
+    sa.Column('stock_code', sa.String(length=20), nullable=True, comment='股票代码（单个分析任务）'),
+    sa.Column('stocks', sa.JSON(), nullable=True, comment='股票列表（批量分析任务）'),
+    sa.Column('analysis_type', sa.String(length=50), nullable=True, comment='分析类型'),
+    sa.Column('ai_provider', sa.String(length=50), nullable=True, comment='AI提供商'),
+    sa.Column('ai_model', sa.String(length=100), nullable=True, comment='AI模型'),
+    sa.Column('prompt_id', sa.Integer(), nullable=True, comment='提示词ID'),
+    sa.Column('status', sa.String(length=20), nullable=False, comment='pending/running/paused/completed/failed/stopped'),
+    sa.Column('total_count', sa.Integer(), nullable=True, comment='股票总数'),
+    sa.Column('completed_count', sa.Integer(), nullable=True, comment='成功数量'),
+    sa.Column('failed_count', sa.Integer(), nullable=True, comment='失败数量'),
+    sa.Column('progress', sa.Float(), nullable=True, comment='进度百分比'),
+    sa.Column('retry_count', sa.Integer(), nullable=True, comment='重试次数'),
+    sa.Column('max_retries', sa.Integer(), nullable=True, comment='最大重试次数'),
+    sa.Column('retry_history', sa.JSON(), nullable=True, comment='重试历史'),
+    sa.Column('error', sa.Text(), nullable=True, comment='错误信息'),
+    sa.Column('final_error', sa.Text(), nullable=True, comment='最终错误信息'),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('paused_at', sa.DateTime(), nullable=True),
+    sa.Column('resumed_at', sa.DateTime(), nullable=True),
+    sa.Column('stopped_at', sa.DateTime(), nullable=True),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.Column('failed_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('task_id')
+    )
+    with op.batch_alter_table('task_records', schema=None) as batch_op:
+        batch_op.create_index('ix_task_records_user_id_created_at', ['user_id', 'created_at'], unique=False)
+        batch_op.create_index('ix_task_records_status_created_at', ['status', 'created_at'], unique=False)
+
+    op.create_table('task_stock_status',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('task_id', sa.String(length=100), nullable=False),
+    sa.Column('stock_code', sa.String(length=20), nullable=False, comment='股票代码'),
+    sa.Column('status', sa.String(length=20), nullable=False, comment='completed/failed'),
+    sa.Column('retry_count', sa.Integer(), nullable=True, comment='重试次数'),
+    sa.Column('error', sa.Text(), nullable=True, comment='错误信息'),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.Column('failed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['task_id'], ['task_records.task_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('task_id', 'stock_code')
+    )
+
+
+def downgrade():
+    op.drop_table('task_stock_status')
+    with op.batch_alter_table('task_records', schema=None) as batch_op:
+        batch_op.drop_index('ix_task_records_status_created_at')
+        batch_op.drop_index('ix_task_records_user_id_created_at')
+
+    op.drop_table('task_records')
@@ -0,0 +1,44 @@
+"""Add coin charge flag and execution lease to task_records
+
+Revision ID: d3f6b8a2c914
+Revises: c7a2e95d1f03
+Create Date: 2025-09-23 10:41:27.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f6b8a2c914'
+down_revision = 'c7a2e95d1f03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('task_records', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('coins_charged', sa.Boolean(), server_default=sa.false(), nullable=False, comment='是否已扣除金币'))
+        batch_op.add_column(sa.Column('lease_owner', sa.String(length=100), nullable=True, comment='执行任务的进程标识'))
+        batch_op.add_column(sa.Column('lease_expires_at', sa.DateTime(), nullable=True, comment='执行租约过期时间'))
+
+    # 已开始执行的批量任务在启动时已经扣过金币
+    task_records = sa.table(
+        'task_records',
+        sa.column('task_type', sa.String),
+        sa.column('status', sa.String),
+        sa.column('coins_charged', sa.Boolean)
+    )
+    op.execute(
+        task_records.update()
+        .where(task_records.c.task_type == 'batch')
+        .where(task_records.c.status != 'pending')
+        .values(coins_charged=True)
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('task_records', schema=None) as batch_op:
+        batch_op.drop_column('lease_expires_at')
+        batch_op.drop_column('lease_owner')
+        batch_op.drop_column('coins_charged')
@@ -0,0 +1,30 @@
+"""Add task id and partial flag to report_index
+
+Revision ID: e5a9c2d7b318
+Revises: d3f6b8a2c914
+Create Date: 2025-09-24 09:18:52.604117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a9c2d7b318'
+down_revision = 'd3f6b8a2c914'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('report_index', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('task_id', sa.String(length=100), nullable=True, comment='生成报告的分析任务ID'))
+        batch_op.add_column(sa.Column('is_partial', sa.Boolean(), server_default=sa.false(), nullable=False, comment='是否为生成中断后保存的部分报告'))
+        batch_op.create_index(batch_op.f('ix_report_index_task_id'), ['task_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('report_index', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_report_index_task_id'))
+        batch_op.drop_column('is_partial')
+        batch_op.drop_column('task_id')
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+报告详情查询基准测试
+在临时目录中逐步扩充报告数量（默认 1k -> 10k -> 100k），
+测量按 report_id 获取报告的耗时，验证详情页延迟不随报告总量增长
+
+用法: python scripts/benchmark_report_lookup.py [数量1 数量2 ...]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models.analysis import ReportIndex
+from app.models.stock import Stock
+from app.services.ai.analysis_service import AnalysisService
+from app.services.data.report_storage import ReportStorage, REPORT_EXTENSION
+
+STOCK_COUNT = 100
+LOOKUPS_PER_ROUND = 200
+
+
+def _grow_corpus(stocks, start: int, end: int, base_time: datetime):
+    """生成报告文件并登记到报告索引"""
+    rows = []
+    storage = ReportStorage()
+    for i in range(start, end):
+        stock = stocks[i % len(stocks)]
+        created = base_time + timedelta(seconds=i)
+        date_str = created.strftime('%Y-%m-%d')
+        timestamp = f"{created.strftime('%H%M%S')}_{i:06d}"
+        report_id = f"{stock.code}_{timestamp}"
+
+        date_dir = os.path.join('data/reports', date_str)
+        os.makedirs(date_dir, exist_ok=True)
+        report_file = os.path.join(date_dir, f"{report_id}_qwen_fundamental{REPORT_EXTENSION}")
+        storage.write_report(report_file, {
+            'report_id': report_id,
+            'stock_code': stock.code,
+            'stock_name': stock.name,
+            'analysis_date': date_str,
+            'content': f"# {stock.name} 分析报告 {i}",
+            'provider': 'qwen',
+            'analysis_type': 'fundamental',
+            'created_at': created.isoformat() + 'Z'
+        })
+
+        rows.append({
+            'stock_id': stock.id,
+            'analysis_date': created.date(),
+            'file_path': report_file,
+            'summary': f"# {stock.name} 分析报告 {i}",
+            'generated_at': created,
+            'report_id': report_id,
+            'stock_code': stock.code,
+            'stock_name': stock.name,
+            'provider': 'qwen',
+            'analysis_type': 'fundamental'
+        })
+
+    db.session.bulk_insert_mappings(ReportIndex, rows)
+    db.session.commit()
+    return [row['report_id'] for row in rows]
+
+
+def run_benchmark(sizes):
+    """运行基准测试"""
+    work_dir = tempfile.mkdtemp(prefix='report_lookup_bench_')
+    os.chdir(work_dir)
+    print(f"工作目录: {work_dir}")
+
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        stocks = [Stock(code=f"S{i:04d}", name=f"测试股票{i}", market='US') for i in range(STOCK_COUNT)]
+        db.session.add_all(stocks)
+        db.session.commit()
+
+        service = AnalysisService(db.session)
+        base_time = datetime(2025, 1, 1)
+        report_ids = []
+
+        print(f"\n{'报告数量':>10} | {'p50(ms)':>8} | {'p95(ms)':>8} | {'max(ms)':>8}")
+        print("-" * 46)
+
+        for size in sorted(sizes):
+            if size > len(report_ids):
+                report_ids.extend(_grow_corpus(stocks, len(report_ids), size, base_time))
+
+            samples = []
+            for report_id in random.sample(report_ids, min(LOOKUPS_PER_ROUND, len(report_ids))):
+                stock_code = report_id.split('_')[0]
+                start = time.perf_counter()
+                report = service.get_analysis_report(stock_code, '', report_id)
+                samples.append((time.perf_counter() - start) * 1000)
+                assert report and report['report_id'] == report_id
+
+            samples.sort()
+            p95 = samples[int(len(samples) * 0.95) - 1]
+            print(f"{size:>10} | {statistics.median(samples):>8.3f} | {p95:>8.3f} | {samples[-1]:>8.3f}")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    run_benchmark(sizes)
@@ -14,6 +14,7 @@ def clear_data():
     # 清理目录
     dirs_to_clear = [
         'data/reports',
+        'data/report_prompts',
         'data/usage', 
         'data/exports',
         'data/logs',
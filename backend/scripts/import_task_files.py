@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+导入旧任务文件
+将 data/reports/*.task.json 导入任务记录表，导入成功后删除原文件。
+已存在的任务会被跳过，脚本可重复执行。
+
+用法: python scripts/import_task_files.py [--keep-files]
+"""
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models.analysis import TaskRecord, TaskStockStatus
+
+TIME_FIELDS = ('created_at', 'started_at', 'paused_at', 'resumed_at', 'stopped_at',
+               'completed_at', 'failed_at', 'updated_at')
+
+
+def _parse_time(value):
+    """解析任务文件中的ISO时间"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.rstrip('Z'))
+    except ValueError:
+        return None
+
+
+def _build_record(task_data):
+    """根据任务文件内容构建任务记录"""
+    task_id = task_data['task_id']
+    record = TaskRecord(
+        task_id=task_id,
+        task_type='single' if task_id.startswith('single_') else 'batch',
+        user_id=task_data.get('user_id'),
+        user_email=task_data.get('user_email'),
+        stock_code=task_data.get('stock_code'),
+        stocks=task_data.get('stocks'),
+        analysis_type=task_data.get('analysis_type'),
+        ai_provider=task_data.get('ai_provider'),
+        ai_model=task_data.get('ai_model'),
+        prompt_id=task_data.get('prompt_id'),
+        status=task_data.get('status', 'pending'),
+        total_count=task_data.get('total_count', 0),
+        completed_count=task_data.get('completed_count', 0),
+        failed_count=task_data.get('failed_count', 0),
+        progress=task_data.get('progress', 0),
+        retry_count=task_data.get('retry_count', 0),
+        max_retries=task_data.get('max_retries', 5),
+        retry_history=task_data.get('retry_history', []),
+        error=task_data.get('error'),
+        final_error=task_data.get('final_error'),
+        # 已开始执行的批量任务在启动时已经扣过金币，恢复执行时不再重复扣除
+        coins_charged=task_id.startswith('batch_') and task_data.get('status', 'pending') != 'pending'
+    )
+    for field in TIME_FIELDS:
+        setattr(record, field, _parse_time(task_data.get(field)))
+    if not record.created_at:
+        record.created_at = datetime.utcnow()
+
+    for stock_code, info in (task_data.get('stock_status') or {}).items():
+        record.stock_statuses.append(TaskStockStatus(
+            stock_code=stock_code,
+            status=info.get('status', 'failed'),
+            retry_count=info.get('retry_count', 0),
+            error=info.get('error'),
+            completed_at=_parse_time(info.get('completed_at')),
+            failed_at=_parse_time(info.get('failed_at'))
+        ))
+    return record
+
+
+def import_task_files(keep_files: bool = False):
+    """导入旧任务文件"""
+    app = create_app()
+
+    with app.app_context():
+        reports_dir = 'data/reports'
+        imported_count = 0
+        skipped_count = 0
+        error_count = 0
+
+        if not os.path.exists(reports_dir):
+            print(f"报告目录不存在: {reports_dir}")
+            return
+
+        for filename in sorted(os.listdir(reports_dir)):
+            if not filename.endswith('.task.json'):
+                continue
+
+            task_file = os.path.join(reports_dir, filename)
+            try:
+                with open(task_file, 'r', encoding='utf-8') as f:
+                    task_data = json.load(f)
+
+                if TaskRecord.query.filter_by(task_id=task_data['task_id']).first():
+                    print(f"  跳过：任务已存在 {task_data['task_id']}")
+                    skipped_count += 1
+                else:
+                    db.session.add(_build_record(task_data))
+                    db.session.commit()
+                    imported_count += 1
+                    print(f"  ✅ 导入任务: {task_data['task_id']}")
+
+                if not keep_files:
+                    os.remove(task_file)
+
+            except Exception as e:
+                db.session.rollback()
+                print(f"  ❌ 导入失败: {filename}, {str(e)}")
+                error_count += 1
+
+        print(f"\n📊 导入完成:")
+        print(f"   导入: {imported_count} 个任务")
+        print(f"   跳过: {skipped_count} 个任务")
+        print(f"   失败: {error_count} 个任务")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='导入旧任务文件到任务记录表')
+    parser.add_argument('--keep-files', action='store_true', help='导入后保留原任务文件')
+    args = parser.parse_args()
+    import_task_files(keep_files=args.keep_files)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+报告文件格式迁移脚本
+将 data/reports 下旧的 JSON 报告文件转换为"元数据头+正文"格式（.report），
+完整提示词按内容去重后单独存储，并同步更新报告索引中的文件路径。
+脚本可重复执行，已迁移的文件会被跳过。
+
+用法: python scripts/migrate_report_format.py [--dry-run]
+"""
+import os
+import sys
+import argparse
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models.analysis import ReportIndex
+from app.services.data.report_storage import ReportStorage, REPORT_EXTENSION, LEGACY_EXTENSION, is_report_file
+
+
+def migrate_report_format(dry_run: bool = False):
+    """迁移报告文件格式"""
+    app = create_app()
+
+    with app.app_context():
+        reports_dir = 'data/reports'
+        report_storage = ReportStorage()
+        migrated_count = 0
+        skipped_count = 0
+        error_count = 0
+        saved_bytes = 0
+
+        if not os.path.exists(reports_dir):
+            print(f"报告目录不存在: {reports_dir}")
+            return
+
+        for date_dir in sorted(os.listdir(reports_dir)):
+            date_path = os.path.join(reports_dir, date_dir)
+            if not os.path.isdir(date_path):
+                continue
+
+            print(f"处理日期目录: {date_dir}")
+
+            for filename in sorted(os.listdir(date_path)):
+                if not is_report_file(filename) or not filename.endswith(LEGACY_EXTENSION):
+                    continue
+
+                old_file = os.path.join(date_path, filename)
+                new_file = old_file[:-len(LEGACY_EXTENSION)] + REPORT_EXTENSION
+
+                try:
+                    report_data = report_storage.read_report(old_file)
+                    old_size = os.path.getsize(old_file)
+
+                    if dry_run:
+                        print(f"  [dry-run] {filename} -> {os.path.basename(new_file)}")
+                        migrated_count += 1
+                        continue
+
+                    if os.path.exists(new_file):
+                        # 上次迁移已写出新文件但未清理旧文件
+                        print(f"  跳过：新格式文件已存在 {os.path.basename(new_file)}")
+                        skipped_count += 1
+                    else:
+                        report_storage.write_report(new_file, report_data)
+                        saved_bytes += old_size - os.path.getsize(new_file)
+                        migrated_count += 1
+                        print(f"  ✅ {filename} -> {os.path.basename(new_file)}")
+
+                    # 更新报告索引中的文件路径
+                    ReportIndex.query.filter_by(file_path=old_file).update(
+                        {'file_path': new_file}, synchronize_session=False
+                    )
+                    db.session.commit()
+                    os.remove(old_file)
+
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"  ❌ 迁移失败: {filename}, {str(e)}")
+                    error_count += 1
+
+        print(f"\n📊 迁移完成:")
+        print(f"   迁移: {migrated_count} 个报告")
+        print(f"   跳过: {skipped_count} 个报告")
+        print(f"   失败: {error_count} 个报告")
+        if not dry_run:
+            print(f"   节省空间: {saved_bytes / 1024:.1f} KB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='迁移报告文件格式')
+    parser.add_argument('--dry-run', action='store_true', help='只列出待迁移的文件，不做修改')
+    args = parser.parse_args()
+    migrate_report_format(dry_run=args.dry_run)
@@ -4,7 +4,6 @@
 """
 import os
 import sys
-import json
 from datetime import datetime
 
 # 添加项目根目录到Python路径
@@ -13,6 +12,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app import create_app, db
 from app.models.analysis import ReportIndex, ReportStatistics, ReportViewLog, ReportDownloadLog
 from app.models.stock import Stock
+from app.repositories.report_repository import ReportCounterRepository
+from app.services.data.report_storage import ReportStorage, is_report_file
 
 def recreate_report_index():
     """重新创建报告索引表"""
@@ -31,6 +32,7 @@ def recreate_report_index():
         print("现有数据已清空")
         
         reports_dir = 'data/reports'
+        report_storage = ReportStorage()
         registered_count = 0
         error_count = 0
         
@@ -48,7 +50,7 @@ def recreate_report_index():
             
             # 遍历该日期目录下的所有报告文件
             for filename in os.listdir(date_path):
-                if not filename.endswith('.json'):
+                if not is_report_file(filename):
                     continue
                 
                 report_file = os.path.join(date_path, filename)
@@ -56,8 +58,7 @@ def recreate_report_index():
                 
                 try:
                     # 读取报告文件
-                    with open(report_file, 'r', encoding='utf-8') as f:
-                        report_data = json.load(f)
+                    report_data = report_storage.read_report(report_file)
                     
                     # 获取股票代码
                     stock_code = report_data.get('stock_code', '')
@@ -83,12 +84,19 @@ def recreate_report_index():
                         analysis_date = analysis_date_str
                     
                     # 创建报告索引记录
+                    created_at = report_data.get('created_at')
                     report_index = ReportIndex(
                         stock_id=stock.id,
                         analysis_date=analysis_date,
                         file_path=report_file,
                         summary=report_data.get('content', '')[:500] if report_data.get('content') else '',
-                        generated_at=datetime.utcnow()
+                        generated_at=datetime.fromisoformat(created_at.rstrip('Z')) if created_at else datetime.utcnow(),
+                        report_id=report_data.get('report_id') or os.path.splitext(filename)[0],
+                        stock_code=stock.code,
+                        stock_name=report_data.get('stock_name') or stock.name,
+                        provider=report_data.get('provider'),
+                        ai_model=report_data.get('ai_model'),
+                        analysis_type=report_data.get('analysis_type', 'fundamental')
                     )
                     
                     db.session.add(report_index)
@@ -102,6 +110,9 @@ def recreate_report_index():
                     error_count += 1
                     db.session.rollback()
         
+        # 重建报告计数
+        ReportCounterRepository(db.session).rebuild()
+        
         print(f"\n重新创建完成！")
         print(f"成功注册: {registered_count} 个报告")
         print(f"错误: {error_count} 个报告")
@@ -4,7 +4,6 @@
 """
 import os
 import sys
-import json
 from datetime import datetime
 
 # 添加项目根目录到Python路径
@@ -13,6 +12,22 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app import create_app, db
 from app.models.analysis import ReportIndex
 from app.models.stock import Stock
+from app.repositories.report_repository import ReportCounterRepository
+from app.services.data.report_storage import ReportStorage, is_report_file
+
+def _fill_catalog_fields(report_index, report_data, stock):
+    """根据报告文件内容填充报告目录字段"""
+    created_at = report_data.get('created_at')
+    report_index.generated_at = datetime.fromisoformat(created_at.rstrip('Z')) if created_at else datetime.utcnow()
+    report_index.report_id = report_data.get('report_id') or os.path.splitext(os.path.basename(report_index.file_path))[0]
+    report_index.stock_code = stock.code
+    report_index.stock_name = report_data.get('stock_name') or stock.name
+    report_index.provider = report_data.get('provider')
+    report_index.ai_model = report_data.get('ai_model')
+    report_index.analysis_type = report_data.get('analysis_type', 'fundamental')
+    report_index.task_id = report_data.get('task_id')
+    report_index.is_partial = bool(report_data.get('partial'))
+
 
 def register_existing_reports():
     """将现有的报告文件注册到数据库"""
@@ -20,6 +35,7 @@ def register_existing_reports():
     
     with app.app_context():
         reports_dir = 'data/reports'
+        report_storage = ReportStorage()
         registered_count = 0
         skipped_count = 0
         error_count = 0
@@ -40,7 +56,7 @@ def register_existing_reports():
             
             # 遍历该日期目录下的所有报告文件
             for filename in os.listdir(date_path):
-                if not filename.endswith('.json'):
+                if not is_report_file(filename):
                     continue
                 
                 report_file = os.path.join(date_path, filename)
@@ -48,8 +64,7 @@ def register_existing_reports():
                 
                 try:
                     # 读取报告文件
-                    with open(report_file, 'r', encoding='utf-8') as f:
-                        report_data = json.load(f)
+                    report_data = report_storage.read_report(report_file)
                     
                     # 获取股票代码
                     stock_code = report_data.get('stock_code', '')
@@ -72,8 +87,15 @@ def register_existing_reports():
                     ).first()
                     
                     if existing_report:
-                        print(f"    跳过：已存在数据库记录")
-                        skipped_count += 1
+                        if existing_report.report_id:
+                            print(f"    跳过：已存在数据库记录")
+                            skipped_count += 1
+                        else:
+                            # 旧记录缺少报告目录字段，从报告文件补齐
+                            _fill_catalog_fields(existing_report, report_data, stock)
+                            db.session.commit()
+                            print(f"    ✅ 补齐报告目录字段：{stock_code}")
+                            registered_count += 1
                         continue
                     
                     # 处理分析日期
@@ -92,9 +114,9 @@ def register_existing_reports():
                         stock_id=stock.id,
                         analysis_date=analysis_date,
                         file_path=report_file,
-                        summary=report_data.get('content', '')[:500] if report_data.get('content') else '',
-                        generated_at=datetime.utcnow()
+                        summary=report_data.get('content', '')[:500] if report_data.get('content') else ''
                     )
+                    _fill_catalog_fields(report_index, report_data, stock)
                     
                     db.session.add(report_index)
                     db.session.commit()
@@ -107,6 +129,9 @@ def register_existing_reports():
                     error_count += 1
                     db.session.rollback()
         
+        # 重建报告计数
+        ReportCounterRepository(db.session).rebuild()
+        
         print(f"\n注册完成！")
         print(f"成功注册: {registered_count} 个报告")
         print(f"跳过: {skipped_count} 个报告")
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+异步Provider测试
+验证批量异步生成在一个事件循环中并发进行，同步接口通过后台事件循环复用同一实现
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.services.ai.async_runner import AnalysisJob, AsyncBatchRunner
+from app.services.ai.llm_provider import DeepSeekProvider, ErrorType
+
+RESPONSE_DELAY = 0.3
+
+
+class _SlowChatHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        time.sleep(RESPONSE_DELAY)
+        prompt = request['messages'][0]['content']
+        if 'FAIL' in prompt:
+            self.send_response(401)
+            body = b'{"error": "unauthorized"}'
+        else:
+            self.send_response(200)
+            body = json.dumps({
+                'choices': [{'message': {'content': f'report: {prompt}'}, 'finish_reason': 'stop'}],
+                'usage': {'total_tokens': 10}
+            }).encode()
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    request_queue_size = 64
+
+
+@pytest.fixture
+def provider():
+    httpd = _Server(('127.0.0.1', 0), _SlowChatHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    provider = DeepSeekProvider({
+        'name': 'deepseek', 'api_key': 'k', 'model': 'deepseek-reasoner',
+        'retry_config': {'max_retries': 0}, 'http_pool_config': {'pool_size': 32}
+    })
+    provider.api_url = f"http://127.0.0.1:{httpd.server_address[1]}/v1/chat/completions"
+    yield provider
+    httpd.shutdown()
+
+
+def test_batch_runner_keeps_generations_in_flight(provider, monkeypatch):
+    """多项生成同时进行，总耗时接近单次请求而不是逐个累加"""
+    # 异步路径不经过线程中的同步请求
+    monkeypatch.setattr(DeepSeekProvider, '_make_api_request',
+                        lambda *args: pytest.fail('不应调用同步请求'))
+    jobs = [AnalysisJob(provider, 'analyze ${code}', {'code': f'S{i}'}) for i in range(20)]
+    jobs.append(AnalysisJob(provider, 'FAIL ${code}', {'code': 'BAD'}))
+    completed = []
+
+    start = time.time()
+    results = AsyncBatchRunner(max_in_flight=32).run_sync(jobs, on_result=lambda i, r: completed.append(i))
+    elapsed = time.time() - start
+
+    assert elapsed < RESPONSE_DELAY * 5
+    assert sorted(completed) == list(range(21))
+    assert [r.content for r in results[:20]] == [f'report: analyze S{i}' for i in range(20)]
+    assert results[20].success is False
+    assert results[20].error_type == ErrorType.AUTHENTICATION_ERROR
+
+
+def test_sync_generate_analysis_wraps_async(provider):
+    """同步接口返回与异步接口相同的结果"""
+    result = provider.generate_analysis('analyze ${code}', {'code': 'AAPL'})
+    assert result.success
+    assert result.content == 'report: analyze AAPL'
+    assert result.metadata['connection']['endpoint'].startswith('http://127.0.0.1')
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI提供商熔断测试
+验证连续失败后熔断、半开探测恢复，以及熔断时分析切换到下一个激活的提供商
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+
+import pytest
+
+from app import create_app, db
+from app.models.ai_config import AIConfig
+from app.services.ai.ai_config_service import AIConfigService
+from app.services.ai.analysis_service import AnalysisService
+from app.services.ai.circuit_breaker import ProviderCircuitBreaker
+from app.services.ai.llm_provider import (AnalysisResult, DeepSeekProvider, ErrorType, GeminiProvider,
+                                          LLMProviderFactory)
+from app.services.ai.provider_pacer import ProviderPacer
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    monkeypatch.setattr(ProviderCircuitBreaker, '_instance', None)
+    breaker = ProviderCircuitBreaker()
+    monkeypatch.setattr('app.services.ai.circuit_breaker.circuit_breaker', breaker)
+    monkeypatch.setattr('app.services.ai.llm_provider.circuit_breaker', breaker)
+    monkeypatch.setattr('app.services.ai.ai_config_service.circuit_breaker', breaker)
+    return breaker
+
+
+def test_breaker_opens_and_recovers(breaker):
+    """连续失败达到阈值后熔断，熔断结束后只放行一个探测请求"""
+    breaker.configure(failure_threshold=2, reset_seconds=0.2)
+
+    breaker.record_result('qwen', False, 'network_error')
+    breaker.record_result('qwen', False, 'parse_error')  # 单次请求问题不计入
+    assert breaker.allow_request('qwen')
+    breaker.record_result('qwen', False, 'timeout_error')
+    assert breaker.is_open('qwen')
+    assert not breaker.allow_request('qwen')
+    assert breaker.get_state('qwen')['state'] == 'open'
+
+    time.sleep(0.25)
+    assert breaker.allow_request('qwen')
+    assert not breaker.allow_request('qwen')
+    breaker.record_result('qwen', True)
+    assert breaker.get_state('qwen')['state'] == 'closed'
+    assert breaker.get_state('qwen')['open_count'] == 1
+
+    # 被取消的探测请求不计入失败，只释放探测名额
+    breaker.record_result('qwen', False, 'network_error')
+    breaker.record_result('qwen', False, 'network_error')
+    time.sleep(0.25)
+    assert breaker.allow_request('qwen')
+    breaker.release_probe('qwen')
+    assert breaker.allow_request('qwen')
+    assert breaker.get_state('qwen')['open_count'] == 2
+
+
+def test_analysis_fails_over_when_provider_is_open(breaker, tmp_path, monkeypatch):
+    """熔断后不再重试原提供商，切换到下一个激活的提供商"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(LLMProviderFactory, '_provider_cache', {})
+    monkeypatch.setattr(ProviderPacer, '_instance', None)
+    pacer = ProviderPacer()
+    pacer.configure(min_interval={}, default_min_interval=0)
+    monkeypatch.setattr('app.services.ai.provider_pacer.provider_pacer', pacer)
+    breaker.configure(failure_threshold=2, reset_seconds=60)
+
+    calls = {'deepseek': 0, 'gemini': 0}
+
+    async def deepseek_down(self, prompt, stock_info):
+        calls['deepseek'] += 1
+        return AnalysisResult(success=False, error='Connection error', error_type=ErrorType.NETWORK_ERROR,
+                              provider='deepseek', model=self.model)
+
+    async def gemini_up(self, prompt, stock_info):
+        calls['gemini'] += 1
+        return AnalysisResult(success=True, content='report', provider='gemini', model=self.model_name)
+
+    monkeypatch.setattr(DeepSeekProvider, '_amake_api_request', deepseek_down)
+    monkeypatch.setattr(GeminiProvider, '_amake_api_request', gemini_up)
+
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        retry = {'retry_config': {'max_retries': 3, 'base_delay': 0.01}}
+        for name, model in (('deepseek', 'deepseek-chat'), ('gemini', 'gemini-2.0-flash')):
+            db.session.add(AIConfig(provider_name=name, display_name=name, api_key='k', model_name=model,
+                                    is_active=True, advanced_config=retry))
+        db.session.commit()
+        service = AnalysisService(db.session)
+
+        provider = service._get_llm_provider('deepseek')
+        result, used, failover_from = service._generate_with_failover(provider, 'deepseek', 'p', {'code': 'AAPL'})
+        assert result.success and used.name == 'gemini' and failover_from == 'deepseek'
+        # 熔断后本次调用中剩余的重试不再发出
+        assert calls == {'deepseek': 2, 'gemini': 1}
+
+        # 熔断期间直接使用接替的提供商
+        result, used, _ = service._generate_with_failover(provider, 'deepseek', 'p', {'code': 'MSFT'})
+        assert result.success and used.name == 'gemini'
+        assert calls == {'deepseek': 2, 'gemini': 2}
+
+        states = AIConfigService(db.session).get_circuit_breaker_states()
+        assert states['deepseek']['state'] == 'open'
+        assert states['deepseek']['failovers_out'] == 2
+        assert states['gemini']['failovers_in'] == 2
+
+        # 所有提供商都熔断时直接返回熔断结果，不等待并发槽位
+        breaker.record_result('gemini', False, 'network_error')
+        breaker.record_result('gemini', False, 'network_error')
+
+        def no_slot(*args, **kwargs):
+            raise AssertionError('熔断时不应占用并发槽位')
+        monkeypatch.setattr(pacer, 'slot', no_slot)
+        result, used, _ = service._generate_with_failover(provider, 'deepseek', 'p', {'code': 'TSLA'})
+        assert not result.success and result.error_type == ErrorType.CIRCUIT_OPEN
+        assert calls == {'deepseek': 2, 'gemini': 2}
+        db.session.remove()
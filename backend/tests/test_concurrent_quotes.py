@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并发获取股票行情测试
+验证同时请求多个数据源时取最先返回的有效数据、优先级更高的数据源在等待时间内胜出、总时限，
+以及所有请求共用一个有上限的线程池
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from app import create_app
+from app.services.data.multi_source_data_service import MultiSourceDataService, StockData, _FetchPool
+
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    app.config.update(STOCK_DATA_FETCH_DEADLINE_SECONDS=1.0, STOCK_DATA_PRIORITY_GRACE_SECONDS=0.2)
+    with app.app_context():
+        yield app
+
+
+def _source(name: str, delay: float, price: float = 100.0):
+    def fetch(symbol):
+        time.sleep(delay)
+        if price is None:
+            raise ValueError(f'{name} 不可用')
+        return StockData(symbol=symbol, name=symbol, price=price, change=0, change_percent=0, volume=0,
+                         timestamp=datetime.now(), source=name)
+    fetch.__name__ = name
+    return fetch
+
+
+def _service(*sources) -> MultiSourceDataService:
+    service = MultiSourceDataService()
+    service.sources = list(sources)
+    return service
+
+
+def test_first_valid_result_wins(app):
+    """高优先级数据源很慢、失败或返回无效数据时，不等待它，直接使用最先返回的有效数据"""
+    service = _service(_source('slow', 5), _source('broken', 0, price=None), _source('zero', 0, price=0),
+                       _source('fast', 0.05))
+    start = time.monotonic()
+    data = service.get_stock_data('AAPL')
+
+    assert data.source == 'fast'
+    assert time.monotonic() - start < 0.5
+    # 结果被缓存
+    assert service.get_stock_data('AAPL') is data
+
+
+def test_priority_decides_among_quick_results(app):
+    """多个数据源都很快返回时，按数据源顺序选择"""
+    service = _service(_source('preferred', 0.1), _source('quicker', 0))
+    assert service.get_stock_data('AAPL').source == 'preferred'
+    assert service.get_stock_data('MSFT', concurrent=False).source == 'preferred'
+
+
+def test_deadline_bounds_total_time(app):
+    """所有数据源都超过总时限时返回None"""
+    service = _service(_source('slow', 3), _source('slower', 4))
+    start = time.monotonic()
+    assert service.get_stock_data('AAPL') is None
+    assert time.monotonic() - start < 1.5
+
+
+def test_fetches_share_bounded_pool(app, monkeypatch):
+    """所有股票的并发请求共用线程池，线程数不超过上限；返回时仍在排队的请求被取消"""
+    monkeypatch.setattr('app.services.data.multi_source_data_service._fetch_pool', _FetchPool())
+    app.config['STOCK_DATA_FETCH_WORKERS'] = 2
+    lock = threading.Lock()
+    running = []
+    peak = []
+    threads = set()
+
+    def tracked(name, delay, price=100.0):
+        source = _source(name, delay, price)
+
+        def fetch(symbol):
+            with lock:
+                running.append(symbol)
+                peak.append(len(running))
+                threads.add(threading.current_thread().name)
+            try:
+                return source(symbol)
+            finally:
+                with lock:
+                    running.remove(symbol)
+        fetch.__name__ = name
+        return fetch
+
+    service = _service(tracked('first', 0.1), tracked('second', 0.1))
+    results = []
+
+    def fetch_quote(symbol):
+        with app.app_context():
+            results.append(service.get_stock_data(symbol))
+
+    workers = [threading.Thread(target=fetch_quote, args=(symbol,)) for symbol in ('AAPL', 'MSFT', 'TSLA')]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=3)
+    assert len(results) == 3 and all(data.source == 'first' for data in results)
+    assert max(peak) <= 2 and len(threads) <= 2
+
+    # 线程被占满直到总时限，仍在排队的请求被取消，之后不再执行
+    monkeypatch.setattr('app.services.data.multi_source_data_service._fetch_pool', _FetchPool())
+    app.config['STOCK_DATA_FETCH_WORKERS'] = 1
+    called = []
+    service = _service(_source('slow', 1.3), lambda symbol: called.append(symbol))
+    assert service.get_stock_data('NVDA') is None
+    time.sleep(0.5)
+    assert called == []
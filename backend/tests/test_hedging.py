@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI请求对冲测试
+验证慢请求超过阈值后向等价配置发送对冲请求、先成功的胜出并取消另一个，以及额外消耗的统计
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+
+import pytest
+
+from app.services.ai.circuit_breaker import ProviderCircuitBreaker
+from app.services.ai.hedging import RequestHedger
+from app.services.ai.llm_provider import AnalysisResult, DeepSeekProvider
+from app.services.ai.report_stream import PartialReportWriter
+
+
+@pytest.fixture(autouse=True)
+def breaker(monkeypatch):
+    monkeypatch.setattr(ProviderCircuitBreaker, '_instance', None)
+    breaker = ProviderCircuitBreaker()
+    breaker.configure(failure_threshold=100)
+    monkeypatch.setattr('app.services.ai.llm_provider.circuit_breaker', breaker)
+    return breaker
+
+
+@pytest.fixture
+def hedger(monkeypatch):
+    monkeypatch.setattr(RequestHedger, '_instance', None)
+    hedger = RequestHedger()
+    hedger.configure(enabled=True, default_delay=0.1, min_delay=0, max_ratio=1.0)
+    monkeypatch.setattr('app.services.ai.llm_provider.request_hedger', hedger)
+    return hedger
+
+
+def _provider(name: str, delay: float, events: list, first_chunk: str = None) -> DeepSeekProvider:
+    provider = DeepSeekProvider({'name': name, 'api_key': 'k', 'model': f'{name}-chat',
+                                 'retry_config': {'max_retries': 0}})
+
+    async def request(prompt, stock_info):
+        events.append(f'{name}:start')
+        try:
+            if first_chunk:
+                await asyncio.sleep(0.01)
+                provider._emit_chunk([], first_chunk)
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            events.append(f'{name}:cancelled')
+            raise
+        return AnalysisResult(success=True, content=f'{name} 报告', provider=name, model=provider.model,
+                              tokens_used=100)
+
+    provider._amake_api_request = request
+    return provider
+
+
+def test_slow_request_is_hedged_and_loser_cancelled(hedger):
+    """主请求超过阈值未返回时发送对冲请求，对冲请求先完成时胜出，主请求被取消"""
+    events = []
+    primary = _provider('deepseek', 5, events)
+    backup = _provider('gemini', 0.05, events)
+
+    start = time.monotonic()
+    result = primary.generate_analysis('分析', {'code': 'AAPL'}, hedge_provider=backup)
+
+    assert time.monotonic() - start < 1.0
+    assert result.success and result.content == 'gemini 报告'
+    assert result.metadata['hedge']['hedge_won'] is True
+    assert events == ['deepseek:start', 'gemini:start', 'deepseek:cancelled']
+    stats = hedger.get_stats()
+    assert stats['requests'] == 1 and stats['hedges'] == 1 and stats['hedge_wins'] == 1
+    assert stats['extra_tokens'] > 0
+
+
+def test_no_hedge_after_first_byte_or_over_ratio(hedger, tmp_path):
+    """主请求已收到首字节或对冲占比达到上限时不发送对冲请求"""
+    events = []
+    primary = _provider('deepseek', 0.3, events, first_chunk='第一段')
+    backup = _provider('gemini', 0.01, events)
+    writer = PartialReportWriter(str(tmp_path / 'AAPL.partial'))
+
+    result = primary.generate_analysis('分析', {'code': 'AAPL'}, report_stream=writer, hedge_provider=backup)
+
+    assert result.content == 'deepseek 报告' and 'hedge' not in result.metadata
+    assert events == ['deepseek:start']
+    assert writer.salvage()[0] == '第一段'
+    assert hedger.get_stats()['thresholds'] == {'deepseek:deepseek-chat:stream': 0.1}
+
+    hedger.configure(max_ratio=0)
+    slow = _provider('deepseek', 0.3, events)
+    result = slow.generate_analysis('分析', {'code': 'AAPL'}, hedge_provider=backup)
+    assert result.content == 'deepseek 报告'
+    assert hedger.get_stats()['skipped_by_ratio'] == 1 and hedger.get_stats()['hedges'] == 0
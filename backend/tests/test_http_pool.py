@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP连接池测试
+验证同一端点的Provider共享连接池，连续请求复用keep-alive连接并记录节省的握手时间
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.services.ai.http_pool import get_http_client
+from app.services.ai.llm_provider import DeepSeekProvider, GeminiProvider
+
+
+class _EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps({'ok': True}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _EchoHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def test_requests_reuse_keep_alive_connection(server):
+    """同一端点的连续请求只建立一次连接"""
+    client = get_http_client(f"{server}/v1/chat", {'pool_size': 2})
+    assert get_http_client(f"{server}/other", {'pool_size': 2}) is client
+
+    first = client.post(f"{server}/v1/chat", json={'n': 1})
+    assert first.connection_metrics['connection_reused'] is False
+    for i in range(4):
+        response = client.post(f"{server}/v1/chat", json={'n': i})
+        assert response.json() == {'ok': True}
+        assert response.connection_metrics['connection_reused'] is True
+
+    stats = client.get_stats()
+    assert stats['requests'] == 5
+    assert stats['new_connections'] == 1
+    assert stats['reused_connections'] == 4
+    assert stats['handshake_saved_ms'] >= 0
+
+
+def test_providers_share_pool_per_endpoint():
+    """同一端点、同一连接池配置的Provider实例共享连接池"""
+    config = {'name': 'deepseek', 'api_key': 'k', 'model': 'deepseek-chat'}
+    assert DeepSeekProvider(config).http is DeepSeekProvider(dict(config)).http
+    assert DeepSeekProvider(config).http is not GeminiProvider({'name': 'gemini', 'api_key': 'k'}).http
+
+    sized = DeepSeekProvider({**config, 'http_pool_config': {'pool_size': 3}})
+    assert sized.http.pool_size == 3
+    assert sized.http is not DeepSeekProvider(config).http
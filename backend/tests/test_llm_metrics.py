@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI调用指标测试
+验证按时间分桶的耗时分位数、重试率和Token速率统计，Provider调用的记录，以及Prometheus文本接口
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from app import create_app, db
+from app.config import TestingConfig
+from app.services.ai.circuit_breaker import ProviderCircuitBreaker
+from app.services.ai.llm_metrics import LLMMetrics
+from app.services.ai.llm_provider import AnalysisResult, DeepSeekProvider, ErrorType
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    monkeypatch.setattr(LLMMetrics, '_instance', None)
+    metrics = LLMMetrics()
+    metrics.configure(bucket_seconds=60, retention_seconds=3600)
+    monkeypatch.setattr('app.services.ai.llm_provider.llm_metrics', metrics)
+    monkeypatch.setattr('app.services.ai.ai_config_service.llm_metrics', metrics)
+    return metrics
+
+
+def test_window_percentiles_and_retention(metrics):
+    """时间窗口内的调用按直方图估算分位数，过期的时间桶被清理"""
+    now = 100000.0
+    metrics.record_call('qwen', 'qwen-max', 40, now=now - 7200)
+    for seconds in range(1, 101):
+        metrics.record_call('qwen', 'qwen-max', seconds, ttft_seconds=seconds / 10, tokens=1000, now=now)
+    metrics.record_call('qwen', 'qwen-max', 3, success=False, error_type='timeout_error', now=now)
+    metrics.record_retry('qwen', 'qwen-max', now=now)
+
+    summary = metrics.summary(window_seconds=600, now=now)['models']['qwen:qwen-max']
+    assert summary['calls'] == 101 and summary['errors'] == {'timeout_error': 1}
+    assert summary['retry_rate'] == round(1 / 101, 4)
+    assert 40 <= summary['latency']['p50'] <= 60
+    assert 90 <= summary['latency']['p95'] <= 100 and summary['latency']['p99'] <= 100
+    assert summary['ttft']['p95'] <= 10
+    assert summary['tokens_per_second'] > 0
+
+    # 两小时前的桶超出保留时长，写入新桶时已被删除
+    assert metrics.summary(window_seconds=3 * 3600, now=now)['models']['qwen:qwen-max']['calls'] == 101
+    assert len(metrics.timeline('qwen', 'qwen-max', 3 * 3600, now=now)) == 1
+
+
+def test_provider_calls_are_recorded(metrics, monkeypatch):
+    """Provider的每次请求和重试都计入指标，并以Prometheus格式输出"""
+    monkeypatch.setattr(ProviderCircuitBreaker, '_instance', None)
+    monkeypatch.setattr('app.services.ai.llm_provider.circuit_breaker', ProviderCircuitBreaker())
+    calls = []
+
+    async def request(self, prompt, stock_info):
+        calls.append(1)
+        if len(calls) == 1:
+            return AnalysisResult(success=False, error='Connection error', error_type=ErrorType.NETWORK_ERROR,
+                                  provider='deepseek', model=self.model)
+        return AnalysisResult(success=True, content='报告', provider='deepseek', model=self.model,
+                              tokens_used=500)
+
+    monkeypatch.setattr(DeepSeekProvider, '_amake_api_request', request)
+    provider = DeepSeekProvider({'name': 'deepseek', 'api_key': 'k', 'model': 'deepseek-chat',
+                                 'retry_config': {'max_retries': 1, 'base_delay': 0.01}})
+    assert provider.generate_analysis('分析', {'code': 'AAPL'}).success
+
+    summary = metrics.summary()['models']['deepseek:deepseek-chat']
+    assert summary['calls'] == 2 and summary['successes'] == 1 and summary['retries'] == 1
+    assert summary['errors'] == {'network_error': 1} and summary['tokens'] == 500
+
+    monkeypatch.setattr(TestingConfig, 'METRICS_AUTH_TOKEN', 'scrape-token')
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        client = app.test_client()
+        assert client.get('/api/ai-config/metrics').status_code in (302, 401)
+        response = client.get('/api/ai-config/metrics', headers={'Authorization': 'Bearer scrape-token'})
+        db.session.remove()
+
+    text = response.get_data(as_text=True)
+    assert response.status_code == 200 and response.mimetype == 'text/plain'
+    assert 'equitycompass_llm_calls_total{provider="deepseek",model="deepseek-chat",status="success"} 1' in text
+    assert 'status="error",error_type="network_error"} 1' in text
+    assert 'equitycompass_llm_retries_total{provider="deepseek",model="deepseek-chat"} 1' in text
+    assert 'equitycompass_llm_request_duration_seconds_bucket{provider="deepseek",model="deepseek-chat",le="+Inf"} 2' in text
+    assert 'equitycompass_llm_tokens_per_call_count{provider="deepseek",model="deepseek-chat"} 1' in text
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Provider实例缓存测试
+验证同一配置复用Provider实例，配置修改或使用统计更新后的行为
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from app import create_app, db
+from app.models.ai_config import AIConfig
+from app.services.ai.ai_config_service import AIConfigService
+from app.services.ai.llm_provider import LLMProviderFactory
+
+
+@pytest.fixture
+def config_service(tmp_path, monkeypatch):
+    """在测试应用上下文中创建一个DeepSeek配置"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(LLMProviderFactory, '_provider_cache', {})
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        config = AIConfig(provider_name='deepseek', display_name='DeepSeek', api_key='sk-test',
+                          model_name='deepseek-chat', is_active=True, is_default=True)
+        db.session.add(config)
+        db.session.commit()
+        yield AIConfigService(db.session), config
+        db.session.remove()
+
+
+def test_provider_reused_until_config_changes(config_service):
+    """配置未变更时复用实例，更新配置后重建实例"""
+    service, config = config_service
+
+    provider = LLMProviderFactory.create_provider_from_db_config(config.id)
+    assert LLMProviderFactory.create_default_provider() is provider
+
+    # 使用统计不影响缓存
+    config.update_usage_stats(success=True)
+    assert LLMProviderFactory.create_provider_from_db_config(config.id) is provider
+
+    service.update_config(config.id, {'model_name': 'deepseek-reasoner'})
+    updated = LLMProviderFactory.create_provider_from_db_config(config.id)
+    assert updated is not provider
+    assert updated.model == 'deepseek-reasoner'
+    assert len(LLMProviderFactory._provider_cache) == 1
+
+
+def test_invalidate_cache(config_service):
+    """清除缓存后重新创建实例"""
+    _, config = config_service
+
+    provider = LLMProviderFactory.create_provider_from_db_config(config.id)
+    LLMProviderFactory.invalidate_cache(config.id)
+    assert LLMProviderFactory.create_provider_from_db_config(config.id) is not provider
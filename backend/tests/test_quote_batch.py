@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量行情测试
+验证港股和其他股票按数据源分组、每组一次请求，结果写入缓存，Yahoo接口的crumb获取和过期后重新获取，
+以及批量分析前的行情预取
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from app import create_app, db
+from app.services.ai.analysis_service import AnalysisService
+from app.services.data.multi_source_data_service import MultiSourceDataService
+
+
+class FakeResponse:
+    def __init__(self, content: bytes = b'', payload: dict = None, status_code: int = 200, text: str = '',
+                 cookies: dict = None):
+        self.content = content
+        self.payload = payload
+        self.status_code = status_code
+        self.text = text
+        self.cookies = cookies or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} Error', response=self)
+
+    def json(self):
+        return self.payload
+
+
+YAHOO_QUOTE_URL = 'https://query1.finance.yahoo.com/v7/finance/quote'
+
+
+@pytest.fixture
+def yahoo(monkeypatch):
+    """模拟数据源：Yahoo行情接口只接受最近一次发放的crumb和对应的cookie"""
+    state = {'log': [], 'crumbs': 0, 'quote_status': None}
+
+    def fake_get(url, params=None, headers=None, cookies=None, timeout=None):
+        state['log'].append((url, params))
+        if url == 'https://fc.yahoo.com':
+            return FakeResponse(status_code=404, cookies={'A3': 'session'})
+        if 'getcrumb' in url:
+            if cookies != {'A3': 'session'}:
+                return FakeResponse(status_code=403)
+            state['crumbs'] += 1
+            return FakeResponse(text=f"crumb{state['crumbs']}")
+        if 'sinajs' in url:
+            return FakeResponse(content=(
+                'var hq_str_hk00700="TENCENT,腾讯控股,599.500,592.500,609.000,595.500,605.500,7.000,1.181,'
+                '0,0,1000,2000000";\n'
+                'var hq_str_hk09988="";\n'
+            ).encode('gbk'))
+        if state['quote_status']:
+            return FakeResponse(status_code=state['quote_status'])
+        if params.get('crumb') != f"crumb{state['crumbs']}" or cookies != {'A3': 'session'}:
+            return FakeResponse(status_code=401)
+        return FakeResponse(payload={'quoteResponse': {'result': [
+            {'symbol': 'AAPL', 'longName': 'Apple Inc.', 'regularMarketPrice': 230.5,
+             'regularMarketChange': 1.5, 'regularMarketChangePercent': 0.65, 'regularMarketVolume': 100},
+            {'symbol': 'MSFT', 'shortName': 'Microsoft', 'regularMarketPrice': 410.0},
+            {'symbol': '09988.HK', 'shortName': 'BABA-W', 'regularMarketPrice': 0}
+        ]}})
+
+    monkeypatch.setattr('app.services.data.multi_source_data_service.requests.get', fake_get)
+    return state
+
+
+def _quote_requests(yahoo):
+    return [params for url, params in yahoo['log'] if url == YAHOO_QUOTE_URL]
+
+
+def test_batch_groups_requests_and_fills_cache(yahoo, monkeypatch):
+    """港股一次新浪请求，其余股票和新浪没有返回的港股一次Yahoo请求，结果写入缓存"""
+    service = MultiSourceDataService()
+    fallback_calls = []
+    monkeypatch.setattr(service, 'get_stock_data', lambda symbol: fallback_calls.append(symbol))
+
+    quotes = service.get_stock_data_batch(['AAPL', '00700.HK', 'MSFT', '09988.HK', 'AAPL'])
+
+    assert yahoo['log'][0][0] == 'https://hq.sinajs.cn/list=hk00700,hk09988'
+    assert _quote_requests(yahoo) == [{'symbols': 'AAPL,MSFT,09988.HK', 'crumb': 'crumb1'}]
+    assert quotes['00700.HK'].price == 599.5 and quotes['00700.HK'].name == '腾讯控股'
+    assert quotes['AAPL'].name == 'Apple Inc.' and quotes['MSFT'].price == 410.0
+    # 两个数据源都没有有效数据的股票逐只获取
+    assert fallback_calls == ['09988.HK'] and quotes['09988.HK'] is None
+
+    assert service.cache.get('stock_AAPL')[1] == 'hit' and service.cache.get('stock_00700.HK')[1] == 'hit'
+    requests_made = len(yahoo['log'])
+    assert service.get_stock_data_batch(['AAPL', 'MSFT'])['MSFT'].source == 'yahoo_direct'
+    assert len(yahoo['log']) == requests_made
+
+
+def test_expired_crumb_is_refreshed(yahoo, caplog):
+    """crumb过期返回401时重新获取crumb并重试一次；其他失败记录HTTP状态码"""
+    service = MultiSourceDataService()
+    assert set(service.get_stock_data_batch(['AAPL'], fallback=False)) == {'AAPL'}
+
+    # 其他进程获取了新的crumb，本进程缓存的crumb失效
+    yahoo['crumbs'] += 1
+    quotes = service.get_stock_data_batch(['MSFT'], fallback=False)
+    assert quotes['MSFT'].price == 410.0
+    assert [params.get('crumb') for params in _quote_requests(yahoo)] == ['crumb1', 'crumb1', 'crumb3']
+
+    yahoo['quote_status'] = 429
+    assert service.get_stock_data_batch(['TSLA'], fallback=False) == {'TSLA': None}
+    assert 'HTTP 429' in caplog.text
+
+
+def test_batch_analysis_prefetches_quotes(yahoo, monkeypatch):
+    """配置了API密钥的批量分析在开始分析前预取行情，demo模式不请求行情"""
+    fresh = MultiSourceDataService()
+    monkeypatch.setattr('app.services.data.multi_source_data_service.multi_source_service', fresh)
+    app = create_app('testing')
+    with app.app_context():
+        service = AnalysisService(db.session)
+        monkeypatch.setattr(service, '_get_llm_provider', lambda name: SimpleNamespace(api_key=None))
+        service._prefetch_quotes([{'code': 'AAPL'}], 'deepseek')
+        assert yahoo['log'] == []
+
+        monkeypatch.setattr(service, '_get_llm_provider', lambda name: SimpleNamespace(api_key='k'))
+        service._prefetch_quotes([{'code': 'AAPL'}, {'code': 'MSFT'}], 'deepseek')
+
+    assert len(_quote_requests(yahoo)) == 1
+    assert fresh.cache.get('stock_AAPL')[1] == 'hit' and fresh.cache.get('stock_MSFT')[1] == 'hit'
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+行情缓存测试
+验证有效期（包括超过一天的条目）、最久未使用淘汰、开盘和收盘后的不同有效期、过期数据的后台刷新，
+以及多个进程通过SQLite共享行情、正在进行的获取（获取失败时等待的进程不再等到租约过期）和数据源请求次数
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from app.services.data.multi_source_data_service import MultiSourceDataService, StockData
+from app.services.data.quote_cache import QuoteCache, is_market_open
+
+
+def _quote(source: str, price: float = 100.0) -> StockData:
+    return StockData(symbol='AAPL', name='Apple', price=price, change=0, change_percent=0, volume=0,
+                     timestamp=datetime.now(), source=source)
+
+
+def test_ttl_lru_and_stats():
+    """过期后先返回stale再未命中，超过容量时淘汰最久未使用的条目"""
+    cache = QuoteCache()
+    cache.configure(max_entries=2, ttl=10, closed_ttl=100, stale_seconds=5)
+    now = 1000000.0
+
+    cache.set('a', 1, now=now)
+    cache.set('b', 2, now=now)
+    assert cache.get('a', now=now + 1) == (1, QuoteCache.HIT)
+    cache.set('c', 3, now=now + 1)
+    assert cache.get('b', now=now + 1) == (None, QuoteCache.MISS)
+
+    assert cache.get('a', now=now + 12) == (1, QuoteCache.STALE)
+    assert cache.get('a', now=now + 16) == (None, QuoteCache.MISS)
+    # 超过一天的条目不会被当作有效
+    assert cache.get('c', now=now + 86400 + 2) == (None, QuoteCache.MISS)
+
+    stats = cache.get_stats()
+    assert stats['hits'] == 1 and stats['stale_hits'] == 1 and stats['misses'] == 3
+    assert stats['evictions'] == 1 and stats['size'] == 0 and stats['hit_rate'] == 0.4
+
+
+def test_market_hours_ttl():
+    """收盘期间获取的行情使用收盘后的有效期，开盘后按开盘有效期过期"""
+    new_york = ZoneInfo('America/New_York')
+    saturday = datetime(2025, 9, 6, 12, 0, tzinfo=new_york).timestamp()
+    monday_open = datetime(2025, 9, 8, 10, 0, tzinfo=new_york).timestamp()
+    monday_before_open = datetime(2025, 9, 8, 9, 0, tzinfo=new_york).timestamp()
+    assert not is_market_open('US', saturday) and is_market_open('US', monday_open)
+    assert not is_market_open('HK', datetime(2025, 9, 8, 12, 30, tzinfo=ZoneInfo('Asia/Hong_Kong')).timestamp())
+
+    cache = QuoteCache()
+    cache.configure(ttl=60, closed_ttl=3600, stale_seconds=0)
+    cache.set('AAPL', 1, market='US', now=saturday)
+    assert cache.get('AAPL', now=saturday + 1800)[1] == QuoteCache.HIT
+
+    cache.set('AAPL', 1, market='US', now=monday_before_open)
+    assert cache.get('AAPL', now=monday_before_open + 1800)[1] == QuoteCache.MISS
+
+    cache.set('AAPL', 1, market='US', now=monday_open)
+    assert cache.get('AAPL', now=monday_open + 30)[1] == QuoteCache.HIT
+    assert cache.get('AAPL', now=monday_open + 90)[1] == QuoteCache.MISS
+
+
+def test_stale_quote_is_served_and_refreshed_in_background():
+    """稍微过期的行情立即返回，同时在后台刷新"""
+    calls = []
+
+    def source(symbol):
+        calls.append(symbol)
+        time.sleep(0.1)
+        return _quote('fresh', 101.0)
+
+    service = MultiSourceDataService()
+    service.sources = [source]
+    service.cache.configure(ttl=60, closed_ttl=60, stale_seconds=60)
+    service.cache.set('stock_AAPL', _quote('old'), now=time.time() - 90)
+
+    start = time.monotonic()
+    assert service.get_stock_data('AAPL').source == 'old'
+    assert service.get_stock_data('AAPL').source == 'old'
+    assert time.monotonic() - start < 0.1
+
+    for _ in range(50):
+        data, status = service.cache.get('stock_AAPL')
+        if status == QuoteCache.HIT:
+            break
+        time.sleep(0.02)
+    assert data.source == 'fresh' and calls == ['AAPL']
+    assert service.get_cache_stats()['refreshes'] == 1
+
+
+class FakeResponse:
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {'chart': {'result': [{'meta': {'longName': 'Apple Inc.', 'regularMarketPrice': 230.0,
+                                                'previousClose': 228.0, 'regularMarketVolume': 100}}]}}
+
+
+def test_workers_share_quotes_through_sqlite(tmp_path, monkeypatch):
+    """一个worker获取的行情其他worker直接使用，正在获取时其他worker等待结果，请求次数合计"""
+    requests_log = []
+    monkeypatch.setattr('app.services.data.multi_source_data_service.requests.get',
+                        lambda url, **kwargs: requests_log.append(url) or FakeResponse())
+    workers = []
+    for _ in range(2):
+        service = MultiSourceDataService()
+        service.sources = [service._get_yahoo_finance_direct]
+        service.cache.configure(shared_store=str(tmp_path / 'quotes.db'), lease_seconds=2)
+        workers.append(service)
+    first, second = workers
+
+    data = first.get_stock_data('AAPL', concurrent=False)
+    shared = second.get_stock_data('AAPL', concurrent=False)
+    assert shared == data and shared.timestamp == data.timestamp
+    assert len(requests_log) == 1 and second.get_cache_stats()['shared_hits'] == 1
+
+    # 第一个worker正在获取时，第二个worker等待它写入的结果，不再请求数据源
+    assert first.cache.acquire_fetch('stock_MSFT')
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(second.get_stock_data('MSFT', concurrent=False)))
+    waiter.start()
+    time.sleep(0.3)
+    first._cache_stock_data('MSFT', _quote('first_worker'))
+    first.cache.release_fetch('stock_MSFT')
+    waiter.join(timeout=2)
+
+    assert results[0].source == 'first_worker' and len(requests_log) == 1
+    assert second.get_cache_stats()['upstream_requests'] == {'yahoo_direct': 1}
+
+
+def test_waiter_stops_when_lease_holder_fails(tmp_path, monkeypatch):
+    """持有租约的worker获取失败并释放租约后，等待的worker立即自己获取，不等到租约过期"""
+    requests_log = []
+    monkeypatch.setattr('app.services.data.multi_source_data_service.requests.get',
+                        lambda url, **kwargs: requests_log.append(url) or FakeResponse())
+    workers = []
+    for _ in range(2):
+        service = MultiSourceDataService()
+        service.sources = [service._get_yahoo_finance_direct]
+        service.cache.configure(shared_store=str(tmp_path / 'quotes.db'), lease_seconds=10)
+        workers.append(service)
+    first, second = workers
+
+    assert first.cache.acquire_fetch('stock_AAPL')
+    assert second.cache.fetch_in_progress('stock_AAPL')
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(second.get_stock_data('AAPL', concurrent=False)))
+    start = time.monotonic()
+    waiter.start()
+    time.sleep(0.3)
+    first.cache.release_fetch('stock_AAPL')
+    waiter.join(timeout=2)
+
+    assert time.monotonic() - start < 2
+    assert results[0].price == 230.0 and len(requests_log) == 1
+    assert not second.cache.fetch_in_progress('stock_AAPL')
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI提供商客户端限流测试
+验证多个worker通过SQLite共享令牌桶额度，Provider在额度不足时先等待再发送
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+import time
+
+import pytest
+
+from app.services.ai.llm_provider import AnalysisResult, DeepSeekProvider
+from app.services.ai.rate_limiter import ProviderRateLimiter, SQLiteBucketStore
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    monkeypatch.setattr(ProviderRateLimiter, '_instance', None)
+    limiter = ProviderRateLimiter()
+    monkeypatch.setattr('app.services.ai.rate_limiter.rate_limiter', limiter)
+    monkeypatch.setattr('app.services.ai.llm_provider.rate_limiter', limiter)
+    return limiter
+
+
+def test_workers_share_bucket_through_sqlite(limiter, tmp_path):
+    """多个worker同时预约，合计只有桶容量的请求无需等待"""
+    path = str(tmp_path / 'rate_limits.db')
+    limiter.configure(store_path=path)
+    limits = {'rpm': 60}
+    key = limiter.bucket_key('deepseek', 'deepseek-chat', 'sk-test')
+    now = 1000.0
+
+    # 另一个worker进程：独立的存储连接
+    other_worker = SQLiteBucketStore(path)
+    waits = []
+    lock = threading.Lock()
+
+    def reserve(use_other_store: bool):
+        for _ in range(20):
+            if use_other_store:
+                level = other_worker.take(f"{key}:rpm", 60, 1.0, 1, now)
+                wait = max(0.0, -level)
+            else:
+                wait = limiter.reserve(key, limits, now=now)
+            with lock:
+                waits.append(wait)
+
+    threads = [threading.Thread(target=reserve, args=(i % 2 == 0,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len([w for w in waits if w == 0]) == 60
+    assert sorted(waits)[-1] == pytest.approx(20.0)
+
+    # 额度按速率恢复，Token用量按实际值修正
+    assert limiter.reserve(key, limits, now=now + 30) == pytest.approx(0.0)
+    assert limiter.reserve(key, {'tpm': 600}, tokens=100, now=now) == 0
+    limiter.record_usage(key, {'tpm': 600}, 100, 700)
+    assert limiter.reserve(key, {'tpm': 600}, tokens=100, now=now) > 0
+
+
+def test_provider_waits_for_capacity_before_sending(limiter, monkeypatch):
+    """Token额度用完后，下一次请求等待额度恢复后再发送"""
+    limiter.configure()
+    sent = []
+
+    async def fake_request(self, prompt, stock_info):
+        sent.append(time.time())
+        return AnalysisResult(success=True, content='ok', provider='deepseek', model=self.model, tokens_used=2000)
+
+    monkeypatch.setattr(DeepSeekProvider, '_amake_api_request', fake_request)
+    provider = DeepSeekProvider({
+        'name': 'deepseek', 'api_key': 'k', 'model': 'deepseek-chat',
+        'rate_limit': {'tpm': 6000}, 'retry_config': {'max_retries': 0}
+    })
+    assert provider.rate_limits == {'tpm': 6000}
+
+    # 每次预估100个Token，实际用量2000：前三次立即发送，第四次等待约1秒（每秒恢复100个Token）
+    for _ in range(4):
+        assert provider.generate_analysis('x' * 400, {'code': 'AAPL'}).success
+
+    assert sent[2] - sent[0] < 0.5
+    assert 0.7 < sent[3] - sent[2] < 2.0
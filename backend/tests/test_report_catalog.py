@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+报告目录测试
+验证报告的保存、列表、筛选和删除都通过报告索引表完成
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import pytest
+
+from app import create_app, db
+from app.models.stock import Stock
+from app.services.ai.analysis_service import AnalysisService
+
+
+@pytest.fixture
+def analysis_service(tmp_path, monkeypatch):
+    """在临时目录中创建测试应用和分析服务"""
+    monkeypatch.chdir(tmp_path)
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        db.session.add(Stock(code='AAPL', name='Apple Inc.', market='US'))
+        db.session.add(Stock(code='00700', name='腾讯控股', market='HK'))
+        db.session.commit()
+        yield AnalysisService(db.session)
+        db.session.remove()
+
+
+def _make_report(stock_code, stock_name, provider='qwen', analysis_type='fundamental'):
+    return {
+        'stock_code': stock_code,
+        'stock_name': stock_name,
+        'analysis_date': '2025-09-20',
+        'content': f'# {stock_name} 分析报告\n\n' + '正文' * 1000,
+        'provider': provider,
+        'analysis_type': analysis_type,
+        'ai_model': f'{provider}-model'
+    }
+
+
+def test_listing_uses_catalog(analysis_service, monkeypatch):
+    """列表查询只读取报告索引，不打开报告文件"""
+    analysis_service.save_analysis_report('AAPL', _make_report('AAPL', 'Apple Inc.'))
+    analysis_service.save_analysis_report('00700', _make_report('00700', '腾讯控股', provider='gemini'))
+    analysis_service.save_analysis_report('AAPL', _make_report('AAPL', 'Apple Inc.', analysis_type='technical'))
+
+    def _fail_json_load(*args, **kwargs):
+        raise AssertionError('列表查询不应解析报告文件')
+    monkeypatch.setattr(json, 'load', _fail_json_load)
+
+    reports = analysis_service.get_all_reports(limit=10)
+    assert len(reports) == 3
+    assert reports[0]['stock_code'] == 'AAPL' and reports[0]['analysis_type'] == 'technical'
+    assert all(len(r['content']) <= 500 for r in reports)
+
+    assert len(analysis_service.get_all_reports_for_stock('AAPL')) == 2
+    assert len(analysis_service.get_all_reports(limit=10, provider='gemini')) == 1
+    assert len(analysis_service.get_all_reports(limit=1, offset=1)) == 1
+
+
+def test_delete_removes_catalog_entry(analysis_service):
+    """删除报告时同步移除文件和索引记录"""
+    report_file = analysis_service.save_analysis_report('AAPL', _make_report('AAPL', 'Apple Inc.'))
+    report_id = analysis_service.get_all_reports(limit=1)[0]['report_id']
+
+    assert analysis_service.delete_analysis_report('AAPL', report_id)
+    assert not os.path.exists(report_file)
+    assert analysis_service.get_all_reports(limit=10) == []
+
+
+def test_get_report_by_id_reads_single_file(analysis_service, monkeypatch):
+    """按report_id获取报告只读取一个文件"""
+    for _ in range(3):
+        analysis_service.save_analysis_report('AAPL', _make_report('AAPL', 'Apple Inc.'))
+    target = analysis_service.get_all_reports(limit=3)[1]['report_id']
+
+    reads = []
+    original_read = analysis_service.report_storage.read_report
+    def _counting_read(*args, **kwargs):
+        reads.append(1)
+        return original_read(*args, **kwargs)
+    monkeypatch.setattr(analysis_service.report_storage, 'read_report', _counting_read)
+
+    report = analysis_service.get_analysis_report('AAPL', '', target)
+    assert report['report_id'] == target
+    assert report['content'].startswith('# Apple Inc. 分析报告')
+    assert len(reads) == 1
+    assert analysis_service.get_analysis_report('AAPL', '', 'AAPL_missing') is None
+
+
+def test_reports_index_paginates_in_database(analysis_service, monkeypatch):
+    """报告列表页的筛选和分页在数据库中完成"""
+    for _ in range(5):
+        analysis_service.save_analysis_report('AAPL', _make_report('AAPL', 'Apple Inc.'))
+    analysis_service.save_analysis_report('00700', _make_report('00700', '腾讯控股', provider='gemini'))
+
+    calls = []
+    original_get_all = AnalysisService.get_all_reports
+    def _recording_get_all(self, limit=20, offset=0, **filters):
+        calls.append((limit, offset, filters))
+        return original_get_all(self, limit=limit, offset=offset, **filters)
+    monkeypatch.setattr(AnalysisService, 'get_all_reports', _recording_get_all)
+
+    from flask import current_app
+    client = current_app.test_client()
+    response = client.get('/reports/?stock=aapl&model=QWEN&page=2&per_page=2')
+    assert response.status_code == 200
+    assert calls == [(2, 2, {'stock_code': 'AAPL', 'provider': 'qwen'})]
+    assert analysis_service.count_reports(stock_code='AAPL', provider='qwen') == 5
+    assert [s['code'] for s in analysis_service.get_report_stocks()] == ['00700', 'AAPL']
+
+
+def test_report_counters_maintained_incrementally(analysis_service, monkeypatch):
+    """报告计数在保存和删除时增量维护，读取时不遍历报告目录"""
+    from app.models.analysis import ReportCounter
+
+    analysis_service.save_analysis_report('AAPL', _make_report('AAPL', 'Apple Inc.'))
+    # 首次读取从报告索引重建计数
+    assert analysis_service.get_global_reports_count() == 1
+
+    analysis_service.save_analysis_report('AAPL', _make_report('AAPL', 'Apple Inc.'))
+    analysis_service.save_analysis_report('00700', _make_report('00700', '腾讯控股'))
+    report_id = analysis_service.get_all_reports_for_stock('00700')[0]['report_id']
+    assert analysis_service.delete_analysis_report('00700', report_id)
+
+    def _fail_listdir(*args, **kwargs):
+        raise AssertionError('读取计数不应遍历报告目录')
+    monkeypatch.setattr(os, 'listdir', _fail_listdir)
+
+    assert analysis_service.get_global_reports_count() == 2
+    assert analysis_service.counter_repo.get_count_for_stocks(['AAPL', '00700']) == 2
+    assert db.session.get(ReportCounter, '00700').report_count == 0
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+报告文件存储测试
+验证元数据头与正文分离、提示词去重存储以及旧格式兼容
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+
+from app.services.data.report_storage import ReportStorage, is_report_file
+
+
+def _make_report(report_id, full_prompt='请分析股票 {{STOCK_CODE}}'):
+    return {
+        'report_id': report_id,
+        'stock_code': 'AAPL',
+        'stock_name': 'Apple Inc.',
+        'provider': 'qwen',
+        'prompt_version': 'v1',
+        'full_prompt': full_prompt,
+        'content': '# Apple Inc. 分析报告\n\n{"不是": "元数据"}\n' + '正文' * 1000
+    }
+
+
+def test_header_is_read_without_body(tmp_path):
+    """元数据头可以单独读取，正文按需加载"""
+    storage = ReportStorage(prompts_dir=str(tmp_path / 'prompts'))
+    report_file = str(tmp_path / 'AAPL_1.report')
+    report = _make_report('AAPL_1')
+    storage.write_report(report_file, report)
+
+    header = storage.read_header(report_file)
+    assert header['report_id'] == 'AAPL_1'
+    assert header['content_length'] == len(report['content'])
+    assert 'content' not in header and 'full_prompt' not in header
+
+    full = storage.read_report(report_file, include_prompt=True)
+    assert full['content'] == report['content']
+    assert full['full_prompt'] == report['full_prompt']
+
+
+def test_prompt_stored_once(tmp_path):
+    """相同提示词只存储一份"""
+    prompts_dir = tmp_path / 'prompts'
+    storage = ReportStorage(prompts_dir=str(prompts_dir))
+    for i in range(3):
+        storage.write_report(str(tmp_path / f'AAPL_{i}.report'), _make_report(f'AAPL_{i}'))
+    storage.write_report(str(tmp_path / 'AAPL_x.report'), _make_report('AAPL_x', full_prompt='另一个提示词'))
+
+    assert len(os.listdir(prompts_dir)) == 2
+
+
+def test_legacy_json_report_readable(tmp_path):
+    """旧的JSON报告文件仍可读取"""
+    storage = ReportStorage(prompts_dir=str(tmp_path / 'prompts'))
+    report_file = str(tmp_path / 'AAPL_1_qwen_fundamental.json')
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(_make_report('AAPL_1'), f, ensure_ascii=False, indent=2)
+
+    assert 'content' not in storage.read_header(report_file)
+    assert storage.read_report(report_file, include_prompt=True)['full_prompt'] == '请分析股票 {{STOCK_CODE}}'
+    assert is_report_file('AAPL_1_qwen_fundamental.json')
+    assert not is_report_file('single_1_AAPL.task.json')
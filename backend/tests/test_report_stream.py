@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式报告生成测试
+验证报告片段到达时写入部分报告文件、生成中断后保留最长的输出，以及通过SSE接口实时查看
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app import create_app, db
+from app.config import TestingConfig
+from app.services.ai.analysis_service import AnalysisService
+from app.services.ai.llm_provider import DeepSeekProvider, ErrorType
+from app.services.ai.report_stream import PartialReportWriter, partial_report_path, read_partial_report
+
+CHUNK_DELAY = 0.1
+
+
+class _StreamingChatHandler(BaseHTTPRequestHandler):
+    """按SSE逐个返回片段；cut_after 不为空时发送该数量的片段后断开连接"""
+    protocol_version = 'HTTP/1.1'
+    cut_after = []
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        assert request['stream'] is True
+        cut_after = self.cut_after.pop(0) if self.cut_after else None
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i in range(cut_after if cut_after is not None else 3):
+            self._send_event({'choices': [{'delta': {'content': f'第{i}段。'}, 'finish_reason': None}]})
+            time.sleep(CHUNK_DELAY)
+        if cut_after is not None:
+            # 不发送结束块直接断开，客户端读到不完整的响应
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self._send_event({'choices': [{'delta': {}, 'finish_reason': 'stop'}], 'usage': {'total_tokens': 30}})
+        self._send_chunk(b'data: [DONE]\n\n')
+        self._send_chunk(b'')
+
+    def _send_event(self, data):
+        self._send_chunk(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode())
+
+    def _send_chunk(self, payload: bytes):
+        self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def provider():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _StreamingChatHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    provider = DeepSeekProvider({
+        'name': 'deepseek', 'api_key': 'k', 'model': 'deepseek-reasoner',
+        'retry_config': {'max_retries': 1, 'base_delay': 0.01}
+    })
+    provider.api_url = f"http://127.0.0.1:{httpd.server_address[1]}/v1/chat/completions"
+    yield provider
+    _StreamingChatHandler.cut_after = []
+    httpd.shutdown()
+
+
+def test_chunks_are_written_while_generating(provider, tmp_path):
+    """生成完成前就能从部分报告文件读到已到达的片段"""
+    path = str(tmp_path / 'AAPL.partial')
+    writer = PartialReportWriter(path)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(
+        provider.generate_analysis('analyze', {'code': 'AAPL'}, report_stream=writer)))
+    thread.start()
+
+    received, offset, seen_while_running = b'', 0, False
+    while thread.is_alive():
+        data, offset, _ = read_partial_report(path, offset)
+        received += data
+        seen_while_running = seen_while_running or bool(data)
+        time.sleep(0.02)
+    thread.join()
+
+    result = results[0]
+    assert seen_while_running
+    assert result.success and result.content == '第0段。第1段。第2段。'
+    assert result.metadata['stream_mode'] and result.tokens_used == 30
+    received += read_partial_report(path, offset)[0]
+    assert received.decode('utf-8') == result.content
+
+
+def test_interrupted_generation_keeps_longest_output(provider, tmp_path):
+    """两次尝试都中途断开时，保留较长的第一次输出"""
+    _StreamingChatHandler.cut_after = [5, 1]
+    writer = PartialReportWriter(str(tmp_path / 'AAPL.partial'))
+
+    result = provider.generate_analysis('analyze', {'code': 'AAPL'}, report_stream=writer)
+
+    assert not result.success and result.error_type == ErrorType.NETWORK_ERROR
+    content, provider_name, model = writer.salvage()
+    assert content == ''.join(f'第{i}段。' for i in range(5))
+    assert (provider_name, model) == ('deepseek', 'deepseek-reasoner')
+    writer.discard()
+    assert not os.listdir(tmp_path)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(TestingConfig, 'ANALYSIS_PARTIAL_REPORT_MIN_CHARS', 10)
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def test_failed_analysis_saves_partial_report(app, monkeypatch):
+    """重试预算用完时，已生成的内容保存为部分报告"""
+    def fake_run_analysis(self, stock_code, *args, report_stream=None, **kwargs):
+        report_stream.begin_attempt('deepseek', 'deepseek-chat')
+        report_stream.write('# 分析报告\n\n已经生成了大部分内容')
+        return {'success': False, 'error': 'Connection error'}
+
+    monkeypatch.setattr(AnalysisService, 'run_analysis', fake_run_analysis)
+    service = AnalysisService(db.session)
+    task_data = {'task_id': 'single_AAPL_1', 'max_retries': 0, 'retry_history': []}
+
+    result = service._run_analysis_with_retry('AAPL', 1, 'fundamental', 'deepseek', task_data)
+
+    assert not result['success'] and '已保存部分报告' in result['error']
+    entry = service.report_repo.get_by_report_id(result['partial_report_id'])
+    report_file = entry.file_path if entry else next(
+        os.path.join(root, name) for root, _, names in os.walk('data/reports') for name in names
+        if name.endswith('.report'))
+    report = service.report_storage.read_report(report_file)
+    assert report['partial'] is True and report['ai_model'] == 'deepseek-chat'
+    assert report['task_id'] == 'single_AAPL_1'
+    assert report['content'].startswith('# 分析报告\n\n已经生成了大部分内容')
+    assert not os.path.exists(partial_report_path('single_AAPL_1', 'AAPL'))
+
+
+def test_task_stream_endpoint(app):
+    """SSE接口返回任务进度和部分报告内容，任务结束后关闭"""
+    service = AnalysisService(db.session)
+    service.task_repo.create({
+        'task_id': 'single_AAPL_1', 'task_type': 'single', 'user_id': 1, 'stock_code': 'AAPL',
+        'status': 'completed', 'total_count': 1, 'completed_count': 1, 'failed_count': 0
+    })
+    writer = PartialReportWriter(partial_report_path('single_AAPL_1', 'AAPL'))
+    writer.begin_attempt()
+    writer.write('实时生成的内容')
+
+    client = app.test_client()
+    assert client.get('/api/analysis/task-stream/single_AAPL_1').status_code == 401
+    with client.session_transaction() as sess:
+        sess['user_id'] = 2
+    assert client.get('/api/analysis/task-stream/single_AAPL_1').status_code == 404
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    response = client.get('/api/analysis/task-stream/single_AAPL_1')
+
+    assert response.mimetype == 'text/event-stream'
+    events = [block.split('\n') for block in response.get_data(as_text=True).strip().split('\n\n')]
+    names = [lines[0][len('event: '):] for lines in events]
+    assert names == ['progress', 'chunk', 'done']
+    chunk = json.loads(events[1][1][len('data: '):])
+    assert chunk == {'stock_code': 'AAPL', 'text': '实时生成的内容', 'offset': len('实时生成的内容'.encode())}
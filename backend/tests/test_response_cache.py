@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI分析结果缓存测试
+验证相同请求复用结果、同时进行的相同请求只调用一次AI，以及按过期时间和容量淘汰
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+import time
+
+import pytest
+
+from app.services.ai.analysis_service import AnalysisService
+from app.services.ai.llm_provider import AnalysisResult, DeepSeekProvider, ErrorType
+from app.services.ai.response_cache import LLMResponseCache, make_cache_key
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(LLMResponseCache, '_instance', None)
+    cache = LLMResponseCache()
+    cache.configure(enabled=True, ttl_seconds=60, max_entries=10, max_bytes=1000)
+    monkeypatch.setattr('app.services.ai.response_cache.response_cache', cache)
+    return cache
+
+
+def test_eviction_by_ttl_entries_and_bytes(cache):
+    """过期条目失效，超出条目数或字节数时淘汰最久未使用的条目"""
+    cache.configure(max_entries=2)
+    cache.get_or_generate('a', lambda: 'A', size_of=len)
+    cache.get_or_generate('b', lambda: 'B', size_of=len)
+    assert cache.get_or_generate('a', lambda: 'new')[1] == 'hit'
+    cache.get_or_generate('c', lambda: 'C', size_of=len)
+    assert cache.get_or_generate('b', lambda: 'B2', size_of=len) == ('B2', 'miss')
+    assert cache.get_stats()['evictions'] == 2
+
+    cache.configure(max_entries=10, max_bytes=5)
+    cache.get_or_generate('big', lambda: 'x' * 4, size_of=len)
+    assert cache.get_stats()['bytes'] <= 5
+
+    cache.configure(ttl_seconds=0.05)
+    cache.get_or_generate('d', lambda: 'D')
+    time.sleep(0.06)
+    assert cache.get_or_generate('d', lambda: 'D2') == ('D2', 'miss')
+
+
+def test_concurrent_identical_requests_generate_once(cache, monkeypatch):
+    """同时发起的相同请求只调用一次AI，其余请求复用结果；失败的结果不缓存"""
+    calls = []
+    outcomes = iter([False, True, True])
+
+    def fake_failover(self, provider, ai_provider, prompt_template, stock_info, retry_budget=None,
+                      report_stream=None):
+        calls.append(stock_info['code'])
+        time.sleep(0.2)
+        if next(outcomes):
+            return AnalysisResult(success=True, content='# 报告', provider='deepseek', model=provider.model,
+                                  retry_count=1), provider, None
+        return AnalysisResult(success=False, error='Connection error', error_type=ErrorType.NETWORK_ERROR,
+                              provider='deepseek', model=provider.model), provider, None
+
+    monkeypatch.setattr(AnalysisService, '_generate_with_failover', fake_failover)
+    service = AnalysisService.__new__(AnalysisService)
+    provider = DeepSeekProvider({'name': 'deepseek', 'api_key': 'k', 'model': 'deepseek-chat'})
+    stock_info = {'code': 'AAPL', 'analysis_date': '2026-10-16'}
+
+    results = []
+
+    def analyze():
+        results.append(service._generate_with_cache(provider, 'deepseek', '分析 ${code}', stock_info))
+
+    threads = [threading.Thread(target=analyze) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 第一次生成失败，等待的请求中有一个重新生成，其余复用它的结果
+    assert len(calls) == 2
+    statuses = sorted(status for _, _, _, status in results)
+    assert statuses == ['miss', 'miss', 'shared', 'shared']
+    shared = [result for result, _, _, status in results if status == 'shared']
+    assert all(result.success and result.content == '# 报告' and result.retry_count == 0 for result in shared)
+
+    result, _, _, status = service._generate_with_cache(provider, 'deepseek', '分析 ${code}', stock_info)
+    assert status == 'hit' and len(calls) == 2
+
+    # 分析日期或格式化后的提示词不同时不命中
+    assert make_cache_key('deepseek', 'deepseek-chat', '分析 AAPL', '2026-10-17') != \
+        make_cache_key('deepseek', 'deepseek-chat', '分析 AAPL', '2026-10-16')
+    service._generate_with_cache(provider, 'deepseek', '分析 ${code}', {**stock_info, 'code': 'MSFT'})
+    assert len(calls) == 3
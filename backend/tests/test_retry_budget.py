@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分析重试预算测试
+验证任务层和Provider层的重试共用一个预算：总尝试次数和墙钟时间都不超过预算，所有尝试记录在一处
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+
+import pytest
+
+from app import create_app, db
+from app.config import TestingConfig
+from app.services.ai.analysis_service import AnalysisService
+from app.services.ai.circuit_breaker import ProviderCircuitBreaker
+from app.services.ai.llm_provider import AnalysisResult, DeepSeekProvider, ErrorType
+from app.services.ai.retry_budget import RetryBudget
+
+
+@pytest.fixture(autouse=True)
+def breaker(monkeypatch):
+    monkeypatch.setattr(ProviderCircuitBreaker, '_instance', None)
+    breaker = ProviderCircuitBreaker()
+    breaker.configure(failure_threshold=100)
+    monkeypatch.setattr('app.services.ai.llm_provider.circuit_breaker', breaker)
+    return breaker
+
+
+def _provider(max_retries: int = 10) -> DeepSeekProvider:
+    return DeepSeekProvider({
+        'name': 'deepseek', 'api_key': 'k', 'model': 'deepseek-chat',
+        'retry_config': {'max_retries': max_retries, 'base_delay': 0.05, 'jitter': False}
+    })
+
+
+def test_provider_stops_at_deadline(monkeypatch):
+    """请求卡住时在截止时间取消，不再重试"""
+    calls = []
+
+    async def hanging_request(self, prompt, stock_info):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            return AnalysisResult(success=False, error='Connection error', error_type=ErrorType.NETWORK_ERROR,
+                                  provider='deepseek', model=self.model)
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(DeepSeekProvider, '_amake_api_request', hanging_request)
+    budget = RetryBudget(max_retries=10, deadline_seconds=0.5)
+    start = time.monotonic()
+    result = _provider().generate_analysis('p', {'code': 'AAPL'}, budget)
+
+    assert time.monotonic() - start < 1.0
+    assert not result.success and result.error_type == ErrorType.TIMEOUT_ERROR
+    assert len(calls) == 2 and budget.retries_used == 1
+    assert [a['error_type'] for a in budget.attempts] == ['network_error', 'timeout_error']
+
+
+def test_task_and_provider_retries_share_budget(monkeypatch, tmp_path):
+    """任务层重试和Provider重试共用股票的重试次数，失败的尝试写入重试历史"""
+    monkeypatch.chdir(tmp_path)
+    calls = []
+
+    async def failing_request(self, prompt, stock_info):
+        calls.append(stock_info['code'])
+        return AnalysisResult(success=False, error='Connection error', error_type=ErrorType.NETWORK_ERROR,
+                              provider='deepseek', model=self.model)
+
+    provider = _provider(max_retries=3)
+    monkeypatch.setattr(DeepSeekProvider, '_amake_api_request', failing_request)
+
+    def fake_run_analysis(self, stock_code, user_id, analysis_type, ai_provider, prompt_id=None,
+                          skip_coin_check=False, retry_budget=None, report_stream=None, task_id=None):
+        result = provider.generate_analysis('p', {'code': stock_code}, retry_budget)
+        return {'success': result.success, 'error': result.error}
+
+    monkeypatch.setattr(AnalysisService, 'run_analysis', fake_run_analysis)
+    monkeypatch.setattr(time, 'sleep', lambda seconds: None)
+
+    monkeypatch.setattr(TestingConfig, 'ANALYSIS_TASK_RETRY_BUDGET', 3)
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        service = AnalysisService(db.session)
+        task_data = {'task_id': 't1', 'max_retries': 2, 'retry_history': []}
+
+        result = service._run_analysis_with_retry('AAPL', 1, 'fundamental', 'deepseek', task_data)
+        # 之前任务层每次重试都会再走一遍Provider的全部重试（3 x 4 次请求）
+        assert not result['success']
+        assert calls == ['AAPL'] * 3
+        assert result['retry_count'] == 2
+        assert len(task_data['retry_history']) == 3
+        assert all(record['layer'] == 'provider' for record in task_data['retry_history'])
+
+        # 同一任务的下一只股票只剩1次任务级重试
+        calls.clear()
+        result = service._run_analysis_with_retry('MSFT', 1, 'fundamental', 'deepseek', task_data)
+        assert calls == ['MSFT'] * 2
+        assert '任务重试次数已用完' in result['error']
+        db.session.remove()
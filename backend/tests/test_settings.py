@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+应用配置测试
+验证分析任务等功能使用的配置项由 app/config/settings.py 加载，create_app 后无需手动设置
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+
+# 配置项及其在测试环境中的值
+TESTING_SETTINGS = {
+    'ANALYSIS_MAX_WORKERS': 3,
+    'ANALYSIS_MAX_QUEUED': 50,
+    'ANALYSIS_MAX_QUEUED_PER_USER': 5,
+    'ANALYSIS_TASK_LEASE_SECONDS': 300,
+    'ANALYSIS_RECOVER_INTERRUPTED_TASKS': False,
+    'TASK_HISTORY_RETENTION_DAYS': 90,
+    'TASK_HISTORY_MAX_PER_USER': 200,
+    'ANALYSIS_PROVIDER_CONCURRENCY': {'qwen': 2, 'deepseek': 3, 'gemini': 4},
+    'ANALYSIS_PROVIDER_MIN_INTERVAL': {'qwen': 2.0, 'deepseek': 1.0, 'gemini': 0.5},
+    'ANALYSIS_PROVIDER_DEFAULT_CONCURRENCY': 2,
+    'ANALYSIS_PROVIDER_DEFAULT_MIN_INTERVAL': 2.0,
+    'ANALYSIS_PROVIDER_RATE_LIMITS': {
+        'qwen': {'rpm': 60, 'tpm': 1000000},
+        'deepseek': {'rpm': 60, 'tpm': 1000000},
+        'gemini': {'rpm': 15, 'tpm': 1000000}
+    },
+    'ANALYSIS_RATE_LIMIT_STORE': None,
+    'ANALYSIS_CIRCUIT_FAILURE_THRESHOLD': 3,
+    'ANALYSIS_CIRCUIT_RESET_SECONDS': 120.0,
+    'ANALYSIS_CIRCUIT_TRIP_ERRORS': ['network_error', 'timeout_error', 'rate_limit_error', 'authentication_error'],
+    'ANALYSIS_PROVIDER_FAILOVER_ORDER': ['qwen', 'deepseek', 'gemini'],
+    'ANALYSIS_STOCK_DEADLINE_SECONDS': 1800.0,
+    'ANALYSIS_STOCK_MAX_RETRIES': 5,
+    'ANALYSIS_TASK_RETRY_BUDGET': 50,
+    'ANALYSIS_STREAM_REPORTS': True,
+    'ANALYSIS_STREAM_POLL_INTERVAL': 0.5,
+    'ANALYSIS_PARTIAL_REPORT_MIN_CHARS': 1000,
+    'ANALYSIS_RESPONSE_CACHE_ENABLED': False,
+    'ANALYSIS_RESPONSE_CACHE_TTL_SECONDS': 21600.0,
+    'ANALYSIS_RESPONSE_CACHE_MAX_ENTRIES': 100,
+    'ANALYSIS_RESPONSE_CACHE_MAX_BYTES': 20 * 1024 * 1024,
+    'ANALYSIS_HEDGE_ENABLED': False,
+    'ANALYSIS_HEDGE_PERCENTILE': 0.95,
+    'ANALYSIS_HEDGE_MIN_SAMPLES': 20,
+    'ANALYSIS_HEDGE_DEFAULT_DELAY': 60.0,
+    'ANALYSIS_HEDGE_MIN_DELAY': 5.0,
+    'ANALYSIS_HEDGE_MAX_RATIO': 0.1,
+    'LLM_METRICS_BUCKET_SECONDS': 60,
+    'LLM_METRICS_RETENTION_SECONDS': 86400,
+    'STOCK_METADATA_CACHE_SECONDS': 600,
+    'STOCK_DATA_CONCURRENT_FETCH': True,
+    'STOCK_DATA_FETCH_DEADLINE_SECONDS': 15.0,
+    'STOCK_DATA_PRIORITY_GRACE_SECONDS': 0.5,
+    'STOCK_DATA_FETCH_WORKERS': 16,
+    'QUOTE_CACHE_MAX_ENTRIES': 1000,
+    'QUOTE_CACHE_TTL_SECONDS': 300.0,
+    'QUOTE_CACHE_CLOSED_TTL_SECONDS': 3600.0,
+    'QUOTE_CACHE_STALE_SECONDS': 300.0,
+    'QUOTE_CACHE_SHARED_STORE': '',
+    'QUOTE_CACHE_SHARED_WAIT_SECONDS': 15.0,
+}
+
+
+def test_settings_are_loaded():
+    """create_app 加载的配置包含各功能的配置项"""
+    config = create_app('testing').config
+    for key, value in TESTING_SETTINGS.items():
+        assert config.get(key) == value, key
+
+    assert create_app('development').config['ANALYSIS_RECOVER_INTERRUPTED_TASKS'] is True
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+股票基础信息缓存测试
+验证获取分析数据时不再创建应用、重复获取不查询数据库，以及修改股票后缓存失效
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models.stock import Stock
+from app.services.data.multi_source_data_service import MultiSourceDataService
+from app.services.data.stock_metadata_cache import StockMetadataCache
+
+
+@pytest.fixture
+def app(monkeypatch):
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        cache = StockMetadataCache()
+        monkeypatch.setattr('app.services.data.stock_metadata_cache.stock_metadata_cache', cache)
+        monkeypatch.setattr('app.services.data.multi_source_data_service.stock_metadata_cache', cache)
+
+        def no_app(*args, **kwargs):
+            raise AssertionError('获取行情时不应创建应用')
+
+        monkeypatch.setattr('app.create_app', no_app)
+        yield app
+        db.session.remove()
+
+
+def _count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return statements, lambda: event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def test_metadata_is_cached_and_invalidated(app, monkeypatch):
+    """重复获取同一股票只查询一次数据库，修改股票后读到新值"""
+    db.session.add(Stock(code='AAPL', name='Apple Inc.', market='US', exchange='NASDAQ', industry='科技'))
+    db.session.add(Stock(code='00700', name='腾讯控股', market='HK', exchange='HKEX', industry='互联网'))
+    db.session.commit()
+
+    service = MultiSourceDataService()
+    monkeypatch.setattr(service, 'get_stock_data', lambda symbol: None)
+
+    statements, stop = _count_queries()
+    try:
+        first = service.get_analysis_ready_data('AAPL')
+        assert len(statements) <= 1
+        second = service.get_analysis_ready_data('AAPL')
+        assert len(statements) <= 1
+        assert service._is_hk_stock('00700')
+        assert not service._is_hk_stock('12345')
+        assert not service._is_hk_stock('12345')
+        assert len(statements) <= 2
+    finally:
+        stop()
+
+    assert first == {**second, 'data_timestamp': first['data_timestamp']}
+    assert first['name'] == 'Apple Inc.' and first['industry'] == '科技' and first['exchange'] == 'NASDAQ'
+
+    stock = Stock.query.filter_by(code='AAPL').first()
+    stock.industry = '消费电子'
+    db.session.commit()
+    assert service.get_analysis_ready_data('AAPL')['industry'] == '消费电子'
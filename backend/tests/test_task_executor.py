@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分析任务执行器测试
+验证工作线程数量有上限、按用户轮转调度、队列满时拒绝提交，批量任务按提供商并发分析，
+以及等待并发槽位时响应停止、Provider等待重试期间释放槽位
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+import time
+import pytest
+
+from app import create_app, db
+from app.config import TestingConfig
+from app.services.ai.analysis_service import AnalysisService
+from app.services.ai.circuit_breaker import ProviderCircuitBreaker
+from app.services.ai.llm_provider import AnalysisResult, DeepSeekProvider, ErrorType
+from app.services.ai.provider_pacer import ProviderPacer, SlotWaitCancelled
+from app.services.ai.retry_budget import RetryBudget
+from app.services.ai.task_executor import AnalysisExecutor, ExecutorFullError, PRIORITY_HIGH
+from app.services.ai.task_manager import task_manager
+
+
+@pytest.fixture
+def executor(tmp_path, monkeypatch):
+    """在测试应用上下文中创建独立的执行器实例"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(AnalysisExecutor, '_instance', None)
+    app = create_app('testing')
+    with app.app_context():
+        yield AnalysisExecutor()
+
+
+def _blocking_job(gate, started, order=None, name=None):
+    def run():
+        if order is not None:
+            order.append(name)
+        started.release()
+        gate.wait(5)
+    return run
+
+
+def test_workers_are_bounded(executor):
+    """同时执行的任务数不超过工作线程数，其余任务排队"""
+    executor.configure(max_workers=2, max_queued=10, max_queued_per_user=10)
+    gate = threading.Event()
+    started = threading.Semaphore(0)
+
+    positions = [executor.submit(f'task_{i}', _blocking_job(gate, started), user_id=1) for i in range(5)]
+    assert started.acquire(timeout=5) and started.acquire(timeout=5)
+
+    stats = executor.get_stats()
+    assert positions[:2] == [0, 0]
+    assert stats['workers'] == 2
+    assert stats['running'] == 2
+    assert stats['queued'] == 3
+    assert executor.get_queue_position('task_0') == 0
+    assert executor.get_queue_position('task_4') == 3
+
+    gate.set()
+    for _ in range(3):
+        assert started.acquire(timeout=5)
+
+
+def test_users_are_served_round_robin(executor):
+    """同一优先级下按用户轮转，高优先级任务先执行"""
+    executor.configure(max_workers=1, max_queued=10, max_queued_per_user=10)
+    gate = threading.Event()
+    started = threading.Semaphore(0)
+    order = []
+
+    executor.submit('blocker', _blocking_job(gate, started, order, 'blocker'), user_id='x')
+    assert started.acquire(timeout=5)
+
+    for name in ('a1', 'a2', 'a3'):
+        executor.submit(name, _blocking_job(gate, started, order, name), user_id='a')
+    executor.submit('b1', _blocking_job(gate, started, order, 'b1'), user_id='b')
+    executor.submit('c1', _blocking_job(gate, started, order, 'c1'), user_id='c', priority=PRIORITY_HIGH)
+    assert executor.get_queue_position('c1') == 1
+    assert executor.get_queue_position('a2') == 4
+
+    gate.set()
+    for _ in range(5):
+        assert started.acquire(timeout=5)
+    assert order == ['blocker', 'c1', 'a1', 'b1', 'a2', 'a3']
+
+
+def test_submit_rejected_when_queue_full(executor):
+    """队列总数或单用户排队数超过上限时拒绝提交"""
+    executor.configure(max_workers=1, max_queued=2, max_queued_per_user=1)
+    gate = threading.Event()
+    started = threading.Semaphore(0)
+
+    assert executor.submit('running', _blocking_job(gate, started), user_id=1) == 0
+    assert started.acquire(timeout=5)
+
+    assert executor.submit('user1_queued', _blocking_job(gate, started), user_id=1) == 1
+    with pytest.raises(ExecutorFullError):
+        executor.submit('user1_rejected', _blocking_job(gate, started), user_id=1)
+
+    # 用户1刚被调度过，用户2排在其前面
+    assert executor.submit('user2_queued', _blocking_job(gate, started), user_id=2) == 1
+    assert executor.get_queue_position('user1_queued') == 2
+    with pytest.raises(ExecutorFullError):
+        executor.submit('user3_rejected', _blocking_job(gate, started), user_id=3)
+
+    # 取消排队中的任务后可以再次提交
+    assert executor.cancel('user1_queued')
+    assert executor.submit('user3_queued', _blocking_job(gate, started), user_id=3) == 2
+    gate.set()
+
+
+def test_batch_stocks_fan_out_per_provider(tmp_path, monkeypatch):
+    """批量任务按提供商并发上限同时分析多只股票，计数正确"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(ProviderPacer, '_instance', None)
+    pacer = ProviderPacer()
+    pacer.configure(concurrency={'qwen': 2}, min_interval={'qwen': 0})
+    monkeypatch.setattr('app.services.ai.provider_pacer.provider_pacer', pacer)
+
+    lock = threading.Lock()
+    active = {'now': 0, 'max': 0}
+
+    def fake_run_analysis(self, stock_code, *args, **kwargs):
+        with pacer.slot('qwen'):
+            with lock:
+                active['now'] += 1
+                active['max'] = max(active['max'], active['now'])
+            time.sleep(0.05)
+            with lock:
+                active['now'] -= 1
+        if stock_code == 'BAD':
+            return {'success': False, 'error': '模型返回为空'}
+        return {'success': True}
+
+    monkeypatch.setattr(AnalysisService, 'run_analysis', fake_run_analysis)
+
+    # 多个线程同时写任务记录，使用文件数据库
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'test.db'}")
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        service = AnalysisService(db.session)
+        codes = ['AAPL', 'MSFT', 'BAD', 'TSLA', 'NVDA']
+        service.task_repo.create({
+            'task_id': 'batch_fanout', 'task_type': 'batch', 'user_id': 1,
+            'stocks': [{'code': code} for code in codes], 'status': 'running',
+            'total_count': len(codes), 'completed_count': 0, 'failed_count': 0
+        })
+        task_data = service.get_task_status('batch_fanout')
+        task_data['max_retries'] = 0
+
+        task_manager.register_task('batch_fanout', None, 'batch_analysis')
+        try:
+            assert service._analyze_batch_stocks('batch_fanout', task_data['stocks'], 1,
+                                                 'fundamental', 'qwen', task_data)
+        finally:
+            task_manager.unregister_task('batch_fanout')
+
+        task = service.get_task_status('batch_fanout')
+        assert active['max'] == 2
+        assert task['completed_count'] == 4
+        assert task['failed_count'] == 1
+        assert task['progress'] == 100
+        assert [item['code'] for item in task['failed_stocks']] == ['BAD']
+        db.session.remove()
+
+
+def test_slot_wait_stops_and_backoff_releases_slot(monkeypatch):
+    """等待槽位的任务被停止时放弃等待；Provider等待重试期间其他股票可以使用槽位"""
+    monkeypatch.setattr('app.services.ai.provider_pacer.ACQUIRE_POLL_SECONDS', 0.05)
+    monkeypatch.setattr(ProviderPacer, '_instance', None)
+    pacer = ProviderPacer()
+    pacer.configure(concurrency={'deepseek': 1}, min_interval={'deepseek': 0})
+    monkeypatch.setattr(ProviderCircuitBreaker, '_instance', None)
+    monkeypatch.setattr('app.services.ai.llm_provider.circuit_breaker', ProviderCircuitBreaker())
+
+    stopped = threading.Event()
+    errors = []
+
+    def waiting_stock():
+        try:
+            with pacer.slot('deepseek', should_continue=lambda: not stopped.is_set()):
+                pass
+        except SlotWaitCancelled as e:
+            errors.append(e)
+
+    with pacer.slot('deepseek'):
+        waiter = threading.Thread(target=waiting_stock)
+        waiter.start()
+        time.sleep(0.1)
+        stopped.set()
+        waiter.join(timeout=1)
+    assert len(errors) == 1
+
+    events = []
+
+    async def request(self, prompt, stock_info):
+        events.append('request')
+        if len(events) == 1:
+            return AnalysisResult(success=False, error='Connection error', error_type=ErrorType.NETWORK_ERROR,
+                                  provider='deepseek', model=self.model)
+        return AnalysisResult(success=True, content='报告', provider='deepseek', model=self.model)
+
+    def other_stock():
+        time.sleep(0.1)
+        with pacer.slot('deepseek'):
+            events.append('other')
+
+    monkeypatch.setattr(DeepSeekProvider, '_amake_api_request', request)
+    provider = DeepSeekProvider({'name': 'deepseek', 'api_key': 'k', 'model': 'deepseek-chat',
+                                 'retry_config': {'max_retries': 1, 'base_delay': 0.3, 'jitter': False}})
+    budget = RetryBudget(max_retries=1)
+    other = threading.Thread(target=other_stock)
+    other.start()
+    with pacer.slot('deepseek') as slot:
+        budget.slot = slot
+        assert provider.generate_analysis('分析', {'code': 'AAPL'}, budget).success
+        assert slot.held
+    other.join(timeout=1)
+    assert events == ['request', 'other', 'request']
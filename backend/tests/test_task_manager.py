@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务管理器测试
+验证暂停的任务阻塞等待而不占用注册表锁，大量任务并发暂停/恢复时不会死锁
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import random
+import threading
+import time
+import pytest
+
+from app.services.ai.task_manager import TaskManager
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    """创建独立的任务管理器实例"""
+    monkeypatch.setattr(TaskManager, '_instance', None)
+    return TaskManager()
+
+
+def test_paused_task_blocks_without_holding_registry_lock(manager):
+    """暂停中的任务等待恢复时，其他任务的注册和查询不受影响"""
+    manager.register_task('paused', None)
+    manager.pause_task('paused')
+    result = {}
+
+    waiter = threading.Thread(target=lambda: result.setdefault('continue', manager.wait_if_paused('paused')))
+    waiter.start()
+    time.sleep(0.1)
+    assert waiter.is_alive()
+
+    started = time.time()
+    manager.register_task('other', None)
+    assert manager.get_task_status('other') == 'running'
+    assert manager.wait_if_paused('other')
+    assert time.time() - started < 0.1
+
+    assert manager.resume_task('paused')
+    waiter.join(1)
+    assert result['continue'] is True
+
+    # 暂停期间被停止时立即唤醒并返回False
+    manager.pause_task('paused')
+    waiter = threading.Thread(target=lambda: result.update(stopped=manager.wait_if_paused('paused')))
+    waiter.start()
+    manager.stop_task('paused')
+    waiter.join(1)
+    assert result['stopped'] is False
+    assert manager.wait_if_paused('paused', timeout=0.01) is False
+
+
+def test_concurrent_pause_resume_stress(manager):
+    """数百个任务并发执行检查点，同时被反复暂停/恢复/停止，所有线程都能及时结束"""
+    task_ids = [f'task_{i}' for i in range(300)]
+    for task_id in task_ids:
+        manager.register_task(task_id, None)
+
+    progress = {task_id: 0 for task_id in task_ids}
+    outcome = {}
+    done = threading.Event()
+
+    def worker(task_id):
+        while progress[task_id] < 50:
+            if not manager.wait_if_paused(task_id):
+                outcome[task_id] = 'stopped'
+                return
+            progress[task_id] += 1
+            time.sleep(0.001)
+        outcome[task_id] = 'completed'
+
+    def controller(seed):
+        rng = random.Random(seed)
+        while not done.is_set():
+            task_id = rng.choice(task_ids)
+            if rng.random() < 0.5:
+                manager.pause_task(task_id)
+            else:
+                manager.resume_task(task_id)
+
+    workers = [threading.Thread(target=worker, args=(task_id,)) for task_id in task_ids]
+    controllers = [threading.Thread(target=controller, args=(seed,)) for seed in range(4)]
+    for thread in workers + controllers:
+        thread.start()
+
+    time.sleep(0.3)
+    done.set()
+    for thread in controllers:
+        thread.join(5)
+
+    # 停止一部分任务，其余全部恢复
+    stopped = set(task_ids[::10])
+    for task_id in task_ids:
+        if task_id in stopped:
+            manager.stop_task(task_id)
+        else:
+            manager.resume_task(task_id)
+
+    for thread in workers:
+        thread.join(10)
+    assert not any(thread.is_alive() for thread in workers)
+
+    for task_id in task_ids:
+        if task_id not in stopped:
+            assert outcome[task_id] == 'completed'
+            assert progress[task_id] == 50
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务记录测试
+验证任务状态的查询、部分更新和历史清理都通过任务记录表完成，中断的任务可以从断点恢复，
+删除任务时一起删除它生成的报告文件、报告索引和报告计数
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+from datetime import datetime, timedelta
+import pytest
+
+from app import create_app, db
+from app.config import TestingConfig
+from app.models.analysis import ReportIndex, TaskStockStatus
+from app.models.stock import Stock
+from app.services.ai.analysis_service import AnalysisService
+from app.services.ai.task_executor import AnalysisExecutor
+from app.services.coin.coin_service import CoinService
+
+
+@pytest.fixture
+def analysis_service(tmp_path, monkeypatch):
+    """在临时目录中创建测试应用和分析服务"""
+    monkeypatch.chdir(tmp_path)
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield AnalysisService(db.session)
+        db.session.remove()
+
+
+def _create_batch(service, task_id, user_id, stock_codes, **fields):
+    data = {
+        'task_id': task_id,
+        'task_type': 'batch',
+        'user_id': user_id,
+        'stocks': [{'code': code, 'name': f'股票{code}'} for code in stock_codes],
+        'status': 'running',
+        'total_count': len(stock_codes),
+        'completed_count': 0,
+        'failed_count': 0
+    }
+    data.update(fields)
+    return service.task_repo.create(data)
+
+
+def test_stock_results_update_counts_and_progress(analysis_service):
+    """记录股票结果时原子地更新计数和进度，重复记录不会重复计数"""
+    _create_batch(analysis_service, 'batch_1_1', 1, ['AAPL', 'MSFT', '00700', 'TSLA'])
+    repo = analysis_service.task_repo
+
+    repo.record_stock_result('batch_1_1', 'AAPL', 'completed')
+    repo.record_stock_result('batch_1_1', 'MSFT', 'failed', retry_count=2, error='超时')
+    repo.record_stock_result('batch_1_1', 'MSFT', 'completed', retry_count=3)
+
+    task = analysis_service.get_task_status('batch_1_1', 1)
+    assert task['completed_count'] == 2
+    assert task['failed_count'] == 0
+    assert task['progress'] == 50
+    assert task['stock_status']['MSFT'] == {'status': 'completed', 'retry_count': 3,
+                                            'completed_at': task['stock_status']['MSFT']['completed_at']}
+    assert task['failed_stocks'] == []
+    assert analysis_service.get_task_status('batch_1_1', 2) is None
+
+
+def test_concurrent_stock_insert_updates_existing_row(analysis_service, monkeypatch):
+    """插入股票状态时遇到其他线程已写入的记录，按更新处理且不丢弃会话中的其他修改"""
+    _create_batch(analysis_service, 'batch_1_1', 1, ['AAPL', 'MSFT'])
+    _create_batch(analysis_service, 'batch_1_2', 1, ['AAPL'])
+    repo = analysis_service.task_repo
+    repo.record_stock_result('batch_1_1', 'AAPL', 'failed', error='超时')
+
+    # 模拟查询时记录尚未写入、插入时已被其他线程写入
+    lookups = []
+    original = repo._get_stock_status
+
+    def racing_lookup(*args):
+        lookups.append(args)
+        return original(*args) if len(lookups) > 1 else None
+
+    monkeypatch.setattr(repo, '_get_stock_status', racing_lookup)
+    db.session.add(TaskStockStatus(task_id='batch_1_2', stock_code='AAPL', status='completed'))
+    repo.record_stock_result('batch_1_1', 'AAPL', 'completed', retry_count=1)
+
+    assert len(lookups) == 2
+    task = analysis_service.get_task_status('batch_1_1', 1)
+    assert task['completed_count'] == 1 and task['failed_count'] == 0 and task['progress'] == 50
+    assert task['stock_status']['AAPL']['retry_count'] == 1
+    assert db.session.query(TaskStockStatus).filter_by(task_id='batch_1_2').count() == 1
+
+
+def test_user_tasks_listed_from_store(analysis_service, monkeypatch):
+    """用户任务列表按创建时间倒序分页，不读取任务文件"""
+    now = datetime.utcnow()
+    for i in range(5):
+        _create_batch(analysis_service, f'batch_1_{i}', 1, ['AAPL'], created_at=now + timedelta(seconds=i))
+    _create_batch(analysis_service, 'batch_2_0', 2, ['AAPL'])
+
+    def _fail_listdir(*args, **kwargs):
+        raise AssertionError('任务查询不应遍历目录')
+    monkeypatch.setattr(os, 'listdir', _fail_listdir)
+
+    tasks = analysis_service.get_user_tasks(1, limit=2, offset=1)
+    assert [t['task_id'] for t in tasks] == ['batch_1_3', 'batch_1_2']
+    assert analysis_service.count_tasks(1) == 5
+    assert analysis_service.count_tasks() == 6
+
+
+def test_purge_history_keeps_active_tasks(analysis_service):
+    """历史清理只删除过期或超出数量上限的已结束任务"""
+    old = datetime.utcnow() - timedelta(days=100)
+    _create_batch(analysis_service, 'batch_1_old', 1, ['AAPL'], status='completed', created_at=old)
+    _create_batch(analysis_service, 'batch_1_running', 1, ['AAPL'], status='running', created_at=old)
+    for i in range(3):
+        _create_batch(analysis_service, f'batch_2_{i}', 2, ['AAPL'], status='failed',
+                      created_at=datetime.utcnow() + timedelta(seconds=i))
+    analysis_service.task_repo.record_stock_result('batch_1_old', 'AAPL', 'completed')
+
+    assert analysis_service.task_repo.purge_history(retention_days=90, max_per_user=2) == 2
+    remaining = {t['task_id'] for t in analysis_service.get_all_tasks()}
+    assert remaining == {'batch_1_running', 'batch_2_2', 'batch_2_1'}
+
+
+def test_delete_task_removes_its_reports(analysis_service):
+    """删除任务后，它生成的报告从文件、报告列表和报告计数中一起删除，其他任务的报告保留"""
+    db.session.add(Stock(code='AAPL', name='Apple Inc.', market='US'))
+    db.session.commit()
+    _create_batch(analysis_service, 'batch_1_done', 1, ['AAPL'], status='completed')
+    report = {'stock_code': 'AAPL', 'content': '# 报告', 'provider': 'qwen', 'analysis_type': 'fundamental'}
+    task_file = analysis_service.save_analysis_report('AAPL', dict(report, task_id='batch_1_done'))
+    analysis_service.save_analysis_report('AAPL', dict(report, task_id='batch_2_other'))
+    assert analysis_service.get_global_reports_count() == 2
+
+    assert analysis_service.delete_task('batch_1_done', 1)
+
+    assert not os.path.exists(task_file)
+    reports = analysis_service.get_all_reports()
+    assert len(reports) == 1 and analysis_service.count_reports() == 1
+    assert analysis_service.get_global_reports_count() == 1
+    assert analysis_service.report_repo.list_for_task('batch_1_done') == []
+
+    _create_batch(analysis_service, 'batch_2_other', 2, ['AAPL'], status='completed')
+    assert analysis_service.delete_task('batch_2_other', 2)
+    assert analysis_service.get_all_reports() == [] and analysis_service.count_reports() == 0
+    assert analysis_service.get_global_reports_count() == 0
+
+
+def test_interrupted_batch_resumes_unfinished_stocks(tmp_path, monkeypatch):
+    """租约过期的批量任务只重新分析未完成的股票，不重复扣金币、不重复生成本任务已完成的报告"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setattr(AnalysisExecutor, '_instance', None)
+    executor = AnalysisExecutor()
+    monkeypatch.setattr('app.services.ai.task_executor.analysis_executor', executor)
+
+    analyzed = []
+
+    def fake_run_analysis(self, stock_code, *args, **kwargs):
+        analyzed.append(stock_code)
+        return {'success': True}
+
+    def fail_spend_coins(self, *args, **kwargs):
+        raise AssertionError('恢复任务不应重复扣除金币')
+
+    monkeypatch.setattr(AnalysisService, 'run_analysis', fake_run_analysis)
+    monkeypatch.setattr(CoinService, 'spend_coins', fail_spend_coins)
+
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        service = AnalysisService(db.session)
+        created_at = datetime.utcnow() - timedelta(minutes=30)
+        _create_batch(service, 'batch_1_crashed', 1, ['AAPL', 'MSFT', 'TSLA', 'NVDA', 'AMZN'],
+                      analysis_type='fundamental', ai_provider='qwen',
+                      created_at=created_at, started_at=created_at, coins_charged=True,
+                      lease_owner='old-host:1', lease_expires_at=datetime.utcnow() - timedelta(minutes=1))
+        service.task_repo.record_stock_result('batch_1_crashed', 'AAPL', 'completed')
+        service.task_repo.record_stock_result('batch_1_crashed', 'MSFT', 'failed', error='超时')
+
+        # TSLA 的报告在进程退出前已经生成，但还没来得及记录状态
+        db.session.add(ReportIndex(stock_id=1, stock_code='TSLA', report_id='TSLA_1', file_path='x.report',
+                                   analysis_date=created_at.date(), analysis_type='fundamental',
+                                   generated_at=created_at + timedelta(minutes=5), task_id='batch_1_crashed'))
+        # 其他任务生成的报告和本任务保存的部分报告不算完成
+        db.session.add(ReportIndex(stock_id=1, stock_code='NVDA', report_id='NVDA_1', file_path='y.report',
+                                   analysis_date=created_at.date(), analysis_type='fundamental',
+                                   generated_at=created_at + timedelta(minutes=5), task_id='batch_2_other'))
+        db.session.add(ReportIndex(stock_id=1, stock_code='AMZN', report_id='AMZN_1', file_path='z.report',
+                                   analysis_date=created_at.date(), analysis_type='fundamental',
+                                   generated_at=created_at + timedelta(minutes=5), task_id='batch_1_crashed',
+                                   is_partial=True))
+        db.session.commit()
+
+        assert service.recover_interrupted_tasks() == 1
+        # 已被本进程接管的任务不会被再次恢复
+        assert service.recover_interrupted_tasks() == 0
+
+        deadline = time.time() + 5
+        while time.time() < deadline and service.get_task_status('batch_1_crashed')['status'] != 'completed':
+            time.sleep(0.05)
+
+        task = service.get_task_status('batch_1_crashed')
+        assert task['status'] == 'completed'
+        assert sorted(analyzed) == ['AMZN', 'MSFT', 'NVDA']
+        assert task['completed_count'] == 5
+        assert task['failed_count'] == 0
+        assert service.task_repo.get_by_task_id('batch_1_crashed').lease_owner != 'old-host:1'
+        db.session.remove()